@@ -0,0 +1,295 @@
+"""
+End-to-end throughput benchmark for the batch pipeline.
+
+Runs the three stages (``generate_jsonl``, ``upload_jsonl_to_openai`` and
+``process_pending_batches``) against the in-process fakes in
+``tests/fakes.py`` for one or more roster sizes, and reports per stage:
+- wall time and rows per second
+- peak resident set size (RSS)
+- the number of S3 and OpenAI requests made
+- the prompt tokens of the batches, and the share served from the fake's
+  prompt cache, as recorded from the returned ``usage``
+
+With ``--async-io`` the upload and download stages run their asyncio
+variants (``ASYNC_IO=true``). ``--prompt-layout`` compares prompt layouts
+(``PROMPT_LAYOUT``); the fake caches prompt prefixes of at least
+``--cache-min-tokens`` tokens, like OpenAI does from 1024 tokens.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py --riders 10000 100000
+    python benchmarks/pipeline_benchmark.py --riders 10000 \\
+        --prompt-layout static-first inline --cache-min-tokens 64
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for src in ("batch-prepare", "batch-upload", "batch-download"):
+    sys.path.insert(0, os.path.join(REPO_ROOT, "packages", src, "src"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "tests"))
+sys.path.insert(0, REPO_ROOT)
+
+# Keep the pipeline quiet and away from real credentials
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+# pylint: disable=wrong-import-position
+import batch_download_result  # noqa: E402
+import batch_prepare_input  # noqa: E402
+import batch_upload_input  # noqa: E402
+from fakes import FakeAsyncOpenAI, FakeOpenAI, FakeS3Client  # noqa: E402
+
+from shared.config import CONTROL_KEY, PROMPT_LAYOUT, RIDERS_FILE  # noqa: E402
+from shared.utils import control_file_utils, s3_utils  # noqa: E402
+
+# pylint: enable=wrong-import-position
+
+STAGES = (
+    ("prepare", batch_prepare_input.generate_jsonl),
+    ("upload", batch_upload_input.upload_jsonl_to_openai),
+    ("download", batch_download_result.process_pending_batches),
+)
+ASYNC_STAGES = (
+    ("prepare", batch_prepare_input.generate_jsonl),
+    ("upload", lambda: asyncio.run(
+        batch_upload_input.upload_jsonl_to_openai_async()
+    )),
+    ("download", lambda: asyncio.run(
+        batch_download_result.process_pending_batches_async()
+    )),
+)
+
+
+def make_roster(size: int, seed: int = 7) -> List[Dict[str, str]]:
+    """Build a synthetic roster of unique riders with random birth dates."""
+    rng = random.Random(seed)  # nosec B311 - not used for security
+    first = ["Blanka", "Tadej", "Geraint", "Demi", "Wout", "Lotte", "Remco"]
+    last = ["Vas", "Pogacar", "Thomas", "Vollering", "Van Aert", "Kopecky"]
+    start = date(1970, 1, 1)
+    return [
+        {
+            "name": f"{rng.choice(first)} {rng.choice(last)} {index}",
+            "birth_date": (
+                start + timedelta(days=rng.randrange(20000))
+            ).isoformat(),
+        }
+        for index in range(size)
+    ]
+
+
+def _reset_peak_rss() -> None:
+    """Reset the kernel's RSS high-water mark (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    """Return the peak RSS since the last reset, in MiB."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and never resets
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_stage(
+    func: Callable[[], Any], s3: FakeS3Client, openai: FakeOpenAI
+) -> Dict[str, Any]:
+    """Run one stage and measure it."""
+    s3_before = Counter(s3.calls)
+    openai_before = Counter(openai.calls)
+    _reset_peak_rss()
+
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "ok": bool(result[0] if isinstance(result, tuple) else result),
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "s3_requests": dict(Counter(s3.calls) - s3_before),
+        "openai_requests": dict(Counter(openai.calls) - openai_before),
+    }
+
+
+def _token_usage(s3: FakeS3Client) -> Dict[str, Any]:
+    """Sum the token usage the download stage recorded for every batch."""
+    control = json.loads(s3.objects[CONTROL_KEY])
+    totals: Counter = Counter()
+    for batch in control["batches"]:
+        totals.update(batch.get("usage") or {})
+    prompt_tokens = totals["prompt_tokens"]
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": totals["cached_tokens"],
+        "cached_ratio": round(
+            totals["cached_tokens"] / prompt_tokens, 3
+        ) if prompt_tokens else 0.0,
+    }
+
+
+def run_benchmark(
+    size: int,
+    failure_rate: float,
+    async_io: bool = False,
+    s3_latency: float = 0.0,
+    prompt_layout: str = PROMPT_LAYOUT,
+    cache_min_tokens: int = 1024
+) -> Dict[str, Any]:
+    """
+    Run the full pipeline against fresh fakes for one roster size.
+
+    Args:
+        size (int): The number of riders in the roster.
+        failure_rate (float): Fraction of requests the fake batch fails.
+        async_io (bool): Run the asyncio variants of the stages.
+        s3_latency (float): Simulated seconds per S3 request.
+        prompt_layout (str): The prompt layout of the prepared requests.
+        cache_min_tokens (int): Shortest prompt prefix the fake caches.
+
+    Returns:
+        dict: Measurements for each stage.
+    """
+    s3 = FakeS3Client(latency=s3_latency)
+    openai = FakeOpenAI(
+        failure_rate=failure_rate,
+        cache_min_tokens=cache_min_tokens,
+        cache_block_tokens=min(cache_min_tokens, 128)
+    )
+    s3_utils.s3 = s3
+    control_file_utils.invalidate_control_cache()
+    batch_prepare_input.PROMPT_LAYOUT = prompt_layout
+    batch_upload_input.client = openai
+    batch_download_result.client = openai
+    for module in (batch_upload_input, batch_download_result):
+        setattr(
+            module, "initialize_async_openai_client",
+            lambda: FakeAsyncOpenAI(openai)
+        )
+
+    s3.objects[RIDERS_FILE] = json.dumps(make_roster(size)).encode("utf-8")
+
+    stages = {}
+    for name, func in ASYNC_STAGES if async_io else STAGES:
+        stage = _run_stage(func, s3, openai)
+        stage["rows_per_second"] = (
+            round(size / stage["seconds"]) if stage["seconds"] else None
+        )
+        stages[name] = stage
+
+    return {
+        "riders": size,
+        "prompt_layout": prompt_layout,
+        "stages": stages,
+        "tokens": _token_usage(s3),
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    """Print one roster size's measurements as a table."""
+    print(
+        f"\n== {report['riders']:,} riders, "
+        f"{report['prompt_layout']} prompts =="
+    )
+    print(
+        f"{'stage':<10}{'ok':<5}{'seconds':>10}{'rows/s':>12}"
+        f"{'peak MiB':>10}  requests"
+    )
+    for name, stage in report["stages"].items():
+        requests = {**stage["s3_requests"], **stage["openai_requests"]}
+        print(
+            f"{name:<10}{str(stage['ok']):<5}{stage['seconds']:>10.3f}"
+            f"{stage['rows_per_second'] or 0:>12,}"
+            f"{stage['peak_rss_mb']:>10.1f}  "
+            + ", ".join(f"{k}={v}" for k, v in sorted(requests.items()))
+        )
+    tokens = report["tokens"]
+    print(
+        f"prompt tokens: {tokens['prompt_tokens']:,}, cached: "
+        f"{tokens['cached_tokens']:,} ({tokens['cached_ratio']:.1%})"
+    )
+
+
+def main() -> int:
+    """Run the benchmark for every requested roster size."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--riders",
+        type=int,
+        nargs="+",
+        default=[10000],
+        help="Roster sizes to benchmark (default: 10000)"
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests the fake batch reports as failed"
+    )
+    parser.add_argument(
+        "--async-io",
+        action="store_true",
+        help="Run the asyncio variants of the upload and download stages"
+    )
+    parser.add_argument(
+        "--s3-latency-ms",
+        type=float,
+        default=0.0,
+        help="Simulated round-trip time of every S3 request"
+    )
+    parser.add_argument(
+        "--prompt-layout",
+        nargs="+",
+        choices=("static-first", "inline"),
+        default=[PROMPT_LAYOUT],
+        help="Prompt layouts to compare (default: PROMPT_LAYOUT)"
+    )
+    parser.add_argument(
+        "--cache-min-tokens",
+        type=int,
+        default=1024,
+        help="Shortest prompt prefix the fake caches (OpenAI: 1024); "
+             "lower it to see the effect of the layout on short prompts"
+    )
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    reports = []
+    for size in args.riders:
+        for layout in args.prompt_layout:
+            report = run_benchmark(
+                size, args.failure_rate, args.async_io,
+                args.s3_latency_ms / 1000, layout, args.cache_min_tokens
+            )
+            _print_report(report)
+            reports.append(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+    return 0 if all(
+        stage["ok"] for r in reports for stage in r["stages"].values()
+    ) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
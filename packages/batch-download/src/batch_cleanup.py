@@ -0,0 +1,62 @@
+"""
+Batch cleanup module.
+
+Deletes the OpenAI files and intermediate S3 objects of finished batches,
+see ``cleanup_utils``. The download stage runs the cleanup at the end of
+each run, before compacting the control file; this entry point is for
+manual and dry runs.
+"""
+
+import argparse
+import sys
+
+from shared.config import (
+    ENABLE_FILE_LOGGING,
+    INTERMEDIATE_RETENTION_DAYS,
+    OPENAI_FILE_RETENTION_DAYS,
+)
+from shared.utils.cleanup_utils import cleanup_batches
+from shared.utils.logging_utils import add_file_handler, configure_logger
+from shared.utils.openai_utils import initialize_openai_client
+from shared.utils.scheduler_utils import run_for_tenants
+
+# Configure logger
+logger = configure_logger('batch_cleanup')
+if ENABLE_FILE_LOGGING:
+    add_file_handler(logger)
+
+
+def _parse_args() -> argparse.Namespace:
+    """Parse command line arguments for the cleanup entry point."""
+    parser = argparse.ArgumentParser(
+        description="Delete the OpenAI files and intermediate S3 objects "
+                    "of finished batches."
+    )
+    parser.add_argument(
+        "--openai-retention-days",
+        type=int,
+        default=OPENAI_FILE_RETENTION_DAYS,
+        help="Days the OpenAI files of a finished batch are kept"
+    )
+    parser.add_argument(
+        "--s3-retention-days",
+        type=int,
+        default=INTERMEDIATE_RETENTION_DAYS,
+        help="Days the intermediate S3 objects of a finished batch are kept"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print what would be deleted"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    client = initialize_openai_client()
+    results = run_for_tenants(lambda: cleanup_batches(
+        client, args.openai_retention_days, args.s3_retention_days,
+        args.dry_run
+    ))
+    sys.exit(0 if results and None not in results.values() else 1)
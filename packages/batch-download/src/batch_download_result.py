@@ -4,31 +4,52 @@ Batch download module for retrieving and processing OpenAI batch results.
 This module handles downloading completed batch results from OpenAI,
 processing the responses, and uploading the generated horoscopes to S3.
 It checks for pending batches, waits for their completion, and updates
-their status in the control file.
+their status in the control file. Requests that failed within a batch are
+resubmitted as a smaller retry batch. Progress through a result file is
+checkpointed, so an interrupted run resumes where it stopped. With
+``DOWNLOAD_LEASING`` several download workers can share a batch by leasing
+byte ranges of its result file. Every tenant is processed in one run; with
+``ASYNC_IO`` the pending batches of all tenants are polled, downloaded and
+published concurrently on asyncio. At the end of a run the files of
+finished batches are cleaned up and the control file is compacted. The
+processing of a batch lives in ``download_utils`` and, for asyncio,
+``async_download_utils``.
 """
 
-import datetime
-import json
+import asyncio
+import functools
 import os
 import sys
-from typing import Any, Dict, Optional
-
-from openai import OpenAIError
 
 from shared.config import (
+    ASYNC_IO,
+    CLEANUP_ENABLED,
+    CONTROL_RETENTION_DAYS,
     ENABLE_FILE_LOGGING,
-    HOROSCOPE_PREFIX,
     RESULT_DIR,
-    STATUS_COMPLETED,
-    STATUS_FAILED,
 )
+from shared.utils.async_download_utils import process_batch_async
+from shared.utils.cleanup_utils import cleanup_batches
 from shared.utils.control_file_utils import (
+    compact_control_data,
     get_pending_batches,
-    update_batch_status,
+)
+from shared.utils.download_utils import process_batch
+from shared.utils.event_utils import (
+    EVENT_FAILED,
+    EVENT_SUCCEEDED,
+    publish_stage_event,
 )
 from shared.utils.logging_utils import add_file_handler, configure_logger
-from shared.utils.openai_utils import initialize_openai_client
-from shared.utils.s3_utils import upload_json_to_s3
+from shared.utils.metrics_utils import flush_metrics, span
+from shared.utils.openai_utils import (
+    initialize_async_openai_client,
+    initialize_openai_client,
+    process_batches_concurrently,
+)
+from shared.utils.profiling_utils import profile_stage
+from shared.utils.schedule_utils import sort_by_deadline
+from shared.utils.scheduler_utils import run_for_tenants, run_for_tenants_async
 
 # Configure logger
 logger = configure_logger('batch_download')
@@ -38,211 +59,102 @@ if ENABLE_FILE_LOGGING:
 # Ensure result directory exists
 os.makedirs(RESULT_DIR, exist_ok=True)
 
-# OpenAI batch status constants
-BATCH_STATUS_COMPLETED = "completed"
-BATCH_STATUS_FAILED = "failed"
-BATCH_STATUS_IN_PROGRESS = "in_progress"
-BATCH_POLL_INTERVAL = 60  # seconds
-
 # ---- Clients ----
 # Initialize OpenAI client
 client = initialize_openai_client()
 
 
-# ---- Helpers ----
-def check_batch_completion(batch_id: str) -> Optional[Any]:
+# ---- Main Logic ----
+def process_pending_batches() -> bool:
     """
-    Check an OpenAI batch to complete or fail.
+    Process all pending batches from the control file.
 
-    Args:
-        batch_id (str): The ID of the batch to check.
+    Retrieves all batches with 'submitted' status, checks if they have
+    reached a terminal status, downloads and processes their (possibly
+    partial) results, and records the terminal status in the control file.
+    Batches are processed earliest delivery deadline first. A batch whose
+    result files cannot be fetched stays submitted and is tried again by
+    the next run.
 
     Returns:
-        object: The batch object if completed or failed, None otherwise.
+        bool: True if at least one batch was successfully processed or
+              if there were no pending batches, False otherwise.
     """
     try:
-        batch = client.batches.retrieve(batch_id)
+        pending_batches = sort_by_deadline(get_pending_batches())
 
-        if batch.status in [BATCH_STATUS_COMPLETED, BATCH_STATUS_FAILED]:
-            logger.info(f"Batch {batch_id} status: {batch.status}")
-            return batch
+        if not pending_batches:
+            logger.info("No pending batches found.")
+            return True
 
+        logger.info(f"Found {len(pending_batches)} pending batches to process")
+
+        success_count = sum(
+            1 for batch_info in pending_batches
+            if process_batch(client, batch_info)
+        )
         logger.info(
-            f"Batch {batch_id} is still {batch.status}. "
-            f"Will check again later."
+            f"Successfully processed {success_count} out of "
+            f"{len(pending_batches)} batches"
         )
-        return None
-    except OpenAIError as e:
-        logger.error(f"Error retrieving batch {batch_id}: {str(e)}")
-        return None
-
-
-def download_and_upload_results(
-        batch: Any, batch_info: Dict[str, Any]
-) -> bool:
-    """
-    Download batch results from OpenAI and upload processed horoscopes to S3.
-
-    Args:
-        batch (object): The OpenAI batch object containing result information.
-        batch_info (dict): Information about the batch from the control file.
-
-    Returns:
-        bool: True if processing was successful, False otherwise.
-    """
-    try:
-        target_date = batch_info["target_date"]
-        result_file_id = batch.output_file_id
-
-        if not result_file_id:
-            logger.error("No result file found in batch.")
-            return False
-
-        logger.info(f"Downloading result file: {result_file_id}")
-
-        # Extract result text to a separate function to reduce local variables
-        result_text = _download_result_file(result_file_id)
-        if result_text is None:
-            return False
-
-        # Process results in a separate function
-        return _process_results(result_text, target_date)
+        return success_count > 0
 
     except Exception as e:
-        logger.error(
-            f"Unexpected error in download_and_upload_results: {str(e)}"
-        )
+        logger.error(f"Unexpected error in process_pending_batches: {str(e)}")
         return False
 
 
-def _download_result_file(result_file_id: str) -> Optional[Any]:
-    """Download the result file from OpenAI."""
-    try:
-        result = client.files.content(result_file_id)
-        return result.text
-    except OpenAIError as e:
-        logger.error(f"Failed to download result file: {str(e)}")
-        return None
-
-
-def _process_results(result_text: str, target_date: str) -> bool:
-    """Process the results and upload horoscopes to S3."""
-    lines = result_text.splitlines()
-    success_count = 0
-    total_count = len(lines)
-
-    for line in lines:
-        try:
-            item = json.loads(line)
-            name = item.get("custom_id", "unknown").replace(" ", "_")
-
-            # Extract output from nested structure
-            choices = (
-                item.get("response", {}).get("body", {}).get("choices", [{}])
-            )
-            output = (
-                choices[0].get("message", {}).get("content", "")
-                if choices
-                else ""
-            )
-
-            if not output:
-                logger.warning(f"Empty or invalid response for {name}")
-                continue
-
-            data = {
-                "name": name,
-                "sign": "",  # Could extract from prompt if needed
-                "horoscope": output.strip()
-            }
-
-            key = f"{HOROSCOPE_PREFIX}/{target_date}/{name}.json".lower()
-
-            # Upload to S3
-            if upload_json_to_s3(key, data):
-                logger.info(f"Uploaded horoscope for {name}")
-                success_count += 1
-            else:
-                logger.error(f"Failed to upload horoscope for {name}")
-
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse result line: {str(e)}")
-
-    logger.info(
-        f"Successfully processed {success_count} "
-        f"out of {total_count} results"
-    )
-    return success_count > 0
-
-
-# ---- Main Logic ----
-def process_pending_batches() -> bool:
+# ---- Async I/O ----
+async def process_pending_batches_async() -> bool:
     """
-    Process all pending batches from the control file.
+    Asyncio variant of ``process_pending_batches``.
 
-    Retrieves all batches with 'submitted' status, checks if they are
-    completed, downloads and processes their results, and updates their
-    status in the control file.
+    All pending batches are polled and processed concurrently, so one
+    batch's download overlaps another's polling and publishing. At most
+    ``OPENAI_MAX_CONCURRENCY`` OpenAI and ``S3_MAX_CONCURRENCY`` S3
+    requests of all tenants are in flight at a time; batches with earlier
+    delivery deadlines are started first and get those slots first.
 
     Returns:
         bool: True if at least one batch was successfully processed or
               if there were no pending batches, False otherwise.
     """
     try:
-        pending_batches = get_pending_batches()
-
+        pending_batches = sort_by_deadline(get_pending_batches())
         if not pending_batches:
             logger.info("No pending batches found.")
             return True
 
-        logger.info(f"Found {len(pending_batches)} pending batches to process")
-
-        success_count = 0
-        for batch_info in pending_batches:
-            batch_id = batch_info["batch_id"]
-            logger.info(f"Processing batch: {batch_id}")
-
-            openai_batch_id = batch_info["openai_batch_id"]
-            batch = check_batch_completion(openai_batch_id)
-            if batch is None:
-                logger.info(f"Batch {batch_id} not ready for processing yet")
-                continue
-
-            # Update batch status in control data
-            if batch.status == BATCH_STATUS_COMPLETED:
-                success = download_and_upload_results(batch, batch_info)
-                new_status = STATUS_COMPLETED if success else STATUS_FAILED
-                if success:
-                    success_count += 1
-            else:
-                new_status = STATUS_FAILED
-
-            # Use update_batch_status instead of direct update
-            additional_data = {
-                "completed_at": datetime.datetime.now(
-                    datetime.timezone.utc
-                ).isoformat()
-            }
-            update_success = update_batch_status(
-                batch_id=batch_id,
-                new_status=new_status,
-                additional_data=additional_data
-            )
-
-            if not update_success:
-                logger.warning(f"Failed to update status for batch {batch_id}")
-
         logger.info(
-            f"Successfully processed {success_count} out of "
-            f"{len(pending_batches)} batches"
+            f"Processing {len(pending_batches)} pending batches concurrently"
+        )
+        success_count = await process_batches_concurrently(
+            initialize_async_openai_client(),
+            functools.partial(process_batch_async, client),
+            pending_batches
         )
         return success_count > 0
 
     except Exception as e:
-        logger.error(f"Unexpected error in process_pending_batches: {str(e)}")
+        logger.error(
+            f"Unexpected error in process_pending_batches_async: {str(e)}"
+        )
         return False
 
 
 if __name__ == "__main__":
-    ready = process_pending_batches()
+    with profile_stage("download"), span("StageRun"):
+        results = (
+            asyncio.run(run_for_tenants_async(process_pending_batches_async))
+            if ASYNC_IO else run_for_tenants(process_pending_batches)
+        )
+        ready = any((results or {}).values())
+        if CLEANUP_ENABLED:
+            with span("BatchCleanup"):
+                run_for_tenants(lambda: cleanup_batches(client))
+        if CONTROL_RETENTION_DAYS > 0:
+            with span("ControlCompaction"):
+                run_for_tenants(compact_control_data)
+    flush_metrics("download")
+    publish_stage_event("download", EVENT_SUCCEEDED if ready else EVENT_FAILED)
     sys.exit(0 if ready else 1)
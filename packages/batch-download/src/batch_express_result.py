@@ -0,0 +1,424 @@
+"""
+Express module for generating horoscopes through real-time Chat Completions.
+
+This module is the fallback for riders that cannot wait for the 24h Batch
+API window, such as riders added after preparation or batches that failed
+close to their deadline. It handles:
+1. Loading a prepared JSONL file (or a subset of its requests) from S3
+2. Sending the requests through a rate-limited asyncio worker pool
+3. Converting the responses into the Batch API output line format
+4. Publishing the horoscopes concurrently through the same path as batch
+   results
+5. Updating batch status in the control file
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from openai import AsyncOpenAI, OpenAIError
+
+from shared.config import (
+    ENABLE_FILE_LOGGING,
+    EXPRESS_CONCURRENCY,
+    EXPRESS_MAX_RPM,
+    EXPRESS_MAX_TPM,
+    RESULT_DIR,
+    STATUS_COMPLETED,
+    STATUS_SUBMITTED,
+)
+from shared.utils.control_file_utils import (
+    get_batch_by_id,
+    update_batch_status,
+)
+from shared.utils.logging_utils import add_file_handler, configure_logger
+from shared.utils.manifest_utils import load_manifest
+from shared.utils.metrics_utils import flush_metrics, record_timing, span
+from shared.utils.openai_utils import initialize_async_openai_client
+from shared.utils.profiling_utils import profile_stage
+from shared.utils.rate_limit_utils import TokenBucket, estimate_request_tokens
+from shared.utils.resilience_utils import OPENAI_GUARD, CircuitOpenError
+from shared.utils.result_utils import ResultTally, process_results_async
+from shared.utils.s3_utils import download_file_from_s3
+from shared.utils.scheduler_utils import (
+    add_tenant_argument,
+    cli_tenant_context,
+)
+
+# Configure logger
+logger = configure_logger('batch_express')
+if ENABLE_FILE_LOGGING:
+    add_file_handler(logger)
+
+
+# ---- Helpers ----
+def load_requests(
+    s3_key: str, custom_ids: Optional[Set[str]] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Load batch requests from a prepared JSONL file in S3.
+
+    Args:
+        s3_key (str): The S3 key of the prepared JSONL file.
+        custom_ids (set, optional): If given, only requests with one of these
+            custom IDs are returned.
+
+    Returns:
+        list: The request dictionaries, or None if the file can't be loaded.
+    """
+    local_path = os.path.join(RESULT_DIR, os.path.basename(s3_key))
+    if not download_file_from_s3(s3_key, local_path):
+        logger.error(f"Failed to download file from S3: {s3_key}")
+        return None
+
+    requests = []
+    try:
+        with open(local_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                if custom_ids and request.get("custom_id") not in custom_ids:
+                    continue
+                requests.append(request)
+    except (IOError, json.JSONDecodeError) as e:
+        logger.error(f"Failed to read requests from {local_path}: {str(e)}")
+        return None
+
+    logger.info(f"Loaded {len(requests)} requests from {s3_key}")
+    return requests
+
+
+async def _complete_request(
+    client: AsyncOpenAI,
+    request: Dict[str, Any],
+    rpm_bucket: TokenBucket,
+    tpm_bucket: TokenBucket
+) -> Dict[str, Any]:
+    """
+    Run one batch request through Chat Completions.
+
+    Args:
+        client (AsyncOpenAI): The asynchronous OpenAI client.
+        request (dict): The batch request line (custom_id, body, ...).
+        rpm_bucket (TokenBucket): The requests-per-minute limiter.
+        tpm_bucket (TokenBucket): The tokens-per-minute limiter.
+
+    Returns:
+        dict: A result line in the Batch API output format.
+    """
+    custom_id = request.get("custom_id")
+    body = request.get("body", {})
+
+    waited = await rpm_bucket.acquire(1)
+    waited += await tpm_bucket.acquire(estimate_request_tokens(body))
+    record_timing("RateLimitWait", waited * 1000)
+
+    try:
+        with span("OpenAIChatCompletion"):
+            completion = await OPENAI_GUARD.call_async(
+                lambda: client.chat.completions.create(**body),
+                idempotent=False
+            )
+        return {
+            "id": f"express_{completion.id}",
+            "custom_id": custom_id,
+            "response": {
+                "status_code": 200,
+                "request_id": completion.id,
+                "body": completion.model_dump()
+            },
+            "error": None
+        }
+    except (OpenAIError, CircuitOpenError) as e:
+        logger.error(f"Chat completion failed for {custom_id}: {str(e)}")
+        return {
+            "id": None,
+            "custom_id": custom_id,
+            "response": None,
+            "error": {"code": type(e).__name__, "message": str(e)}
+        }
+
+
+async def run_express_requests(
+    requests: List[Dict[str, Any]],
+    concurrency: int = EXPRESS_CONCURRENCY
+) -> List[Dict[str, Any]]:
+    """
+    Run requests through a rate-limited pool of asyncio workers.
+
+    Args:
+        requests (list): The batch request lines to run.
+        concurrency (int): The number of concurrent workers.
+
+    Returns:
+        list: Result lines in the Batch API output format.
+    """
+    client = initialize_async_openai_client()
+    rpm_bucket = TokenBucket(EXPRESS_MAX_RPM)
+    tpm_bucket = TokenBucket(EXPRESS_MAX_TPM)
+
+    queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    results: List[Dict[str, Any]] = []
+
+    async def worker() -> None:
+        """Take requests off the queue until it is empty."""
+        while True:
+            try:
+                request = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.append(
+                await _complete_request(
+                    client, request, rpm_bucket, tpm_bucket
+                )
+            )
+
+    workers = max(1, min(concurrency, len(requests)))
+    logger.info(
+        f"Running {len(requests)} requests with {workers} workers "
+        f"(RPM={EXPRESS_MAX_RPM}, TPM={EXPRESS_MAX_TPM})"
+    )
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        await client.close()
+
+    return results
+
+
+def _resolve_input(
+    batch_id: Optional[str],
+    input_key: Optional[str],
+    target_date: Optional[str],
+    manifest_key: Optional[str]
+) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Resolve input file, target date and manifest from a batch or args."""
+    if batch_id:
+        batch_info = get_batch_by_id(batch_id)
+        if batch_info is None:
+            return None, None, None
+        return (
+            batch_info["input_file"],
+            batch_info["target_date"],
+            batch_info.get("manifest_file")
+        )
+    return input_key, target_date, manifest_key
+
+
+def _publish_results(
+    results: List[Dict[str, Any]],
+    target_date: str,
+    manifest_key: Optional[str]
+) -> Tuple[bool, Dict[str, int]]:
+    """
+    Publish the horoscopes of express results.
+
+    Returns:
+        tuple: (success, usage) where success is True if at least one
+               horoscope was published and usage is the summed token usage.
+    """
+    result_text = "\n".join(json.dumps(result) for result in results)
+    manifest = load_manifest(manifest_key) if manifest_key else None
+    tally = ResultTally.empty()
+    success = asyncio.run(process_results_async(
+        result_text, target_date, manifest=manifest, tally=tally
+    ))
+    return success, tally.usage
+
+
+def _release_openai_batch(batch_id: str) -> bool:
+    """
+    Cancel the OpenAI batch of a batch that is still submitted.
+
+    Returns:
+        bool: True if the batch is not running on OpenAI (any more). If it
+              cannot be cancelled it is left for the download stage.
+    """
+    batch_info = get_batch_by_id(batch_id)
+    if batch_info is None or batch_info.get("status") != STATUS_SUBMITTED \
+            or not batch_info.get("openai_batch_id"):
+        return True
+    if not asyncio.run(_cancel_openai_batch(batch_info["openai_batch_id"])):
+        logger.error(
+            f"Batch {batch_id} is still running on OpenAI, leaving it for "
+            f"the download stage"
+        )
+        return False
+    return True
+
+
+async def _cancel_openai_batch(openai_batch_id: str) -> bool:
+    """Cancel a batch on OpenAI; return True on success."""
+    client = initialize_async_openai_client()
+    try:
+        with span("OpenAIBatchCancel"):
+            await OPENAI_GUARD.call_async(
+                lambda: client.batches.cancel(openai_batch_id)
+            )
+    except (OpenAIError, CircuitOpenError) as e:
+        logger.error(f"Error cancelling batch {openai_batch_id}: {str(e)}")
+        return False
+    finally:
+        await client.close()
+    logger.info(f"Cancelled OpenAI batch {openai_batch_id}")
+    return True
+
+
+def _mark_completed(batch_id: str) -> bool:
+    """
+    Mark a batch completed by express mode before its results are published.
+
+    Returns:
+        bool: True if the control file was updated, False if the update was
+              rejected or failed, in which case nothing may be published.
+    """
+    if update_batch_status(
+        batch_id=batch_id,
+        new_status=STATUS_COMPLETED,
+        additional_data={
+            "mode": "express",
+            "completed_at": datetime.datetime.now(
+                datetime.timezone.utc
+            ).isoformat()
+        }
+    ):
+        return True
+    logger.error(
+        f"Could not mark batch {batch_id} completed, not publishing its "
+        f"express results"
+    )
+    return False
+
+
+def _record_express_usage(
+    batch_id: str, success: bool, usage: Dict[str, int]
+) -> None:
+    """Record the usage of a completed express batch in the control file."""
+    if not success:
+        logger.error(
+            f"Batch {batch_id} is marked completed but no horoscope was "
+            f"published; run express mode for it again"
+        )
+    if not update_batch_status(
+        batch_id=batch_id, additional_data={"usage": usage}
+    ):
+        logger.warning(f"Failed to record the usage of batch {batch_id}")
+
+
+# ---- Main Logic ----
+def process_express(
+    batch_id: Optional[str] = None,
+    input_key: Optional[str] = None,
+    target_date: Optional[str] = None,
+    custom_ids: Optional[Set[str]] = None,
+    manifest_key: Optional[str] = None
+) -> bool:
+    """
+    Generate horoscopes for a prepared JSONL file in real time.
+
+    Either ``batch_id`` (a batch in the control file) or both ``input_key``
+    and ``target_date`` must be given. When a whole batch is run, a batch
+    still submitted to OpenAI is cancelled there first; if that fails the
+    batch is left for the download stage. If every request succeeds, the
+    batch is marked as completed before its results are published, and
+    nothing is published if the control file rejects the update.
+
+    Args:
+        batch_id (str, optional): The control file ID of the batch to run.
+        input_key (str, optional): The S3 key of a prepared JSONL file.
+        target_date (str, optional): The target date for ``input_key``.
+        custom_ids (set, optional): Restrict the run to these custom IDs.
+        manifest_key (str, optional): The S3 key of the rider manifest for
+            ``input_key``.
+
+    Returns:
+        bool: True if at least one horoscope was published, False otherwise.
+    """
+    try:
+        input_file, resolved_date, resolved_manifest = _resolve_input(
+            batch_id, input_key, target_date, manifest_key
+        )
+        if not input_file or not resolved_date:
+            logger.error(
+                "Either a known batch ID or an input key and target date "
+                "must be provided"
+            )
+            return False
+
+        requests = load_requests(input_file, custom_ids)
+        if not requests:
+            logger.info("No requests to run in express mode.")
+            return False
+
+        # Only a run of a whole batch completes it
+        completing = batch_id if not custom_ids else None
+        if completing and not _release_openai_batch(completing):
+            return False
+
+        results = asyncio.run(run_express_requests(requests))
+        failed_count = sum(1 for result in results if result["error"])
+        logger.info(
+            f"Express run finished: {len(results) - failed_count} succeeded, "
+            f"{failed_count} failed"
+        )
+
+        if completing and failed_count == 0:
+            if not _mark_completed(completing):
+                return False
+        else:
+            completing = None
+
+        success, usage = _publish_results(
+            results, resolved_date, resolved_manifest
+        )
+        if completing:
+            _record_express_usage(completing, success, usage)
+        return success
+
+    except Exception as e:
+        logger.error(f"Unexpected error in process_express: {str(e)}")
+        return False
+
+
+def _parse_args() -> argparse.Namespace:
+    """Parse command line arguments for the express entry point."""
+    parser = argparse.ArgumentParser(
+        description="Generate horoscopes through real-time Chat Completions."
+    )
+    parser.add_argument("--batch-id", help="Control file batch ID to run")
+    parser.add_argument("--input-key", help="S3 key of a prepared JSONL file")
+    parser.add_argument("--target-date", help="Target date for --input-key")
+    parser.add_argument(
+        "--manifest-key", help="S3 key of the rider manifest for --input-key"
+    )
+    parser.add_argument(
+        "--custom-id",
+        action="append",
+        dest="custom_ids",
+        help="Only run this custom ID (may be repeated)"
+    )
+    add_tenant_argument(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    with profile_stage("express"), span("StageRun"), \
+            cli_tenant_context(args.tenant):
+        published = process_express(
+            batch_id=args.batch_id,
+            input_key=args.input_key,
+            target_date=args.target_date,
+            custom_ids=set(args.custom_ids) if args.custom_ids else None,
+            manifest_key=args.manifest_key
+        )
+    flush_metrics("express")
+    sys.exit(0 if published else 1)
@@ -0,0 +1,79 @@
+"""
+Control-file compaction module.
+
+This module keeps the batch control file small by moving terminal batches
+older than the retention window to date-partitioned archive objects, and
+lets operators look up archived batches. It handles:
+1. Archiving completed, failed, expired and cancelled batches
+2. Querying the archives by target date, status or batch ID
+
+The download stage also compacts the control file at the end of each run,
+so this entry point is only needed for manual runs and archive queries.
+"""
+
+import argparse
+import json
+import sys
+
+from shared.config import CONTROL_RETENTION_DAYS, ENABLE_FILE_LOGGING
+from shared.utils.control_file_utils import (
+    compact_control_data,
+    query_archived_batches,
+)
+from shared.utils.logging_utils import add_file_handler, configure_logger
+from shared.utils.scheduler_utils import (
+    add_tenant_argument,
+    cli_tenant_context,
+    run_for_tenants,
+)
+
+# Configure logger
+logger = configure_logger('control_compaction')
+if ENABLE_FILE_LOGGING:
+    add_file_handler(logger)
+
+
+def _parse_args() -> argparse.Namespace:
+    """Parse command line arguments for the compaction entry point."""
+    parser = argparse.ArgumentParser(
+        description="Archive old batches from the control file, or query "
+                    "the archives."
+    )
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=CONTROL_RETENTION_DAYS,
+        help="Days a terminal batch stays in the control file"
+    )
+    parser.add_argument(
+        "--query-from",
+        help="Print archived batches from this target date (YYYY-MM-DD) "
+             "instead of compacting"
+    )
+    parser.add_argument(
+        "--query-to",
+        help="Last target date of the query (defaults to --query-from)"
+    )
+    parser.add_argument("--status", help="Only print batches in this status")
+    parser.add_argument("--batch-id", help="Only print this batch")
+    add_tenant_argument(
+        parser,
+        "Tenant ID to query (required when several tenants are configured)"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.query_from:
+        with cli_tenant_context(args.tenant):
+            for batch in query_archived_batches(
+                args.query_from,
+                args.query_to,
+                status=args.status,
+                batch_id=args.batch_id
+            ):
+                print(json.dumps(batch.to_dict()))
+    else:
+        run_for_tenants(lambda: compact_control_data(args.retention_days))
+    sys.exit(0)
@@ -0,0 +1,183 @@
+"""
+Batch planner report module.
+
+This module prints the latency model the prepare stage plans batches with:
+1. The batch history it was fitted to and how well earlier predictions
+   matched the actual time-to-publish
+2. The fitted time-to-publish per batch size and the factor of every
+   submission hour
+3. Predictions for a range of batch sizes, and the shard count and
+   submission time the planner would pick for a roster of a given size
+"""
+
+import argparse
+import math
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Mapping, Optional, Sequence
+
+from shared.config import ENABLE_FILE_LOGGING, PLANNER_HISTORY_DAYS
+from shared.utils.logging_utils import add_file_handler, configure_logger
+from shared.utils.planner_utils import (
+    LatencyModel,
+    fit_latency_model,
+    history_samples,
+    load_history,
+    plan_shards,
+    plan_submission,
+)
+from shared.utils.scheduler_utils import (
+    add_tenant_argument,
+    cli_tenant_context,
+)
+
+# Configure logger
+logger = configure_logger('batch_planner')
+if ENABLE_FILE_LOGGING:
+    add_file_handler(logger)
+
+
+def _duration(seconds: float) -> str:
+    """Format seconds as hours and minutes."""
+    minutes = int(round(seconds / 60))
+    return f"{minutes // 60}h{minutes % 60:02d}m"
+
+
+def _prediction_error(batches: Sequence[Mapping[str, Any]]) -> List[str]:
+    """Report the error of the predictions recorded in completed batches."""
+    pairs = []
+    for batch in batches:
+        if batch.get("predicted_seconds") is None:
+            continue
+        samples = history_samples([batch])
+        if samples:
+            pairs.append((float(batch["predicted_seconds"]), samples[0]))
+    if not pairs:
+        return ["  no completed batch has a recorded prediction yet"]
+    error = sum(abs(p - s.seconds) for p, s in pairs) / len(pairs)
+    bias = sum(p - s.seconds for p, s in pairs) / len(pairs)
+    return [
+        f"  {len(pairs)} planned batches: mean absolute error "
+        f"{_duration(error)}, mean bias {bias / 60:+.0f} min"
+    ]
+
+
+def _prediction_lines(
+    model: LatencyModel, sizes: List[int], now: datetime
+) -> List[str]:
+    """Predict the time-to-publish of each batch size submitted ``now``."""
+    lines = [f"Time-to-publish if submitted at {now:%H:%M} UTC:"]
+    for size in sizes:
+        best = plan_submission(model, size, now)
+        best_text = (
+            f", or {_duration(model.predict(size, best))} "
+            f"submitted at {best:%H:%M} UTC"
+            if best != now else ""
+        )
+        lines.append(
+            f"  {size:>7,} requests: "
+            f"{_duration(model.predict(size, now))}{best_text}"
+        )
+    return lines
+
+
+def _roster_plan(model: LatencyModel, riders: int, now: datetime) -> str:
+    """Describe the batches the planner would create for ``riders``."""
+    shards = plan_shards(model, riders, now)
+    size = math.ceil(riders / shards)
+    submit_at = plan_submission(model, size, now)
+    publish_at = submit_at + timedelta(seconds=model.predict(size, submit_at))
+    return (
+        f"Plan for {riders:,} riders: {shards} batches of up to "
+        f"{size:,} requests, submitted at {submit_at:%H:%M} UTC, "
+        f"published around {publish_at:%Y-%m-%d %H:%M} UTC"
+    )
+
+
+def planner_report(
+    batches: Sequence[Mapping[str, Any]],
+    model: Optional[LatencyModel],
+    sizes: List[int],
+    riders: Optional[int],
+    now: datetime
+) -> List[str]:
+    """
+    Build the lines of the planner report.
+
+    Args:
+        batches (list): The batch history.
+        model (LatencyModel, optional): The model fitted to the latency
+            samples of ``batches``.
+        sizes (list): Batch sizes to predict the time-to-publish of.
+        riders (int, optional): A roster size to plan batches for.
+        now (datetime): The submission time of the predictions.
+
+    Returns:
+        list: The report lines.
+    """
+    samples = history_samples(batches)
+    lines = [f"History: {len(batches)} batches, {len(samples)} samples"]
+    if model is None:
+        lines.append("Not enough completed batches to fit a model")
+        return lines
+
+    lines += [
+        "",
+        f"Model: {_duration(model.intercept)} + "
+        f"{model.slope * 1000 / 60:.1f} min per 1000 requests",
+        "Submission hour factors (UTC hour: factor, samples):",
+    ]
+    counts = [0] * 24
+    for sample in samples:
+        counts[sample.submitted_at.hour] += 1
+    for hour in range(0, 24, 6):
+        lines.append("  " + "  ".join(
+            f"{h:02d}: {model.hourly[h]:.2f} ({counts[h]})"
+            for h in range(hour, hour + 6)
+        ))
+
+    lines += ["", "Prediction accuracy:"] + _prediction_error(batches)
+    lines += [""] + _prediction_lines(model, sizes, now)
+    if riders:
+        lines += ["", _roster_plan(model, riders, now)]
+    return lines
+
+
+def _parse_args() -> argparse.Namespace:
+    """Parse command line arguments for the planner report."""
+    parser = argparse.ArgumentParser(
+        description="Print the batch latency model and its predictions."
+    )
+    parser.add_argument(
+        "--history-days",
+        type=int,
+        default=PLANNER_HISTORY_DAYS,
+        help="Days of archived batches to fit the model to"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="1000,5000,10000,25000,50000",
+        help="Comma-separated batch sizes to predict"
+    )
+    parser.add_argument(
+        "--riders",
+        type=int,
+        help="Plan the batches of a roster with this many riders"
+    )
+    add_tenant_argument(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    with cli_tenant_context(args.tenant):
+        history = load_history(args.history_days)
+    report = planner_report(
+        history,
+        fit_latency_model(history_samples(history)),
+        [int(size) for size in args.sizes.split(",") if size],
+        args.riders,
+        datetime.now(timezone.utc)
+    )
+    print("\n".join(report))
+    sys.exit(0)
@@ -2,34 +2,99 @@
 Batch preparation module for generating OpenAI input files.
 
 This module prepares JSONL files for OpenAI batch processing by:
-1. Loading rider information from S3
-2. Generating personalized horoscope prompts for each rider
-3. Creating a JSONL file with the prompts
-4. Uploading the file to S3
-5. Creating a batch entry in the control file
+1. Loading rider information from S3 (JSON, Arrow IPC or Parquet roster),
+   for every tenant in turn
+2. Generating personalized horoscope prompts for each rider, for each of
+   the next ``LOOKAHEAD_DAYS`` days that has no batch yet, with the
+   constant instructions ahead of the rider's details (``PROMPT_LAYOUT``)
+3. Creating JSONL files with the prompts and rider manifests, partitioned
+   by the riders' delivery deadlines and split into batches of at most
+   ``MAX_REQUESTS_PER_BATCH`` requests
+4. Uploading the files to S3
+5. Creating a batch entry per file in the control file
 """
 
+import argparse
 import json
+import math
 import sys
+import time
 import uuid
-from datetime import date, datetime, timedelta
-from typing import Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
 from shared.config import (
+    BATCH_TOKEN_BUDGET,
     ENABLE_FILE_LOGGING,
+    LOOKAHEAD_DAYS,
+    MAX_REQUESTS_PER_BATCH,
     OPENAI_INPUT_FILE,
+    OPENAI_MAX_TOKENS,
     OUTPUT_PREFIX,
-    RIDERS_FILE,
+    PROMPT_LAYOUT,
+)
+from shared.utils.control_file_utils import (
+    create_batches,
+    get_scheduled_target_dates,
+)
+from shared.utils.event_utils import (
+    EVENT_FAILED,
+    EVENT_SUCCEEDED,
+    publish_stage_event,
 )
-from shared.utils.control_file_utils import create_batch
 from shared.utils.logging_utils import add_file_handler, configure_logger
-from shared.utils.s3_utils import download_json_from_s3, upload_file_to_s3
+from shared.utils.manifest_utils import (
+    ManifestEntry,
+    custom_id_for,
+    derive_rider_id,
+    manifest_key_for,
+    save_manifest,
+)
+from shared.utils.metrics_utils import (
+    flush_metrics,
+    increment,
+    record_timing,
+    span,
+)
+from shared.utils.planner_utils import (
+    LatencyModel,
+    load_latency_model,
+    plan_shards,
+    plan_submission,
+)
+from shared.utils.profiling_utils import profile_stage
+from shared.utils.rate_limit_utils import estimate_prompt_tokens
+from shared.utils.roster_utils import load_roster
+from shared.utils.s3_utils import upload_file_to_s3
+from shared.utils.schedule_utils import partition_by_deadline
+from shared.utils.scheduler_utils import run_for_tenants
+from shared.utils.tenant_utils import current_tenant, tenant_key
 
 # Configure logger
 logger = configure_logger('batch_prepare')
 if ENABLE_FILE_LOGGING:
     add_file_handler(logger)
 
+# Prompt layouts: constant instructions first, so they form a prefix shared
+# by all requests that OpenAI's prompt caching can reuse, or the original
+# prompt with the rider's details at its start
+PROMPT_LAYOUT_STATIC_FIRST = "static-first"
+PROMPT_LAYOUT_INLINE = "inline"
+
+SYSTEM_PROMPT = (
+    "You are a friendly, creative and professional horoscope writer."
+)
+INSTRUCTIONS = (
+    "Write a daily horoscope for the rider, zodiac sign and date given in "
+    "the user message. Make it friendly, encouraging, personalized and a "
+    "little bit mystical. Do not include astrological terms. Keep it under "
+    "3 sentences and feel free to use some cycling jargon, but not too "
+    "much. Don't forget some advice for personal life or for race "
+    "recovery, maybe some improvement in technical setup or strategic "
+    "planning or nutrition."
+)
+
 
 # ---- Helpers ----
 def get_zodiac_sign(birthdate: str) -> str:
@@ -63,123 +128,493 @@ def get_zodiac_sign(birthdate: str) -> str:
         return "Unknown"
 
 
-# ---- Main Logic ----
-def generate_jsonl() -> Tuple[Optional[str], Optional[str]]:
+def assign_zodiac_signs(birth_dates: Sequence[str]) -> List[str]:
+    """
+    Determine the zodiac sign of every birthdate in a roster column.
+
+    Each distinct birthdate is parsed only once, so a large roster needs one
+    date parse per distinct birthdate rather than one per rider.
+
+    Args:
+        birth_dates (Sequence[str]): Birthdates in ISO ``YYYY-MM-DD`` format.
+
+    Returns:
+        list: The zodiac sign of each birthdate, in order.
+    """
+    signs: Dict[str, str] = {}
+    for birthdate in birth_dates:
+        if birthdate not in signs:
+            signs[birthdate] = get_zodiac_sign(birthdate)
+    return [signs[birthdate] for birthdate in birth_dates]
+
+
+def lookahead_dates(days: int, start: Optional[date] = None) -> List[str]:
+    """
+    Return the target dates of a lookahead run.
+
+    Args:
+        days (int): The number of days to prepare; at least one.
+        start (date, optional): The day of the run. Defaults to today.
+
+    Returns:
+        list: The ``days`` dates after ``start``, as ISO strings.
+    """
+    start = start or date.today()
+    return [
+        (start + timedelta(days=offset)).isoformat()
+        for offset in range(1, max(days, 1) + 1)
+    ]
+
+
+def shard_bounds(count: int, max_requests: int) -> List[Tuple[int, int]]:
+    """
+    Split ``count`` riders into batches of at most ``max_requests``.
+
+    The shards are as even as possible, so the last one is not a
+    straggler.
+
+    Returns:
+        list: (start, end) index pairs, end exclusive.
+    """
+    shards = max(-(-count // max(max_requests, 1)), 1)
+    size, extra = divmod(count, shards)
+    bounds = []
+    start = 0
+    for shard in range(shards):
+        end = start + size + (1 if shard < extra else 0)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _inline_messages(
+    name: str, sign: str, target_date: str
+) -> List[Dict[str, str]]:
+    """Return the messages with the rider's details inside the prompt."""
+    prompt = (
+        f"Generate a daily horoscope for {name}, whose zodiac "
+        f"sign is {sign}, for the date {target_date}. "
+        f"Make it friendly, encouraging, personalized and a "
+        f"little bit mystical. Do not include astrological "
+        f"terms. Keep it under 3 sentences and feel free to "
+        f"use some cycling jargon, but not too much. "
+        f"Don't forget some advice for personal life or for "
+        f"race recovery, maybe some improvement in "
+        f"technical setup or strategic planning or nutrition. "
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _static_first_messages(
+    name: str, sign: str, target_date: str
+) -> List[Dict[str, str]]:
+    """
+    Return the messages with every constant instruction first.
+
+    The system message is identical for all requests, so the provider can
+    serve it from its prompt cache; the date, sign and name follow, in
+    order of how many requests share them.
+    """
+    return [
+        {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{INSTRUCTIONS}"},
+        {
+            "role": "user",
+            "content": (
+                f"Date: {target_date}\nZodiac sign: {sign}\nRider: {name}"
+            ),
+        },
+    ]
+
+
+def build_request(
+    custom_id: str,
+    name: str,
+    sign: str,
+    target_date: str,
+    layout: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Return the batch request for one rider's horoscope.
+
+    Args:
+        custom_id (str): The request's custom ID.
+        name (str): The rider's name.
+        sign (str): The rider's zodiac sign.
+        target_date (str): The horoscope's date.
+        layout (str, optional): ``static-first`` or ``inline``; defaults to
+            ``PROMPT_LAYOUT``.
+
+    Returns:
+        dict: The JSONL line of the request.
+    """
+    if (layout or PROMPT_LAYOUT) == PROMPT_LAYOUT_INLINE:
+        messages = _inline_messages(name, sign, target_date)
+    else:
+        messages = _static_first_messages(name, sign, target_date)
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": current_tenant().model,
+            "messages": messages,
+            "temperature": 0.8,
+            "max_tokens": OPENAI_MAX_TOKENS
+        }
+    }
+
+
+def fit_token_budget(
+    tokens: Sequence[int], max_requests: int, budget: int = BATCH_TOKEN_BUDGET
+) -> List[Tuple[int, int]]:
     """
-    Generate JSONL file with horoscope prompts for all riders.
+    Split requests into shards that fit the token budget.
+
+    The even split of ``shard_bounds`` is kept when every shard fits.
+    Otherwise the requests are packed in one pass, starting a new shard
+    when the next request would take the current one over ``budget``
+    tokens or ``max_requests`` requests; a request over the budget on
+    its own gets a shard to itself.
 
-    Loads rider data from S3, creates personalized horoscope prompts,
-    writes them to a JSONL file, uploads the file to S3, and creates
-    a batch entry in the control file.
+    Args:
+        tokens (Sequence): The estimated prompt tokens of every request.
+        max_requests (int): The most requests in one shard.
+        budget (int): The most prompt tokens in one batch; 0 disables.
 
     Returns:
-        tuple: (jsonl_key, target_date) if successful, (None, None) otherwise.
+        list: (start, end) index pairs, end exclusive; empty without
+              requests.
+    """
+    if not tokens:
+        return []
+    bounds = shard_bounds(len(tokens), max_requests)
+    if budget <= 0:
+        return bounds
+    totals = [0, *accumulate(tokens)]
+    if all(totals[end] - totals[start] <= budget for start, end in bounds):
+        return bounds
+    oversized = sum(1 for count in tokens if count > budget)
+    if oversized:
+        logger.warning(
+            f"{oversized} requests exceed the token budget of {budget} "
+            "on their own; each gets a shard to itself"
+        )
+    max_requests = max(max_requests, 1)
+    bounds = []
+    start = 0
+    for index in range(1, len(tokens)):
+        if (index - start >= max_requests
+                or totals[index + 1] - totals[start] > budget):
+            bounds.append((start, index))
+            start = index
+    bounds.append((start, len(tokens)))
+    return bounds
+
+
+def _prepare_shard(
+    riders: Sequence[ManifestEntry], target_date: str
+) -> Optional[Tuple[str, str]]:
     """
+    Write and upload the JSONL file and manifest of one batch.
+
+    Args:
+        riders (Sequence): (rider_id, name, sign) of the batch's riders.
+        target_date (str): The date the horoscopes are for.
+
+    Returns:
+        tuple: (jsonl_key, manifest_key), or None if a step failed.
+    """
+    batch_uuid = str(uuid.uuid4())[:8]  # Use first 8 chars of UUID
+    jsonl_key = f"{OUTPUT_PREFIX}/{target_date}-{batch_uuid}.jsonl"
+    manifest_key = manifest_key_for(jsonl_key)
+    manifest: Dict[str, ManifestEntry] = {}
+    logger.info(
+        f"Preparing JSONL for target date: {target_date} "
+        f"with ID: {batch_uuid}"
+    )
+
+    build_started = time.perf_counter()
     try:
-        # Step 1: Load riders list from S3
-        logger.info("Loading riders list from S3...")
-        riders = download_json_from_s3(RIDERS_FILE)
-        if riders is None:
-            logger.error("Failed to load riders list")
-            return None, None
+        with open(OPENAI_INPUT_FILE, "w", encoding="utf-8") as f:
+            for rider_id, name, sign in riders:
+                custom_id = custom_id_for(rider_id)
+                manifest[custom_id] = (rider_id, name, sign)
+                request = build_request(custom_id, name, sign, target_date)
+                f.write(json.dumps(request) + "\n")
+        logger.info(f"Created JSONL with {len(riders)} rider prompts")
+        record_timing(
+            "BuildRequests", (time.perf_counter() - build_started) * 1000
+        )
+        increment("RequestsPrepared", len(riders))
+    except IOError as e:
+        logger.error(f"Failed to create JSONL file: {str(e)}")
+        return None
 
-        logger.info(f"Successfully loaded {len(riders)} riders from S3")
+    logger.info(f"Uploading JSONL to S3: {jsonl_key}")
+    if not upload_file_to_s3(OPENAI_INPUT_FILE, jsonl_key):
+        logger.error("Failed to upload JSONL to S3")
+        return None
 
-        # Step 2: Build prompt entries
-        target_date = (date.today() + timedelta(days=1)).isoformat()
-        # Generate a unique identifier for this batch
-        batch_uuid = str(uuid.uuid4())[:8]  # Use first 8 chars of UUID
-        jsonl_key = f"{OUTPUT_PREFIX}/{target_date}-{batch_uuid}.jsonl"
-        logger.info(
-            f"Preparing JSONL for target date: {target_date} "
-            f"with ID: {batch_uuid}"
+    logger.info(f"Uploading manifest to S3: {manifest_key}")
+    if not save_manifest(manifest_key, manifest):
+        logger.error("Failed to upload manifest to S3")
+        return None
+    return jsonl_key, manifest_key
+
+
+def _plan_partition(
+    model: Optional[LatencyModel], count: int, deadline: datetime
+) -> Dict[str, Any]:
+    """
+    Plan the shard count and submission time of a deadline partition.
+
+    Without a latency model, the partition is split into as few batches as
+    ``MAX_REQUESTS_PER_BATCH`` allows and submitted right away.
+    """
+    now = datetime.now(timezone.utc)
+    plan: Dict[str, Any] = {
+        "now": now,
+        "shards": len(shard_bounds(count, MAX_REQUESTS_PER_BATCH)),
+        "submit_at": now,
+    }
+    if model is not None and count:
+        plan["shards"] = plan_shards(model, count, now)
+        plan["submit_at"] = plan_submission(
+            model, math.ceil(count / plan["shards"]), now, deadline
         )
+    return plan
 
-        try:
-            with open(OPENAI_INPUT_FILE, "w", encoding="utf-8") as f:
-                rider_count = 0
-                for rider in riders:
-                    name = rider["name"].title()  # type: ignore
-                    birthdate = rider["birth_date"]  # type: ignore
-                    sign = get_zodiac_sign(birthdate)
-
-                    prompt = (
-                        f"Generate a daily horoscope for {name}, whose zodiac "
-                        f"sign is {sign}, for the date {target_date}. "
-                        f"Make it friendly, encouraging, personalized and a "
-                        f"little bit mystical. Do not include astrological "
-                        f"terms. Keep it under 3 sentences and feel free to "
-                        f"use some cycling jargon, but not too much. "
-                        f"Don't forget some advice for personal life or for "
-                        f"race recovery, maybe some improvement in "
-                        f"technical setup or strategic planning or nutrition. "
-                    )
-
-                    request = {
-                        "custom_id": f"{name}",
-                        "method": "POST",
-                        "url": "/v1/chat/completions",
-                        "body": {
-                            "model": "gpt-4.1-nano",
-                            "messages": [
-                                {
-                                    "role": "system",
-                                    "content": (
-                                        "You are a friendly, creative "
-                                        "and professional horoscope writer."
-                                    )
-                                },
-                                {"role": "user", "content": prompt}
-                            ],
-                            "temperature": 0.8
-                        }
-                    }
-
-                    f.write(json.dumps(request) + "\n")
-                    rider_count += 1
-
-                logger.info(f"Created JSONL with {rider_count} rider prompts")
-        except IOError as e:
-            logger.error(f"Failed to create JSONL file: {str(e)}")
-            return None, None
-
-        # Step 3: Upload to S3
-        logger.info(f"Uploading JSONL to S3: {jsonl_key}")
-        if not upload_file_to_s3(OPENAI_INPUT_FILE, jsonl_key):
-            logger.error("Failed to upload JSONL to S3")
-            return None, None
-
-        # Step 4: Update control file with new batch info
-        success, batch_id = create_batch(
-            input_file=jsonl_key,
-            target_date=target_date,
-            additional_data={
-                "rider_count": rider_count
-            }
+
+def _prepare_partition(
+    partition: Sequence[ManifestEntry],
+    target_date: str,
+    deadline: datetime,
+    model: Optional[LatencyModel]
+) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+    """
+    Upload the shards of one deadline partition.
+
+    Returns:
+        list: The JSONL key and control-file data of each shard, or None
+              on failure.
+    """
+    tokens = [
+        estimate_prompt_tokens(
+            build_request("", name, sign, target_date)["body"]
         )
+        for _, name, sign in partition
+    ]
+    plan = _plan_partition(model, len(partition), deadline)
+    max_requests = math.ceil(len(partition) / plan["shards"])
+    shards = []
+    for start, end in fit_token_budget(tokens, max_requests):
+        prepared = _prepare_shard(partition[start:end], target_date)
+        if prepared is None:
+            return None
+        shard_data: Dict[str, Any] = {
+            "rider_count": end - start,
+            "manifest_file": prepared[1],
+            "deadline": deadline.isoformat(),
+            "estimated_tokens": sum(tokens[start:end]),
+        }
+        if model is not None:
+            shard_data["predicted_seconds"] = round(
+                model.predict(end - start, plan["submit_at"])
+            )
+            if plan["submit_at"] > plan["now"]:
+                shard_data["submit_after"] = plan["submit_at"].isoformat()
+        shards.append((prepared[0], shard_data))
+    return shards
 
-        if not success or batch_id is None:
-            logger.error("Failed to create batch in control file")
-            return None, None
 
-        batch_uuid = '' if batch_id is None else batch_id
+def _prepare_date(
+    riders: Sequence[ManifestEntry],
+    timezones: Sequence[Optional[str]],
+    target_date: str,
+    model: Optional[LatencyModel] = None
+) -> Optional[List[str]]:
+    """
+    Prepare the batches of one target date.
+
+    Riders are partitioned by delivery deadline, and each partition is
+    split into batches of at most ``MAX_REQUESTS_PER_BATCH`` requests. With
+    a latency model, the planner picks the number of batches and their
+    submission time instead. Either way, partitions are split further until
+    no batch exceeds ``BATCH_TOKEN_BUDGET`` estimated prompt tokens.
+
+    Batches are created earliest deadline first, each recording its
+    deadline and estimated prompt tokens. Every shard is uploaded first and
+    the batches are then added with a single control-file write, so a date
+    either gets all of its batches or none and is prepared again by the
+    next run.
+
+    Returns:
+        list: The JSONL keys of the created batches, or None on failure.
+    """
+    shards: List[Tuple[str, Dict[str, Any]]] = []
+    for deadline, indices in partition_by_deadline(timezones, target_date):
+        prepared = _prepare_partition(
+            [riders[index] for index in indices], target_date, deadline,
+            model
+        )
+        if prepared is None:
+            return None
+        shards += prepared
 
+    batch_ids = create_batches([
+        (jsonl_key, target_date, {
+            **shard_data, "shard": shard, "shard_count": len(shards)
+        })
+        for shard, (jsonl_key, shard_data) in enumerate(shards, start=1)
+    ])
+    if batch_ids is None:
+        logger.error("Failed to create batches in control file")
+        return None
+    for shard, (batch_id, (_, shard_data)) in enumerate(
+        zip(batch_ids, shards), start=1
+    ):
         logger.info(
             f"Successfully created batch for {target_date} "
-            f"(UUID: {batch_uuid})"
+            f"(UUID: {batch_id}, shard {shard} of {len(shards)}, "
+            f"due {shard_data['deadline']})"
         )
-        return jsonl_key, target_date
+    return [jsonl_key for jsonl_key, _ in shards]
+
+
+# ---- Main Logic ----
+def generate_jsonl(
+    days: int = LOOKAHEAD_DAYS
+) -> Optional[List[Tuple[str, str]]]:
+    """
+    Generate JSONL files with horoscope prompts for the coming days.
+
+    Loads rider data from S3 and, for each of the next ``days`` days that
+    has no prepared, submitted or completed batch yet, creates personalized
+    horoscope prompts for every rider. The prompts of a day are partitioned
+    by delivery deadline (from the roster's optional ``timezone`` field) and
+    split into batches of at most ``MAX_REQUESTS_PER_BATCH`` requests; each
+    batch's JSONL file and rider manifest are uploaded to S3 and a batch
+    entry for the day is created in the control file, earliest deadline
+    first.
+
+    Args:
+        days (int): The number of days to prepare, starting tomorrow.
+
+    Returns:
+        list: (jsonl_key, target_date) of every created batch, or None if
+              the roster couldn't be loaded or no day could be prepared.
+    """
+    try:
+        # Step 1: Load riders list from S3
+        logger.info("Loading riders list from S3...")
+        with span("LoadRoster"):
+            roster = load_roster(current_tenant().riders_file)
+        if roster is None:
+            logger.error("Failed to load riders list")
+            return None
+
+        logger.info(f"Successfully loaded {len(roster.names)} riders from S3")
+
+        # Step 2: Skip the days that already have batches
+        scheduled = get_scheduled_target_dates()
+        target_dates = [
+            target_date for target_date in lookahead_dates(days)
+            if target_date not in scheduled
+        ]
+        skipped = max(days, 1) - len(target_dates)
+        if skipped:
+            logger.info(f"Skipping {skipped} days that already have batches")
+            increment("LookaheadDaysSkipped", skipped)
+        if not target_dates:
+            return []
+
+        # Step 3: Assign signs and rider IDs once for all days
+        with span("AssignSigns"):
+            signs = assign_zodiac_signs(roster.birth_dates)
+        used_ids: Set[str] = set()
+        riders: List[ManifestEntry] = [
+            (
+                derive_rider_id(roster.rider(index), used_ids),
+                roster.names[index].title(),
+                sign
+            )
+            for index, sign in enumerate(signs)
+        ]
+
+        timezones = roster.timezones or [None] * len(riders)
+        model = load_latency_model()
+
+        # Step 4: Upload the batches of every day
+        created: List[Tuple[str, str]] = []
+        failed_dates: List[str] = []
+        for target_date in target_dates:
+            jsonl_keys = _prepare_date(
+                riders, timezones, target_date, model
+            )
+            if jsonl_keys is None:
+                failed_dates.append(target_date)
+                continue
+            created.extend((key, target_date) for key in jsonl_keys)
+
+        if failed_dates:
+            # The next run prepares these days again
+            logger.error(f"Failed to prepare {', '.join(failed_dates)}")
+            increment("LookaheadDaysFailed", len(failed_dates))
+        return created or None
 
     except Exception as e:
         logger.error(f"Unexpected error in generate_jsonl: {str(e)}")
-        return None, None
+        return None
 
 
 if __name__ == "__main__":
-    batch_jsonl_key, batch_target_date = generate_jsonl()
-    if batch_jsonl_key and batch_target_date:
-        logger.info("Batch preparation completed successfully")
+    parser = argparse.ArgumentParser(
+        description="Prepare horoscope batches for the coming days"
+    )
+    parser.add_argument(
+        "--days", type=int, default=LOOKAHEAD_DAYS,
+        help="number of days to prepare, starting tomorrow"
+    )
+    args = parser.parse_args()
+
+    def prepare_tenant() -> Optional[List[Tuple[str, str]]]:
+        """Prepare the current tenant, returning full S3 keys."""
+        created = generate_jsonl(args.days)
+        if created is None:
+            return None
+        return [(tenant_key(key), day) for key, day in created]
+
+    with profile_stage("prepare"), span("StageRun"):
+        results = run_for_tenants(prepare_tenant)
+    flush_metrics("prepare")
+    failed_tenants = sorted(
+        tenant for tenant, created in (results or {}).items()
+        if created is None
+    )
+    batches = [
+        batch for created in (results or {}).values()
+        for batch in created or []
+    ]
+    if batches:
+        publish_stage_event("prepare", EVENT_SUCCEEDED, {
+            "input_files": [key for key, _ in batches],
+            "target_dates": sorted({day for _, day in batches}),
+        })
+    if results is not None and not failed_tenants:
+        logger.info(
+            f"Batch preparation completed successfully "
+            f"({len(batches)} batches)"
+        )
         sys.exit(0)
     else:
-        logger.error("Batch preparation failed")
+        logger.error(
+            f"Batch preparation failed for tenants "
+            f"{', '.join(failed_tenants)}" if failed_tenants
+            else "Batch preparation failed"
+        )
+        if not batches:
+            publish_stage_event("prepare", EVENT_FAILED)
         sys.exit(1)
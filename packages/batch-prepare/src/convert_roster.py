@@ -0,0 +1,56 @@
+"""
+Roster conversion module.
+
+This module converts the JSON rider roster in S3 to a columnar Arrow IPC
+or Parquet file, which the prepare stage loads much faster and with far
+less memory. Point ``RIDERS_FILE`` (or the tenant's ``riders_file``) at
+the converted key afterwards.
+Requires the optional ``pyarrow`` dependency.
+"""
+
+import argparse
+import sys
+
+from shared.config import ENABLE_FILE_LOGGING
+from shared.utils.logging_utils import add_file_handler, configure_logger
+from shared.utils.roster_utils import convert_roster
+from shared.utils.scheduler_utils import (
+    add_tenant_argument,
+    cli_tenant_context,
+)
+
+# Configure logger
+logger = configure_logger('convert_roster')
+if ENABLE_FILE_LOGGING:
+    add_file_handler(logger)
+
+
+def _parse_args() -> argparse.Namespace:
+    """Parse command line arguments for the converter entry point."""
+    parser = argparse.ArgumentParser(
+        description="Convert the JSON rider roster to Arrow IPC or Parquet."
+    )
+    parser.add_argument(
+        "--source",
+        help="S3 key of the JSON roster (default: the tenant's roster)"
+    )
+    parser.add_argument(
+        "--target",
+        required=True,
+        help="S3 key to write, ending in .arrow, .feather, .ipc or .parquet"
+    )
+    add_tenant_argument(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    with cli_tenant_context(args.tenant) as tenant:
+        converted = convert_roster(
+            args.source or tenant.riders_file, args.target
+        )
+    if converted:
+        logger.info(f"Roster written to {args.target}")
+        sys.exit(0)
+    logger.error("Roster conversion failed")
+    sys.exit(1)
@@ -7,26 +7,64 @@ This module handles:
 3. Uploading files to OpenAI
 4. Creating batch processing jobs
 5. Updating batch status in the control file
+
+Every tenant is processed in one run. With ``ASYNC_IO`` the batches (of all
+tenants) are submitted concurrently on asyncio.
 """
 
+import asyncio
+import functools
+import os
 import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 
-from openai import OpenAIError
+from openai import AsyncOpenAI, OpenAIError
 
 from shared.config import (
+    ASYNC_IO,
     ENABLE_FILE_LOGGING,
+    ENQUEUED_TOKEN_LIMIT,
     OPENAI_COMPLETION_WINDOW,
     OPENAI_INPUT_FILE,
     STATUS_FAILED,
     STATUS_SUBMITTED,
 )
+from shared.utils.async_s3_utils import get_s3_object_async
+from shared.utils.batch_record_utils import BatchRecord
 from shared.utils.control_file_utils import (
+    get_pending_batches,
     get_prepared_batches,
     update_batch_status,
 )
+from shared.utils.event_utils import (
+    EVENT_FAILED,
+    EVENT_SCHEDULED,
+    EVENT_SUCCEEDED,
+    publish_stage_event,
+)
 from shared.utils.logging_utils import add_file_handler, configure_logger
-from shared.utils.openai_utils import initialize_openai_client
+from shared.utils.metrics_utils import flush_metrics, increment, span
+from shared.utils.openai_utils import (
+    initialize_async_openai_client,
+    initialize_openai_client,
+    process_batches_concurrently,
+)
+from shared.utils.profiling_utils import profile_stage
+from shared.utils.resilience_utils import OPENAI_GUARD, CircuitOpenError
 from shared.utils.s3_utils import download_file_from_s3
+from shared.utils.schedule_utils import (
+    next_submission_time,
+    sort_by_deadline,
+    submission_due,
+)
+from shared.utils.scheduler_utils import (
+    FairLimiter,
+    run_for_tenants,
+    run_for_tenants_async,
+    run_in_thread,
+)
+from shared.utils.tenant_utils import current_tenant
 
 # Configure logger
 logger = configure_logger('batch_upload')
@@ -39,6 +77,112 @@ if ENABLE_FILE_LOGGING:
 client = initialize_openai_client()
 
 
+def _create_input_file() -> Any:
+    """Upload ``OPENAI_INPUT_FILE``, reopening it for every attempt."""
+    with open(OPENAI_INPUT_FILE, "rb") as file:
+        return client.files.create(file=file, purpose="batch")
+
+
+def _nothing_due(held: List[BatchRecord]) -> bool:
+    """
+    Log why no batch is due and return the stage result.
+
+    A stage run that only finds batches planned for later, or held back by
+    ``ENQUEUED_TOKEN_LIMIT``, succeeds. The follow-up run of planned
+    batches is scheduled by ``_publish_events``; held batches are submitted
+    by the upload run that follows the download of the enqueued batches.
+    """
+    if held:
+        tokens = sum(int(batch.get("estimated_tokens", 0)) for batch in held)
+        logger.info(
+            f"All due batches are held back by the enqueued-token limit: "
+            f"{len(held)} batches waiting for {tokens} tokens"
+        )
+        return True
+    not_before = next_submission_time(get_prepared_batches())
+    if not_before is None:
+        logger.info("No prepared batches found in control file.")
+        return False
+    logger.info(
+        f"All prepared batches are planned for later, the next one at "
+        f"{not_before.isoformat()}"
+    )
+    return True
+
+
+def _next_submission_time() -> Optional[datetime]:
+    """Return when the next deferred batch of any tenant becomes due."""
+    times = run_for_tenants(
+        lambda: next_submission_time(get_prepared_batches())
+    ) or {}
+    return min(
+        (when for when in times.values() if when is not None), default=None
+    )
+
+
+def _publish_events(succeeded: bool) -> None:
+    """
+    Publish the completion event of an upload run.
+
+    If batches are planned for later submission, a ``scheduled`` upload
+    event is published as well, so the dispatcher runs upload again when
+    the first of them becomes due instead of waiting for the cron slot.
+    """
+    not_before = _next_submission_time()
+    if not_before is not None:
+        publish_stage_event(
+            "upload", EVENT_SCHEDULED, {"not_before": not_before.isoformat()}
+        )
+    publish_stage_event(
+        "upload", EVENT_SUCCEEDED if succeeded else EVENT_FAILED
+    )
+
+
+def _due_batches() -> Tuple[List[BatchRecord], List[BatchRecord]]:
+    """
+    Return the prepared batches to submit now, most urgent first.
+
+    Batches the planner scheduled for later (``submit_after``) are left
+    for a later run, and so are batches that would take the estimated
+    prompt tokens of all submitted batches over the tenant's share of
+    ``ENQUEUED_TOKEN_LIMIT``, since OpenAI would reject them. The most
+    urgent batch is always submitted when nothing else is enqueued.
+
+    Returns:
+        tuple: (due, held) where due are the batches to submit and held the
+               due batches held back by the enqueued-token limit.
+    """
+    prepared_batches = sort_by_deadline(get_prepared_batches())
+    due = [batch for batch in prepared_batches if submission_due(batch)]
+    if len(due) < len(prepared_batches):
+        logger.info(
+            f"Deferring {len(prepared_batches) - len(due)} batches until "
+            f"their planned submission time"
+        )
+    if ENQUEUED_TOKEN_LIMIT <= 0:
+        return due, []
+
+    token_limit = ENQUEUED_TOKEN_LIMIT * current_tenant().share
+    enqueued = sum(
+        int(batch.get("estimated_tokens", 0))
+        for batch in get_pending_batches()
+    )
+    admitted = []
+    for batch in due:
+        tokens = int(batch.get("estimated_tokens", 0))
+        if enqueued and enqueued + tokens > token_limit:
+            break
+        admitted.append(batch)
+        enqueued += tokens
+    if len(admitted) < len(due):
+        logger.info(
+            f"Holding back {len(due) - len(admitted)} batches: "
+            f"{enqueued} tokens enqueued of {token_limit:.0f}"
+        )
+        increment("BatchesHeldForTokens", len(due) - len(admitted))
+    return admitted, due[len(admitted):]
+
+
 def upload_jsonl_to_openai() -> bool:
     """
     Upload prepared JSONL files to OpenAI and create batch processing jobs.
@@ -46,17 +190,20 @@ def upload_jsonl_to_openai() -> bool:
     Retrieves prepared batches from the control file, downloads the JSONL files
     from S3, uploads them to OpenAI, creates batch processing jobs, and updates
     the batch status in the control file.
+    Batches are submitted earliest delivery deadline first; batches
+    planned for a later submission time, or that would exceed the
+    enqueued-token limit, are skipped until a later run.
 
     Returns:
-        bool: True if at least one batch was successfully processed,
-            False otherwise.
+        bool: True if at least one batch was successfully processed or
+            every prepared batch is planned for later or held back by the
+            enqueued-token limit, False otherwise.
     """
     try:
         # Get prepared batches directly using the utility function
-        prepared_batches = get_prepared_batches()
+        prepared_batches, held = _due_batches()
         if not prepared_batches:
-            logger.info("No prepared batches found in control file.")
-            return False
+            return _nothing_due(held)
 
         logger.info(
             f"Found {len(prepared_batches)} prepared batches to process"
@@ -85,14 +232,13 @@ def upload_jsonl_to_openai() -> bool:
             # Upload the file to OpenAI
             try:
                 logger.info("Uploading file to OpenAI...")
-                with open(OPENAI_INPUT_FILE, "rb") as file:
-                    file_resp = client.files.create(
-                        file=file,
-                        purpose="batch"
+                with span("OpenAIFileCreate"):
+                    file_resp = OPENAI_GUARD.call(
+                        _create_input_file, idempotent=False
                     )
                 file_id = file_resp.id
                 logger.info(f"Uploaded file. File ID: {file_id}")
-            except (OpenAIError, IOError) as e:
+            except (OpenAIError, CircuitOpenError, IOError) as e:
                 logger.error(f"Failed to upload file to OpenAI: {str(e)}")
                 update_batch_status(
                     batch_id=batch.get("batch_id"),
@@ -105,16 +251,21 @@ def upload_jsonl_to_openai() -> bool:
             # Submit batch job
             try:
                 logger.info("Submitting batch job...")
-                batch_resp = client.batches.create(
-                    input_file_id=file_id,
-                    endpoint="/v1/chat/completions",
-                    completion_window=OPENAI_COMPLETION_WINDOW
-                )
+                with span("OpenAIBatchCreate"):
+                    batch_resp = OPENAI_GUARD.call(
+                        functools.partial(
+                            client.batches.create,
+                            input_file_id=file_id,
+                            endpoint="/v1/chat/completions",
+                            completion_window=OPENAI_COMPLETION_WINDOW
+                        ),
+                        idempotent=False
+                    )
                 openai_batch_id = batch_resp.id
                 logger.info(
                     f"Submitted batch job. Batch ID: {openai_batch_id}"
                 )
-            except OpenAIError as e:
+            except (OpenAIError, CircuitOpenError) as e:
                 logger.error(f"Failed to submit batch job: {str(e)}")
                 update_batch_status(
                     batch_id=batch.get("batch_id"),
@@ -131,10 +282,12 @@ def upload_jsonl_to_openai() -> bool:
                 new_status=STATUS_SUBMITTED,
                 additional_data={
                     "file_id": file_id,
-                    "openai_batch_id": openai_batch_id
+                    "openai_batch_id": openai_batch_id,
+                    "submitted_at": datetime.now(timezone.utc).isoformat()
                 }
             )
             success_count += 1
+            increment("BatchesSubmitted")
 
         logger.info(
             f"Successfully processed {success_count} out of "
@@ -147,6 +300,123 @@ def upload_jsonl_to_openai() -> bool:
         return False
 
 
+async def _submit_batch_async(
+    async_client: AsyncOpenAI,
+    batch: Mapping[str, Any],
+    limit: FairLimiter
+) -> bool:
+    """
+    Upload one prepared batch to OpenAI and record the outcome.
+
+    The JSONL file is read into memory rather than through the shared
+    ``OPENAI_INPUT_FILE``, so several batches can be in flight at once.
+
+    Args:
+        async_client (AsyncOpenAI): The asynchronous OpenAI client.
+        batch (dict): The prepared batch from the control file.
+        limit (FairLimiter): Bounds the concurrent OpenAI requests.
+
+    Returns:
+        bool: True if the batch was submitted.
+    """
+    s3_key = batch["input_file"]
+    new_status = STATUS_FAILED
+    additional_data: Dict[str, Any] = {}
+
+    data = await get_s3_object_async(s3_key)
+    if data is None:
+        logger.error(f"Failed to download file from S3: {s3_key}")
+        additional_data["error"] = "Failed to download file from S3"
+    else:
+        try:
+            async with limit:
+                with span("OpenAIFileCreate"):
+                    file_resp = await OPENAI_GUARD.call_async(
+                        lambda: async_client.files.create(
+                            file=(os.path.basename(s3_key), data),
+                            purpose="batch"
+                        ),
+                        idempotent=False
+                    )
+            additional_data["file_id"] = file_resp.id
+            logger.info(f"Uploaded {s3_key}. File ID: {file_resp.id}")
+
+            async with limit:
+                with span("OpenAIBatchCreate"):
+                    batch_resp = await OPENAI_GUARD.call_async(
+                        lambda: async_client.batches.create(
+                            input_file_id=file_resp.id,
+                            endpoint="/v1/chat/completions",
+                            completion_window=OPENAI_COMPLETION_WINDOW
+                        ),
+                        idempotent=False
+                    )
+            additional_data["openai_batch_id"] = batch_resp.id
+            additional_data["submitted_at"] = datetime.now(
+                timezone.utc
+            ).isoformat()
+            new_status = STATUS_SUBMITTED
+            logger.info(f"Submitted batch job. Batch ID: {batch_resp.id}")
+        except (OpenAIError, CircuitOpenError) as e:
+            logger.error(f"Failed to submit {s3_key} to OpenAI: {str(e)}")
+            additional_data["error"] = str(e)
+
+    # Control-file updates are serialized by control_file_utils
+    await run_in_thread(
+        update_batch_status,
+        batch_id=batch.get("batch_id"),
+        s3_key=s3_key,
+        new_status=new_status,
+        additional_data=additional_data
+    )
+    if new_status == STATUS_SUBMITTED:
+        increment("BatchesSubmitted")
+        return True
+    return False
+
+
+async def upload_jsonl_to_openai_async() -> bool:
+    """
+    Asyncio variant of ``upload_jsonl_to_openai``.
+
+    Every prepared batch is downloaded, uploaded and submitted
+    concurrently, with at most ``OPENAI_MAX_CONCURRENCY`` OpenAI requests
+    of all tenants in flight; batches with earlier delivery deadlines are
+    started first.
+
+    Returns:
+        bool: True if at least one batch was successfully processed or
+            every prepared batch is planned for later or held back by the
+            enqueued-token limit, False otherwise.
+    """
+    try:
+        prepared_batches, held = _due_batches()
+        if not prepared_batches:
+            return _nothing_due(held)
+
+        logger.info(
+            f"Submitting {len(prepared_batches)} prepared batches "
+            f"concurrently"
+        )
+        success_count = await process_batches_concurrently(
+            initialize_async_openai_client(),
+            _submit_batch_async,
+            prepared_batches
+        )
+        return success_count > 0
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return False
+
+
 if __name__ == "__main__":
-    success = upload_jsonl_to_openai()
+    with profile_stage("upload"), span("StageRun"):
+        results = (
+            asyncio.run(run_for_tenants_async(upload_jsonl_to_openai_async))
+            if ASYNC_IO else run_for_tenants(upload_jsonl_to_openai)
+        )
+        success = any((results or {}).values())
+    flush_metrics("upload")
+    _publish_events(success)
     sys.exit(0 if success else 1)
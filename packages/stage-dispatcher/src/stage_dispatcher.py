@@ -0,0 +1,339 @@
+"""
+Stage dispatcher module for event-driven pipeline triggering.
+
+This module launches the next pipeline stage as soon as the previous one
+publishes its completion event, instead of waiting for a fixed schedule.
+It handles:
+1. Reading pending stage events (S3 marker objects or a local queue dir)
+2. Deciding which stage follows each event
+3. Holding upload and download events until OpenAI reports a submitted
+   batch as finished, so download runs once per finished batch instead of
+   polling on a schedule, and again while batches are still submitted
+4. Holding scheduled events, published by upload for batches planned for
+   later submission, until their ``not_before`` time
+5. Launching the next stage as an ECS task or a local subprocess
+6. Acknowledging the event so it is dispatched only once, or moving the
+   event of a failed stage to the dead-letter queue
+"""
+
+import argparse
+import functools
+import os
+import subprocess  # nosec B404 - only runs the pipeline's own scripts
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import boto3
+
+from shared.config import (
+    DISPATCH_LAUNCHER,
+    DISPATCH_POLL_INTERVAL,
+    DOWNLOAD_TASK_DEFINITION,
+    ECS_CLUSTER,
+    ECS_SECURITY_GROUPS,
+    ECS_SUBNETS,
+    ENABLE_FILE_LOGGING,
+    UPLOAD_TASK_DEFINITION,
+)
+from shared.utils.batch_record_utils import BatchRecord
+from shared.utils.control_file_utils import (
+    get_pending_batches,
+    get_prepared_batches,
+)
+from shared.utils.event_utils import (
+    EVENT_SCHEDULED,
+    EVENT_SUCCEEDED,
+    ack_event,
+    dead_letter_event,
+    list_pending_events,
+)
+from shared.utils.logging_utils import add_file_handler, configure_logger
+from shared.utils.openai_utils import initialize_openai_client
+from shared.utils.resilience_utils import OPENAI_GUARD
+from shared.utils.schedule_utils import submission_due
+from shared.utils.scheduler_utils import run_for_tenants
+
+# Configure logger
+logger = configure_logger('stage_dispatcher')
+if ENABLE_FILE_LOGGING:
+    add_file_handler(logger)
+
+STAGE_UPLOAD = "upload"
+STAGE_DOWNLOAD = "download"
+
+# OpenAI batch statuses after which the download stage has work to do
+TERMINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Stages launched after a successful event from each stage; download
+# events are handled by ``next_stages``
+NEXT_STAGES: Dict[str, List[str]] = {
+    "prepare": [STAGE_UPLOAD],
+    STAGE_UPLOAD: [STAGE_DOWNLOAD],
+}
+
+TASK_DEFINITIONS = {
+    STAGE_UPLOAD: UPLOAD_TASK_DEFINITION,
+    STAGE_DOWNLOAD: DOWNLOAD_TASK_DEFINITION,
+}
+
+REPO_ROOT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "..")
+)
+LOCAL_STAGE_SCRIPTS = {
+    STAGE_UPLOAD: os.path.join(
+        REPO_ROOT, "packages", "batch-upload", "src", "batch_upload_input.py"
+    ),
+    STAGE_DOWNLOAD: os.path.join(
+        REPO_ROOT, "packages", "batch-download", "src",
+        "batch_download_result.py"
+    ),
+}
+
+
+# ---- Clients ----
+# Initialize OpenAI client
+client = initialize_openai_client()
+
+
+# ---- Helpers ----
+def _all_tenants(
+    query: Callable[[], List[BatchRecord]]
+) -> List[BatchRecord]:
+    """Return the batches ``query`` finds for every tenant."""
+    results = run_for_tenants(query) or {}
+    return [batch for batches in results.values() for batch in batches or []]
+
+
+def submitted_batches_finished() -> bool:
+    """
+    Check whether the download stage has anything to wait for.
+
+    Returns:
+        bool: True if at least one submitted batch is finished on OpenAI,
+              or if no batch is submitted at all.
+    """
+    pending_batches = _all_tenants(get_pending_batches)
+    if not pending_batches:
+        return True
+    for batch_info in pending_batches:
+        try:
+            batch = OPENAI_GUARD.call(functools.partial(
+                client.batches.retrieve, batch_info["openai_batch_id"]
+            ))
+        except Exception as e:
+            logger.error(
+                f"Failed to check batch {batch_info.get('batch_id')}: "
+                f"{str(e)}"
+            )
+            continue
+        if batch.status in TERMINAL_BATCH_STATUSES:
+            return True
+    return False
+
+
+def next_stages(event: Dict[str, Any]) -> List[str]:
+    """
+    Return the stages to launch for an event.
+
+    A download run, successful or not, is followed by upload when it left
+    prepared retry batches that are due (whose upload event leads to
+    download again), and otherwise by another download while batches are
+    still submitted. A scheduled event runs its own stage again. Other
+    failed stages get no follow-up.
+
+    Args:
+        event (dict): A stage completion event.
+
+    Returns:
+        list: The stage names to launch, possibly empty.
+    """
+    stage = event.get("stage", "")
+    if event.get("status") == EVENT_SCHEDULED:
+        return [stage] if stage in TASK_DEFINITIONS else []
+    if stage == STAGE_DOWNLOAD:
+        prepared_batches = _all_tenants(get_prepared_batches)
+        if any(submission_due(batch) for batch in prepared_batches):
+            # Retry batches were created and are waiting to be submitted;
+            # batches planned for later have their own scheduled event
+            return [STAGE_UPLOAD]
+        if _all_tenants(get_pending_batches):
+            return [STAGE_DOWNLOAD]
+        return []
+
+    if event.get("status") != EVENT_SUCCEEDED:
+        return []
+    return list(NEXT_STAGES.get(stage, []))
+
+
+def scheduled_event_due(
+    event: Dict[str, Any], now: Optional[datetime] = None
+) -> bool:
+    """Return whether an event may be dispatched now."""
+    if event.get("status") != EVENT_SCHEDULED:
+        return True
+    try:
+        not_before = datetime.fromisoformat(
+            str(event.get("payload", {}).get("not_before"))
+        )
+    except ValueError:
+        logger.warning(f"Event {event.get('event_id')} has no valid time")
+        return True
+    if not_before.tzinfo is None:
+        not_before = not_before.replace(tzinfo=timezone.utc)
+    return not_before <= (now or datetime.now(timezone.utc))
+
+
+def launch_ecs_task(stage: str) -> bool:
+    """Start the stage's ECS task definition on Fargate."""
+    task_definition = TASK_DEFINITIONS.get(stage)
+    if not ECS_CLUSTER or not task_definition:
+        logger.error(f"No ECS cluster or task definition for stage {stage}")
+        return False
+    try:
+        response = boto3.client("ecs").run_task(
+            cluster=ECS_CLUSTER,
+            taskDefinition=task_definition,
+            launchType="FARGATE",
+            count=1,
+            networkConfiguration={
+                "awsvpcConfiguration": {
+                    "subnets": [s for s in ECS_SUBNETS.split(",") if s],
+                    "securityGroups": [
+                        g for g in ECS_SECURITY_GROUPS.split(",") if g
+                    ],
+                    "assignPublicIp": "ENABLED",
+                }
+            },
+        )
+    except Exception as e:
+        logger.error(f"Failed to start ECS task for {stage}: {str(e)}")
+        return False
+
+    if response.get("failures"):
+        logger.error(f"ECS refused to start {stage}: {response['failures']}")
+        return False
+    logger.info(f"Started ECS task for stage {stage}")
+    return True
+
+
+def launch_local_process(stage: str) -> bool:
+    """Run the stage's entry point as a local subprocess and wait for it."""
+    script = LOCAL_STAGE_SCRIPTS.get(stage)
+    if not script:
+        logger.error(f"No local script for stage {stage}")
+        return False
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [REPO_ROOT, env.get("PYTHONPATH")])
+    )
+    logger.info(f"Running stage {stage} locally: {script}")
+    result = subprocess.run(  # nosec B603 - fixed script paths
+        [sys.executable, script], env=env, check=False
+    )
+    # A stage that ran but found nothing to do still counts as dispatched
+    logger.info(f"Stage {stage} exited with code {result.returncode}")
+    return True
+
+
+def launch_stage(stage: str) -> bool:
+    """Launch a stage with the configured launcher."""
+    if DISPATCH_LAUNCHER == "ecs":
+        return launch_ecs_task(stage)
+    return launch_local_process(stage)
+
+
+# ---- Main Logic ----
+def dispatch_pending_events(now: Optional[datetime] = None) -> int:
+    """
+    Launch the follow-up stages of all pending events.
+
+    Events whose follow-up stages all launched (or that need none) are
+    acknowledged, or moved to the dead-letter queue if the stage failed;
+    the others stay pending and are retried next time. Events followed by
+    download also stay pending until a submitted batch is finished, so
+    ``--watch`` replaces the download stage's polling schedule, and
+    scheduled events stay pending until their time. Each stage is launched
+    at most once per pass.
+
+    Args:
+        now (datetime, optional): The current time, for tests.
+
+    Returns:
+        int: The number of stages launched.
+    """
+    events = list_pending_events()
+    if not events:
+        logger.info("No pending stage events.")
+        return 0
+
+    launched = 0
+    # Stages started in this pass; several events may ask for the same one
+    started: Set[str] = set()
+    download_ready: Optional[bool] = None
+    for event in events:
+        if not scheduled_event_due(event, now):
+            continue
+        stages = next_stages(event)
+        if STAGE_DOWNLOAD in stages and STAGE_DOWNLOAD not in started:
+            if download_ready is None:
+                download_ready = submitted_batches_finished()
+            if not download_ready:
+                logger.info(
+                    f"Event {event.get('event_id')}: no submitted batch is "
+                    f"finished yet, keeping it pending"
+                )
+                continue
+
+        logger.info(
+            f"Event {event.get('event_id')} from {event.get('stage')} "
+            f"({event.get('status')}): launching {stages or 'nothing'}"
+        )
+
+        new_stages = [stage for stage in stages if stage not in started]
+        for stage in new_stages:
+            if launch_stage(stage):
+                started.add(stage)
+                launched += 1
+
+        if not started.issuperset(new_stages):
+            continue
+        if event.get("status") in (EVENT_SUCCEEDED, EVENT_SCHEDULED):
+            ack_event(event)
+        else:
+            dead_letter_event(event)
+
+    return launched
+
+
+def _parse_args() -> argparse.Namespace:
+    """Parse command line arguments for the dispatcher entry point."""
+    parser = argparse.ArgumentParser(
+        description="Launch pipeline stages on stage completion events."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep polling for events instead of exiting after one pass"
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=DISPATCH_POLL_INTERVAL,
+        help="Seconds between polls in --watch mode"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    try:
+        dispatch_pending_events()
+        while args.watch:
+            time.sleep(args.interval)
+            dispatch_pending_events()
+    except KeyboardInterrupt:
+        logger.info("Dispatcher stopped")
+    sys.exit(0)
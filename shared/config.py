@@ -4,17 +4,30 @@ Configuration module for the Veloscope Generator application.
 This module loads environment variables and defines configuration constants
 used throughout the application, including:
 - Environment settings
-- S3 configuration
-- OpenAI API settings
+- S3 configuration and the object storage backend
+- Tenant registry and tenant prefixes
+- OpenAI API settings, output caps, batch token budgets and prompt layout
+- Express mode rate limits
+- Async I/O concurrency limits
+- Multi-day lookahead and batch sharding
+- Delivery deadlines by rider timezone
+- Batch size and submission time planner
+- Request retries, circuit breaking and hedged reads
 - File paths and prefixes
+- Control-file retention and cleanup of finished batches
+- Download worker leasing
+- Stage event and dispatcher settings
 - Batch status constants
 - Logging configuration
+- Metrics configuration
+- Profiling configuration
 
 The configuration is loaded from environment variables, with sensible defaults
 provided for development environments.
 """
 
 import os
+import socket
 import tempfile  # Add this import at the top of the file
 from typing import Literal
 
@@ -31,10 +44,76 @@ S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "default_bucket")
 CONTROL_KEY = os.getenv("CONTROL_KEY", "batch_control.json")
 RIDERS_FILE = os.getenv("RIDERS_FILE", "riders.json")
 
+# Tenants: S3 key of the tenant registry (empty serves a single tenant with
+# the keys above). Tenants without an explicit prefix keep their objects
+# under TENANTS_PREFIX/<tenant id>
+TENANTS_KEY = os.getenv("TENANTS_KEY", "")
+TENANTS_PREFIX = os.getenv("TENANTS_PREFIX", "tenants")
+
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-nano")
 OPENAI_COMPLETION_WINDOW: Literal["24h"] = "24h"
+# Output cap of every horoscope request
+OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "200"))
+# Most estimated prompt tokens in one batch, and across all submitted
+# batches of the account (the Batch API's enqueued-token limit, split
+# between tenants by weight); 0 disables
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "2000000"))
+ENQUEUED_TOKEN_LIMIT = int(os.getenv("ENQUEUED_TOKEN_LIMIT", "0"))
+# Prompt layout: 'static-first' puts the constant instructions ahead of the
+# rider's details so OpenAI can serve them from its prompt cache; 'inline'
+# is the original prompt starting with the rider's name
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "static-first").lower()
+
+# Express (real-time Chat Completions) configuration
+EXPRESS_MAX_RPM = int(os.getenv("EXPRESS_MAX_RPM", "500"))
+EXPRESS_MAX_TPM = int(os.getenv("EXPRESS_MAX_TPM", "200000"))
+EXPRESS_CONCURRENCY = int(os.getenv("EXPRESS_CONCURRENCY", "16"))
+
+# Async I/O: run the upload and download stages on asyncio, keeping up to
+# S3_MAX_CONCURRENCY S3 and OPENAI_MAX_CONCURRENCY OpenAI requests in flight
+ASYNC_IO = os.getenv("ASYNC_IO", "false").lower() == "true"
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "64"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+
+# Resilience of S3 and OpenAI requests: attempts per request, jittered
+# exponential backoff, circuit breaker and hedged S3 reads (a read slower
+# than the recent p95, but at least HEDGE_MIN_MS, is sent a second time)
+REQUEST_MAX_ATTEMPTS = int(os.getenv("REQUEST_MAX_ATTEMPTS", "4"))
+REQUEST_BACKOFF_BASE_MS = int(os.getenv("REQUEST_BACKOFF_BASE_MS", "200"))
+REQUEST_BACKOFF_MAX_MS = int(os.getenv("REQUEST_BACKOFF_MAX_MS", "20000"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "10"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+HEDGED_READS = os.getenv("HEDGED_READS", "true").lower() == "true"
+HEDGE_MIN_MS = int(os.getenv("HEDGE_MIN_MS", "50"))
+
+# Batch preparation: number of future days prepared per run, and the most
+# requests in one batch (OpenAI accepts up to 50,000); larger days are
+# split into several batches
+LOOKAHEAD_DAYS = int(os.getenv("LOOKAHEAD_DAYS", "1"))
+MAX_REQUESTS_PER_BATCH = int(os.getenv("MAX_REQUESTS_PER_BATCH", "50000"))
+
+# Batch planner: fit time-to-publish against batch size and submission hour
+# from the completed batches of the last PLANNER_HISTORY_DAYS days, once at
+# least PLANNER_MIN_SAMPLES are known, and use it to size shards (no smaller
+# than MIN_REQUESTS_PER_BATCH where possible) and to time submissions.
+# BATCH_OVERHEAD_SECONDS is the pipeline's fixed cost of every extra batch
+PLANNER_HISTORY_DAYS = int(os.getenv("PLANNER_HISTORY_DAYS", "30"))
+PLANNER_MIN_SAMPLES = int(os.getenv("PLANNER_MIN_SAMPLES", "10"))
+MIN_REQUESTS_PER_BATCH = int(os.getenv("MIN_REQUESTS_PER_BATCH", "1000"))
+BATCH_OVERHEAD_SECONDS = float(os.getenv("BATCH_OVERHEAD_SECONDS", "60"))
+
+# Delivery deadlines: riders get their horoscope by DELIVERY_HOUR local
+# time in their roster timezone (DEFAULT_TIMEZONE if they have none).
+# Riders whose deadlines lie within DEADLINE_WINDOW_HOURS of each other
+# share a batch, and the earliest batches are submitted and downloaded first
+DELIVERY_HOUR = int(os.getenv("DELIVERY_HOUR", "6"))
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
+DEADLINE_WINDOW_HOURS = int(os.getenv("DEADLINE_WINDOW_HOURS", "6"))
+
+# Number of times the failed requests of a batch are resubmitted
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "2"))
 
 # AWS Configuration
 AWS_REGION = os.getenv("AWS_REGION", "eu-central-1")
@@ -44,15 +123,71 @@ TEMP_DIR = tempfile.gettempdir()
 RESULT_DIR = os.path.join(TEMP_DIR, "batch_results")
 OPENAI_INPUT_FILE = os.path.join(TEMP_DIR, "openai_input.jsonl")
 
+# Object storage: 's3', or 'local' to keep objects as files under
+# LOCAL_STORAGE_DIR/<bucket>/<key>
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3").lower()
+LOCAL_STORAGE_DIR = os.getenv(
+    "LOCAL_STORAGE_DIR", os.path.join(TEMP_DIR, "veloscope_storage")
+)
+
 # S3 Prefixes and paths
 OUTPUT_PREFIX = "openai/input"
+RESULT_FILES_PREFIX = "openai/output"
 HOROSCOPE_PREFIX = "horoscope"
 
+# Control-file compaction: terminal batches older than the retention window
+# are moved to gzipped JSONL archives partitioned by target date
+CONTROL_RETENTION_DAYS = int(os.getenv("CONTROL_RETENTION_DAYS", "7"))
+CONTROL_ARCHIVE_PREFIX = os.getenv("CONTROL_ARCHIVE_PREFIX", "control-archive")
+
+# Cleanup of terminal batches: their OpenAI input, output and error files
+# are deleted OPENAI_FILE_RETENTION_DAYS after they finished (or their
+# retry batch finished) and their intermediate S3 objects (input
+# JSONL, manifest, staged output, checkpoint and leases)
+# INTERMEDIATE_RETENTION_DAYS after they finished. Keep both within
+# CONTROL_RETENTION_DAYS: archived batches are no longer cleaned up
+CLEANUP_ENABLED = os.getenv("CLEANUP_ENABLED", "true").lower() == "true"
+OPENAI_FILE_RETENTION_DAYS = int(os.getenv("OPENAI_FILE_RETENTION_DAYS", "2"))
+INTERMEDIATE_RETENTION_DAYS = int(
+    os.getenv("INTERMEDIATE_RETENTION_DAYS", "3")
+)
+
+# Resumable result processing: checkpoint every N result lines
+CHECKPOINTS_PREFIX = os.getenv("CHECKPOINTS_PREFIX", "checkpoints")
+CHECKPOINT_EVERY = int(os.getenv("CHECKPOINT_EVERY", "500"))
+
+# Download worker leasing: split result files across parallel workers
+DOWNLOAD_LEASING = os.getenv("DOWNLOAD_LEASING", "false").lower() == "true"
+LEASES_PREFIX = os.getenv("LEASES_PREFIX", "leases")
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", "600"))
+RESULT_RANGE_BYTES = int(
+    os.getenv("RESULT_RANGE_BYTES", str(8 * 1024 * 1024))
+)
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# Stage completion events: 'none', 's3' or 'local'
+EVENT_BACKEND = os.getenv("EVENT_BACKEND", "none").lower()
+EVENTS_PREFIX = os.getenv("EVENTS_PREFIX", "events")
+EVENT_QUEUE_DIR = os.getenv(
+    "EVENT_QUEUE_DIR", os.path.join(TEMP_DIR, "veloscope_events")
+)
+
+# Stage dispatcher: 'local' (subprocess) or 'ecs' (RunTask)
+DISPATCH_LAUNCHER = os.getenv("DISPATCH_LAUNCHER", "local").lower()
+DISPATCH_POLL_INTERVAL = int(os.getenv("DISPATCH_POLL_INTERVAL", "30"))
+ECS_CLUSTER = os.getenv("ECS_CLUSTER", "")
+ECS_SUBNETS = os.getenv("ECS_SUBNETS", "")
+ECS_SECURITY_GROUPS = os.getenv("ECS_SECURITY_GROUPS", "")
+UPLOAD_TASK_DEFINITION = os.getenv("UPLOAD_TASK_DEFINITION", "")
+DOWNLOAD_TASK_DEFINITION = os.getenv("DOWNLOAD_TASK_DEFINITION", "")
+
 # Batch status constants
 STATUS_PREPARED = "prepared"
 STATUS_SUBMITTED = "submitted"
 STATUS_COMPLETED = "completed"
 STATUS_FAILED = "failed"
+STATUS_EXPIRED = "expired"
+STATUS_CANCELLED = "cancelled"
 
 # Logging Configuration
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -60,3 +195,20 @@ LOG_DIR = os.getenv("LOG_DIR", os.path.join(tempfile.gettempdir(), "logs"))
 ENABLE_FILE_LOGGING = os.getenv(
     "ENABLE_FILE_LOGGING", "false"
 ).lower() == "true"
+# 'text' or 'json'
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Write log records from a background thread instead of the caller's
+LOG_ASYNC = os.getenv("LOG_ASYNC", "false").lower() == "true"
+# Repetitive messages in loops: log the first N, then every Kth
+LOG_SAMPLE_FIRST = int(os.getenv("LOG_SAMPLE_FIRST", "10"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "1000"))
+
+# Profiling Configuration
+# Comma-separated: cprofile, tracemalloc, pyinstrument (empty disables)
+PROFILE_MODE = os.getenv("PROFILE_MODE", "")
+PROFILE_UPLOAD = os.getenv("PROFILE_UPLOAD", "false").lower() == "true"
+DIAGNOSTICS_PREFIX = os.getenv("DIAGNOSTICS_PREFIX", "diagnostics")
+
+# Metrics Configuration
+ENABLE_METRICS = os.getenv("ENABLE_METRICS", "true").lower() == "true"
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "Veloscope")
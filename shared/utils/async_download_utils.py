@@ -0,0 +1,195 @@
+"""
+Utility module for processing finished OpenAI batches on asyncio.
+
+This module holds the asyncio variants of ``download_utils``: a batch is
+polled, its output file downloaded and its horoscopes published without
+blocking the event loop, so the download stage can process all pending
+batches concurrently. The OpenAI requests share the limiter passed in by
+the caller. Leased processing, failed-request handling and control-file
+updates run the blocking code of ``download_utils`` in a worker thread,
+with the blocking OpenAI client the caller passes in.
+"""
+
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from openai import AsyncOpenAI, OpenAI, OpenAIError
+
+from ..config import DOWNLOAD_LEASING
+from .download_utils import (
+    TERMINAL_BATCH_STATUSES,
+    download_with_leases,
+    finish_batch,
+    finish_results,
+    has_results,
+    new_tally,
+    read_spool,
+    resume_from_checkpoint,
+    write_spool,
+)
+from .logging_utils import configure_logger
+from .metrics_utils import increment, span
+from .resilience_utils import OPENAI_GUARD, CircuitOpenError
+from .result_utils import (
+    ResultTally,
+    load_batch_manifest,
+    process_results_async,
+)
+from .scheduler_utils import FairLimiter, run_in_thread
+
+# Configure logger
+logger = configure_logger('async_download_utils')
+
+
+async def check_batch_completion_async(
+    async_client: AsyncOpenAI, batch_id: str, limit: FairLimiter
+) -> Optional[Any]:
+    """Asyncio variant of ``download_utils.check_batch_completion``."""
+    try:
+        async with limit:
+            with span("OpenAIBatchRetrieve"):
+                batch = await OPENAI_GUARD.call_async(
+                    lambda: async_client.batches.retrieve(batch_id)
+                )
+    except (OpenAIError, CircuitOpenError) as e:
+        logger.error(f"Error retrieving batch {batch_id}: {str(e)}")
+        return None
+
+    if batch.status in TERMINAL_BATCH_STATUSES:
+        logger.info(f"Batch {batch_id} status: {batch.status}")
+        return batch
+    logger.info(
+        f"Batch {batch_id} is still {batch.status}. Will check again later."
+    )
+    return None
+
+
+async def _spool_result_file_async(
+    async_client: AsyncOpenAI,
+    batch_id: str,
+    result_file_id: str,
+    limit: FairLimiter
+) -> Optional[str]:
+    """Asyncio variant of ``download_utils._spool_result_file``."""
+    result_text = read_spool(batch_id)
+    if result_text is not None:
+        return result_text
+
+    logger.info(f"Downloading result file: {result_file_id}")
+    try:
+        async with limit:
+            with span("OpenAIFileContent"):
+                result = await OPENAI_GUARD.call_async(
+                    lambda: async_client.files.content(result_file_id)
+                )
+        result_text = result.text
+    except (OpenAIError, CircuitOpenError) as e:
+        logger.error(f"Failed to download result file: {str(e)}")
+        return None
+    increment("OpenAIBytesRead", len(result_text), "Bytes")
+    write_spool(batch_id, result_text)
+    return str(result_text)
+
+
+async def _publish_output_async(
+    async_client: AsyncOpenAI,
+    batch: Any,
+    batch_info: Mapping[str, Any],
+    tally: ResultTally,
+    limit: FairLimiter
+) -> Optional[bool]:
+    """
+    Publish the horoscopes of a batch's output file, resuming if need be.
+
+    Returns:
+        bool: True if at least one horoscope of the batch was published,
+              or None if the output file could not be downloaded.
+    """
+    batch_id = batch_info["batch_id"]
+    result_text = await _spool_result_file_async(
+        async_client, batch_id, batch.output_file_id, limit
+    )
+    if result_text is None:
+        return None
+    progress, published_before = await run_in_thread(
+        resume_from_checkpoint,
+        batch_id, result_text, batch.output_file_id, tally
+    )
+    published_now = await process_results_async(
+        result_text,
+        batch_info["target_date"],
+        manifest=await run_in_thread(load_batch_manifest, batch_info),
+        tally=tally,
+        progress=progress
+    )
+    return published_now or published_before > 0
+
+
+async def download_and_upload_results_async(
+    client: OpenAI,
+    async_client: AsyncOpenAI,
+    batch: Any,
+    batch_info: Mapping[str, Any],
+    limit: FairLimiter
+) -> Tuple[Optional[bool], Dict[str, Any]]:
+    """
+    Asyncio variant of ``download_utils.download_and_upload_results``.
+
+    The output file is downloaded and its horoscopes published without
+    blocking the event loop. Leased processing and the failed-request
+    handling (error file and retry batch) run the blocking code in a
+    worker thread with ``client``.
+    """
+    try:
+        if DOWNLOAD_LEASING:
+            return await run_in_thread(
+                download_with_leases, client, batch, batch_info
+            )
+
+        tally = new_tally(batch)
+        success: Optional[bool] = False
+        if batch.output_file_id:
+            success = await _publish_output_async(
+                async_client, batch, batch_info, tally, limit
+            )
+            if success is None:
+                return None, {}
+        else:
+            logger.error("No result file found in batch.")
+        return await run_in_thread(
+            finish_results, client, batch, batch_info, tally, success
+        )
+
+    except Exception as e:
+        logger.error(
+            f"Unexpected error in download_and_upload_results_async: "
+            f"{str(e)}"
+        )
+        return None, {}
+
+
+async def process_batch_async(
+    client: OpenAI,
+    async_client: AsyncOpenAI,
+    batch_info: Mapping[str, Any],
+    limit: FairLimiter
+) -> bool:
+    """Asyncio variant of ``download_utils.process_batch``."""
+    batch = await check_batch_completion_async(
+        async_client, batch_info["openai_batch_id"], limit
+    )
+    if batch is None:
+        logger.info(
+            f"Batch {batch_info['batch_id']} not ready for processing yet"
+        )
+        return False
+
+    success, details = (
+        await download_and_upload_results_async(
+            client, async_client, batch, batch_info, limit
+        )
+        if has_results(batch) else (False, {})
+    )
+    # Control-file updates are serialized by control_file_utils
+    return await run_in_thread(
+        finish_batch, batch_info, batch, success, details
+    )
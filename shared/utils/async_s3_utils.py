@@ -0,0 +1,78 @@
+"""
+Asyncio variants of the Amazon S3 operations in ``s3_utils``.
+
+Each coroutine runs the corresponding ``s3_utils`` function on a shared
+thread pool, so error handling, metrics and the boto3 client (which is
+thread-safe) are the same as for the blocking calls, and the calls see the
+caller's tenant. A limiter per event loop keeps at most
+``S3_MAX_CONCURRENCY`` requests of all tenants in flight, shared by tenant
+weight; coroutines beyond that wait without occupying a thread, so callers
+can gather thousands of uploads at once.
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, TypeVar, Union
+
+from ..config import S3_MAX_CONCURRENCY
+from . import s3_utils
+from .scheduler_utils import loop_limiter
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(
+    max_workers=S3_MAX_CONCURRENCY, thread_name_prefix="s3"
+)
+
+
+async def _run(func: Callable[..., T], *args: Any) -> T:
+    """Run a blocking S3 call on the pool once a slot is free."""
+    context = contextvars.copy_context()
+    async with loop_limiter("s3", S3_MAX_CONCURRENCY):
+        return await asyncio.get_running_loop().run_in_executor(
+            _executor, functools.partial(context.run, func, *args)
+        )
+
+
+async def get_s3_object_async(key: str) -> Optional[bytes]:
+    """Get an object from the S3 bucket; see ``get_s3_object``."""
+    return await _run(s3_utils.get_s3_object, key)
+
+
+async def put_s3_object_async(
+    key: str, data: Union[str, bytes], content_type: str = "application/json"
+) -> bool:
+    """Put an object into the S3 bucket; see ``put_s3_object``."""
+    return await _run(s3_utils.put_s3_object, key, data, content_type)
+
+
+async def upload_json_to_s3_async(key: str, data: Dict[str, Any]) -> bool:
+    """Upload JSON data to S3; see ``upload_json_to_s3``."""
+    return await _run(s3_utils.upload_json_to_s3, key, data)
+
+
+async def download_json_from_s3_async(key: str) -> Optional[Dict[str, Any]]:
+    """Download and parse JSON data from S3; see ``download_json_from_s3``."""
+    return await _run(s3_utils.download_json_from_s3, key)
+
+
+async def upload_file_to_s3_async(local_path: str, s3_key: str) -> bool:
+    """Upload a file to S3; see ``upload_file_to_s3``."""
+    return await _run(s3_utils.upload_file_to_s3, local_path, s3_key)
+
+
+async def download_file_from_s3_async(s3_key: str, local_path: str) -> bool:
+    """Download a file from S3; see ``download_file_from_s3``."""
+    return await _run(s3_utils.download_file_from_s3, s3_key, local_path)
+
+
+async def list_objects_async(prefix: str = "") -> List[str]:
+    """List objects with the given prefix; see ``list_objects``."""
+    return await _run(s3_utils.list_objects, prefix)
+
+
+async def delete_object_async(key: str) -> bool:
+    """Delete an object from the S3 bucket; see ``delete_object``."""
+    return await _run(s3_utils.delete_object, key)
@@ -0,0 +1,299 @@
+"""
+Utility module for typed batch records.
+
+Batch entries of the control file are held in memory as ``BatchRecord``
+objects rather than plain dictionaries. This module provides:
+- ``BatchRecord``, a slotted record of the known batch fields that still
+  reads and writes like a dictionary, so stages can use either style
+- A codec between records and the JSON objects of the control file and its
+  archives, which keeps unknown fields
+- The allowed status transitions of a batch
+- ``BatchIndex``, a lookup of records by ID, input file and status, built
+  once per control-file load
+"""
+
+import copy
+import sys
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+)
+
+from ..config import (
+    STATUS_CANCELLED,
+    STATUS_COMPLETED,
+    STATUS_EXPIRED,
+    STATUS_FAILED,
+    STATUS_PREPARED,
+    STATUS_SUBMITTED,
+)
+from .logging_utils import configure_logger
+
+# Configure logger
+logger = configure_logger('batch_record_utils')
+
+# Fields every stage writes, in the order they are serialized
+BATCH_FIELDS = (
+    "batch_id",
+    "input_file",
+    "target_date",
+    "status",
+    "created_at",
+    "updated_at",
+    "rider_count",
+    "manifest_file",
+    "deadline",
+    "estimated_tokens",
+    "predicted_seconds",
+    "submit_after",
+    "shard",
+    "shard_count",
+    "parent_batch_id",
+    "retry_attempt",
+    "file_id",
+    "openai_batch_id",
+    "submitted_at",
+    "completed_at",
+    "openai_status",
+    "output_file_id",
+    "error_file_id",
+    "request_counts",
+    "usage",
+    "mode",
+    "error",
+    "openai_files_deleted_at",
+    "s3_objects_deleted_at",
+)
+_FIELD_SET = frozenset(BATCH_FIELDS)
+
+# String fields with few distinct values, shared between records
+_INTERNED_FIELDS = frozenset(
+    ("target_date", "status", "openai_status", "deadline", "mode")
+)
+
+# Statuses a batch may move to from each status. Express mode completes
+# batches in any status but completed; a batch may always keep its status
+ALLOWED_TRANSITIONS: Dict[str, FrozenSet[str]] = {
+    STATUS_PREPARED: frozenset(
+        (STATUS_SUBMITTED, STATUS_FAILED, STATUS_CANCELLED, STATUS_COMPLETED)
+    ),
+    STATUS_SUBMITTED: frozenset(
+        (STATUS_COMPLETED, STATUS_FAILED, STATUS_EXPIRED, STATUS_CANCELLED)
+    ),
+    STATUS_FAILED: frozenset((STATUS_COMPLETED,)),
+    STATUS_EXPIRED: frozenset((STATUS_COMPLETED,)),
+    STATUS_CANCELLED: frozenset((STATUS_COMPLETED,)),
+    STATUS_COMPLETED: frozenset(),
+}
+
+_MISSING = object()
+
+
+def _copy_value(value: Any) -> Any:
+    """Deep-copy a mutable field value; return others unchanged."""
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+def can_transition(old_status: Optional[str], new_status: str) -> bool:
+    """Return True if a batch in ``old_status`` may move to ``new_status``."""
+    if old_status == new_status or old_status not in ALLOWED_TRANSITIONS:
+        return True
+    return new_status in ALLOWED_TRANSITIONS[old_status]
+
+
+class BatchRecord(MutableMapping[str, Any]):
+    """
+    One batch entry of the control file.
+
+    Known fields live in slots, and fields that were never set are absent
+    rather than None, so a record serializes back to the same JSON object.
+    Unknown fields, such as the details a stage records with a status
+    change, are kept in a small dictionary.
+    """
+
+    __slots__ = BATCH_FIELDS + ("_extra",)
+
+    batch_id: str
+    input_file: str
+    target_date: str
+    status: str
+    created_at: str
+    updated_at: str
+    rider_count: int
+    manifest_file: Optional[str]
+    deadline: Optional[str]
+    estimated_tokens: int
+    predicted_seconds: int
+    submit_after: str
+    shard: int
+    shard_count: int
+    parent_batch_id: Optional[str]
+    retry_attempt: int
+    file_id: Optional[str]
+    openai_batch_id: str
+    submitted_at: str
+    completed_at: str
+    openai_status: str
+    output_file_id: Optional[str]
+    error_file_id: Optional[str]
+    request_counts: Dict[str, Any]
+    usage: Dict[str, int]
+    mode: str
+    error: str
+    openai_files_deleted_at: str
+    s3_objects_deleted_at: str
+    _extra: Optional[Dict[str, Any]]
+
+    def __init__(self, data: Optional[Mapping[str, Any]] = None) -> None:
+        self._extra = None
+        if not data:
+            return
+        # The decoding hot path, so __setitem__ is inlined
+        for key, value in data.items():
+            if key not in _FIELD_SET:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[key] = value
+                continue
+            if key in _INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            value = getattr(self, key, _MISSING)
+        else:
+            value = (self._extra or {}).get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in _FIELD_SET:
+            if key in _INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        try:
+            if key in _FIELD_SET:
+                delattr(self, key)
+            elif self._extra is not None:
+                del self._extra[key]
+            else:
+                raise KeyError(key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self) -> Iterator[str]:
+        for field in BATCH_FIELDS:
+            if getattr(self, field, _MISSING) is not _MISSING:
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"BatchRecord({self.to_dict()!r})"
+
+    def copy(self) -> "BatchRecord":
+        """
+        Return a copy that can be changed without affecting this one.
+
+        Nested dictionaries and lists, such as the usage or error details,
+        are copied too; strings and numbers are immutable and shared.
+        """
+        record = BatchRecord({
+            key: _copy_value(value)
+            for key, value in (self._extra or {}).items()
+        })
+        for field in BATCH_FIELDS:
+            value = getattr(self, field, _MISSING)
+            if value is not _MISSING:
+                setattr(record, field, _copy_value(value))
+        return record
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the record as a JSON-ready dictionary."""
+        data = {}
+        for field in BATCH_FIELDS:
+            value = getattr(self, field, _MISSING)
+            if value is not _MISSING:
+                data[field] = value
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+
+def decode_batches(entries: Iterable[Any]) -> List[BatchRecord]:
+    """
+    Build records from the ``batches`` list of the control file.
+
+    Entries that are not JSON objects are skipped.
+    """
+    records = []
+    for entry in entries:
+        if isinstance(entry, Mapping):
+            records.append(BatchRecord(entry))
+        else:
+            logger.warning(f"Skipping invalid batch entry: {entry!r}")
+    return records
+
+
+def encode_batches(
+    records: Iterable[Mapping[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Return records (or plain dictionaries) as JSON-ready dictionaries."""
+    return [
+        record.to_dict() if isinstance(record, BatchRecord) else dict(record)
+        for record in records
+    ]
+
+
+class BatchIndex:
+    """Records of one control-file load by batch ID, input file and status."""
+
+    __slots__ = ("by_id", "by_input_file", "by_status")
+
+    def __init__(self, records: Iterable[BatchRecord]) -> None:
+        self.by_id: Dict[str, BatchRecord] = {}
+        self.by_input_file: Dict[str, BatchRecord] = {}
+        self.by_status: Dict[str, List[BatchRecord]] = {}
+        for record in records:
+            batch_id = record.get("batch_id")
+            if batch_id:
+                self.by_id.setdefault(batch_id, record)
+            input_file = record.get("input_file")
+            if input_file:
+                self.by_input_file.setdefault(input_file, record)
+            self.by_status.setdefault(
+                record.get("status") or "", []
+            ).append(record)
+
+    def find(
+        self, batch_id: Optional[str] = None, input_file: Optional[str] = None
+    ) -> Optional[BatchRecord]:
+        """Look a record up by batch ID, falling back to its input file."""
+        record = self.by_id.get(batch_id) if batch_id else None
+        if record is None and input_file:
+            record = self.by_input_file.get(input_file)
+        return record
+
+    def with_status(self, status: str) -> List[BatchRecord]:
+        """Return the records in ``status``, in control-file order."""
+        return list(self.by_status.get(status, ()))
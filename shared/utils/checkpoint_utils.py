@@ -0,0 +1,76 @@
+"""
+Utility module for resumable processing checkpoints.
+
+A checkpoint is a small JSON document in S3 under ``CHECKPOINTS_PREFIX``
+recording how far a long-running step got (e.g. the last processed line of
+a batch result file) together with the state needed to continue. It lives
+in S3 rather than on local disk so that a replacement container, not just
+a restarted process, can resume where the previous one stopped.
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+from ..config import CHECKPOINTS_PREFIX
+from .logging_utils import configure_logger
+from .s3_utils import delete_object, get_s3_object_with_etag, put_s3_object
+
+# Configure logger
+logger = configure_logger('checkpoint_utils')
+
+
+def checkpoint_key(name: str) -> str:
+    """Return the S3 key of the checkpoint called ``name``."""
+    return f"{CHECKPOINTS_PREFIX}/{name}.json"
+
+
+def load_checkpoint(name: str) -> Optional[Dict[str, Any]]:
+    """
+    Load a checkpoint.
+
+    Args:
+        name (str): The checkpoint name, e.g. a batch ID.
+
+    Returns:
+        dict: The checkpoint data, or None if there is no checkpoint.
+    """
+    # A missing checkpoint is the normal case, so it is not logged as error
+    data, _ = get_s3_object_with_etag(checkpoint_key(name))
+    if data is None:
+        return None
+    try:
+        checkpoint: Dict[str, Any] = json.loads(data)
+    except json.JSONDecodeError as e:
+        logger.error(f"Ignoring invalid checkpoint {name}: {str(e)}")
+        return None
+    logger.info(f"Loaded checkpoint {name}")
+    return checkpoint
+
+
+def save_checkpoint(name: str, data: Dict[str, Any]) -> bool:
+    """
+    Save a checkpoint, replacing any earlier one.
+
+    Args:
+        name (str): The checkpoint name, e.g. a batch ID.
+        data (dict): The progress and state to resume from.
+
+    Returns:
+        bool: True if the checkpoint was saved.
+    """
+    return put_s3_object(
+        checkpoint_key(name), json.dumps(data, separators=(",", ":"))
+    )
+
+
+def clear_checkpoint(name: str) -> bool:
+    """
+    Delete a checkpoint once the work it tracks is finished.
+
+    Args:
+        name (str): The checkpoint name, e.g. a batch ID.
+
+    Returns:
+        bool: True if the checkpoint no longer exists.
+    """
+    return delete_object(checkpoint_key(name))
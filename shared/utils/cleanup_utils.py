@@ -0,0 +1,291 @@
+"""
+Utility module for cleaning up finished batches.
+
+Once a batch has reached a terminal status its OpenAI files and the
+intermediate S3 objects of the pipeline are no longer needed. This module
+provides functions to:
+- Delete the input, output and error files of finished batches from OpenAI
+  once ``OPENAI_FILE_RETENTION_DAYS`` have passed
+- Delete the intermediate S3 objects of terminal batches (input JSONL,
+  manifest, staged output, checkpoint and leases) once
+  ``INTERMEDIATE_RETENTION_DAYS`` have passed, with batched DeleteObjects
+  requests
+- Record the cleanup in the control file, so each batch is cleaned once
+
+The OpenAI files of a finished batch are due after the retention period.
+Those of a batch that failed, expired or was cancelled and has a retry
+batch are kept until the retry batch has finished too.
+Input files and manifests still referenced by a batch that is not cleaned
+up yet, such as a retry batch sharing its parent's manifest, are kept.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Mapping, Optional, Set
+
+from openai import NotFoundError, OpenAI, OpenAIError
+
+from ..config import (
+    CONTROL_RETENTION_DAYS,
+    INTERMEDIATE_RETENTION_DAYS,
+    LEASES_PREFIX,
+    OPENAI_FILE_RETENTION_DAYS,
+    RESULT_FILES_PREFIX,
+)
+from .checkpoint_utils import checkpoint_key
+from .control_file_utils import (
+    TERMINAL_STATUSES,
+    annotate_batches,
+    get_control_data,
+)
+from .logging_utils import configure_logger
+from .metrics_utils import increment, span
+from .resilience_utils import OPENAI_GUARD, CircuitOpenError
+from .s3_utils import delete_objects, list_objects
+
+# Configure logger
+logger = configure_logger('cleanup_utils')
+
+# Control-file fields recording when a batch was cleaned up
+OPENAI_FILES_DELETED = "openai_files_deleted_at"
+S3_OBJECTS_DELETED = "s3_objects_deleted_at"
+
+
+def _finished_at(batch: Mapping[str, Any]) -> Optional[datetime]:
+    """Return when a terminal batch finished, in UTC."""
+    value = batch.get("completed_at") or batch.get("updated_at")
+    try:
+        finished_at = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    # Naive timestamps are local times
+    return finished_at.astimezone(timezone.utc)
+
+
+def _openai_file_ids(
+    client: OpenAI, batch: Mapping[str, Any]
+) -> Optional[List[str]]:
+    """
+    Return the OpenAI files of a batch.
+
+    Batches recorded before the download stage kept the output and error
+    file IDs are looked up from OpenAI.
+
+    Returns:
+        list: The file IDs, or None if the batch could not be looked up.
+    """
+    file_ids = [batch.get("file_id")]
+    if batch.get("openai_batch_id") and "output_file_id" not in batch:
+        try:
+            with span("OpenAIBatchRetrieve"):
+                openai_batch = OPENAI_GUARD.call(
+                    lambda: client.batches.retrieve(batch["openai_batch_id"])
+                )
+        except (OpenAIError, CircuitOpenError) as e:
+            logger.error(
+                f"Error retrieving batch {batch['openai_batch_id']}: {str(e)}"
+            )
+            return None
+        file_ids += [
+            getattr(openai_batch, "output_file_id", None),
+            getattr(openai_batch, "error_file_id", None),
+        ]
+    else:
+        file_ids += [batch.get("output_file_id"), batch.get("error_file_id")]
+    return [file_id for file_id in file_ids if file_id]
+
+
+def _delete_openai_file(client: OpenAI, file_id: str) -> bool:
+    """Delete an OpenAI file; a file that is already gone counts as deleted."""
+    try:
+        with span("OpenAIFileDelete"):
+            OPENAI_GUARD.call(lambda: client.files.delete(file_id))
+    except NotFoundError:
+        pass
+    except (OpenAIError, CircuitOpenError) as e:
+        logger.error(f"Error deleting OpenAI file {file_id}: {str(e)}")
+        return False
+    increment("OpenAIFilesDeleted")
+    return True
+
+
+def _input_keys(batch: Mapping[str, Any]) -> Set[str]:
+    """Return the input JSONL and manifest keys of a batch."""
+    return {
+        key for key in (batch.get("input_file"), batch.get("manifest_file"))
+        if key
+    }
+
+
+def _intermediate_keys(batch: Mapping[str, Any]) -> List[str]:
+    """Return the S3 objects the download stage created for a batch."""
+    batch_id = batch["batch_id"]
+    return [
+        f"{RESULT_FILES_PREFIX}/{batch_id}-output.jsonl",
+        checkpoint_key(batch_id),
+    ] + list_objects(f"{LEASES_PREFIX}/{batch_id}/")
+
+
+def _is_due(batch: Mapping[str, Any], field: str, cutoff: datetime) -> bool:
+    """Return True if a batch finished before ``cutoff`` and is not clean."""
+    if batch.get("status") not in TERMINAL_STATUSES or batch.get(field):
+        return False
+    finished_at = _finished_at(batch)
+    return finished_at is not None and finished_at <= cutoff
+
+
+def _retry_finished(
+    batch: Mapping[str, Any], by_id: Mapping[str, Mapping[str, Any]]
+) -> bool:
+    """
+    Return True unless a batch's retry batch is still running.
+
+    Batches without a retry batch, because they completed, never reached
+    OpenAI, were not retried or ran out of retry attempts, have nothing
+    left to recover. A retry batch that is no longer in the control file
+    was archived when it finished.
+    """
+    retry_batch_id = batch.get("retry_batch_id")
+    if not retry_batch_id:
+        return True
+    retry = by_id.get(retry_batch_id)
+    return retry is None or retry.get("status") in TERMINAL_STATUSES
+
+
+def _warn_if_archived_first(
+    openai_retention_days: int, s3_retention_days: int
+) -> None:
+    """Warn when batches are archived before their cleanup is due."""
+    if 0 < CONTROL_RETENTION_DAYS < max(
+        openai_retention_days, s3_retention_days
+    ):
+        logger.warning(
+            "Cleanup retention exceeds CONTROL_RETENTION_DAYS; batches "
+            "archived before their retention ends are never cleaned up"
+        )
+
+
+def _delete_openai_files(
+    client: OpenAI,
+    due: List[Mapping[str, Any]],
+    dry_run: bool,
+    annotations: Dict[str, Dict[str, Any]],
+    stamp: str
+) -> int:
+    """Delete the OpenAI files of due batches; return how many."""
+    count = 0
+    for batch in due:
+        file_ids = _openai_file_ids(client, batch)
+        if file_ids is None:
+            continue
+        if dry_run:
+            logger.info(f"Would delete OpenAI files {file_ids}")
+            count += len(file_ids)
+            continue
+        deleted = [f for f in file_ids if _delete_openai_file(client, f)]
+        count += len(deleted)
+        if len(deleted) == len(file_ids):
+            annotations.setdefault(batch["batch_id"], {})[
+                OPENAI_FILES_DELETED
+            ] = stamp
+    return count
+
+
+def _delete_s3_objects(
+    batches: List[Mapping[str, Any]],
+    due: List[Mapping[str, Any]],
+    dry_run: bool,
+    annotations: Dict[str, Dict[str, Any]],
+    stamp: str
+) -> int:
+    """Delete the intermediate S3 objects of due batches; return how many."""
+    due_ids = {batch["batch_id"] for batch in due}
+    # Keep inputs shared with batches that are not cleaned up yet
+    in_use: Set[str] = set()
+    for batch in batches:
+        if batch.get("batch_id") not in due_ids and \
+                not batch.get(S3_OBJECTS_DELETED):
+            in_use |= _input_keys(batch)
+    keys_by_batch = {
+        batch["batch_id"]: sorted(_input_keys(batch) - in_use) +
+        _intermediate_keys(batch)
+        for batch in due
+    }
+    keys = sorted({key for keys in keys_by_batch.values() for key in keys})
+    if dry_run:
+        for key in keys:
+            logger.info(f"Would delete s3://{key}")
+        return len(keys)
+    if not keys:
+        return 0
+    with span("S3Cleanup"):
+        failed = set(delete_objects(keys))
+    for batch_id, batch_keys in keys_by_batch.items():
+        if not failed.intersection(batch_keys):
+            annotations.setdefault(batch_id, {})[S3_OBJECTS_DELETED] = stamp
+    return len(keys) - len(failed)
+
+
+def cleanup_batches(
+    client: OpenAI,
+    openai_retention_days: int = OPENAI_FILE_RETENTION_DAYS,
+    s3_retention_days: int = INTERMEDIATE_RETENTION_DAYS,
+    dry_run: bool = False,
+    now: Optional[datetime] = None
+) -> Dict[str, int]:
+    """
+    Delete the OpenAI files and intermediate S3 objects of finished batches.
+
+    A batch whose deletions partly failed is not marked clean and is tried
+    again on the next run.
+
+    Args:
+        client (OpenAI): The client to delete the OpenAI files with.
+        openai_retention_days (int): Days the OpenAI files of a finished
+            batch are kept.
+        s3_retention_days (int): Days the intermediate S3 objects of a
+            terminal batch are kept.
+        dry_run (bool): Only log what would be deleted.
+        now (datetime, optional): The current time, for tests.
+
+    Returns:
+        dict: The number of ``openai_files`` and ``s3_objects`` deleted (or
+              due for deletion in a dry run).
+    """
+    _warn_if_archived_first(openai_retention_days, s3_retention_days)
+    now = now or datetime.now(timezone.utc)
+    openai_cutoff = now - timedelta(days=openai_retention_days)
+    s3_cutoff = now - timedelta(days=s3_retention_days)
+    stamp = now.isoformat()
+    batches = get_control_data()["batches"]
+    by_id = {batch["batch_id"]: batch for batch in batches}
+    annotations: Dict[str, Dict[str, Any]] = {}
+
+    counts = {
+        "openai_files": _delete_openai_files(
+            client,
+            [
+                batch for batch in batches
+                if _is_due(batch, OPENAI_FILES_DELETED, openai_cutoff)
+                and _retry_finished(batch, by_id)
+            ],
+            dry_run, annotations, stamp
+        ),
+        "s3_objects": _delete_s3_objects(
+            batches,
+            [
+                batch for batch in batches
+                if _is_due(batch, S3_OBJECTS_DELETED, s3_cutoff)
+            ],
+            dry_run, annotations, stamp
+        ),
+    }
+
+    if annotations and not annotate_batches(annotations):
+        logger.warning("Failed to record the cleanup in the control file")
+    increment("BatchesCleanedUp", len(annotations))
+    logger.info(
+        f"{'Would delete' if dry_run else 'Deleted'} "
+        f"{counts['openai_files']} OpenAI files and "
+        f"{counts['s3_objects']} S3 objects"
+    )
+    return counts
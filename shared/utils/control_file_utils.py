@@ -3,40 +3,184 @@ Utility module for managing batch control data.
 
 This module provides functions to read, update, and manage the batch control
 file stored in S3. It handles operations such as:
-- Retrieving control data from S3
-- Updating control data in S3
-- Filtering batches by status
-- Creating new batch entries
-- Updating batch status
+- Retrieving control data from S3, through a per-process cache that is
+  revalidated with conditional GETs. Batches are decoded into
+  ``BatchRecord`` objects and indexed by ID and status once per load;
+  callers get copies, never the cached objects
+- Updating control data in S3 with conditional writes that re-apply the
+  change to a fresh copy when another process wrote in between
+- Filtering batches by status, ID or input file, and finding the target
+  dates that already have batches
+- Creating new batch entries, alone or several with one write
+- Updating batch status, rejecting invalid status transitions, and
+  annotating batches without touching it
+- Compacting the control file by archiving old terminal batches, and
+  querying those archives
 """
 
+import functools
+import gzip
+import json
+import threading
 import uuid
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+import zlib
+from datetime import date, datetime, timedelta
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    cast,
+)
 
 from ..config import (
+    CONTROL_ARCHIVE_PREFIX,
     CONTROL_KEY,
+    CONTROL_RETENTION_DAYS,
+    STATUS_CANCELLED,
     STATUS_COMPLETED,
+    STATUS_EXPIRED,
     STATUS_FAILED,
     STATUS_PREPARED,
     STATUS_SUBMITTED,
 )
+from .batch_record_utils import (
+    BatchIndex,
+    BatchRecord,
+    can_transition,
+    decode_batches,
+    encode_batches,
+)
 from .logging_utils import configure_logger
-from .s3_utils import download_json_from_s3, upload_json_to_s3
+from .metrics_utils import increment, span
+from .s3_utils import (
+    delete_object,
+    get_s3_object,
+    get_s3_object_with_etag,
+    list_objects,
+    put_s3_object,
+    put_s3_object_conditional,
+)
+from .tenant_utils import current_tenant
 
 # Configure logger
 logger = configure_logger('control_file_utils')
 
+# Statuses after which a batch entry never changes again
+TERMINAL_STATUSES = (
+    STATUS_COMPLETED, STATUS_FAILED, STATUS_EXPIRED, STATUS_CANCELLED
+)
 
-def get_control_data() -> Dict[str, Any]:
+# Times a control-file update is applied before it gives up on conflicts
+CONTROL_UPDATE_ATTEMPTS = 5
+
+
+# Control data of the last read or write in this process, with its ETag
+# and the index of its batches, per tenant
+_control_caches: Dict[str, Dict[str, Any]] = {}
+
+# Serializes read-modify-write updates from worker threads of one process
+_control_lock = threading.RLock()
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def _with_control_lock(func: F) -> F:
+    """Run ``func`` while holding the process-wide control-file lock."""
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with _control_lock:
+            return func(*args, **kwargs)
+    return cast(F, wrapper)
+
+
+def _control_cache() -> Dict[str, Any]:
+    """Return the control-file cache of the current tenant."""
+    return _control_caches.setdefault(
+        current_tenant().tenant_id, {"etag": None, "data": None, "index": None}
+    )
+
+
+def invalidate_control_cache() -> None:
     """
-    Retrieve the batch control data from S3.
+    Forget the current tenant's cached control data, forcing the next read
+    to download.
+    """
+    _control_caches.pop(current_tenant().tenant_id, None)
 
-    Returns:
-        dict: The control data as a dictionary, or an empty dictionary with
-              'batches' key if the file doesn't exist or can't be read.
+
+def _read_control_object() -> Optional[Any]:
+    """
+    Return the parsed control file, revalidating the cached copy.
+
+    The cached copy's ETag is sent as ``If-None-Match``; if the file is
+    unchanged S3 answers 304 and the cached object is returned without
+    downloading or parsing anything.
+    """
+    cached_etag = _control_cache()["etag"]
+    data, etag = get_s3_object_with_etag(
+        CONTROL_KEY, if_none_match=cached_etag
+    )
+    if data is None:
+        if cached_etag is not None and etag == cached_etag:
+            increment("ControlFileCacheHits")
+            return _control_cache()["data"]
+        invalidate_control_cache()
+        return None
+    increment("ControlFileBytesRead", len(data), "Bytes")
+    try:
+        control_data = json.loads(data)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parsing control file JSON: {str(e)}")
+        invalidate_control_cache()
+        return None
+    if isinstance(control_data, dict) and \
+            isinstance(control_data.get("batches"), list):
+        control_data["batches"] = decode_batches(control_data["batches"])
+    _control_cache()["etag"] = etag
+    _control_cache()["data"] = control_data
+    _control_cache()["index"] = None
+    return control_data
+
+
+def _batch_index(control_data: Dict[str, Any]) -> BatchIndex:
+    """
+    Return the index of the batches in ``control_data``.
+
+    The index of the cached control data is built once and reused until the
+    data is reloaded or written.
+    """
+    cache = _control_cache()
+    if cache["data"] is not control_data:
+        return BatchIndex(control_data.get("batches", []))
+    if cache["index"] is None:
+        cache["index"] = BatchIndex(control_data.get("batches", []))
+    return cast(BatchIndex, cache["index"])
+
+
+def _dump_control_data(control_data: Dict[str, Any]) -> str:
+    """Serialize control data, encoding its batch records."""
+    return json.dumps(
+        {**control_data, "batches": encode_batches(control_data["batches"])},
+        indent=2
+    )
+
+
+def _load_control_data() -> Dict[str, Any]:
+    """
+    Return the cached control data, revalidated against S3.
+
+    The result is shared with the cache and must not be modified; see
+    ``get_control_data``.
     """
-    control_data = download_json_from_s3(CONTROL_KEY)
+    with span("ControlFileRead"):
+        control_data = _read_control_object()
     if control_data is None:
         logger.info("Control file not found, creating new one")
         control_data = {"batches": []}
@@ -55,23 +199,84 @@ def get_control_data() -> Dict[str, Any]:
     return control_data
 
 
-def update_control_data(control_data: Dict[str, Any]) -> bool:
+def get_control_data() -> Dict[str, Any]:
+    """
+    Retrieve the batch control data from S3.
+
+    Repeated calls within a process are served from a cache as long as the
+    file in S3 is unchanged, but every call returns its own copy, so
+    changing it does not affect other readers. Changes are saved with
+    ``update_control_data``. Batch entries are ``BatchRecord`` objects,
+    which read and write like dictionaries.
+
+    Returns:
+        dict: The control data as a dictionary, or an empty dictionary with
+              'batches' key if the file doesn't exist or can't be read.
     """
-    Update the batch control data in S3.
+    control_data = _load_control_data()
+    return {
+        **control_data,
+        "batches": [batch.copy() for batch in control_data["batches"]],
+    }
+
+
+@_with_control_lock
+def update_control_data(mutate: Callable[[Dict[str, Any]], bool]) -> bool:
+    """
+    Change the batch control data in S3.
+
+    ``mutate`` is applied to a copy of the control data, which is then
+    written on condition that the file still has the ETag it was read with
+    (or, for a new file, that none exists yet). If another process wrote
+    in between, the file is reloaded and ``mutate`` applied again, up to
+    ``CONTROL_UPDATE_ATTEMPTS`` times, so no update is lost. On success the
+    written data and its new ETag replace the cached copy (write-through);
+    on failure the cache is dropped.
 
     Args:
-        control_data (dict): The control data to upload.
+        mutate (callable): Changes the control data in place and returns
+            True, or returns False to leave the file unchanged.
 
     Returns:
-        bool: True if the update was successful, False otherwise.
+        bool: True if the update was successful, False if ``mutate``
+              declined it or the write failed.
     """
-    success = upload_json_to_s3(CONTROL_KEY, control_data)
-    if not success:
-        logger.error("Failed to update control data in S3")
-    return success
+    for _ in range(CONTROL_UPDATE_ATTEMPTS):
+        control_data = get_control_data()
+        etag = _control_cache()["etag"]
+        if not mutate(control_data):
+            return False
+        try:
+            control_data["batches"] = [
+                batch if isinstance(batch, BatchRecord)
+                else BatchRecord(batch)
+                for batch in control_data["batches"]
+            ]
+            json_data = _dump_control_data(control_data)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Error serializing control data: {str(e)}")
+            invalidate_control_cache()
+            return False
+
+        with span("ControlFileWrite"):
+            new_etag = put_s3_object_conditional(
+                CONTROL_KEY, json_data, if_match=etag,
+                create_only=etag is None, content_type="application/json"
+            )
+        invalidate_control_cache()
+        if new_etag is not None:
+            increment("ControlFileBytesWritten", len(json_data), "Bytes")
+            _control_cache()["etag"] = new_etag
+            _control_cache()["data"] = control_data
+            return True
+        increment("ControlFileWriteConflicts")
+        logger.warning("Control file changed since it was read, retrying")
+
+    logger.error("Failed to update control data in S3")
+    return False
 
 
-def get_batches_by_status(status: str) -> List[Dict[str, Any]]:
+def get_batches_by_status(status: str) -> List[BatchRecord]:
     """
     Get all batches with a specific status from the control file.
 
@@ -79,12 +284,11 @@ def get_batches_by_status(status: str) -> List[Dict[str, Any]]:
         status (str): The status to filter by (e.g., 'prepared', 'submitted').
 
     Returns:
-        list: A list of batch dictionaries with the specified status.
+        list: A list of batch records with the specified status.
     """
-    control_data = get_control_data()
     filtered_batches = [
-        batch for batch in control_data.get("batches", [])
-        if batch.get("status") == status
+        batch.copy()
+        for batch in _batch_index(_load_control_data()).with_status(status)
     ]
 
     logger.info(
@@ -93,46 +297,99 @@ def get_batches_by_status(status: str) -> List[Dict[str, Any]]:
     return filtered_batches
 
 
-def get_pending_batches() -> List[Dict[str, Any]]:
+def get_batch_by_id(batch_id: str) -> Optional[BatchRecord]:
+    """
+    Get a single batch from the control file by its ID.
+
+    Args:
+        batch_id (str): The ID of the batch to retrieve.
+
+    Returns:
+        BatchRecord: The batch record, or None if no batch has the given ID.
+    """
+    batch = _batch_index(_load_control_data()).find(batch_id)
+    if batch is None:
+        logger.error(f"Batch not found: ID={batch_id}")
+        return None
+    return batch.copy()
+
+
+def get_batch_by_input_file(s3_key: str) -> Optional[BatchRecord]:
+    """
+    Get a single batch from the control file by its input file.
+
+    Args:
+        s3_key (str): The S3 key of the batch's input file.
+
+    Returns:
+        BatchRecord: The batch record, or None if no batch uses the file.
+    """
+    batch = _batch_index(_load_control_data()).find(
+        input_file=s3_key
+    )
+    return batch.copy() if batch is not None else None
+
+
+def get_pending_batches() -> List[BatchRecord]:
     """
     Get all batches with 'submitted' status from the control file.
 
     Returns:
-        list: A list of batch dictionaries with 'submitted' status.
+        list: A list of batch records with 'submitted' status.
     """
     return get_batches_by_status(STATUS_SUBMITTED)
 
 
-def get_prepared_batches() -> List[Dict[str, Any]]:
+def get_prepared_batches() -> List[BatchRecord]:
     """
     Get all batches with 'prepared' status from the control file.
 
     Returns:
-        list: A list of batch dictionaries with 'prepared' status.
+        list: A list of batch records with 'prepared' status.
     """
     return get_batches_by_status(STATUS_PREPARED)
 
 
-def get_completed_batches() -> List[Dict[str, Any]]:
+def get_completed_batches() -> List[BatchRecord]:
     """
     Get all batches with 'completed' status from the control file.
 
     Returns:
-        list: A list of batch dictionaries with 'completed' status.
+        list: A list of batch records with 'completed' status.
     """
     return get_batches_by_status(STATUS_COMPLETED)
 
 
-def get_failed_batches() -> List[Dict[str, Any]]:
+def get_failed_batches() -> List[BatchRecord]:
     """
     Get all batches with 'failed' status from the control file.
 
     Returns:
-        list: A list of batch dictionaries with 'failed' status.
+        list: A list of batch records with 'failed' status.
     """
     return get_batches_by_status(STATUS_FAILED)
 
 
+def get_scheduled_target_dates() -> Set[str]:
+    """
+    Get the target dates that have a prepared, submitted or completed batch.
+
+    Dates whose batches all failed, expired or were cancelled are not
+    included, so they are prepared again.
+
+    Returns:
+        set: The target dates, as ISO ``YYYY-MM-DD`` strings.
+    """
+    index = _batch_index(_load_control_data())
+    return {
+        str(batch["target_date"])
+        for status in (STATUS_PREPARED, STATUS_SUBMITTED, STATUS_COMPLETED)
+        for batch in index.by_status.get(status, ())
+        if batch.get("target_date")
+    }
+
+
+@_with_control_lock
 def create_batch(
     input_file: str,
     target_date: str,
@@ -155,44 +412,68 @@ def create_batch(
                operation was successful, and batch_id is the ID of the created
                batch.
     """
-    try:
-        control_data = get_control_data()
-
-        # Generate a unique batch ID
-        batch_id = str(uuid.uuid4())
+    batch_ids = create_batches(
+        [(input_file, target_date, additional_data or {})], status
+    )
+    if batch_ids is None:
+        return False, None
+    return True, batch_ids[0]
 
-        # Create the batch entry
-        batch_entry = {
-            "batch_id": batch_id,
-            "input_file": input_file,
-            "target_date": target_date,
-            "status": status,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
 
-        # Add additional data if provided
-        if additional_data:
-            batch_entry.update(additional_data)
+@_with_control_lock
+def create_batches(
+    entries: Sequence[Tuple[str, str, Mapping[str, Any]]],
+    status: str = STATUS_PREPARED
+) -> Optional[List[str]]:
+    """
+    Create several batch entries in the control file with one write.
 
-        # Add the batch to the control data
-        control_data["batches"].append(batch_entry)
+    Either every entry is added or, if the write fails, none is.
 
-        # Update the control file
-        # pylint: disable=R1705
-        if update_control_data(control_data):
-            logger.info(f"Created new batch with ID: {batch_id}")
-            return True, batch_id
-        else:
-            logger.error("Failed to create batch")
-            return False, None
-        # pylint: enable=R1705
+    Args:
+        entries (list): (input_file, target_date, additional_data) of each
+            batch, as for ``create_batch``.
+        status (str, optional): The initial status of the batches.
+            Defaults to 'prepared'.
 
+    Returns:
+        list: The IDs of the created batches, in the order of ``entries``,
+              or None if the batches could not be created.
+    """
+    try:
+        now = datetime.now().isoformat()
+        records = []
+        for input_file, target_date, additional_data in entries:
+            # Generate a unique batch ID and create the batch entry
+            record = BatchRecord({
+                "batch_id": str(uuid.uuid4()),
+                "input_file": input_file,
+                "target_date": target_date,
+                "status": status,
+                "created_at": now,
+                "updated_at": now
+            })
+            record.update(additional_data)
+            records.append(record)
+
+        def add_batches(control_data: Dict[str, Any]) -> bool:
+            control_data["batches"].extend(records)
+            return True
+
+        # Add the batches to the control file
+        if not update_control_data(add_batches):
+            logger.error("Failed to create batches")
+            return None
     except Exception as e:
-        logger.error(f"Error creating batch: {str(e)}")
-        return False, None
+        logger.error(f"Error creating batches: {str(e)}")
+        return None
+
+    batch_ids = [str(record["batch_id"]) for record in records]
+    logger.info(f"Created new batches with IDs: {', '.join(batch_ids)}")
+    return batch_ids
 
 
+@_with_control_lock
 def update_batch_status(
     batch_id: Optional[str] = None,
     s3_key: Optional[str] = None,
@@ -202,6 +483,9 @@ def update_batch_status(
     """
     Update the status and/or additional data of a batch in the control file.
 
+    A status change not allowed by ``ALLOWED_TRANSITIONS`` (such as moving a
+    completed batch back to failed) is rejected.
+
     Args:
         batch_id (str, optional): The ID of the batch to update.
         s3_key (str, optional): The S3 key of the batch's input file
@@ -211,36 +495,268 @@ def update_batch_status(
             the batch entry.
 
     Returns:
-        bool: True if the update was successful, False otherwise.
+        bool: True if the update was successful, False if the batch was not
+              found, the transition is not allowed or the write failed.
     """
     if not batch_id and not s3_key:
         logger.error("Either batch_id or s3_key must be provided")
         return False
 
-    control_data = get_control_data()
+    def update_batch(control_data: Dict[str, Any]) -> bool:
+        # Find the batch to update
+        batch = _batch_index(control_data).find(batch_id, s3_key)
+        if batch is None:
+            logger.error(f"Batch not found: ID={batch_id}, S3 Key={s3_key}")
+            return False
+
+        # Update status if provided
+        if new_status:
+            if not can_transition(batch.get("status"), new_status):
+                increment("InvalidStatusTransitions")
+                logger.error(
+                    f"Not moving batch {batch.get('batch_id')} from "
+                    f"{batch.get('status')} to {new_status}"
+                )
+                return False
+            batch["status"] = new_status
+
+        # Update additional data if provided
+        if additional_data:
+            batch.update(additional_data)
 
-    # Find the batch to update
-    for batch in control_data.get("batches", []):
-        if (batch_id and batch.get("batch_id") == batch_id) or \
-           (s3_key and batch.get("input_file") == s3_key):
+        # Update the timestamp
+        batch["updated_at"] = datetime.now().isoformat()
+        return True
 
-            # Update status if provided
-            if new_status:
-                batch["status"] = new_status
+    # Save the updated control data
+    if not update_control_data(update_batch):
+        return False
+    logger.info(f"Updated batch {batch_id or s3_key} status to {new_status}")
+    return True
 
-            # Update additional data if provided
-            if additional_data:
-                batch.update(additional_data)
 
-            # Update the timestamp
-            batch["updated_at"] = datetime.now().isoformat()
+@_with_control_lock
+def annotate_batches(annotations: Dict[str, Dict[str, Any]]) -> bool:
+    """
+    Add bookkeeping data to several batches with one control-file write.
 
-            logger.info(
-                f"Updated batch {batch.get('batch_id')} status to {new_status}"
-            )
+    Unlike ``update_batch_status`` this leaves ``updated_at`` alone, so
+    annotating a terminal batch does not restart its retention window.
+
+    Args:
+        annotations (dict): The data to add to each batch, keyed by batch
+            ID. Batches no longer in the control file are skipped.
 
-            # Save the updated control data
-            return update_control_data(control_data)
+    Returns:
+        bool: True if the update was successful, False otherwise.
+    """
+    if not annotations:
+        return True
 
-    logger.error(f"Batch not found: ID={batch_id}, S3 Key={s3_key}")
-    return False
+    def annotate(control_data: Dict[str, Any]) -> bool:
+        index = _batch_index(control_data)
+        for batch_id, data in annotations.items():
+            batch = index.find(batch_id)
+            if batch is not None:
+                batch.update(data)
+        return True
+
+    return update_control_data(annotate)
+
+
+def _batch_updated_at(batch: Mapping[str, Any]) -> Optional[datetime]:
+    """Return when a batch entry last changed, as a naive local time."""
+    value = batch.get("updated_at") or batch.get("created_at")
+    try:
+        updated_at = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if updated_at.tzinfo is not None:
+        updated_at = updated_at.astimezone().replace(tzinfo=None)
+    return updated_at
+
+
+def _archive_prefix(target_date: str) -> str:
+    """Return the archive prefix of a target date (``YYYY/MM/DD``)."""
+    return f"{CONTROL_ARCHIVE_PREFIX}/{target_date.replace('-', '/')}/"
+
+
+def _split_archivable(
+    batches: List[Dict[str, Any]], cutoff: datetime
+) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+    """
+    Split batches into those to keep and those to archive.
+
+    Returns:
+        tuple: (live, by_date) where live are the batches that stay in the
+               control file and by_date the terminal batches unchanged
+               since ``cutoff``, grouped by target date.
+    """
+    live: List[Dict[str, Any]] = []
+    by_date: Dict[str, List[Dict[str, Any]]] = {}
+    for batch in batches:
+        updated_at = _batch_updated_at(batch)
+        if batch.get("status") in TERMINAL_STATUSES and \
+                updated_at is not None and updated_at < cutoff:
+            target_date = str(batch.get("target_date", "unknown"))
+            by_date.setdefault(target_date, []).append(batch)
+        else:
+            live.append(batch)
+    return live, by_date
+
+
+def _write_archives(
+    by_date: Dict[str, List[Dict[str, Any]]], stamp: str
+) -> Optional[List[str]]:
+    """
+    Write one gzipped JSONL archive object per target date.
+
+    Returns:
+        list: The written keys, or None if a write failed; the archives
+              written before the failure are deleted again.
+    """
+    written: List[str] = []
+    for target_date, archived in sorted(by_date.items()):
+        key = f"{_archive_prefix(target_date)}batches-{stamp}.jsonl.gz"
+        body = gzip.compress("".join(
+            json.dumps(record, separators=(",", ":")) + "\n"
+            for record in encode_batches(archived)
+        ).encode("utf-8"))
+        if not put_s3_object(key, body, "application/gzip"):
+            logger.error("Failed to write control archive, not compacting")
+            _delete_archives(written)
+            return None
+        written.append(key)
+    return written
+
+
+def _delete_archives(keys: List[str]) -> None:
+    """Delete archive objects of a compaction that did not go through."""
+    for key in keys:
+        delete_object(key)
+
+
+def compact_control_data(
+    retention_days: int = CONTROL_RETENTION_DAYS,
+    now: Optional[datetime] = None
+) -> int:
+    """
+    Move old terminal batches from the control file to archive objects.
+
+    Batches in a terminal status that have not changed for
+    ``retention_days`` are written as compact, gzipped JSONL to one archive
+    object per target date, then removed from the control file. The control
+    file is replaced with a conditional write, so a concurrent update by a
+    pipeline stage is never lost: compaction gives up instead and deletes
+    the archives it wrote.
+
+    Args:
+        retention_days (int): Days a terminal batch stays in the control
+            file.
+        now (datetime, optional): The current time, for tests.
+
+    Returns:
+        int: The number of archived batches.
+    """
+    control_data = _read_control_object()
+    etag = _control_cache()["etag"]
+    if control_data is None or etag is None:
+        logger.info("No control file to compact")
+        return 0
+    try:
+        batches = list(control_data["batches"])
+    except (KeyError, TypeError) as e:
+        logger.error(f"Not compacting unreadable control file: {str(e)}")
+        return 0
+
+    now = now or datetime.now()
+    live, by_date = _split_archivable(
+        batches, now - timedelta(days=retention_days)
+    )
+    if not by_date:
+        logger.info("No batches old enough to archive")
+        return 0
+
+    written = _write_archives(by_date, now.strftime("%Y%m%dT%H%M%S"))
+    if written is None:
+        return 0
+
+    compacted = {**control_data, "batches": live}
+    new_etag = put_s3_object_conditional(
+        CONTROL_KEY, _dump_control_data(compacted), if_match=etag
+    )
+    if new_etag is None:
+        logger.warning(
+            "Control file changed during compaction, will retry next run"
+        )
+        invalidate_control_cache()
+        _delete_archives(written)
+        return 0
+    _control_cache()["etag"] = new_etag
+    _control_cache()["data"] = compacted
+    _control_cache()["index"] = None
+
+    archived_count = len(batches) - len(live)
+    increment("ControlBatchesArchived", archived_count)
+    logger.info(
+        f"Archived {archived_count} batches in {len(written)} objects, "
+        f"{len(live)} batches remain in the control file"
+    )
+    return archived_count
+
+
+def _read_archive(key: str) -> List[BatchRecord]:
+    """
+    Read the batch records of an archive object.
+
+    Returns:
+        list: The archived batch records, or an empty list if the archive
+              could not be read or is corrupt.
+    """
+    data = get_s3_object(key)
+    if data is None:
+        return []
+    try:
+        return [
+            BatchRecord(json.loads(line))
+            for line in gzip.decompress(data).decode("utf-8").splitlines()
+        ]
+    except (OSError, EOFError, zlib.error, ValueError) as e:
+        logger.error(f"Skipping unreadable control archive {key}: {str(e)}")
+        return []
+
+
+def query_archived_batches(
+    start_date: str,
+    end_date: Optional[str] = None,
+    status: Optional[str] = None,
+    batch_id: Optional[str] = None
+) -> List[BatchRecord]:
+    """
+    Find archived batches by target date, and optionally status or ID.
+
+    Args:
+        start_date (str): The first target date (``YYYY-MM-DD``).
+        end_date (str, optional): The last target date, inclusive.
+            Defaults to ``start_date``.
+        status (str, optional): Only return batches with this status.
+        batch_id (str, optional): Only return the batch with this ID.
+
+    Returns:
+        list: The matching batch records, ordered by target date. A
+              batch archived twice (after an interrupted compaction) is
+              returned once; unreadable archives are skipped.
+    """
+    day = date.fromisoformat(start_date)
+    last_day = date.fromisoformat(end_date or start_date)
+    found: Dict[str, BatchRecord] = {}
+    while day <= last_day:
+        for key in sorted(list_objects(_archive_prefix(day.isoformat()))):
+            for batch in _read_archive(key):
+                if status and batch.get("status") != status:
+                    continue
+                if batch_id and batch.get("batch_id") != batch_id:
+                    continue
+                found[batch.get("batch_id", key)] = batch
+        day += timedelta(days=1)
+    return list(found.values())
@@ -0,0 +1,866 @@
+"""
+Utility module for processing the results of finished OpenAI batches.
+
+The download stage uses this module to turn a batch that reached a
+terminal status on OpenAI into published horoscopes and a control-file
+outcome. This module provides functions to:
+- Check whether an OpenAI batch has reached a terminal status
+- Download (and spool) its output file and publish the horoscopes,
+  resuming from the batch's checkpoint
+- Share the output file between download workers by leasing byte ranges
+  of a staged copy in S3
+- Resubmit the failed (or, for expired and cancelled batches, unpublished)
+  requests as a retry batch
+- Record the terminal status of the batch in the control file
+
+The OpenAI client is passed in by the caller.
+"""
+
+import datetime
+import json
+import os
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from openai import OpenAI, OpenAIError
+
+from ..config import (
+    DOWNLOAD_LEASING,
+    LEASE_TTL_SECONDS,
+    OUTPUT_PREFIX,
+    RESULT_DIR,
+    RESULT_FILES_PREFIX,
+    RESULT_RANGE_BYTES,
+    RETRY_MAX_ATTEMPTS,
+    STATUS_CANCELLED,
+    STATUS_COMPLETED,
+    STATUS_EXPIRED,
+    STATUS_FAILED,
+)
+from .checkpoint_utils import (
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
+from .control_file_utils import (
+    create_batch,
+    get_batch_by_input_file,
+    update_batch_status,
+)
+from .lease_utils import (
+    LEASE_DONE,
+    LeaseLostError,
+    acquire_lease,
+    complete_lease,
+    lease_key,
+    read_lease,
+    read_line_range,
+    release_lease,
+    renew_lease_if_due,
+    split_byte_ranges,
+)
+from .logging_utils import configure_logger
+from .manifest_utils import ManifestEntry
+from .metrics_utils import increment, span
+from .resilience_utils import OPENAI_GUARD, CircuitOpenError
+from .result_utils import (
+    ResultProgress,
+    ResultTally,
+    load_batch_manifest,
+    merge_usage,
+    process_results,
+    published_custom_ids,
+    record_usage,
+)
+from .s3_utils import (
+    download_file_from_s3,
+    get_object_size,
+    put_s3_object_conditional,
+    upload_file_to_s3,
+)
+
+# Configure logger
+logger = configure_logger('download_utils')
+
+# OpenAI batch status constants
+BATCH_STATUS_COMPLETED = "completed"
+BATCH_STATUS_FAILED = "failed"
+BATCH_STATUS_EXPIRED = "expired"
+BATCH_STATUS_CANCELLED = "cancelled"
+BATCH_STATUS_IN_PROGRESS = "in_progress"
+
+# Control file status for each terminal OpenAI batch status
+TERMINAL_BATCH_STATUSES = {
+    BATCH_STATUS_COMPLETED: STATUS_COMPLETED,
+    BATCH_STATUS_FAILED: STATUS_FAILED,
+    BATCH_STATUS_EXPIRED: STATUS_EXPIRED,
+    BATCH_STATUS_CANCELLED: STATUS_CANCELLED,
+}
+# Terminal statuses whose unfinished requests are resubmitted
+INCOMPLETE_BATCH_STATUSES = (BATCH_STATUS_EXPIRED, BATCH_STATUS_CANCELLED)
+
+
+def check_batch_completion(client: OpenAI, batch_id: str) -> Optional[Any]:
+    """
+    Check whether an OpenAI batch has reached a terminal status.
+
+    Args:
+        client (OpenAI): The OpenAI client.
+        batch_id (str): The ID of the batch to check.
+
+    Returns:
+        object: The batch object if completed, failed, expired or cancelled,
+                None otherwise.
+    """
+    try:
+        with span("OpenAIBatchRetrieve"):
+            batch = OPENAI_GUARD.call(
+                lambda: client.batches.retrieve(batch_id)
+            )
+
+        if batch.status in TERMINAL_BATCH_STATUSES:
+            logger.info(f"Batch {batch_id} status: {batch.status}")
+            return batch
+
+        logger.info(
+            f"Batch {batch_id} is still {batch.status}. "
+            f"Will check again later."
+        )
+        return None
+    except (OpenAIError, CircuitOpenError) as e:
+        logger.error(f"Error retrieving batch {batch_id}: {str(e)}")
+        return None
+
+
+def new_tally(batch: Any) -> ResultTally:
+    """
+    Return an empty tally for the results of a batch.
+
+    Published IDs are only tracked when requests may be missing from both
+    the output and the error file, i.e. for expired and cancelled batches.
+    """
+    return ResultTally.empty(batch.status in INCOMPLETE_BATCH_STATUSES)
+
+
+def process_batch(client: OpenAI, batch_info: Mapping[str, Any]) -> bool:
+    """
+    Check one pending batch and process it if it has finished.
+
+    Returns:
+        bool: True if at least one horoscope of the batch was published.
+    """
+    batch_id = batch_info["batch_id"]
+    logger.info(f"Processing batch: {batch_id}")
+    batch = check_batch_completion(client, batch_info["openai_batch_id"])
+    if batch is None:
+        logger.info(f"Batch {batch_id} not ready for processing yet")
+        return False
+
+    success: Optional[bool] = False
+    details: Dict[str, Any] = {}
+    if has_results(batch):
+        # Expired and cancelled batches: harvest partial output and
+        # resubmit the rest
+        success, details = download_and_upload_results(
+            client, batch, batch_info
+        )
+    return finish_batch(batch_info, batch, success, details)
+
+
+def download_and_upload_results(
+        client: OpenAI, batch: Any, batch_info: Mapping[str, Any]
+) -> Tuple[Optional[bool], Dict[str, Any]]:
+    """
+    Download batch results from OpenAI and upload processed horoscopes to S3.
+
+    Requests that failed, either in the batch error file or while processing
+    the output file, are collected and resubmitted as a retry batch holding
+    only those requests. For expired or cancelled batches the partial output
+    is harvested and every request without a published horoscope is
+    resubmitted. With ``DOWNLOAD_LEASING`` the output file is split into
+    byte ranges shared with other download workers. The token usage of the
+    results is summed into ``details["usage"]``.
+
+    Args:
+        client (OpenAI): The OpenAI client.
+        batch (object): The OpenAI batch object containing result information.
+        batch_info (dict): Information about the batch from the control file.
+
+    Returns:
+        tuple: (success, details) where success is True if at least one
+               horoscope was published, or None if the batch was not
+               processed this run (its result files could not be fetched,
+               or other workers are still processing it) and stays
+               submitted, and details is a dictionary of failure
+               information to record in the control file.
+    """
+    try:
+        if DOWNLOAD_LEASING:
+            return download_with_leases(client, batch, batch_info)
+
+        tally = new_tally(batch)
+        success: Optional[bool] = False
+        if batch.output_file_id:
+            success = _process_with_checkpoints(
+                client, batch_info, batch.output_file_id, tally
+            )
+            if success is None:
+                return None, {}
+        else:
+            logger.error("No result file found in batch.")
+        return finish_results(client, batch, batch_info, tally, success)
+
+    except Exception as e:
+        logger.error(
+            f"Unexpected error in download_and_upload_results: {str(e)}"
+        )
+        return None, {}
+
+
+def finish_results(
+    client: OpenAI,
+    batch: Any,
+    batch_info: Mapping[str, Any],
+    tally: ResultTally,
+    success: Optional[bool]
+) -> Tuple[Optional[bool], Dict[str, Any]]:
+    """
+    Handle the failed requests of a processed batch and add its usage.
+
+    Returns:
+        tuple: (success, details) as ``download_and_upload_results``.
+    """
+    details = handle_failed_requests(client, batch, batch_info, tally)
+    if details is None:
+        return None, {}
+    record_usage(details, tally.usage)
+    return success, details
+
+
+def handle_failed_requests(
+    client: OpenAI,
+    batch: Any,
+    batch_info: Mapping[str, Any],
+    tally: ResultTally
+) -> Optional[Dict[str, Any]]:
+    """
+    Collect the failed requests of a batch and resubmit them.
+
+    Adds the requests listed in the batch error file to the failed IDs of
+    ``tally`` and creates a retry batch for them (and, if published IDs are
+    tracked, for every request that was not published).
+
+    Returns:
+        dict: Failure details to record in the control file, or None if the
+              error file could not be downloaded.
+    """
+    details: Dict[str, Any] = {}
+    error_file_id = getattr(batch, "error_file_id", None)
+    if error_file_id:
+        logger.info(f"Downloading error file: {error_file_id}")
+        error_text = _download_result_file(client, error_file_id)
+        if error_text is None:
+            return None
+        errors = _parse_error_file(error_text)
+        tally.failed_ids.update(errors)
+        details["error_codes"] = _count_error_codes(errors)
+
+    if tally.failed_ids or tally.published_ids is not None:
+        details["failed_request_count"] = len(tally.failed_ids)
+        retry_batch_id = _create_retry_batch(batch_info, tally)
+        if retry_batch_id:
+            details["retry_batch_id"] = retry_batch_id
+    return details
+
+
+def download_with_leases(
+    client: OpenAI, batch: Any, batch_info: Mapping[str, Any]
+) -> Tuple[Optional[bool], Dict[str, Any]]:
+    """
+    Process a batch together with other download workers.
+
+    Each worker processes the result-file ranges it can lease. The worker
+    that finds every range done takes the batch lease, handles the failed
+    requests once, and stores the outcome in the completed batch lease, so
+    a worker that crashes before updating the control file is replaced by
+    one that simply reports the stored outcome.
+    """
+    batch_id = batch_info["batch_id"]
+    batch_key = lease_key(batch_id, "batch")
+    finished = read_lease(batch_key)
+    if finished is not None and finished.get("state") == LEASE_DONE:
+        outcome = finished.get("data") or {}
+        logger.info(f"Batch {batch_id} was finalized by {finished['owner']}")
+        return bool(outcome.get("success")), outcome.get("details", {})
+
+    tally = new_tally(batch)
+    success: Optional[bool] = False
+    if batch.output_file_id:
+        success = _process_result_ranges(
+            client, batch_info, batch.output_file_id, tally
+        )
+        if success is None:
+            return None, {}
+    else:
+        logger.error("No result file found in batch.")
+
+    batch_lease = acquire_lease(batch_key)
+    if batch_lease is None:
+        logger.info(f"Batch {batch_id} is being finalized by another worker")
+        return None, {}
+
+    details = handle_failed_requests(client, batch, batch_info, tally)
+    if details is None:
+        release_lease(batch_lease)
+        return None, {}
+    record_usage(details, tally.usage)
+    complete_lease(batch_lease, {"success": success, "details": details})
+    return success, details
+
+
+def _stage_result_file(
+    client: OpenAI, batch_id: str, result_file_id: str
+) -> Optional[str]:
+    """
+    Copy a batch output file to S3 so workers can read it by byte range.
+
+    Returns:
+        str: The S3 key of the staged file, or None if staging failed.
+    """
+    staged_key = f"{RESULT_FILES_PREFIX}/{batch_id}-output.jsonl"
+    if get_object_size(staged_key) is not None:
+        return staged_key
+
+    logger.info(f"Staging result file {result_file_id} to {staged_key}")
+    result_text = _download_result_file(client, result_file_id)
+    if result_text is None:
+        return None
+    # Another worker may have staged the same file meanwhile; either copy
+    # is identical, so losing the race is fine
+    put_s3_object_conditional(
+        staged_key, result_text.encode("utf-8"),
+        create_only=True, content_type="application/jsonl"
+    )
+    if get_object_size(staged_key) is None:
+        return None
+    return staged_key
+
+
+def _process_result_ranges(
+    client: OpenAI,
+    batch_info: Mapping[str, Any],
+    result_file_id: str,
+    tally: ResultTally
+) -> Optional[bool]:
+    """
+    Process the leasable byte ranges of a result file.
+
+    Every range whose lease this worker acquires is processed and its
+    failed (and, if tracked, published) custom IDs and token usage are
+    stored in the completed lease. Processing a range is idempotent, so a
+    range taken over from a crashed worker is simply processed again.
+
+    Returns:
+        bool: Whether any horoscope of the batch was published, once every
+              range is done, or None while ranges are still held by other
+              workers or the result file could not be staged.
+    """
+    batch_id = batch_info["batch_id"]
+    staged_key = _stage_result_file(client, batch_id, result_file_id)
+    size = get_object_size(staged_key) if staged_key else None
+    if staged_key is None or size is None:
+        logger.error(f"Failed to stage result file for batch {batch_id}")
+        return None
+
+    manifest = load_batch_manifest(batch_info)
+    ranges = split_byte_ranges(size, RESULT_RANGE_BYTES)
+    logger.info(f"Result file of batch {batch_id}: {len(ranges)} ranges")
+
+    for start, end in ranges:
+        lease = acquire_lease(
+            lease_key(batch_id, "ranges", f"{start}-{end}"),
+            ttl=LEASE_TTL_SECONDS
+        )
+        if lease is None:
+            continue
+        text = read_line_range(staged_key, start, end, size)
+        if text is None:
+            release_lease(lease)
+            continue
+        _process_range(
+            lease, text, batch_info["target_date"], manifest,
+            tally.published_ids is not None
+        )
+
+    published = _collect_ranges(batch_id, ranges, tally)
+    return None if published is None else published > 0
+
+
+def _collect_ranges(
+    batch_id: str, ranges: List[Tuple[int, int]], tally: ResultTally
+) -> Optional[int]:
+    """
+    Add the outcomes stored in the range leases of a batch to ``tally``.
+
+    Returns:
+        int: The number of horoscopes published, or None while ranges are
+             still being processed by other workers.
+    """
+    published = 0
+    pending = 0
+    for start, end in ranges:
+        lease = read_lease(lease_key(batch_id, "ranges", f"{start}-{end}"))
+        if lease is None or lease.get("state") != LEASE_DONE:
+            pending += 1
+            continue
+        result = lease.get("data") or {}
+        tally.failed_ids.update(result.get("failed_ids", []))
+        if tally.published_ids is not None:
+            tally.published_ids.update(result.get("published_ids", []))
+        published += int(result.get("published", 0))
+        merge_usage(tally.usage, result.get("usage", {}))
+
+    if pending:
+        logger.info(
+            f"{pending} of {len(ranges)} ranges of batch {batch_id} are "
+            f"still being processed by other workers"
+        )
+        return None
+    return published
+
+
+def _process_range(
+    lease: Dict[str, Any],
+    text: str,
+    target_date: str,
+    manifest: Optional[Dict[str, ManifestEntry]],
+    track_published: bool
+) -> None:
+    """
+    Process the lines of a leased range and complete its lease.
+
+    The lease is renewed while the range is processed, so a range that
+    takes longer than ``LEASE_TTL_SECONDS`` is not taken over by another
+    worker. If it is lost anyway, the range is left to the new holder.
+    """
+    def keep_lease(lines_done: int, published: int) -> None:
+        """Renew the range lease between checkpoints."""
+        if not renew_lease_if_due(lease, LEASE_TTL_SECONDS):
+            raise LeaseLostError(
+                f"Lost lease {lease['key']} after {lines_done} lines "
+                f"({published} published)"
+            )
+
+    tally = ResultTally.empty(track_published=True)
+    try:
+        process_results(
+            text,
+            target_date,
+            manifest=manifest,
+            tally=tally,
+            progress=ResultProgress(on_progress=keep_lease)
+        )
+    except LeaseLostError as e:
+        logger.warning(str(e))
+        return
+
+    published_ids = tally.published_ids or set()
+    result: Dict[str, Any] = {
+        "failed_ids": sorted(tally.failed_ids),
+        "published": len(published_ids),
+        "usage": tally.usage,
+    }
+    if track_published:
+        result["published_ids"] = sorted(published_ids)
+    if complete_lease(lease, result):
+        increment("ResultRangesProcessed")
+
+
+def _process_with_checkpoints(
+    client: OpenAI,
+    batch_info: Mapping[str, Any],
+    result_file_id: str,
+    tally: ResultTally
+) -> Optional[bool]:
+    """
+    Process a batch output file, resuming from the batch's checkpoint.
+
+    The checkpoint records the number of lines handled so far, the
+    failed (and, if tracked, published) custom IDs and the token usage so
+    far, so a run that replaces an interrupted one neither re-uploads
+    horoscopes nor loses failures.
+
+    Returns:
+        bool: True if at least one horoscope of the batch was published,
+              or None if the output file could not be downloaded.
+    """
+    batch_id = batch_info["batch_id"]
+    result_text = _spool_result_file(client, batch_id, result_file_id)
+    if result_text is None:
+        return None
+
+    progress, published_before = resume_from_checkpoint(
+        batch_id, result_text, result_file_id, tally
+    )
+    published_now = process_results(
+        result_text,
+        batch_info["target_date"],
+        manifest=load_batch_manifest(batch_info),
+        tally=tally,
+        progress=progress
+    )
+    return published_now or published_before > 0
+
+
+def resume_from_checkpoint(
+    batch_id: str, result_text: str, result_file_id: str, tally: ResultTally
+) -> Tuple[ResultProgress, int]:
+    """
+    Restore a batch's checkpoint into ``tally``.
+
+    The checkpoint stores the failed IDs and the line to resume from, but
+    not the published IDs: they are rebuilt from the lines of
+    ``result_text`` before that line, so a checkpoint costs the same
+    however far processing got.
+
+    Returns:
+        tuple: (progress, published_before) where progress resumes
+               ``process_results`` at the checkpoint and saves new ones.
+    """
+    checkpoint = load_checkpoint(batch_id) or {}
+    if checkpoint.get("output_file_id") != result_file_id:
+        checkpoint = {}
+    start_line = int(checkpoint.get("line", 0))
+    tally.failed_ids.update(checkpoint.get("failed_ids", []))
+    if tally.published_ids is not None and start_line:
+        tally.published_ids.update(
+            published_custom_ids(result_text, start_line, tally.failed_ids)
+        )
+    merge_usage(tally.usage, checkpoint.get("usage", {}))
+    published_before = int(checkpoint.get("published", 0))
+
+    def save_progress(lines_done: int, published: int) -> None:
+        """Checkpoint the progress of this batch."""
+        save_checkpoint(batch_id, {
+            "output_file_id": result_file_id,
+            "line": lines_done,
+            "published": published_before + published,
+            "failed_ids": sorted(tally.failed_ids),
+            "usage": dict(tally.usage),
+        })
+
+    return ResultProgress(start_line, save_progress), published_before
+
+
+def _spool_path(batch_id: str) -> str:
+    """Return the local spool path of a batch's output file."""
+    return os.path.join(RESULT_DIR, f"{batch_id}-output.jsonl")
+
+
+def _spool_result_file(
+    client: OpenAI, batch_id: str, result_file_id: str
+) -> Optional[str]:
+    """
+    Return a batch's output file, downloading it only if not spooled yet.
+
+    The file is kept in ``RESULT_DIR`` until the batch is finalized, so a
+    run restarted in the same container does not download it again.
+    """
+    result_text = read_spool(batch_id)
+    if result_text is not None:
+        return result_text
+
+    logger.info(f"Downloading result file: {result_file_id}")
+    result_text = _download_result_file(client, result_file_id)
+    if result_text is None:
+        return None
+    write_spool(batch_id, result_text)
+    return str(result_text)
+
+
+def read_spool(batch_id: str) -> Optional[str]:
+    """Return a batch's spooled output file, or None if not spooled."""
+    spool_path = _spool_path(batch_id)
+    if not os.path.exists(spool_path):
+        return None
+    logger.info(f"Using spooled result file: {spool_path}")
+    with open(spool_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def write_spool(batch_id: str, result_text: str) -> None:
+    """Spool a batch's output file to ``RESULT_DIR``."""
+    spool_path = _spool_path(batch_id)
+    try:
+        # Write then rename so an interrupted write is never reused
+        with open(f"{spool_path}.part", "w", encoding="utf-8") as f:
+            f.write(result_text)
+        os.replace(f"{spool_path}.part", spool_path)
+    except OSError as e:
+        logger.warning(f"Failed to spool result file: {str(e)}")
+
+
+def _clear_progress(batch_id: str) -> None:
+    """Remove the checkpoint and spooled output of a finalized batch."""
+    clear_checkpoint(batch_id)
+    try:
+        os.remove(_spool_path(batch_id))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to remove spooled result file: {str(e)}")
+
+
+def _download_result_file(
+    client: OpenAI, result_file_id: str
+) -> Optional[Any]:
+    """Download the result file from OpenAI."""
+    try:
+        with span("OpenAIFileContent"):
+            text = OPENAI_GUARD.call(
+                lambda: client.files.content(result_file_id).text
+            )
+        increment("OpenAIBytesRead", len(text), "Bytes")
+        return text
+    except (OpenAIError, CircuitOpenError) as e:
+        logger.error(f"Failed to download result file: {str(e)}")
+        return None
+
+
+def _parse_error_file(error_text: str) -> Dict[str, str]:
+    """
+    Parse a batch error file into a mapping of custom ID to error code.
+
+    Args:
+        error_text (str): The JSONL content of the batch error file.
+
+    Returns:
+        dict: The error code of each failed request, keyed by custom ID.
+    """
+    errors: Dict[str, str] = {}
+    for line in error_text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse error line: {str(e)}")
+            continue
+
+        custom_id = item.get("custom_id")
+        if not custom_id:
+            continue
+
+        error = item.get("error") or (
+            (item.get("response") or {}).get("body", {}).get("error")
+        ) or {}
+        errors[custom_id] = str(error.get("code") or "unknown")
+
+    logger.info(f"Found {len(errors)} failed requests in error file")
+    return errors
+
+
+def _count_error_codes(errors: Dict[str, str]) -> Dict[str, int]:
+    """Count failed requests per error code."""
+    counts: Dict[str, int] = {}
+    for code in errors.values():
+        counts[code] = counts.get(code, 0) + 1
+    return counts
+
+
+def _create_retry_batch(
+    batch_info: Mapping[str, Any], tally: ResultTally
+) -> Optional[str]:
+    """
+    Create a prepared batch holding only the failed requests of a batch.
+
+    The requests are copied from the batch's input file, so the retry batch
+    is picked up by the next batch-upload run like any other batch. The
+    retry input key is derived from the parent's, so a retry batch left by
+    an interrupted run is found and reused.
+
+    Args:
+        batch_info (dict): Information about the batch from the control file.
+        tally (ResultTally): The failed custom IDs to retry; if published
+            IDs are tracked, every request not among them is retried too.
+
+    Returns:
+        str: The ID of the retry batch, or None if no retry was created.
+    """
+    attempt = int(batch_info.get("retry_attempt", 0)) + 1
+    if attempt > RETRY_MAX_ATTEMPTS:
+        logger.warning(
+            f"Not retrying unfinished requests of batch "
+            f"{batch_info.get('batch_id')}: retry limit reached"
+        )
+        return None
+
+    input_key = batch_info["input_file"]
+    base_name = os.path.splitext(os.path.basename(input_key))[0]
+    base_name = base_name.split("-retry")[0]
+    retry_key = f"{OUTPUT_PREFIX}/{base_name}-retry{attempt}.jsonl"
+    # A run that stopped before recording the parent's outcome has already
+    # created the retry batch; reuse it instead of submitting it twice
+    existing = get_batch_by_input_file(retry_key)
+    if existing is not None:
+        logger.info(
+            f"Retry batch {existing['batch_id']} of batch "
+            f"{batch_info.get('batch_id')} already exists"
+        )
+        return str(existing["batch_id"])
+
+    retry_count = _upload_retry_file(input_key, retry_key, tally)
+    if not retry_count:
+        return None
+
+    success, retry_batch_id = create_batch(
+        input_file=retry_key,
+        target_date=batch_info["target_date"],
+        additional_data={
+            "rider_count": retry_count,
+            "parent_batch_id": batch_info.get("batch_id"),
+            "retry_attempt": attempt,
+            "manifest_file": batch_info.get("manifest_file"),
+            "deadline": batch_info.get("deadline")
+        }
+    )
+    if not success:
+        logger.error("Failed to create retry batch in control file")
+        return None
+
+    logger.info(
+        f"Created retry batch {retry_batch_id} with {retry_count} requests "
+        f"(attempt {attempt})"
+    )
+    return retry_batch_id
+
+
+def _upload_retry_file(
+    input_key: str, retry_key: str, tally: ResultTally
+) -> int:
+    """
+    Upload the requests of ``input_key`` that need a retry to ``retry_key``.
+
+    Returns:
+        int: The number of requests uploaded, 0 if there were none or the
+             retry file could not be written.
+    """
+    input_path = os.path.join(RESULT_DIR, os.path.basename(input_key))
+    if not download_file_from_s3(input_key, input_path):
+        logger.error(f"Failed to download input file for retry: {input_key}")
+        return 0
+    retry_path = os.path.join(RESULT_DIR, os.path.basename(retry_key))
+
+    try:
+        retry_count = _copy_retry_requests(input_path, retry_path, tally)
+    except (IOError, json.JSONDecodeError) as e:
+        logger.error(f"Failed to create retry JSONL: {str(e)}")
+        return 0
+
+    if retry_count == 0:
+        logger.info("No unfinished requests found in input file")
+        return 0
+
+    if not upload_file_to_s3(retry_path, retry_key):
+        logger.error("Failed to upload retry JSONL to S3")
+        return 0
+    return retry_count
+
+
+def _copy_retry_requests(
+    input_path: str, retry_path: str, tally: ResultTally
+) -> int:
+    """Copy the requests that need a retry; return how many there were."""
+    retry_count = 0
+    with open(input_path, "r", encoding="utf-8") as src, \
+            open(retry_path, "w", encoding="utf-8") as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            custom_id = json.loads(line).get("custom_id")
+            if custom_id in tally.failed_ids or (
+                tally.published_ids is not None
+                and custom_id not in tally.published_ids
+            ):
+                dst.write(line if line.endswith("\n") else line + "\n")
+                retry_count += 1
+    return retry_count
+
+
+def _request_counts(batch: Any) -> Dict[str, Any]:
+    """Extract the request counts reported by OpenAI for a batch."""
+    counts = getattr(batch, "request_counts", None)
+    if counts is None:
+        return {}
+    return {
+        "request_counts": {
+            "total": counts.total,
+            "completed": counts.completed,
+            "failed": counts.failed
+        }
+    }
+
+
+def has_results(batch: Any) -> bool:
+    """Return True if a terminal batch has output worth processing."""
+    return batch.status == BATCH_STATUS_COMPLETED or \
+        batch.status in INCOMPLETE_BATCH_STATUSES
+
+
+def finish_batch(
+    batch_info: Mapping[str, Any],
+    batch: Any,
+    success: Optional[bool],
+    details: Dict[str, Any]
+) -> bool:
+    """
+    Record the terminal status of a processed batch in the control file.
+
+    A batch whose results were not processed this run (``success`` is None)
+    stays submitted.
+
+    Returns:
+        bool: True if at least one horoscope of the batch was published.
+    """
+    if success is None:
+        logger.info(
+            f"Batch {batch_info['batch_id']} was not finalized in this run, "
+            f"will check again later"
+        )
+        return False
+    _record_batch_outcome(batch_info, batch, success, details)
+    return success
+
+
+def _record_batch_outcome(
+    batch_info: Mapping[str, Any],
+    batch: Any,
+    success: bool,
+    details: Dict[str, Any]
+) -> None:
+    """Update the control file with the outcome of a processed batch."""
+    batch_id = batch_info["batch_id"]
+    new_status = TERMINAL_BATCH_STATUSES[batch.status]
+    if batch.status == BATCH_STATUS_COMPLETED:
+        new_status = STATUS_COMPLETED if success else STATUS_FAILED
+
+    additional_data = {
+        "completed_at": datetime.datetime.now(
+            datetime.timezone.utc
+        ).isoformat(),
+        "openai_status": batch.status,
+        # Recorded for the cleanup stage, which deletes the files later
+        "output_file_id": getattr(batch, "output_file_id", None),
+        "error_file_id": getattr(batch, "error_file_id", None),
+        **_request_counts(batch),
+        **details
+    }
+    update_success = update_batch_status(
+        batch_id=batch_id,
+        new_status=new_status,
+        additional_data=additional_data
+    )
+
+    if not update_success:
+        logger.warning(f"Failed to update status for batch {batch_id}")
+    elif not DOWNLOAD_LEASING:
+        _clear_progress(batch_id)
@@ -0,0 +1,188 @@
+"""
+Utility module for stage completion events.
+
+Each pipeline stage publishes an event when it finishes, and the stage
+dispatcher consumes pending events to launch the next stage right away
+instead of waiting for its cron slot. Events are small JSON documents
+stored by one of two backends, selected by ``EVENT_BACKEND``:
+- ``s3``: objects under ``EVENTS_PREFIX/pending/`` in the bucket
+- ``local``: files under ``EVENT_QUEUE_DIR/pending/``, for local runs and
+  tests
+With the default ``none`` no events are published.
+
+Consumed events are moved to ``processed/`` so they are handled only once.
+Events of failed stage runs are moved to ``dead-letter/`` instead, where
+they are kept for inspection. A ``scheduled`` event asks for its stage to
+run again once its ``not_before`` time has come.
+"""
+
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from ..config import EVENT_BACKEND, EVENT_QUEUE_DIR, EVENTS_PREFIX
+from .logging_utils import configure_logger
+from .s3_utils import (
+    delete_object,
+    download_json_from_s3,
+    list_objects,
+    put_s3_object,
+)
+
+# Configure logger
+logger = configure_logger('event_utils')
+
+EVENT_SUCCEEDED = "succeeded"
+EVENT_FAILED = "failed"
+# A stage asks to run again at ``payload["not_before"]``
+EVENT_SCHEDULED = "scheduled"
+
+PENDING = "pending"
+PROCESSED = "processed"
+DEAD_LETTER = "dead-letter"
+
+
+def _event_name(event: Dict[str, Any]) -> str:
+    """Return the sortable object/file name of an event."""
+    return f"{event['created_at']}-{event['stage']}-{event['event_id']}.json"
+
+
+def publish_stage_event(
+    stage: str,
+    status: str = EVENT_SUCCEEDED,
+    payload: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Publish a stage completion event.
+
+    Args:
+        stage (str): The stage that finished, e.g. ``prepare``.
+        status (str): ``succeeded``, ``failed`` or ``scheduled``.
+        payload (dict, optional): Stage-specific details, e.g. batch IDs.
+
+    Returns:
+        dict: The published event, or None if events are disabled or the
+              event could not be stored.
+    """
+    if EVENT_BACKEND == "none":
+        return None
+
+    event = {
+        "event_id": str(uuid.uuid4()),
+        "stage": stage,
+        "status": status,
+        "created_at": datetime.now(timezone.utc).strftime(
+            "%Y%m%dT%H%M%S%fZ"
+        ),
+        "payload": payload or {},
+    }
+    name = _event_name(event)
+    data = json.dumps(event)
+
+    try:
+        if EVENT_BACKEND == "local":
+            pending_dir = os.path.join(EVENT_QUEUE_DIR, PENDING)
+            os.makedirs(pending_dir, exist_ok=True)
+            # Write then rename so readers never see a partial file
+            tmp_path = os.path.join(pending_dir, f".{name}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(pending_dir, name))
+        elif not put_s3_object(f"{EVENTS_PREFIX}/{PENDING}/{name}", data):
+            return None
+    except OSError as e:
+        logger.error(f"Failed to publish {stage} event: {str(e)}")
+        return None
+
+    logger.info(f"Published {status} event for stage {stage}: {name}")
+    return event
+
+
+def list_pending_events() -> List[Dict[str, Any]]:
+    """
+    Return the pending events, oldest first.
+
+    Returns:
+        list: The pending event dictionaries.
+    """
+    events = []
+    if EVENT_BACKEND == "local":
+        pending_dir = os.path.join(EVENT_QUEUE_DIR, PENDING)
+        if not os.path.isdir(pending_dir):
+            return []
+        for name in sorted(os.listdir(pending_dir)):
+            if name.startswith(".") or not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(pending_dir, name),
+                          encoding="utf-8") as f:
+                    events.append(json.load(f))
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Failed to read event {name}: {str(e)}")
+    elif EVENT_BACKEND == "s3":
+        for key in sorted(list_objects(f"{EVENTS_PREFIX}/{PENDING}/")):
+            event = download_json_from_s3(key)
+            if event is not None:
+                events.append(event)
+    return events
+
+
+def _move_event(event: Dict[str, Any], state: str) -> bool:
+    """Move a pending event to ``state`` (a sibling of ``pending``)."""
+    name = _event_name(event)
+    if EVENT_BACKEND == "local":
+        target_dir = os.path.join(EVENT_QUEUE_DIR, state)
+        os.makedirs(target_dir, exist_ok=True)
+        try:
+            os.replace(
+                os.path.join(EVENT_QUEUE_DIR, PENDING, name),
+                os.path.join(target_dir, name)
+            )
+            return True
+        except OSError as e:
+            logger.error(f"Failed to move event {name} to {state}: {str(e)}")
+            return False
+
+    if EVENT_BACKEND == "s3":
+        if not put_s3_object(
+            f"{EVENTS_PREFIX}/{state}/{name}", json.dumps(event)
+        ):
+            return False
+        return delete_object(f"{EVENTS_PREFIX}/{PENDING}/{name}")
+
+    return False
+
+
+def ack_event(event: Dict[str, Any]) -> bool:
+    """
+    Mark an event as processed so it is not dispatched again.
+
+    Args:
+        event (dict): The event returned by ``list_pending_events``.
+
+    Returns:
+        bool: True if the event was moved to ``processed``.
+    """
+    return _move_event(event, PROCESSED)
+
+
+def dead_letter_event(event: Dict[str, Any]) -> bool:
+    """
+    Move the event of a failed stage run to the dead-letter queue.
+
+    The event is not dispatched again, but stays available for
+    inspection, unlike an acknowledged event.
+
+    Args:
+        event (dict): The event returned by ``list_pending_events``.
+
+    Returns:
+        bool: True if the event was moved to ``dead-letter``.
+    """
+    logger.error(
+        f"Stage {event.get('stage')} failed, moved event "
+        f"{event.get('event_id')} to the dead-letter queue"
+    )
+    return _move_event(event, DEAD_LETTER)
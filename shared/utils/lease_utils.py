@@ -0,0 +1,280 @@
+"""
+Utility module for worker leases stored in S3.
+
+A lease is a small JSON object (owner, expiry, state) under
+``LEASES_PREFIX``. Leases are acquired and updated with S3 conditional
+writes, so exactly one worker wins each race:
+- a new lease is created with ``If-None-Match: *``
+- an expired lease is taken over, renewed, released or completed with
+  ``If-Match`` on the ETag the worker last saw
+A completed lease (state ``done``) is never handed out again and keeps the
+result data of the work it guarded.
+
+This module also splits a JSONL object into byte ranges, so several
+download workers can each lease and process a part of one result file. A
+range owns every line that starts inside it.
+"""
+
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import LEASE_TTL_SECONDS, LEASES_PREFIX, WORKER_ID
+from .logging_utils import configure_logger
+from .metrics_utils import increment
+from .s3_utils import (
+    get_s3_object_range,
+    get_s3_object_with_etag,
+    put_s3_object_conditional,
+)
+
+# Configure logger
+logger = configure_logger('lease_utils')
+
+LEASE_ACTIVE = "active"
+LEASE_DONE = "done"
+
+# Bytes fetched at a time to finish a line that crosses a range end
+LINE_OVERFLOW_CHUNK = 64 * 1024
+
+
+class LeaseLostError(Exception):
+    """Raised when a worker finds that another worker took over its lease."""
+
+
+def lease_key(*parts: str) -> str:
+    """Return the S3 key of the lease named by ``parts``."""
+    return "/".join((LEASES_PREFIX,) + parts) + ".json"
+
+
+def _write_lease(
+    key: str,
+    body: Dict[str, Any],
+    if_match: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Write a lease conditionally and return it with its key and ETag."""
+    etag = put_s3_object_conditional(
+        key, json.dumps(body), if_match=if_match, create_only=not if_match
+    )
+    if etag is None:
+        return None
+    return {**body, "key": key, "etag": etag}
+
+
+def read_lease(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Read a lease and its ETag.
+
+    Args:
+        key (str): The S3 key of the lease.
+
+    Returns:
+        dict: The lease with ``key`` and ``etag`` added, or None if it
+              does not exist or cannot be parsed.
+    """
+    data, etag = get_s3_object_with_etag(key)
+    if data is None or etag is None:
+        return None
+    try:
+        lease: Dict[str, Any] = json.loads(data)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid lease {key}: {str(e)}")
+        return None
+    return {**lease, "key": key, "etag": etag}
+
+
+def acquire_lease(
+    key: str,
+    owner: str = WORKER_ID,
+    ttl: int = LEASE_TTL_SECONDS
+) -> Optional[Dict[str, Any]]:
+    """
+    Acquire a lease, taking it over if its holder let it expire.
+
+    Args:
+        key (str): The S3 key of the lease.
+        owner (str): The ID of the acquiring worker.
+        ttl (int): Seconds until the lease expires unless renewed.
+
+    Returns:
+        dict: The acquired lease, or None if another worker holds it or
+              the guarded work is already done.
+    """
+    body = {
+        "owner": owner,
+        "expires_at": time.time() + ttl,
+        "state": LEASE_ACTIVE,
+    }
+    lease = _write_lease(key, body)
+    if lease is not None:
+        return lease
+
+    current = read_lease(key)
+    if current is None or current.get("state") == LEASE_DONE:
+        return None
+    if current.get("owner") != owner and current["expires_at"] > time.time():
+        return None
+
+    lease = _write_lease(key, body, if_match=current["etag"])
+    if lease is not None and current.get("owner") != owner:
+        increment("LeaseTakeovers")
+        logger.info(
+            f"Took over expired lease {key} from {current.get('owner')}"
+        )
+    return lease
+
+
+def renew_lease(
+    lease: Dict[str, Any], ttl: int = LEASE_TTL_SECONDS
+) -> bool:
+    """
+    Extend a held lease.
+
+    Args:
+        lease (dict): The lease returned by ``acquire_lease``; updated in
+            place with the new expiry and ETag.
+        ttl (int): Seconds until the lease expires unless renewed again.
+
+    Returns:
+        bool: True if the lease is still held by this worker.
+    """
+    body = {
+        "owner": lease["owner"],
+        "expires_at": time.time() + ttl,
+        "state": LEASE_ACTIVE,
+    }
+    renewed = _write_lease(lease["key"], body, if_match=lease["etag"])
+    if renewed is None:
+        logger.warning(f"Lost lease {lease['key']}")
+        return False
+    lease.update(renewed)
+    return True
+
+
+def renew_lease_if_due(
+    lease: Dict[str, Any], ttl: int = LEASE_TTL_SECONDS
+) -> bool:
+    """
+    Renew a held lease once less than half of ``ttl`` is left.
+
+    Long-running work calls this between steps, so the lease stays held
+    without an S3 write per step.
+
+    Args:
+        lease (dict): The lease returned by ``acquire_lease``; updated in
+            place when renewed.
+        ttl (int): Seconds the lease is extended by.
+
+    Returns:
+        bool: True if the lease is still held by this worker.
+    """
+    if lease["expires_at"] - time.time() > ttl / 2:
+        return True
+    return renew_lease(lease, ttl)
+
+
+def complete_lease(
+    lease: Dict[str, Any], data: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Mark the work guarded by a lease as done.
+
+    Args:
+        lease (dict): The lease returned by ``acquire_lease``.
+        data (dict, optional): Results to keep with the lease for the
+            worker that aggregates them.
+
+    Returns:
+        bool: True if the lease was completed, False if it was lost to
+              another worker in the meantime.
+    """
+    body = {
+        "owner": lease["owner"],
+        "expires_at": lease["expires_at"],
+        "state": LEASE_DONE,
+        "data": data or {},
+    }
+    if _write_lease(lease["key"], body, if_match=lease["etag"]) is None:
+        logger.warning(f"Lost lease {lease['key']} before completing it")
+        return False
+    return True
+
+
+def release_lease(lease: Dict[str, Any]) -> bool:
+    """
+    Give up a lease so another worker can acquire it right away.
+
+    Args:
+        lease (dict): The lease returned by ``acquire_lease``.
+
+    Returns:
+        bool: True if the lease was released.
+    """
+    body = {"owner": lease["owner"], "expires_at": 0, "state": LEASE_ACTIVE}
+    return _write_lease(lease["key"], body, if_match=lease["etag"]) is not None
+
+
+def split_byte_ranges(size: int, range_bytes: int) -> List[Tuple[int, int]]:
+    """
+    Split an object into half-open byte ranges.
+
+    Args:
+        size (int): The object size in bytes.
+        range_bytes (int): The maximum size of each range.
+
+    Returns:
+        list: ``(start, end)`` tuples covering ``[0, size)``.
+    """
+    range_bytes = max(range_bytes, 1)
+    return [
+        (start, min(start + range_bytes, size))
+        for start in range(0, size, range_bytes)
+    ]
+
+
+def read_line_range(
+    key: str, start: int, end: int, size: int
+) -> Optional[str]:
+    """
+    Read the lines of a JSONL object that start inside a byte range.
+
+    The line that crosses ``start`` belongs to the previous range and is
+    skipped; the line that crosses ``end`` is read to its end.
+
+    Args:
+        key (str): The S3 key of the object.
+        start (int): The first byte of the range.
+        end (int): The byte after the range.
+        size (int): The object size in bytes.
+
+    Returns:
+        str: The lines owned by the range, or None if a read fails.
+    """
+    if start >= end:
+        return ""
+    data = get_s3_object_range(key, max(start - 1, 0), end - 1)
+    if data is None:
+        return None
+
+    if start > 0:
+        # Byte start-1 is included so a line starting exactly at start is kept
+        newline = data.find(b"\n")
+        if newline < 0:
+            return ""
+        data = data[newline + 1:]
+
+    position = end
+    while data and not data.endswith(b"\n") and position < size:
+        extra = get_s3_object_range(
+            key, position, min(position + LINE_OVERFLOW_CHUNK, size) - 1
+        )
+        if extra is None:
+            return None
+        newline = extra.find(b"\n")
+        if newline >= 0:
+            data += extra[:newline + 1]
+            break
+        data += extra
+        position += len(extra)
+
+    return data.decode("utf-8")
@@ -3,14 +3,144 @@ Utility module for configuring and managing logging.
 
 This module provides functions to set up logging with consistent formatting
 across different components of the application, including console and file
-logging options.
+logging options. It also supports:
+- Structured JSON output (``LOG_FORMAT=json``)
+- Asynchronous logging (``LOG_ASYNC=true``), where records are put on an
+  in-memory queue and formatted and written by a background listener thread
+- Sampling of repetitive messages in hot loops through ``LogSampler``
 """
 
+import atexit
+import json
 import logging
 import os
-from datetime import datetime
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, List, Optional
 
-from ..config import LOG_DIR, LOG_LEVEL
+from ..config import (
+    LOG_ASYNC,
+    LOG_DIR,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_SAMPLE_EVERY,
+    LOG_SAMPLE_FIRST,
+)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed via ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {
+    "message", "asctime"
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Format a record as JSON.
+
+        Args:
+            record (logging.LogRecord): The record to format.
+
+        Returns:
+            str: The JSON document for the record.
+        """
+        entry = {
+            "timestamp": datetime.fromtimestamp(
+                record.created, timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _create_formatter() -> logging.Formatter:
+    """Create the formatter selected by ``LOG_FORMAT``."""
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT)
+
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    The standard ``QueueHandler.prepare`` merges the message and its
+    arguments in the calling thread; skipping that keeps the cost on the
+    logging thread down to creating the record and enqueueing it.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Return the record unchanged."""
+        return record
+
+
+class _DispatchHandler(logging.Handler):
+    """Forward records to every sink handler whose filters accept them."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.sinks: List[logging.Handler] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Hand the record to each sink."""
+        for sink in self.sinks:
+            if record.levelno >= sink.level:
+                sink.handle(record)
+
+    def flush(self) -> None:
+        """Flush every sink."""
+        for sink in self.sinks:
+            sink.flush()
+
+
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_dispatcher = _DispatchHandler()
+_listener: Optional[QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def _ensure_listener() -> None:
+    """Start the background listener and its console sink once."""
+    global _listener  # pylint: disable=global-statement
+    with _listener_lock:
+        if _listener is not None:
+            return
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(getattr(logging, LOG_LEVEL))
+        console_handler.setFormatter(_create_formatter())
+        _dispatcher.sinks.append(console_handler)
+        _listener = QueueListener(_log_queue, _dispatcher)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """
+    Stop the asynchronous listener after writing all queued records.
+
+    Safe to call more than once, and a no-op when ``LOG_ASYNC`` is off.
+    """
+    global _listener  # pylint: disable=global-statement
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _dispatcher.flush()
+        _listener = None
+        _dispatcher.sinks.clear()
 
 
 def configure_logger(name: str) -> logging.Logger:
@@ -18,7 +148,9 @@ def configure_logger(name: str) -> logging.Logger:
     Configure a logger with the specified name.
 
     Sets up a logger with consistent formatting for console output and
-    returns it for use in the application.
+    returns it for use in the application. With ``LOG_ASYNC`` enabled the
+    logger only enqueues records, and a shared background thread writes
+    them.
 
     Args:
         name (str): The name of the logger, typically the module name.
@@ -34,17 +166,17 @@ def configure_logger(name: str) -> logging.Logger:
     if logger.handlers:
         logger.handlers.clear()
 
+    if LOG_ASYNC:
+        _ensure_listener()
+        logger.addHandler(_LazyQueueHandler(_log_queue))
+        return logger
+
     # Create console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(getattr(logging, LOG_LEVEL))
 
-    # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-
     # Add formatter to console handler
-    console_handler.setFormatter(formatter)
+    console_handler.setFormatter(_create_formatter())
 
     # Add console handler to logger
     logger.addHandler(console_handler)
@@ -76,14 +208,73 @@ def add_file_handler(logger: logging.Logger) -> None:
     file_handler = logging.FileHandler(log_file)
     file_handler.setLevel(getattr(logging, LOG_LEVEL))
 
-    # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-
     # Add formatter to file handler
-    file_handler.setFormatter(formatter)
+    file_handler.setFormatter(_create_formatter())
 
-    # Add file handler to logger
-    logger.addHandler(file_handler)
+    if LOG_ASYNC:
+        # Written by the listener thread, for this logger's records only
+        file_handler.addFilter(logging.Filter(logger.name))
+        _ensure_listener()
+        _dispatcher.sinks.append(file_handler)
+    else:
+        # Add file handler to logger
+        logger.addHandler(file_handler)
     logger.info(f"Logging to file: {log_file}")
+
+
+class LogSampler:
+    """
+    Rate-limit a repetitive log message inside a loop.
+
+    The first ``first`` occurrences are logged, then every ``every``-th
+    one; the rest are only counted. ``summary`` logs how many occurrences
+    were seen and suppressed, so one line replaces thousands.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        label: str,
+        level: int = logging.INFO,
+        first: int = LOG_SAMPLE_FIRST,
+        every: int = LOG_SAMPLE_EVERY
+    ) -> None:
+        """
+        Create a sampler for one kind of message.
+
+        Args:
+            logger (logging.Logger): The logger to write to.
+            label (str): A short description used in the summary line.
+            level (int): The level of the sampled messages.
+            first (int): How many occurrences are always logged.
+            every (int): Log every n-th occurrence after the first ones.
+        """
+        self.logger = logger
+        self.label = label
+        self.level = level
+        self.first = first
+        self.every = max(every, 1)
+        self.count = 0
+        self.suppressed = 0
+
+    def log(self, msg: str, *args: Any) -> None:
+        """
+        Log ``msg % args`` if this occurrence is sampled.
+
+        Formatting is deferred to the logging framework, so suppressed
+        occurrences cost only a counter increment.
+        """
+        self.count += 1
+        if self.count <= self.first or self.count % self.every == 0:
+            self.logger.log(self.level, msg, *args)
+        else:
+            self.suppressed += 1
+
+    def summary(self) -> None:
+        """Log the number of occurrences, if any were suppressed."""
+        if self.suppressed:
+            self.logger.log(
+                self.level,
+                "%s: %d occurrences, %d not logged individually",
+                self.label, self.count, self.suppressed
+            )
@@ -0,0 +1,134 @@
+"""
+Utility module for per-batch rider manifests.
+
+Every prepared batch gets a manifest mapping each request's ``custom_id``
+to the rider it was generated for. This module provides functions to:
+- Derive stable rider IDs and collision-free custom IDs
+- Derive the manifest key that belongs to a batch input file
+- Save a manifest to S3 in a compact JSON form
+- Load a manifest from S3 as a dictionary for O(1) result routing
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, Mapping, Optional, Set, Tuple
+
+from .logging_utils import configure_logger
+from .s3_utils import get_s3_object, put_s3_object
+
+# Configure logger
+logger = configure_logger('manifest_utils')
+
+# (rider_id, name, sign)
+ManifestEntry = Tuple[str, str, str]
+
+CUSTOM_ID_PREFIX = "rider-"
+MANIFEST_SUFFIX = ".manifest.json"
+# Roster IDs used as-is; they become part of the horoscope's S3 key
+RIDER_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def derive_rider_id(rider: Mapping[str, Any], used_ids: Set[str]) -> str:
+    """
+    Return a stable rider ID that is unique within ``used_ids``.
+
+    The roster's ``id`` field is used when present and safe to put in an
+    S3 key (``RIDER_ID_PATTERN``); otherwise the ID is a short hash of the
+    rider's name and birth date, so it stays the same from day to day.
+    Duplicates get a numeric suffix. The returned ID is added to
+    ``used_ids``.
+
+    Args:
+        rider (Mapping): The rider record from the roster.
+        used_ids (set): The rider IDs already assigned in this batch.
+
+    Returns:
+        str: The rider ID.
+    """
+    roster_id = rider.get("id")
+    if roster_id not in (None, "") and \
+            RIDER_ID_PATTERN.fullmatch(str(roster_id)):
+        base_id = str(roster_id)
+    else:
+        if roster_id not in (None, ""):
+            logger.warning(
+                f"Roster ID {roster_id!r} is not a valid rider ID, "
+                f"using a derived ID instead"
+            )
+        seed = f"{rider.get('name', '')}|{rider.get('birth_date', '')}"
+        base_id = hashlib.sha256(seed.encode("utf-8")).hexdigest()[:12]
+
+    rider_id = base_id
+    suffix = 2
+    while rider_id in used_ids:
+        rider_id = f"{base_id}-{suffix}"
+        suffix += 1
+
+    if rider_id != base_id:
+        logger.warning(
+            f"Duplicate rider ID {base_id}, using {rider_id} instead"
+        )
+
+    used_ids.add(rider_id)
+    return rider_id
+
+
+def custom_id_for(rider_id: str) -> str:
+    """Return the batch request custom ID for a rider ID."""
+    return f"{CUSTOM_ID_PREFIX}{rider_id}"
+
+
+def manifest_key_for(input_key: str) -> str:
+    """Return the S3 key of the manifest belonging to a batch input file."""
+    return f"{os.path.splitext(input_key)[0]}{MANIFEST_SUFFIX}"
+
+
+def save_manifest(key: str, manifest: Dict[str, ManifestEntry]) -> bool:
+    """
+    Save a manifest to S3 as compact JSON.
+
+    Args:
+        key (str): The S3 key to store the manifest under.
+        manifest (dict): The manifest entries, keyed by custom ID.
+
+    Returns:
+        bool: True if the upload was successful, False otherwise.
+    """
+    try:
+        data = json.dumps(
+            manifest, separators=(",", ":"), ensure_ascii=False
+        )
+        return put_s3_object(key, data.encode("utf-8"))
+    except Exception as e:
+        logger.error(f"Error saving manifest to S3: {str(e)}")
+        return False
+
+
+def load_manifest(key: str) -> Optional[Dict[str, ManifestEntry]]:
+    """
+    Load a manifest from S3.
+
+    Args:
+        key (str): The S3 key of the manifest.
+
+    Returns:
+        dict: The manifest entries keyed by custom ID, or None if the
+              manifest can't be loaded.
+    """
+    data = get_s3_object(key)
+    if data is None:
+        return None
+    try:
+        raw = json.loads(data)
+        manifest = {
+            custom_id: (str(entry[0]), str(entry[1]), str(entry[2]))
+            for custom_id, entry in raw.items()
+        }
+    except (ValueError, TypeError, IndexError, AttributeError) as e:
+        logger.error(f"Error parsing manifest {key}: {str(e)}")
+        return None
+
+    logger.info(f"Loaded manifest {key} with {len(manifest)} entries")
+    return manifest
@@ -0,0 +1,244 @@
+"""
+Utility module for in-process metrics and timing spans.
+
+This module records timings and counters during a stage run and emits them
+at the end of the run as:
+- a CloudWatch Embedded Metric Format (EMF) JSON document on stdout, which
+  CloudWatch Logs turns into metrics without any extra service or API call
+- a human-readable summary table in the stage log
+
+Timings are aggregated per name as they are recorded: count, total and
+max are kept as running totals, and p95 is estimated from a fixed-size
+random sample of the durations. A hot loop can therefore record a span per
+item without growing the memory use or the output.
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ..config import ENABLE_METRICS, ENV, METRICS_NAMESPACE
+from .logging_utils import configure_logger
+
+# Configure logger
+logger = configure_logger('metrics_utils')
+
+# Durations kept per span to estimate its p95
+TIMING_SAMPLE_SIZE = 1024
+
+
+class _Timing:
+    """Running totals of a span and a uniform sample of its durations."""
+
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: List[float] = []
+
+    def add(self, milliseconds: float) -> None:
+        """Add one duration, replacing a random sample once full."""
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+        if len(self.samples) < TIMING_SAMPLE_SIZE:
+            self.samples.append(milliseconds)
+            return
+        # Reservoir sampling keeps every duration equally likely
+        slot = random.randrange(self.count)  # nosec B311 - not for security
+        if slot < TIMING_SAMPLE_SIZE:
+            self.samples[slot] = milliseconds
+
+    def summary(self) -> Dict[str, float]:
+        """Return count, total, max and the estimated p95."""
+        ordered = sorted(self.samples)
+        p95_index = max(0, int(round(0.95 * len(ordered))) - 1)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "p95": ordered[p95_index],
+        }
+
+
+_lock = threading.Lock()
+_timings: Dict[str, _Timing] = {}
+_counters: Dict[str, Tuple[float, str]] = {}
+
+
+def record_timing(name: str, milliseconds: float) -> None:
+    """
+    Record one duration sample for a named span.
+
+    Args:
+        name (str): The span name, e.g. ``S3GetObject``.
+        milliseconds (float): The duration of the span.
+    """
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = _Timing()
+        timing.add(milliseconds)
+
+
+def increment(name: str, value: float = 1, unit: str = "Count") -> None:
+    """
+    Add ``value`` to a named counter.
+
+    Args:
+        name (str): The counter name, e.g. ``S3BytesWritten``.
+        value (float): The amount to add.
+        unit (str): The CloudWatch unit of the counter.
+    """
+    with _lock:
+        current, _ = _counters.get(name, (0.0, unit))
+        _counters[name] = (current + value, unit)
+
+
+def set_gauge(name: str, value: float, unit: str = "None") -> None:
+    """
+    Set a named value, replacing any earlier one.
+
+    Args:
+        name (str): The metric name, e.g. ``ResultRowsPerSecond``.
+        value (float): The value to report.
+        unit (str): The CloudWatch unit of the value.
+    """
+    with _lock:
+        _counters[name] = (value, unit)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time the enclosed block and record it under ``name``.
+
+    Args:
+        name (str): The span name.
+
+    Yields:
+        None
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, (time.perf_counter() - started) * 1000)
+
+
+def _timing_summaries() -> Dict[str, Dict[str, float]]:
+    """Return the summary of every recorded span."""
+    with _lock:
+        return {
+            name: timing.summary() for name, timing in _timings.items()
+            if timing.count
+        }
+
+
+def build_emf_document(
+    stage: str, timestamp_ms: Optional[int] = None
+) -> Dict[str, object]:
+    """
+    Build a CloudWatch EMF document from the recorded metrics.
+
+    Every span ``X`` becomes the metrics ``XCount``, ``XTime`` (total),
+    ``XMaxTime`` and ``XP95Time``; counters and gauges are reported as is.
+    All metrics carry the ``Stage`` and ``Environment`` dimensions.
+
+    Args:
+        stage (str): The pipeline stage name, e.g. ``prepare``.
+        timestamp_ms (int, optional): The metric timestamp in epoch
+            milliseconds. Defaults to now.
+
+    Returns:
+        dict: The EMF document.
+    """
+    values: Dict[str, float] = {}
+    units: Dict[str, str] = {}
+
+    timings = _timing_summaries()
+    with _lock:
+        counters = dict(_counters)
+
+    for name, summary in timings.items():
+        values[f"{name}Count"] = summary["count"]
+        units[f"{name}Count"] = "Count"
+        for suffix, key in (("Time", "total"), ("MaxTime", "max"),
+                            ("P95Time", "p95")):
+            values[f"{name}{suffix}"] = round(summary[key], 3)
+            units[f"{name}{suffix}"] = "Milliseconds"
+
+    for name, (value, unit) in counters.items():
+        values[name] = value
+        units[name] = unit
+
+    document: Dict[str, object] = {
+        "_aws": {
+            "Timestamp": timestamp_ms or int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["Stage", "Environment"]],
+                "Metrics": [
+                    {"Name": name, "Unit": units[name]} for name in values
+                ],
+            }],
+        },
+        "Stage": stage,
+        "Environment": ENV,
+    }
+    document.update(values)
+    return document
+
+
+def format_summary() -> str:
+    """Format the recorded metrics as a text table."""
+    timings = _timing_summaries()
+    with _lock:
+        counters = dict(_counters)
+
+    lines = [
+        f"{'span':<28}{'count':>8}{'total ms':>12}{'avg ms':>10}"
+        f"{'p95 ms':>10}{'max ms':>10}"
+    ]
+    for name in sorted(timings, key=lambda n: -timings[n]["total"]):
+        summary = timings[name]
+        lines.append(
+            f"{name:<28}{summary['count']:>8.0f}{summary['total']:>12.1f}"
+            f"{summary['total'] / summary['count']:>10.2f}"
+            f"{summary['p95']:>10.2f}{summary['max']:>10.2f}"
+        )
+    for name in sorted(counters):
+        value, unit = counters[name]
+        lines.append(f"{name:<28}{value:>20,.1f} {unit}")
+    return "\n".join(lines)
+
+
+def flush_metrics(stage: str) -> None:
+    """
+    Emit the recorded metrics and reset them.
+
+    Writes the EMF document as a single line to stdout and logs the text
+    summary. Does nothing but reset when ``ENABLE_METRICS`` is false.
+
+    Args:
+        stage (str): The pipeline stage name, e.g. ``prepare``.
+    """
+    if ENABLE_METRICS and (_timings or _counters):
+        document = build_emf_document(stage)
+        sys.stdout.write(json.dumps(document, separators=(",", ":")) + "\n")
+        sys.stdout.flush()
+        logger.info(f"Metrics summary for {stage}:\n{format_summary()}")
+    reset_metrics()
+
+
+def reset_metrics() -> None:
+    """Discard all recorded metrics."""
+    with _lock:
+        _timings.clear()
+        _counters.clear()
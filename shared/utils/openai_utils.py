@@ -2,19 +2,25 @@
 Utility module for OpenAI API interactions.
 
 This module provides common functions for interacting with the OpenAI API,
-including client initialization and error handling.
+including client initialization and error handling. The clients make a
+single attempt per request; retries are made by ``resilience_utils``.
 """
 
+import asyncio
 import sys
+from typing import Awaitable, Callable, Sequence, TypeVar
 
-from openai import OpenAI, OpenAIError
+from openai import AsyncOpenAI, OpenAI, OpenAIError
 
-from ..config import OPENAI_API_KEY
+from ..config import OPENAI_API_KEY, OPENAI_MAX_CONCURRENCY
 from .logging_utils import configure_logger
+from .scheduler_utils import FairLimiter, loop_limiter
 
 # Configure logger
 logger = configure_logger('openai_utils')
 
+T = TypeVar("T")
+
 
 def initialize_openai_client() -> OpenAI:
     """
@@ -29,6 +35,7 @@ def initialize_openai_client() -> OpenAI:
     try:
         client = OpenAI(
             api_key=OPENAI_API_KEY,
+            max_retries=0,
         )
         return client
     except OpenAIError as e:
@@ -37,3 +44,67 @@ def initialize_openai_client() -> OpenAI:
     except Exception as e:
         logger.error(f"Failed to initialize OpenAI client: {str(e)}")
         sys.exit(1)
+
+
+def initialize_async_openai_client() -> AsyncOpenAI:
+    """
+    Initialize and return an asynchronous OpenAI client.
+
+    Returns:
+        AsyncOpenAI: An initialized asynchronous OpenAI client.
+
+    Exits:
+        If client initialization fails, logs the error and exits with code 1.
+    """
+    try:
+        client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            max_retries=0,
+        )
+        return client
+    except OpenAIError as e:
+        logger.error(f"Failed to initialize async OpenAI client: {str(e)}")
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"Failed to initialize async OpenAI client: {str(e)}")
+        sys.exit(1)
+
+
+async def process_batches_concurrently(
+    async_client: AsyncOpenAI,
+    worker: Callable[[AsyncOpenAI, T, FairLimiter], Awaitable[bool]],
+    batches: Sequence[T],
+) -> int:
+    """
+    Run ``worker`` for every batch concurrently and close the client.
+
+    The workers share the event loop's OpenAI limiter, so at most
+    ``OPENAI_MAX_CONCURRENCY`` OpenAI requests of all tenants are in
+    flight. A worker that raises is logged and counted as failed.
+
+    Args:
+        async_client (AsyncOpenAI): The client the workers use.
+        worker (Callable): Processes one batch; returns True on success.
+        batches (Sequence): The batches, in the order to start them.
+
+    Returns:
+        int: The number of batches the worker processed successfully.
+    """
+    limit = loop_limiter("openai", OPENAI_MAX_CONCURRENCY)
+    try:
+        outcomes = await asyncio.gather(
+            *(worker(async_client, batch, limit) for batch in batches),
+            return_exceptions=True
+        )
+    finally:
+        await async_client.close()
+
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            logger.error(f"Unexpected error processing batch: {outcome}")
+    success_count = sum(1 for outcome in outcomes if outcome is True)
+    logger.info(
+        f"Successfully processed {success_count} out of "
+        f"{len(batches)} batches"
+    )
+    return success_count
@@ -0,0 +1,296 @@
+"""
+Utility module for planning batch sizes and submission times.
+
+Completed batches in the control file (and its archives) record when they
+were submitted, when their results were published and how many requests
+they had. This module mines that history to:
+- Fit a latency model: time-to-publish grows linearly with batch size and
+  is scaled by a factor for the UTC hour of day the batch was submitted
+- Pick the number of batches a partition is split into, trading a shorter
+  time-to-publish per batch against the fixed cost of every extra batch
+- Pick a submission time within the next day that minimizes the expected
+  publish time while still meeting the delivery deadline
+
+Until ``PLANNER_MIN_SAMPLES`` completed batches are known there is no model
+and the prepare stage keeps its defaults.
+"""
+
+import math
+from datetime import date, datetime, timedelta, timezone
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from ..config import (
+    BATCH_OVERHEAD_SECONDS,
+    MAX_REQUESTS_PER_BATCH,
+    MIN_REQUESTS_PER_BATCH,
+    PLANNER_HISTORY_DAYS,
+    PLANNER_MIN_SAMPLES,
+    STATUS_COMPLETED,
+)
+from .batch_record_utils import BatchRecord
+from .control_file_utils import get_control_data, query_archived_batches
+from .logging_utils import configure_logger
+
+# Configure logger
+logger = configure_logger('planner_utils')
+
+# Weight, in samples, of the neutral factor 1.0 in every hour's factor, so
+# hours with few samples stay close to the overall model
+HOUR_PRIOR_SAMPLES = 3
+# Submission is only deferred if that publishes at least this much earlier
+MIN_DEFER_GAIN = timedelta(minutes=15)
+# Most shard counts tried for one partition
+MAX_SHARD_CANDIDATES = 64
+
+
+class Sample(NamedTuple):
+    """One completed batch: its size, submission time and time-to-publish."""
+
+    size: int
+    submitted_at: datetime
+    seconds: float
+
+
+class ShardLimits(NamedTuple):
+    """The batch sizes and per-batch cost ``plan_shards`` works with."""
+
+    # Shards stay within these sizes where possible
+    max_requests: int = MAX_REQUESTS_PER_BATCH
+    min_requests: int = MIN_REQUESTS_PER_BATCH
+    # Seconds of pipeline work every batch adds
+    overhead: float = BATCH_OVERHEAD_SECONDS
+
+
+class LatencyModel(NamedTuple):
+    """Time-to-publish of a batch as a function of size and submit hour."""
+
+    samples: int
+    intercept: float
+    slope: float
+    hourly: Tuple[float, ...]
+
+    def predict(self, size: int, submit_at: datetime) -> float:
+        """Return the expected seconds from submission to publication."""
+        base = self.intercept + self.slope * size
+        hour = submit_at.astimezone(timezone.utc).hour
+        return max(base * self.hourly[hour], 0.0)
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    """Parse a control-file timestamp; naive ones are in local time."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc)
+
+
+def history_samples(batches: Iterable[Mapping[str, Any]]) -> List[Sample]:
+    """
+    Extract latency samples from completed batch entries.
+
+    A batch's submission time is its ``submitted_at``, or its
+    ``created_at`` for batches uploaded before submissions were recorded.
+
+    Args:
+        batches (Iterable): Batch dictionaries from the control file.
+
+    Returns:
+        list: One sample per completed batch with usable timestamps.
+    """
+    samples = []
+    for batch in batches:
+        if batch.get("status") != STATUS_COMPLETED:
+            continue
+        submitted = _parse_time(
+            batch.get("submitted_at") or batch.get("created_at")
+        )
+        completed = _parse_time(batch.get("completed_at"))
+        size = batch.get("rider_count")
+        if submitted is None or completed is None or not size:
+            continue
+        seconds = (completed - submitted).total_seconds()
+        if seconds > 0:
+            samples.append(Sample(int(size), submitted, seconds))
+    return samples
+
+
+def _fit_line(samples: List[Sample]) -> Tuple[float, float]:
+    """Fit seconds = intercept + slope * size, with both non-negative."""
+    n = len(samples)
+    mean_x = sum(s.size for s in samples) / n
+    mean_y = sum(s.seconds for s in samples) / n
+    var_x = sum((s.size - mean_x) ** 2 for s in samples)
+    if var_x == 0:
+        return mean_y, 0.0
+    slope = sum(
+        (s.size - mean_x) * (s.seconds - mean_y) for s in samples
+    ) / var_x
+    if slope <= 0:
+        return mean_y, 0.0
+    intercept = mean_y - slope * mean_x
+    if intercept < 0:
+        # Fit through the origin instead
+        slope = sum(s.size * s.seconds for s in samples) / sum(
+            s.size ** 2 for s in samples
+        )
+        return 0.0, slope
+    return intercept, slope
+
+
+def fit_latency_model(
+    samples: List[Sample], min_samples: int = PLANNER_MIN_SAMPLES
+) -> Optional[LatencyModel]:
+    """
+    Fit the latency model to history samples.
+
+    Args:
+        samples (list): Samples from ``history_samples``.
+        min_samples (int): The fewest samples worth fitting.
+
+    Returns:
+        LatencyModel: The model, or None if there are too few samples.
+    """
+    if not samples or len(samples) < max(min_samples, 1):
+        return None
+    intercept, slope = _fit_line(samples)
+
+    ratio_sums = [0.0] * 24
+    counts = [0] * 24
+    for sample in samples:
+        base = intercept + slope * sample.size
+        if base <= 0:
+            continue
+        hour = sample.submitted_at.hour
+        ratio_sums[hour] += sample.seconds / base
+        counts[hour] += 1
+    hourly = tuple(
+        (ratio_sums[hour] + HOUR_PRIOR_SAMPLES)
+        / (counts[hour] + HOUR_PRIOR_SAMPLES)
+        for hour in range(24)
+    )
+    return LatencyModel(len(samples), intercept, slope, hourly)
+
+
+def load_history(
+    history_days: int = PLANNER_HISTORY_DAYS
+) -> List[BatchRecord]:
+    """
+    Return the batches of the control file and of recent archives.
+
+    Args:
+        history_days (int): The number of past target dates whose archives
+            are read.
+
+    Returns:
+        list: Batch records, each batch once.
+    """
+    batches: Dict[str, BatchRecord] = {}
+    if history_days > 0:
+        today = date.today()
+        for batch in query_archived_batches(
+            (today - timedelta(days=history_days)).isoformat(),
+            today.isoformat(),
+            status=STATUS_COMPLETED
+        ):
+            batches[str(batch.get("batch_id"))] = batch
+    for batch in get_control_data().get("batches", []):
+        batches[str(batch.get("batch_id"))] = batch
+    return list(batches.values())
+
+
+def load_latency_model(
+    history_days: int = PLANNER_HISTORY_DAYS
+) -> Optional[LatencyModel]:
+    """Fit the latency model to the batch history in S3."""
+    try:
+        model = fit_latency_model(
+            history_samples(load_history(history_days))
+        )
+    except Exception as e:
+        logger.error(f"Error loading batch history: {str(e)}")
+        return None
+    if model is None:
+        logger.info("Not enough batch history for the planner")
+    else:
+        logger.info(
+            f"Latency model from {model.samples} batches: "
+            f"{model.intercept:.0f}s + {model.slope * 1000:.1f}s per 1000 "
+            f"requests"
+        )
+    return model
+
+
+def plan_shards(
+    model: LatencyModel,
+    count: int,
+    submit_at: datetime,
+    limits: ShardLimits = ShardLimits()
+) -> int:
+    """
+    Choose how many batches ``count`` requests are split into.
+
+    All shards run at once, so the partition is published when its largest
+    shard is, plus ``limits.overhead`` seconds of pipeline work for every
+    batch. Shards stay between ``limits.min_requests`` and
+    ``limits.max_requests`` requests where possible.
+
+    Returns:
+        int: The number of shards with the lowest expected time-to-publish.
+    """
+    fewest = max(math.ceil(count / max(limits.max_requests, 1)), 1)
+    most = max(math.ceil(count / max(limits.min_requests, 1)), fewest)
+    most = min(most, fewest + MAX_SHARD_CANDIDATES - 1)
+
+    def cost(shards: int) -> float:
+        size = math.ceil(count / shards)
+        return model.predict(size, submit_at) + limits.overhead * shards
+
+    return min(range(fewest, most + 1), key=cost)
+
+
+def plan_submission(
+    model: LatencyModel,
+    size: int,
+    now: datetime,
+    deadline: Optional[datetime] = None
+) -> datetime:
+    """
+    Choose when to submit a batch of ``size`` requests.
+
+    The candidates are now and the start of each of the next 23 hours.
+    A later hour is only chosen if its expected publish time is at least
+    ``MIN_DEFER_GAIN`` earlier than submitting now and still before the
+    deadline.
+
+    Returns:
+        datetime: The planned submission time (``now`` unless deferring
+                  pays off).
+    """
+    publish_now = now + timedelta(seconds=model.predict(size, now))
+    top_of_hour = now.replace(minute=0, second=0, microsecond=0)
+    # The earliest-publishing later hour; only one that beats submitting
+    # now can pay off, since MIN_DEFER_GAIN is positive
+    best_start: Optional[datetime] = None
+    best_publish = publish_now
+    for hours in range(1, 24):
+        start = top_of_hour + timedelta(hours=hours)
+        publish = start + timedelta(seconds=model.predict(size, start))
+        if deadline is not None and publish > deadline:
+            continue
+        if publish < best_publish:
+            best_start, best_publish = start, publish
+    if best_start is not None and best_publish + MIN_DEFER_GAIN <= publish_now:
+        return best_start
+    return now
@@ -0,0 +1,165 @@
+"""
+Utility module for opt-in profiling of pipeline stages.
+
+Profiling is controlled by the ``PROFILE_MODE`` environment variable, a
+comma-separated list of:
+- ``cprofile``: deterministic CPU profile (``.prof`` file plus a text report)
+- ``tracemalloc``: top memory allocation sites and peak traced memory
+- ``pyinstrument``: sampling profiler HTML report (optional dependency)
+
+Artifacts are written to ``LOG_DIR`` and, with ``PROFILE_UPLOAD=true``,
+uploaded to S3 under ``DIAGNOSTICS_PREFIX/<stage>/<timestamp>/``.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Iterator, List, Optional, Set
+
+from ..config import DIAGNOSTICS_PREFIX, LOG_DIR, PROFILE_MODE, PROFILE_UPLOAD
+from .logging_utils import configure_logger
+from .s3_utils import upload_file_to_s3
+
+# Configure logger
+logger = configure_logger('profiling_utils')
+
+SUPPORTED_PROFILERS = {"cprofile", "tracemalloc", "pyinstrument"}
+REPORT_LINES = 50
+TRACEMALLOC_FRAMES = 10
+
+
+def enabled_profilers() -> Set[str]:
+    """Return the profilers selected by ``PROFILE_MODE``."""
+    selected = {
+        name.strip().lower() for name in PROFILE_MODE.split(",")
+        if name.strip()
+    }
+    unknown = selected - SUPPORTED_PROFILERS
+    if unknown:
+        logger.warning(f"Ignoring unknown profilers: {sorted(unknown)}")
+    return selected & SUPPORTED_PROFILERS
+
+
+def _start_pyinstrument() -> Optional[Any]:
+    """Start the sampling profiler, if pyinstrument is installed."""
+    try:
+        from pyinstrument import (  # pylint: disable=import-outside-toplevel
+            Profiler,
+        )
+    except ImportError:
+        logger.warning("pyinstrument is not installed, skipping it")
+        return None
+    profiler = Profiler()
+    profiler.start()
+    return profiler
+
+
+def _write_text(path: str, text: str) -> str:
+    """Write a text artifact and return its path."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def _write_cprofile(profiler: cProfile.Profile, base: str) -> List[str]:
+    """Write the raw cProfile stats and a cumulative-time report."""
+    profiler.dump_stats(f"{base}.prof")
+    report = io.StringIO()
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_LINES)
+    return [
+        f"{base}.prof",
+        _write_text(f"{base}-cprofile.txt", report.getvalue())
+    ]
+
+
+def _write_tracemalloc(base: str) -> List[str]:
+    """Write the top allocation sites and the peak traced memory."""
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    lines = [
+        f"Current traced memory: {current / 1024 / 1024:.1f} MiB",
+        f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB",
+        "",
+        f"Top {REPORT_LINES} allocation sites:",
+    ]
+    for stat in snapshot.statistics("lineno")[:REPORT_LINES]:
+        lines.append(str(stat))
+    return [_write_text(f"{base}-tracemalloc.txt", "\n".join(lines) + "\n")]
+
+
+def _upload_artifacts(stage: str, timestamp: str, paths: List[str]) -> None:
+    """Upload profiling artifacts to the diagnostics prefix in S3."""
+    for path in paths:
+        key = (
+            f"{DIAGNOSTICS_PREFIX}/{stage}/{timestamp}/"
+            f"{os.path.basename(path)}"
+        )
+        if not upload_file_to_s3(path, key):
+            logger.error(f"Failed to upload profiling artifact: {path}")
+
+
+@contextmanager
+def profile_stage(stage: str) -> Iterator[None]:
+    """
+    Profile the enclosed block with the profilers in ``PROFILE_MODE``.
+
+    Does nothing when no profiler is enabled. Errors while writing or
+    uploading artifacts are logged and never fail the stage.
+
+    Args:
+        stage (str): The pipeline stage name, used in artifact names.
+
+    Yields:
+        None
+    """
+    profilers = enabled_profilers()
+    if not profilers:
+        yield
+        return
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    logger.info(f"Profiling {stage} with: {', '.join(sorted(profilers))}")
+
+    if "tracemalloc" in profilers:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    sampler = (
+        _start_pyinstrument() if "pyinstrument" in profilers else None
+    )
+    cpu_profiler = cProfile.Profile() if "cprofile" in profilers else None
+    if cpu_profiler:
+        cpu_profiler.enable()
+
+    try:
+        yield
+    finally:
+        if cpu_profiler:
+            cpu_profiler.disable()
+        if sampler:
+            sampler.stop()
+
+        try:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            base = os.path.join(LOG_DIR, f"{stage}-{timestamp}")
+            paths: List[str] = []
+            if cpu_profiler:
+                paths.extend(_write_cprofile(cpu_profiler, base))
+            if "tracemalloc" in profilers and tracemalloc.is_tracing():
+                paths.extend(_write_tracemalloc(base))
+            if sampler:
+                paths.append(
+                    _write_text(f"{base}-pyinstrument.html",
+                                sampler.output_html())
+                )
+            logger.info(f"Wrote profiling artifacts: {paths}")
+
+            if PROFILE_UPLOAD:
+                _upload_artifacts(stage, timestamp, paths)
+        except Exception as e:
+            logger.error(f"Failed to write profiling artifacts: {str(e)}")
@@ -0,0 +1,145 @@
+"""
+Utility module for client-side rate limiting.
+
+This module provides an asyncio token bucket used to keep concurrent
+OpenAI requests within the account's requests-per-minute (RPM) and
+tokens-per-minute (TPM) limits, along with helpers to count the prompt
+tokens of a chat completion request and to estimate how many tokens it
+will count against the TPM limit. Prompts are tokenized with the optional
+``tiktoken`` dependency when it is installed, and estimated from their
+length otherwise.
+"""
+
+import asyncio
+import functools
+import time
+from typing import Any, Dict, Optional
+
+from ..config import OPENAI_MODEL
+
+# Rough characters-per-token ratio for English text
+CHARS_PER_TOKEN = 4
+# Completion allowance used when a request does not cap its output
+DEFAULT_COMPLETION_TOKENS = 256
+# Tokens the chat format adds per message, and to prime the reply
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+# Encoding for models tiktoken does not know
+DEFAULT_ENCODING = "o200k_base"
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """
+    Asynchronous token bucket refilled continuously at a per-minute rate.
+
+    The bucket starts full, so up to ``per_minute`` units can be spent in a
+    burst before callers are made to wait for the refill.
+    """
+
+    def __init__(self, per_minute: int) -> None:
+        """
+        Create a bucket that refills ``per_minute`` units every minute.
+
+        Args:
+            per_minute (int): The capacity and refill rate of the bucket.
+        """
+        self.capacity = float(max(per_minute, 1))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        """Add the tokens accrued since the last refill."""
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """
+        Wait until ``amount`` units are available and spend them.
+
+        Requests larger than the bucket capacity are clamped to the capacity
+        so that they can still proceed once the bucket is full.
+
+        Args:
+            amount (float): The number of units to spend.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= amount
+        return waited
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str) -> Optional[Any]:
+    """Return the tiktoken encoding of a model, or None without tiktoken."""
+    try:
+        import tiktoken  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def count_tokens(text: str, model: str = OPENAI_MODEL) -> int:
+    """
+    Count the tokens of a text for a model.
+
+    Uses ``tiktoken`` when it is installed, and the text length divided by
+    ``CHARS_PER_TOKEN`` otherwise.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_prompt_tokens(body: Dict[str, Any]) -> int:
+    """
+    Estimate the prompt tokens of a chat completion request.
+
+    Args:
+        body (dict): The chat completion request body.
+
+    Returns:
+        int: The tokens of every message plus the chat format overhead.
+    """
+    model = str(body.get("model") or OPENAI_MODEL)
+    messages = body.get("messages", [])
+    return sum(
+        count_tokens(str(message.get("content", "")), model)
+        + TOKENS_PER_MESSAGE
+        for message in messages
+    ) + TOKENS_PER_REPLY
+
+
+def estimate_request_tokens(body: Dict[str, Any]) -> int:
+    """
+    Estimate the tokens a chat completion request counts against TPM.
+
+    OpenAI counts the prompt tokens plus the requested completion cap, so
+    the estimate is ``estimate_prompt_tokens`` plus ``max_tokens`` (or
+    ``DEFAULT_COMPLETION_TOKENS`` when unset).
+
+    Args:
+        body (dict): The chat completion request body.
+
+    Returns:
+        int: The estimated number of tokens for the request.
+    """
+    completion_tokens = body.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return estimate_prompt_tokens(body) + int(completion_tokens)
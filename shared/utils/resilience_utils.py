@@ -0,0 +1,493 @@
+"""
+Utility module for resilient calls to S3 and OpenAI.
+
+Every S3 and OpenAI request of the pipeline goes through the
+``ServiceGuard`` of its service (``S3_GUARD`` or ``OPENAI_GUARD``), which
+combines:
+- retries with jittered exponential backoff (honouring ``Retry-After``)
+  for throttling, 5xx and network errors
+- throttling-aware pacing: every throttled response doubles the minimum
+  spacing between request starts, and every success shrinks it by 10%
+- a circuit breaker that fails calls fast after repeated failures and
+  lets a single probe through once ``CIRCUIT_RESET_SECONDS`` have passed
+- hedged reads: a read still running after the recent p95 latency is
+  duplicated, and whichever copy finishes first wins
+
+Non-idempotent calls (creating files or batches) are only retried after
+throttling, which guarantees the first attempt was not applied. The SDK
+clients are created without their own retries so attempts are not
+multiplied. Retries, throttles, hedges and breaker trips are recorded as
+metrics prefixed with the service name.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import (
+    Awaitable,
+    Callable,
+    Deque,
+    List,
+    NamedTuple,
+    Optional,
+    TypeVar,
+)
+
+from botocore.exceptions import (
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+from openai import (
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+)
+
+from ..config import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+    HEDGE_MIN_MS,
+    HEDGED_READS,
+    REQUEST_BACKOFF_BASE_MS,
+    REQUEST_BACKOFF_MAX_MS,
+    REQUEST_MAX_ATTEMPTS,
+)
+from .logging_utils import configure_logger
+from .metrics_utils import increment, set_gauge
+
+# Configure logger
+logger = configure_logger('resilience_utils')
+
+T = TypeVar("T")
+
+# Error kinds returned by classify_error
+THROTTLED = "throttled"
+SERVER_ERROR = "server_error"
+NETWORK_ERROR = "network_error"
+
+THROTTLING_CODES = {
+    "SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded",
+    "TooManyRequestsException", "429",
+}
+SERVER_ERROR_CODES = {
+    "InternalError", "ServiceUnavailable", "500", "502", "503", "504",
+}
+NETWORK_ERRORS = (
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+    APIConnectionError,
+    ConnectionError,
+    TimeoutError,
+)
+
+# Recent read latencies kept for the hedging threshold
+LATENCY_WINDOW = 200
+# Reads observed before hedging starts
+HEDGE_MIN_SAMPLES = 20
+# Upper bound of the pacing interval between request starts
+MAX_PACING_SECONDS = 2.0
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open."""
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """
+    Classify a failed request.
+
+    Args:
+        error (BaseException): The error raised by an S3 or OpenAI call.
+
+    Returns:
+        str: ``throttled``, ``server_error`` or ``network_error`` if the
+             request may succeed when retried, None otherwise (e.g. a
+             missing key or a failed precondition).
+    """
+    if isinstance(error, RateLimitError):
+        return THROTTLED
+    if isinstance(error, InternalServerError):
+        return SERVER_ERROR
+    if isinstance(error, NETWORK_ERRORS):
+        return NETWORK_ERROR
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        code = str(response.get("Error", {}).get("Code", ""))
+        if code in THROTTLING_CODES:
+            return THROTTLED
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if code in SERVER_ERROR_CODES or (
+            isinstance(status, int) and status >= 500
+        ):
+            return SERVER_ERROR
+    return None
+
+
+def _retry_after(error: BaseException) -> float:
+    """Return the ``Retry-After`` seconds of an HTTP error response, or 0."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return 0.0
+    try:
+        return max(float(headers.get("retry-after", 0)), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def backoff_delay(
+    attempt: int,
+    base: float = REQUEST_BACKOFF_BASE_MS / 1000,
+    cap: float = REQUEST_BACKOFF_MAX_MS / 1000
+) -> float:
+    """
+    Return a "full jitter" backoff delay for a retry.
+
+    Args:
+        attempt (int): The number of failed attempts so far (1 or more).
+        base (float): The delay ceiling of the first retry, in seconds.
+        cap (float): The maximum delay, in seconds.
+
+    Returns:
+        float: A random delay between 0 and
+               ``min(cap, base * 2 ** (attempt - 1))``.
+    """
+    ceiling = min(cap, base * (2 ** max(attempt - 1, 0)))
+    return random.uniform(0, ceiling)  # nosec B311 - jitter, not security
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker shared by the threads of a process.
+
+    The circuit opens after ``failure_threshold`` consecutive failures.
+    While open, ``allow`` refuses calls; after ``reset_seconds`` a single
+    probe call is allowed (half-open), whose outcome closes or reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS
+    ) -> None:
+        """
+        Create a closed circuit.
+
+        Args:
+            name (str): The service name, used in logs and metrics.
+            failure_threshold (int): Consecutive failures that open it.
+            reset_seconds (float): Seconds before an open circuit is probed.
+        """
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a call may be made now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and \
+                    time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"{self.name} circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the circuit at the threshold."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED
+                and self.failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                increment(f"{self.name}CircuitOpened")
+                logger.warning(
+                    f"{self.name} circuit opened after {self.failures} "
+                    f"failures; failing fast for {self.reset_seconds}s"
+                )
+
+
+class AdaptivePacer:
+    """
+    Spaces out request starts after the service starts throttling.
+
+    The interval doubles on every throttled response and decays by 10% on
+    every success, so a throttled client settles just below the rate the
+    service accepts. Unthrottled clients are never delayed.
+    """
+
+    def __init__(self, name: str, initial: float = 0.01) -> None:
+        """
+        Create a pacer without delay.
+
+        Args:
+            name (str): The service name, used for the pacing gauge.
+            initial (float): The interval after the first throttle, in
+                seconds.
+        """
+        self.name = name
+        self.initial = initial
+        self.interval = 0.0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Reserve the next start slot and return the seconds to wait."""
+        with self._lock:
+            if not self.interval:
+                return 0.0
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+            return start - now
+
+    def wait(self) -> None:
+        """Block until the next request may start."""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        """Wait without blocking the event loop until a request may start."""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_throttled(self) -> None:
+        """Slow down after a throttled response."""
+        with self._lock:
+            self.interval = min(
+                max(self.interval * 2, self.initial), MAX_PACING_SECONDS
+            )
+            interval = self.interval
+        set_gauge(
+            f"{self.name}PacingInterval", interval * 1000, "Milliseconds"
+        )
+
+    def on_success(self) -> None:
+        """Speed up again after a successful response."""
+        with self._lock:
+            if self.interval:
+                self.interval *= 0.9
+                if self.interval < self.initial / 10:
+                    self.interval = 0.0
+
+
+class RetryPolicy(NamedTuple):
+    """How a ``ServiceGuard`` retries and hedges the calls of its service."""
+
+    # Attempts per call, including the first
+    max_attempts: int = REQUEST_MAX_ATTEMPTS
+    # Whether ``ServiceGuard.read`` may hedge slow calls
+    hedged_reads: bool = HEDGED_READS
+    # Never hedge sooner than this
+    hedge_min_seconds: float = HEDGE_MIN_MS / 1000
+
+
+class ServiceGuard:
+    """Retries, pacing, circuit breaking and hedging for one service."""
+
+    def __init__(
+        self,
+        name: str,
+        policy: RetryPolicy = RetryPolicy(),
+        breaker: Optional[CircuitBreaker] = None
+    ) -> None:
+        """
+        Create the guard of a service.
+
+        Args:
+            name (str): The service name, e.g. ``S3``; prefixes metrics.
+            policy (RetryPolicy): The retry and hedging settings.
+            breaker (CircuitBreaker, optional): Defaults to a new breaker.
+        """
+        self.name = name
+        self.policy = policy._replace(
+            max_attempts=max(policy.max_attempts, 1)
+        )
+        self.breaker = breaker or CircuitBreaker(name)
+        self.pacer = AdaptivePacer(name)
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _check_circuit(self) -> None:
+        """Raise ``CircuitOpenError`` if calls must fail fast."""
+        if not self.breaker.allow():
+            increment(f"{self.name}CircuitRejected")
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def _on_error(
+        self, error: BaseException, attempt: int, idempotent: bool
+    ) -> Optional[float]:
+        """Record a failed attempt and return the retry delay, if any."""
+        kind = classify_error(error)
+        if kind is None:
+            # The service answered; the request itself was wrong
+            self.breaker.record_success()
+            return None
+        if kind == THROTTLED:
+            increment(f"{self.name}Throttled")
+            self.pacer.on_throttled()
+        if attempt >= self.policy.max_attempts or (
+            not idempotent and kind != THROTTLED
+        ):
+            self.breaker.record_failure()
+            return None
+        increment(f"{self.name}Retries")
+        return max(backoff_delay(attempt), _retry_after(error))
+
+    def _on_success(self) -> None:
+        """Record a successful attempt."""
+        self.pacer.on_success()
+        self.breaker.record_success()
+
+    def call(self, func: Callable[[], T], idempotent: bool = True) -> T:
+        """
+        Call ``func`` with retries, pacing and circuit breaking.
+
+        Args:
+            func (callable): The request to make.
+            idempotent (bool): Whether the request may be repeated after
+                an error that does not prove it was not applied.
+
+        Returns:
+            The result of ``func``.
+
+        Raises:
+            CircuitOpenError: If the service's circuit is open.
+            Exception: The last error of ``func`` once retries are spent.
+        """
+        self._check_circuit()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.pacer.wait()
+            try:
+                result = func()
+            except Exception as e:
+                delay = self._on_error(e, attempt, idempotent)
+                if delay is None:
+                    raise
+                logger.debug(
+                    "%s attempt %d failed (%s), retrying in %.2fs",
+                    self.name, attempt, e, delay
+                )
+                time.sleep(delay)
+                continue
+            self._on_success()
+            return result
+
+    async def call_async(
+        self, func: Callable[[], Awaitable[T]], idempotent: bool = True
+    ) -> T:
+        """Asyncio variant of ``call``; ``func`` returns an awaitable."""
+        self._check_circuit()
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.pacer.wait_async()
+            try:
+                result = await func()
+            except Exception as e:
+                delay = self._on_error(e, attempt, idempotent)
+                if delay is None:
+                    raise
+                logger.debug(
+                    "%s attempt %d failed (%s), retrying in %.2fs",
+                    self.name, attempt, e, delay
+                )
+                await asyncio.sleep(delay)
+                continue
+            self._on_success()
+            return result
+
+    def hedge_delay(self) -> Optional[float]:
+        """Return the p95 read latency to hedge after, or None to not hedge."""
+        if not self.policy.hedged_reads:
+            return None
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+        return max(p95, self.policy.hedge_min_seconds)
+
+    def _timed(self, func: Callable[[], T]) -> T:
+        """Call ``func`` and record its latency if it succeeds."""
+        started = time.monotonic()
+        result = func()
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+        return result
+
+    def _hedged(self, func: Callable[[], T]) -> T:
+        """Run ``func``, duplicating it if it is slower than usual."""
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._timed(func)
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    thread_name_prefix=f"{self.name.lower()}-hedge"
+                )
+            pool = self._hedge_pool
+
+        futures: List["Future[T]"] = [pool.submit(self._timed, func)]
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            increment(f"{self.name}HedgedReads")
+            futures.append(pool.submit(self._timed, func))
+
+        for future in as_completed(futures):
+            if future.exception() is None:
+                if future is not futures[0]:
+                    increment(f"{self.name}HedgeWins")
+                return future.result()
+        # Every call failed: raise the error of the first one
+        return futures[0].result()
+
+    def read(self, func: Callable[[], T]) -> T:
+        """
+        Call an idempotent read with retries and hedging.
+
+        ``func`` should include reading the response body, since a slow
+        body is the usual reason to hedge.
+        """
+        return self.call(lambda: self._hedged(func))
+
+
+S3_GUARD = ServiceGuard("S3")
+OPENAI_GUARD = ServiceGuard("OpenAI", RetryPolicy(hedged_reads=False))
@@ -0,0 +1,392 @@
+"""
+Utility module for publishing batch results.
+
+The download stage (for Batch API output files) and the express stage (for
+real-time Chat Completions) both turn result lines in the Batch API output
+format into horoscopes. This module provides:
+- Routing a result line to its rider through the batch manifest
+- Publishing the horoscopes of a result file to S3, blocking or on asyncio,
+  with checkpoint callbacks every ``CHECKPOINT_EVERY`` lines
+- Summing the token usage reported by the results
+- Rebuilding the published custom IDs of a checkpoint
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from ..config import CHECKPOINT_EVERY, HOROSCOPE_PREFIX
+from .async_s3_utils import upload_json_to_s3_async
+from .logging_utils import LogSampler, configure_logger
+from .manifest_utils import ManifestEntry, load_manifest
+from .metrics_utils import increment, record_timing, set_gauge
+from .s3_utils import upload_json_to_s3
+from .scheduler_utils import run_in_thread
+
+# Configure logger
+logger = configure_logger('result_utils')
+
+# Token counts of a result's ``usage`` that are summed per batch
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+# Finds the custom ID of a result line that is not valid JSON
+_CUSTOM_ID_PATTERN = re.compile(r'"custom_id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+# (custom_id, name, key, data) of a result line; see ``horoscope_for``
+Horoscope = Tuple[Optional[str], str, str, Optional[Dict[str, Any]]]
+
+
+class ResultTally(NamedTuple):
+    """
+    What the results of a batch came to, filled in while they are processed.
+
+    ``published_ids`` is only tracked (not None) for batches whose requests
+    may be missing from both the output and the error file.
+    """
+
+    failed_ids: Set[str]
+    published_ids: Optional[Set[str]]
+    usage: Dict[str, int]
+
+    @classmethod
+    def empty(cls, track_published: bool = False) -> "ResultTally":
+        """Return a tally with nothing recorded yet."""
+        return cls(set(), set() if track_published else None, {})
+
+
+class ResultProgress(NamedTuple):
+    """Where result processing starts and how it reports its progress."""
+
+    # Lines before this one were handled by an earlier, interrupted run
+    start_line: int = 0
+    # Called with (lines_done, published) every CHECKPOINT_EVERY lines
+    on_progress: Optional[Callable[[int, int], None]] = None
+
+
+class _ResultLogs(NamedTuple):
+    """Sampled logs of one result-processing run."""
+
+    uploaded: LogSampler
+    empty: LogSampler
+    upload_error: LogSampler
+    parse_error: LogSampler
+
+
+class _ResultRun:
+    """The tally and sampled logs of one result-processing run."""
+
+    def __init__(
+        self,
+        target_date: str,
+        manifest: Optional[Dict[str, ManifestEntry]],
+        tally: ResultTally
+    ) -> None:
+        self.target_date = target_date
+        self.manifest = manifest
+        self.tally = tally
+        self.published = 0
+        self.started = time.perf_counter()
+        self.logs = _ResultLogs(
+            uploaded=LogSampler(logger, "Uploaded horoscopes"),
+            empty=LogSampler(
+                logger, "Empty or invalid responses", logging.WARNING
+            ),
+            upload_error=LogSampler(
+                logger, "Failed horoscope uploads", logging.ERROR
+            ),
+            parse_error=LogSampler(
+                logger, "Unparseable result lines", logging.ERROR
+            ),
+        )
+
+    def parse(self, line: str) -> Optional[Horoscope]:
+        """
+        Parse one result line and count its token usage.
+
+        Returns:
+            tuple: The horoscope to upload (see ``horoscope_for``), or None
+                   if the line has nothing to publish.
+        """
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            self.logs.parse_error.log("Failed to parse result line: %s", e)
+            _fail_unparseable_line(line, self.tally.failed_ids)
+            return None
+        add_usage(self.tally.usage, item)
+        horoscope = horoscope_for(item, self.target_date, self.manifest)
+        custom_id, name, _, data = horoscope
+        if data is None:
+            self.logs.empty.log("Empty or invalid response for %s", name)
+            if custom_id:
+                self.tally.failed_ids.add(custom_id)
+            return None
+        return horoscope
+
+    def record_upload(self, horoscope: Horoscope, published: bool) -> None:
+        """Log the upload of one horoscope and track its custom ID."""
+        custom_id, name, _, _ = horoscope
+        if published:
+            self.published += 1
+            self.logs.uploaded.log("Uploaded horoscope for %s", name)
+            if self.tally.published_ids is not None and custom_id:
+                self.tally.published_ids.add(custom_id)
+        else:
+            self.logs.upload_error.log(
+                "Failed to upload horoscope for %s", name
+            )
+            if custom_id:
+                self.tally.failed_ids.add(custom_id)
+
+    def finish(self, total_count: int) -> None:
+        """Log the sampled totals and record the metrics of the run."""
+        for sampler in self.logs:
+            sampler.summary()
+        elapsed = time.perf_counter() - self.started
+        record_timing("ProcessResults", elapsed * 1000)
+        increment("ResultRows", total_count)
+        increment("HoroscopesPublished", self.published)
+        if elapsed > 0:
+            set_gauge(
+                "ResultRowsPerSecond", total_count / elapsed, "Count/Second"
+            )
+
+        logger.info(
+            f"Successfully processed {self.published} "
+            f"out of {total_count} results"
+        )
+
+
+def load_batch_manifest(
+    batch_info: Mapping[str, Any]
+) -> Optional[Dict[str, ManifestEntry]]:
+    """Load the rider manifest of a batch, if it has one."""
+    manifest_key = batch_info.get("manifest_file")
+    if not manifest_key:
+        return None
+    manifest = load_manifest(manifest_key)
+    if manifest is None:
+        logger.warning(
+            f"Failed to load manifest {manifest_key}, "
+            f"falling back to name-based keys"
+        )
+    return manifest
+
+
+def horoscope_for(
+    item: Dict[str, Any],
+    target_date: str,
+    manifest: Optional[Dict[str, ManifestEntry]]
+) -> Horoscope:
+    """
+    Build the horoscope object for one result line.
+
+    Returns:
+        tuple: (custom_id, name, key, data) where key is the S3 key of the
+               horoscope and data is None if the response has no output.
+    """
+    custom_id = item.get("custom_id")
+    entry = manifest.get(custom_id) if manifest and custom_id else None
+    if entry:
+        rider_id, name, sign = entry
+        key = f"{HOROSCOPE_PREFIX}/{target_date}/{rider_id}.json"
+    else:
+        name = (custom_id or "unknown").replace(" ", "_")
+        sign = ""
+        key = f"{HOROSCOPE_PREFIX}/{target_date}/{name}.json".lower()
+
+    # Extract output from nested structure
+    response = item.get("response") or {}
+    choices = (
+        response.get("body", {}).get("choices", [{}])
+        if response.get("status_code", 200) == 200
+        else []
+    )
+    output = (
+        choices[0].get("message", {}).get("content", "")
+        if choices
+        else ""
+    )
+    if not output:
+        return custom_id, name, key, None
+
+    data = {
+        "name": name,
+        "sign": sign,
+        "horoscope": output.strip()
+    }
+    if entry:
+        data["rider_id"] = rider_id
+    return custom_id, name, key, data
+
+
+def process_results(
+    result_text: str,
+    target_date: str,
+    manifest: Optional[Dict[str, ManifestEntry]] = None,
+    tally: Optional[ResultTally] = None,
+    progress: ResultProgress = ResultProgress()
+) -> bool:
+    """
+    Process the results and upload horoscopes to S3.
+
+    Each result is routed to its rider through ``manifest`` (custom ID to
+    rider ID, name and sign). Batches prepared before manifests existed use
+    the custom ID as the rider name. Custom IDs of result lines that could
+    not be published, including lines that are not valid JSON but still
+    name their custom ID, are added to the failed IDs of ``tally``, and
+    those that were published to its published IDs, if tracked. The token
+    usage of every result is added to its usage.
+
+    Lines before ``progress.start_line`` were handled by an earlier,
+    interrupted run and are skipped. ``progress.on_progress(lines_done,
+    published)`` is called every ``CHECKPOINT_EVERY`` lines and at the end,
+    so the caller can save a checkpoint to resume from.
+
+    Returns:
+        bool: True if at least one horoscope was published.
+    """
+    lines = result_text.splitlines()
+    start_line, on_progress = progress
+    if start_line:
+        logger.info(f"Resuming result processing at line {start_line}")
+    run = _ResultRun(target_date, manifest, tally or ResultTally.empty())
+
+    for line_number in range(start_line, len(lines)):
+        if on_progress and line_number > start_line and \
+                line_number % CHECKPOINT_EVERY == 0:
+            on_progress(line_number, run.published)
+        horoscope = run.parse(lines[line_number])
+        if horoscope is not None:
+            # Upload to S3
+            run.record_upload(
+                horoscope, upload_json_to_s3(horoscope[2], horoscope[3] or {})
+            )
+
+    if on_progress:
+        on_progress(len(lines), run.published)
+    run.finish(max(len(lines) - start_line, 0))
+    return run.published > 0
+
+
+async def process_results_async(
+    result_text: str,
+    target_date: str,
+    manifest: Optional[Dict[str, ManifestEntry]] = None,
+    tally: Optional[ResultTally] = None,
+    progress: ResultProgress = ResultProgress()
+) -> bool:
+    """
+    Asyncio variant of ``process_results``.
+
+    The horoscopes of each ``CHECKPOINT_EVERY`` lines are uploaded
+    concurrently through ``async_s3_utils``; ``on_progress`` is called
+    after each such chunk, so checkpoints land on the same lines as in the
+    blocking variant.
+    """
+    lines = result_text.splitlines()
+    start_line, on_progress = progress
+    if start_line:
+        logger.info(f"Resuming result processing at line {start_line}")
+    run = _ResultRun(target_date, manifest, tally or ResultTally.empty())
+
+    chunk_start = start_line
+    while chunk_start < len(lines):
+        chunk_end = min(
+            (chunk_start // CHECKPOINT_EVERY + 1) * CHECKPOINT_EVERY,
+            len(lines)
+        )
+        uploads = list(filter(None, map(
+            run.parse, lines[chunk_start:chunk_end]
+        )))
+        uploaded = await asyncio.gather(*(
+            upload_json_to_s3_async(key, data or {})
+            for _, _, key, data in uploads
+        ))
+        for horoscope, published in zip(uploads, uploaded):
+            run.record_upload(horoscope, published)
+
+        chunk_start = chunk_end
+        if on_progress and chunk_end < len(lines):
+            await run_in_thread(on_progress, chunk_end, run.published)
+
+    if on_progress:
+        await run_in_thread(on_progress, len(lines), run.published)
+    run.finish(max(len(lines) - start_line, 0))
+    return run.published > 0
+
+
+def published_custom_ids(
+    result_text: str, end_line: int, failed_ids: Set[str]
+) -> Set[str]:
+    """
+    Return the custom IDs published by the lines before ``end_line``.
+
+    Every result line with a custom ID is either published or added to the
+    failed IDs, so the published IDs of a checkpoint follow from the result
+    file and the failed IDs recorded up to it.
+    """
+    published: Set[str] = set()
+    for line in result_text.splitlines()[:end_line]:
+        try:
+            custom_id = json.loads(line).get("custom_id")
+        except (json.JSONDecodeError, AttributeError):
+            continue
+        if custom_id and custom_id not in failed_ids:
+            published.add(custom_id)
+    return published
+
+
+def _fail_unparseable_line(line: str, failed_ids: Set[str]) -> None:
+    """Add the custom ID of a result line that is not valid JSON."""
+    match = _CUSTOM_ID_PATTERN.search(line)
+    if match is None:
+        increment("UnroutableResultLines")
+        logger.error("Result line without a readable custom ID, not retried")
+        return
+    try:
+        failed_ids.add(str(json.loads(f'"{match.group(1)}"')))
+    except json.JSONDecodeError:
+        failed_ids.add(match.group(1))
+
+
+def add_usage(usage: Dict[str, int], item: Dict[str, Any]) -> None:
+    """Add the token usage of one result line to ``usage``."""
+    body = (item.get("response") or {}).get("body") or {}
+    reported = body.get("usage") if isinstance(body, dict) else None
+    if not isinstance(reported, dict):
+        return
+    for field in USAGE_FIELDS:
+        usage[field] = usage.get(field, 0) + int(reported.get(field) or 0)
+    details = reported.get("prompt_tokens_details") or {}
+    usage["cached_tokens"] = (
+        usage.get("cached_tokens", 0) + int(details.get("cached_tokens") or 0)
+    )
+
+
+def merge_usage(usage: Dict[str, int], other: Dict[str, Any]) -> None:
+    """Add usage totals, e.g. of a checkpoint or a range, to ``usage``."""
+    for field, count in other.items():
+        usage[field] = usage.get(field, 0) + int(count)
+
+
+def record_usage(details: Dict[str, Any], usage: Dict[str, int]) -> None:
+    """Record the token usage of a batch in its details and metrics."""
+    if not usage:
+        return
+    details["usage"] = usage
+    increment("PromptTokens", usage.get("prompt_tokens", 0))
+    increment("CompletionTokens", usage.get("completion_tokens", 0))
+    increment("CachedPromptTokens", usage.get("cached_tokens", 0))
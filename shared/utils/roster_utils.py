@@ -0,0 +1,235 @@
+"""
+Utility module for loading and converting the rider roster.
+
+The roster can be stored in S3 as:
+- a JSON array of rider objects (the original format, always supported)
+- an Arrow IPC file (``.arrow``, ``.feather`` or ``.ipc``)
+- a Parquet file (``.parquet``)
+
+The format follows from the key's extension. Columnar rosters need the
+optional ``pyarrow`` dependency; only the ``id``, ``name``, ``birth_date``
+and ``timezone`` columns are read, from a memory-mapped local copy, so
+large rosters load without parsing every field of every rider. ``id`` and
+``timezone`` (an IANA name giving the rider's delivery deadline) are
+optional.
+"""
+
+import os
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from ..config import TEMP_DIR
+from .logging_utils import configure_logger
+from .metrics_utils import increment
+from .s3_utils import (
+    download_file_from_s3,
+    download_json_from_s3,
+    put_s3_object,
+)
+
+# Configure logger
+logger = configure_logger('roster_utils')
+
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+PARQUET_EXTENSIONS = (".parquet",)
+ROSTER_COLUMNS = ("id", "name", "birth_date", "timezone")
+
+
+class Roster(NamedTuple):
+    """
+    Rider roster columns.
+
+    ``ids`` and ``timezones`` are None if no rider has an ID or timezone.
+    """
+
+    names: List[str]
+    birth_dates: List[str]
+    ids: Optional[List[Any]] = None
+    timezones: Optional[List[Optional[str]]] = None
+
+    def rider(self, index: int) -> Dict[str, Any]:
+        """Return the rider at ``index`` as a roster record."""
+        return {
+            "id": self.ids[index] if self.ids is not None else None,
+            "name": self.names[index],
+            "birth_date": self.birth_dates[index],
+        }
+
+
+def roster_format(key: str) -> str:
+    """Return ``arrow``, ``parquet`` or ``json`` for a roster key."""
+    extension = os.path.splitext(key)[1].lower()
+    if extension in ARROW_EXTENSIONS:
+        return "arrow"
+    if extension in PARQUET_EXTENSIONS:
+        return "parquet"
+    return "json"
+
+
+def _import_pyarrow() -> Optional[Any]:
+    """Import pyarrow, which is only needed for columnar rosters."""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        logger.error(
+            "pyarrow is required for Arrow and Parquet rosters; "
+            "install it or use a JSON roster"
+        )
+        return None
+    return pyarrow
+
+
+def _load_json_roster(key: str) -> Optional[Roster]:
+    """Load a JSON array roster."""
+    riders: Any = download_json_from_s3(key)
+    if riders is None:
+        return None
+    try:
+        roster = Roster(
+            names=[rider["name"] for rider in riders],
+            birth_dates=[rider["birth_date"] for rider in riders],
+            ids=[rider.get("id") for rider in riders],
+            timezones=[rider.get("timezone") or None for rider in riders],
+        )
+    except (KeyError, TypeError, AttributeError) as e:
+        logger.error(f"Invalid rider record in roster: {str(e)}")
+        return None
+    if all(rider_id in (None, "") for rider_id in roster.ids or []):
+        roster = roster._replace(ids=None)
+    if not any(roster.timezones or []):
+        roster = roster._replace(timezones=None)
+    return roster
+
+
+def _table_to_roster(table: Any) -> Roster:
+    """Copy the roster columns of an Arrow table into a ``Roster``."""
+    return Roster(
+        names=table.column("name").to_pylist(),
+        birth_dates=[
+            str(value) for value in table.column("birth_date").to_pylist()
+        ],
+        ids=(
+            table.column("id").to_pylist()
+            if "id" in table.column_names else None
+        ),
+        timezones=(
+            table.column("timezone").to_pylist()
+            if "timezone" in table.column_names else None
+        ),
+    )
+
+
+def _load_columnar_roster(key: str, fmt: str) -> Optional[Roster]:
+    """Load the roster columns from a memory-mapped Arrow/Parquet copy."""
+    pa = _import_pyarrow()
+    if pa is None:
+        return None
+    # pylint: disable=import-outside-toplevel
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    local_path = os.path.join(TEMP_DIR, os.path.basename(key))
+    if not download_file_from_s3(key, local_path):
+        return None
+    try:
+        if fmt == "parquet":
+            schema = pyarrow.parquet.read_schema(local_path)
+            columns = [c for c in ROSTER_COLUMNS if c in schema.names]
+            return _table_to_roster(pyarrow.parquet.read_table(
+                local_path, columns=columns, memory_map=True
+            ))
+        with pa.memory_map(local_path) as source:
+            # The IPC file footer indexes the record batches, so only the
+            # selected columns' buffers are touched
+            table = pyarrow.ipc.open_file(source).read_all()
+            columns = [c for c in ROSTER_COLUMNS if c in table.column_names]
+            return _table_to_roster(table.select(columns))
+    except (KeyError, OSError, pa.ArrowException) as e:
+        logger.error(f"Failed to read {fmt} roster {key}: {str(e)}")
+        return None
+    finally:
+        try:
+            os.remove(local_path)
+        except OSError:
+            pass
+
+
+def load_roster(key: str) -> Optional[Roster]:
+    """
+    Load the rider roster from S3 in whatever format it is stored.
+
+    Args:
+        key (str): The S3 key of the roster.
+
+    Returns:
+        Roster: The roster columns, or None if loading fails.
+    """
+    fmt = roster_format(key)
+    roster = (
+        _load_json_roster(key) if fmt == "json"
+        else _load_columnar_roster(key, fmt)
+    )
+    if roster is not None:
+        increment("RosterRiders", len(roster.names))
+    return roster
+
+
+def convert_roster(source_key: str, target_key: str) -> bool:
+    """
+    Convert a JSON roster to Arrow IPC or Parquet.
+
+    Only the columns the pipeline reads (``id`` and ``timezone`` if any
+    rider has one, ``name`` and ``birth_date``) are written, as strings.
+
+    Args:
+        source_key (str): The S3 key of the JSON roster.
+        target_key (str): The S3 key to write; its extension selects the
+            format.
+
+    Returns:
+        bool: True if the converted roster was uploaded.
+    """
+    fmt = roster_format(target_key)
+    if fmt == "json":
+        logger.error(f"Target {target_key} is not an Arrow or Parquet key")
+        return False
+    pa = _import_pyarrow()
+    if pa is None:
+        return False
+    # pylint: disable=import-outside-toplevel
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    roster = _load_json_roster(source_key)
+    if roster is None:
+        return False
+
+    columns = {
+        "name": pa.array(roster.names, pa.string()),
+        "birth_date": pa.array(roster.birth_dates, pa.string()),
+    }
+    if roster.ids is not None:
+        columns["id"] = pa.array(
+            [None if i in (None, "") else str(i) for i in roster.ids],
+            pa.string()
+        )
+    if roster.timezones is not None:
+        columns["timezone"] = pa.array(roster.timezones, pa.string())
+    table = pa.table(columns)
+
+    sink = pa.BufferOutputStream()
+    if fmt == "parquet":
+        pyarrow.parquet.write_table(table, sink)
+    else:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    data = sink.getvalue().to_pybytes()
+
+    logger.info(
+        f"Converted {len(roster.names)} riders from {source_key} "
+        f"({fmt}, {len(data)} bytes)"
+    )
+    content_type = (
+        "application/vnd.apache.parquet" if fmt == "parquet"
+        else "application/vnd.apache.arrow.file"
+    )
+    return put_s3_object(target_key, data, content_type)
@@ -3,26 +3,56 @@ Utility module for Amazon S3 operations.
 
 This module provides functions to interact with Amazon S3 for storing and
 retrieving data, including JSON objects and files. It handles common S3
-operations such as uploading, downloading, and checking for the existence
-of objects.
+operations such as uploading, downloading, deleting, and checking for the
+existence of objects, as well as conditional writes (``If-Match`` /
+``If-None-Match``) and byte-range reads used by worker leases. The client is
+a boto3 S3 client or, with ``STORAGE_BACKEND=local``, a directory-backed
+replacement (see ``storage_utils``). Every request is retried, paced and
+circuit-broken by ``S3_GUARD``, and reads are hedged (see
+``resilience_utils``).
+
+Keys are relative to the current tenant: each function maps them into the
+tenant's prefix (see ``tenant_utils``), and ``list_objects`` returns them
+relative to it again.
 """
 
+import functools
 import json
 import os
-from typing import Any, Dict, List, Optional, Union
-
-import boto3
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from ..config import ENABLE_FILE_LOGGING, S3_BUCKET_NAME
 from .logging_utils import add_file_handler, configure_logger
+from .metrics_utils import increment, span
+from .resilience_utils import S3_GUARD
+from .storage_utils import create_storage_client
+from .tenant_utils import strip_tenant_key, tenant_key
 
 # Configure logger
 logger = configure_logger('s3_utils')
 if ENABLE_FILE_LOGGING:
     add_file_handler(logger)
 
-# S3 client
-s3 = boto3.client("s3")
+# S3 client, or its local replacement with STORAGE_BACKEND=local
+s3 = create_storage_client()
+
+# Error codes S3 returns when a conditional write loses a race
+PRECONDITION_ERROR_CODES = {"PreconditionFailed", "ConditionalRequestConflict"}
+
+# Most keys S3 accepts in one DeleteObjects request
+DELETE_OBJECTS_BATCH_SIZE = 1000
+
+
+def _is_precondition_failure(error: Exception) -> bool:
+    """Return True if ``error`` is a failed If-Match/If-None-Match check."""
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in PRECONDITION_ERROR_CODES
+
+
+def _fetch_object(**kwargs: Any) -> Tuple[bytes, Optional[str]]:
+    """Get an object including its body, so a slow body can be hedged."""
+    response = s3.get_object(Bucket=S3_BUCKET_NAME, **kwargs)
+    return bytes(response['Body'].read()), response.get("ETag")
 
 
 def get_s3_object(key: str) -> Optional[bytes]:
@@ -35,9 +65,12 @@ def get_s3_object(key: str) -> Optional[bytes]:
     Returns:
         bytes: The content of the S3 object, or None if retrieval fails.
     """
+    key = tenant_key(key)
     try:
-        response = s3.get_object(Bucket=S3_BUCKET_NAME, Key=key)
-        return bytes(response['Body'].read())
+        with span("S3GetObject"):
+            data, _ = S3_GUARD.read(lambda: _fetch_object(Key=key))
+        increment("S3BytesRead", len(data), "Bytes")
+        return data
     except Exception as e:
         logger.error(f"Error getting object from S3: {str(e)}")
         return None
@@ -57,14 +90,17 @@ def put_s3_object(
     Returns:
         bool: True if the operation was successful, False otherwise.
     """
+    key = tenant_key(key)
     try:
-        s3.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=key,
-            Body=data,
-            ContentType=content_type
-        )
-        logger.info(f"Successfully uploaded object to S3: {key}")
+        with span("S3PutObject"):
+            S3_GUARD.call(lambda: s3.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=key,
+                Body=data,
+                ContentType=content_type
+            ))
+        increment("S3BytesWritten", len(data), "Bytes")
+        logger.debug("Successfully uploaded object to S3: %s", key)
         return True
     except Exception as e:
         logger.error(f"Error putting object to S3: {str(e)}")
@@ -126,12 +162,15 @@ def upload_file_to_s3(local_path: str, s3_key: str) -> bool:
     Returns:
         bool: True if the upload was successful, False otherwise.
     """
+    s3_key = tenant_key(s3_key)
     try:
-        s3.upload_file(
-            Filename=local_path,
-            Bucket=S3_BUCKET_NAME,
-            Key=s3_key
-        )
+        with span("S3UploadFile"):
+            S3_GUARD.call(lambda: s3.upload_file(
+                Filename=local_path,
+                Bucket=S3_BUCKET_NAME,
+                Key=s3_key
+            ))
+        increment("S3BytesWritten", os.path.getsize(local_path), "Bytes")
         logger.info(f"Successfully uploaded file to S3: {s3_key}")
         return True
     except Exception as e:
@@ -150,14 +189,17 @@ def download_file_from_s3(s3_key: str, local_path: str) -> bool:
     Returns:
         bool: True if the download was successful, False otherwise.
     """
+    s3_key = tenant_key(s3_key)
     try:
         # Ensure directory exists
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        s3.download_file(
-            Bucket=S3_BUCKET_NAME,
-            Key=s3_key,
-            Filename=local_path
-        )
+        with span("S3DownloadFile"):
+            S3_GUARD.call(lambda: s3.download_file(
+                Bucket=S3_BUCKET_NAME,
+                Key=s3_key,
+                Filename=local_path
+            ))
+        increment("S3BytesRead", os.path.getsize(local_path), "Bytes")
         logger.info(
             f"Successfully downloaded file from S3: {s3_key} to {local_path}"
         )
@@ -177,14 +219,26 @@ def list_objects(prefix: str = "") -> List[str]:
     Returns:
         list: A list of object keys matching the prefix.
     """
+    prefix = tenant_key(prefix)
+    keys: List[str] = []
+    pagination: Dict[str, str] = {}
     try:
-        response = s3.list_objects_v2(
-            Bucket=S3_BUCKET_NAME,
-            Prefix=prefix
-        )
-        if 'Contents' in response:
-            return [obj['Key'] for obj in response['Contents']]
-        return []
+        while True:
+            with span("S3ListObjects"):
+                response = S3_GUARD.call(lambda: s3.list_objects_v2(
+                    Bucket=S3_BUCKET_NAME,
+                    Prefix=prefix,
+                    **pagination
+                ))
+            keys.extend(
+                strip_tenant_key(obj['Key'])
+                for obj in response.get('Contents', [])
+            )
+            if not response.get('IsTruncated'):
+                return keys
+            pagination = {
+                "ContinuationToken": response['NextContinuationToken']
+            }
     except Exception as e:
         logger.error(f"Error listing objects in S3: {str(e)}")
         return []
@@ -200,8 +254,214 @@ def object_exists(key: str) -> bool:
     Returns:
         bool: True if the object exists, False otherwise.
     """
+    key = tenant_key(key)
     try:
-        s3.head_object(Bucket=S3_BUCKET_NAME, Key=key)
+        with span("S3HeadObject"):
+            S3_GUARD.call(
+                lambda: s3.head_object(Bucket=S3_BUCKET_NAME, Key=key)
+            )
         return True
     except Exception:
         return False
+
+
+def delete_object(key: str) -> bool:
+    """
+    Delete an object from the S3 bucket.
+
+    Args:
+        key (str): The S3 key of the object to delete.
+
+    Returns:
+        bool: True if the deletion was successful, False otherwise.
+    """
+    key = tenant_key(key)
+    try:
+        with span("S3DeleteObject"):
+            S3_GUARD.call(
+                lambda: s3.delete_object(Bucket=S3_BUCKET_NAME, Key=key)
+            )
+        logger.debug("Successfully deleted object from S3: %s", key)
+        return True
+    except Exception as e:
+        logger.error(f"Error deleting object from S3: {str(e)}")
+        return False
+
+
+def delete_objects(keys: List[str]) -> List[str]:
+    """
+    Delete objects from the S3 bucket with batched DeleteObjects requests.
+
+    Keys are sent in chunks of ``DELETE_OBJECTS_BATCH_SIZE``, the most one
+    request accepts, in quiet mode so S3 only reports the failures.
+
+    Args:
+        keys (list): The S3 keys of the objects to delete.
+
+    Returns:
+        list: The keys that could not be deleted.
+    """
+    failed: List[str] = []
+    for start in range(0, len(keys), DELETE_OBJECTS_BATCH_SIZE):
+        chunk = keys[start:start + DELETE_OBJECTS_BATCH_SIZE]
+        delete = {
+            "Objects": [{"Key": tenant_key(key)} for key in chunk],
+            "Quiet": True,
+        }
+        try:
+            with span("S3DeleteObjects"):
+                response = S3_GUARD.call(functools.partial(
+                    s3.delete_objects, Bucket=S3_BUCKET_NAME, Delete=delete
+                ))
+        except Exception as e:
+            logger.error(f"Error deleting objects from S3: {str(e)}")
+            failed.extend(chunk)
+            continue
+        errors = response.get("Errors", [])
+        for error in errors:
+            logger.warning(
+                f"Error deleting {error.get('Key')} from S3: "
+                f"{error.get('Code')} {error.get('Message', '')}"
+            )
+            failed.append(strip_tenant_key(error.get("Key", "")))
+        increment("S3ObjectsDeleted", len(chunk) - len(errors))
+    return failed
+
+
+def _is_not_modified(error: Exception) -> bool:
+    """Return True if ``error`` is a 304 answer to an If-None-Match GET."""
+    response = getattr(error, "response", None) or {}
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    code = response.get("Error", {}).get("Code")
+    return status == 304 or code in ("304", "NotModified")
+
+
+def get_s3_object_with_etag(
+    key: str, if_none_match: Optional[str] = None
+) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Get an object and its ETag from the S3 bucket.
+
+    With ``if_none_match``, S3 only sends the object if its ETag differs,
+    so revalidating an unchanged object costs a 304 instead of a download.
+
+    Args:
+        key (str): The S3 key of the object to retrieve.
+        if_none_match (str, optional): The ETag of a cached copy.
+
+    Returns:
+        tuple: (data, etag); (None, if_none_match) if the cached copy is
+               still current; (None, None) if retrieval fails.
+    """
+    key = tenant_key(key)
+    conditions = {"IfNoneMatch": if_none_match} if if_none_match else {}
+    try:
+        with span("S3GetObject"):
+            data, etag = S3_GUARD.read(
+                lambda: _fetch_object(Key=key, **conditions)
+            )
+        increment("S3BytesRead", len(data), "Bytes")
+        return data, etag
+    except Exception as e:
+        if if_none_match and _is_not_modified(e):
+            return None, if_none_match
+        logger.debug("Could not get object %s from S3: %s", key, e)
+        return None, None
+
+
+def put_s3_object_conditional(
+    key: str,
+    data: Union[str, bytes],
+    if_match: Optional[str] = None,
+    create_only: bool = False,
+    content_type: str = "application/json"
+) -> Optional[str]:
+    """
+    Put an object only if it is unchanged, or only if it does not exist.
+
+    Without conditions this is a plain put that returns the new ETag.
+
+    Args:
+        key (str): The S3 key to store the object under.
+        data (Union[str, bytes]): The data to store in S3.
+        if_match (str, optional): Write only if the current ETag matches.
+        create_only (bool): Write only if no object exists under ``key``.
+        content_type (str): The content type of the data.
+
+    Returns:
+        str: The ETag of the written object, or None if the condition
+             failed or the write failed.
+    """
+    key = tenant_key(key)
+    conditions: Dict[str, str] = {}
+    if if_match:
+        conditions["IfMatch"] = if_match
+    if create_only:
+        conditions["IfNoneMatch"] = "*"
+    try:
+        with span("S3PutObject"):
+            # A conditional write is only repeated if it was throttled, as
+            # a retry after an applied write would fail its own condition
+            response = S3_GUARD.call(lambda: s3.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=key,
+                Body=data,
+                ContentType=content_type,
+                **conditions
+            ), idempotent=not conditions)
+        increment("S3BytesWritten", len(data), "Bytes")
+        etag: Optional[str] = response.get("ETag")
+        return etag
+    except Exception as e:
+        if _is_precondition_failure(e):
+            increment("S3PreconditionFailed")
+            logger.debug("Conditional write to %s lost a race", key)
+        else:
+            logger.error(f"Error putting object to S3: {str(e)}")
+        return None
+
+
+def get_s3_object_range(key: str, start: int, end: int) -> Optional[bytes]:
+    """
+    Get a byte range of an object from the S3 bucket.
+
+    Args:
+        key (str): The S3 key of the object.
+        start (int): The first byte to read.
+        end (int): The last byte to read (inclusive, as in HTTP ranges).
+
+    Returns:
+        bytes: The requested bytes, or None if retrieval fails.
+    """
+    key = tenant_key(key)
+    try:
+        with span("S3GetObjectRange"):
+            data, _ = S3_GUARD.read(
+                lambda: _fetch_object(Key=key, Range=f"bytes={start}-{end}")
+            )
+        increment("S3BytesRead", len(data), "Bytes")
+        return data
+    except Exception as e:
+        logger.error(f"Error getting object range from S3: {str(e)}")
+        return None
+
+
+def get_object_size(key: str) -> Optional[int]:
+    """
+    Get the size of an object in the S3 bucket.
+
+    Args:
+        key (str): The S3 key of the object.
+
+    Returns:
+        int: The object size in bytes, or None if it does not exist.
+    """
+    key = tenant_key(key)
+    try:
+        with span("S3HeadObject"):
+            response = S3_GUARD.call(
+                lambda: s3.head_object(Bucket=S3_BUCKET_NAME, Key=key)
+            )
+        return int(response["ContentLength"])
+    except Exception:
+        return None
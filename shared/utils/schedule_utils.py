@@ -0,0 +1,204 @@
+"""
+Utility module for horoscope delivery deadlines.
+
+A rider should have their horoscope by ``DELIVERY_HOUR`` local time on the
+target date. Riders in Asia/Pacific therefore need theirs many hours before
+riders in the Americas. This module provides functions to:
+- Compute the UTC delivery deadline of a timezone on a target date
+- Partition riders into deadline windows, earliest first, so every window
+  can be prepared as its own batch
+- Order batches by deadline, so the upload and download stages handle the
+  most urgent batches first
+- Hold back batches whose planned submission time has not come yet, and
+  find when the next of them becomes due
+"""
+
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+from typing import (
+    Any,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+if sys.version_info >= (3, 9):
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+else:
+    from backports.zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from ..config import DEADLINE_WINDOW_HOURS, DEFAULT_TIMEZONE, DELIVERY_HOUR
+from .logging_utils import configure_logger
+
+# Configure logger
+logger = configure_logger('schedule_utils')
+
+# A batch entry: a control-file record or a plain dictionary
+B = TypeVar("B", bound=Mapping[str, Any])
+
+# Deadline of batches without a target date: after every other batch
+NO_DEADLINE = datetime.max.replace(tzinfo=timezone.utc)
+
+_unknown_timezones: Set[str] = set()
+
+
+def _zone(name: Optional[str]) -> Any:
+    """Return the tzinfo of a timezone name, falling back to the default."""
+    for candidate in (name, DEFAULT_TIMEZONE):
+        if not candidate:
+            continue
+        if candidate.upper() == "UTC":
+            return timezone.utc
+        try:
+            return ZoneInfo(candidate)
+        except (ZoneInfoNotFoundError, ValueError):
+            if candidate not in _unknown_timezones:
+                _unknown_timezones.add(candidate)
+                logger.warning(
+                    f"Unknown timezone {candidate!r}, using "
+                    f"{DEFAULT_TIMEZONE} instead"
+                )
+    return timezone.utc
+
+
+def delivery_deadline(target_date: str, tz_name: Optional[str]) -> datetime:
+    """
+    Return when horoscopes for a timezone are due.
+
+    Args:
+        target_date (str): The target date in ISO ``YYYY-MM-DD`` format.
+        tz_name (str, optional): An IANA timezone name such as
+            ``Asia/Tokyo``; missing or unknown names use
+            ``DEFAULT_TIMEZONE``.
+
+    Returns:
+        datetime: ``DELIVERY_HOUR`` local time on ``target_date``, in UTC.
+    """
+    local = datetime.combine(
+        date.fromisoformat(target_date), time(DELIVERY_HOUR),
+        tzinfo=_zone(tz_name)
+    )
+    return local.astimezone(timezone.utc)
+
+
+def partition_by_deadline(
+    timezones: Sequence[Optional[str]],
+    target_date: str,
+    window_hours: int = DEADLINE_WINDOW_HOURS
+) -> List[Tuple[datetime, List[int]]]:
+    """
+    Group riders whose deadlines fall within the same window.
+
+    Windows start at the earliest remaining deadline and span
+    ``window_hours`` hours (0 gives every distinct deadline its own
+    window), so there are at most about ``24 / window_hours`` partitions a
+    day however many timezones the roster has.
+
+    Args:
+        timezones (Sequence): The timezone name of every rider, in roster
+            order.
+        target_date (str): The target date in ISO ``YYYY-MM-DD`` format.
+        window_hours (int): The width of a deadline window.
+
+    Returns:
+        list: (deadline, rider indices) per partition, earliest first. The
+              deadline is the earliest deadline of the partition.
+    """
+    deadlines: Dict[Optional[str], datetime] = {}
+    for name in timezones:
+        if name not in deadlines:
+            deadlines[name] = delivery_deadline(target_date, name)
+
+    order = sorted(
+        range(len(timezones)), key=lambda index: deadlines[timezones[index]]
+    )
+    window = timedelta(hours=max(window_hours, 0))
+    partitions: List[Tuple[datetime, List[int]]] = []
+    for index in order:
+        deadline = deadlines[timezones[index]]
+        if partitions and (
+            deadline - partitions[-1][0] < window
+            or deadline == partitions[-1][0]
+        ):
+            partitions[-1][1].append(index)
+        else:
+            partitions.append((deadline, [index]))
+    return partitions
+
+
+def batch_deadline(batch: Mapping[str, Any]) -> datetime:
+    """
+    Return the delivery deadline of a batch from the control file.
+
+    Batches prepared before deadlines were recorded fall back to the
+    deadline of ``DEFAULT_TIMEZONE`` on their target date.
+    """
+    try:
+        if batch.get("deadline"):
+            deadline = datetime.fromisoformat(batch["deadline"])
+            if deadline.tzinfo is None:
+                deadline = deadline.replace(tzinfo=timezone.utc)
+            return deadline
+        if batch.get("target_date"):
+            return delivery_deadline(batch["target_date"], None)
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid deadline in batch {batch.get('batch_id')}")
+    return NO_DEADLINE
+
+
+def sort_by_deadline(batches: List[B]) -> List[B]:
+    """Return batches ordered by deadline, keeping the order of ties."""
+    return sorted(batches, key=batch_deadline)
+
+
+def submission_due(
+    batch: Mapping[str, Any], now: Optional[datetime] = None
+) -> bool:
+    """
+    Return whether a batch may be submitted.
+
+    Batches are due unless their ``submit_after`` time, planned by the
+    prepare stage, is still in the future.
+    """
+    submit_after = _submit_after(batch)
+    return submit_after is None or \
+        submit_after <= (now or datetime.now(timezone.utc))
+
+
+def next_submission_time(
+    batches: Sequence[Mapping[str, Any]], now: Optional[datetime] = None
+) -> Optional[datetime]:
+    """
+    Return when the first of the batches that are not due yet becomes due.
+
+    Returns:
+        datetime: The earliest future ``submit_after`` time (UTC), or None
+                  if every batch is due.
+    """
+    now = now or datetime.now(timezone.utc)
+    pending = [
+        submit_after for submit_after in map(_submit_after, batches)
+        if submit_after is not None and submit_after > now
+    ]
+    return min(pending, default=None)
+
+
+def _submit_after(batch: Mapping[str, Any]) -> Optional[datetime]:
+    """Return the planned submission time of a batch, if it has one."""
+    if not batch.get("submit_after"):
+        return None
+    try:
+        submit_after = datetime.fromisoformat(batch["submit_after"])
+    except (TypeError, ValueError):
+        logger.warning(
+            f"Invalid submit_after in batch {batch.get('batch_id')}"
+        )
+        return None
+    if submit_after.tzinfo is None:
+        submit_after = submit_after.replace(tzinfo=timezone.utc)
+    return submit_after
@@ -0,0 +1,293 @@
+"""
+Utility module for processing every tenant in one stage run.
+
+One deployment serves all tenants listed in the tenant registry
+(``TENANTS_KEY``). This module provides functions to:
+- Load the tenant registry from S3
+- Select the tenant of a single-tenant command line tool
+- Run a stage function once per tenant, with that tenant current, so a
+  failing tenant does not stop the others
+- Run the asyncio variant of a stage for all tenants concurrently
+- Share a fixed number of in-flight requests between tenants in proportion
+  to their weights (weighted fair queuing), so a tenant with a large
+  backlog cannot starve the others
+- Run blocking calls in a worker thread with the current tenant
+"""
+
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import sys
+import time
+import weakref
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from ..config import TENANTS_KEY
+from .logging_utils import configure_logger
+from .metrics_utils import increment, record_timing
+from .s3_utils import download_json_from_s3
+from .tenant_utils import (
+    DEFAULT_TENANT,
+    Tenant,
+    current_tenant,
+    parse_tenants,
+    tenant_context,
+)
+
+# Configure logger
+logger = configure_logger('scheduler_utils')
+
+T = TypeVar("T")
+
+
+def load_tenants() -> Optional[List[Tenant]]:
+    """
+    Return the tenants to process.
+
+    Without ``TENANTS_KEY`` this is the default tenant alone. The registry
+    is read outside any tenant prefix.
+
+    Returns:
+        list: The tenants, or None if the registry could not be read.
+    """
+    if not TENANTS_KEY:
+        return [DEFAULT_TENANT]
+    with tenant_context(DEFAULT_TENANT):
+        registry = download_json_from_s3(TENANTS_KEY)
+    if registry is None or not isinstance(registry.get("tenants"), list):
+        logger.error(f"Failed to load tenant registry {TENANTS_KEY}")
+        return None
+    tenants = parse_tenants(registry["tenants"])
+    logger.info(f"Loaded {len(tenants)} tenants from {TENANTS_KEY}")
+    return tenants
+
+
+def find_tenant(tenant_id: Optional[str]) -> Optional[Tenant]:
+    """Return a tenant by ID, or the only tenant if no ID is given."""
+    tenants = load_tenants()
+    if tenants is None:
+        return None
+    if tenant_id is None:
+        if len(tenants) == 1:
+            return tenants[0]
+        logger.error("Several tenants are configured; pass a tenant ID")
+        return None
+    for tenant in tenants:
+        if tenant.tenant_id == tenant_id:
+            return tenant
+    logger.error(f"Unknown tenant {tenant_id}")
+    return None
+
+
+def add_tenant_argument(
+    parser: argparse.ArgumentParser,
+    help_text: str = "Tenant ID (required when several tenants are configured)"
+) -> None:
+    """Add the ``--tenant`` option of a single-tenant command line tool."""
+    parser.add_argument("--tenant", help=help_text)
+
+
+@contextlib.contextmanager
+def cli_tenant_context(tenant_id: Optional[str]) -> Iterator[Tenant]:
+    """
+    Make the tenant chosen with ``--tenant`` current for the enclosed block.
+
+    Exits the process with status 1 if the tenant cannot be found, so
+    command line tools need no error handling of their own.
+    """
+    tenant = find_tenant(tenant_id)
+    if tenant is None:
+        sys.exit(1)
+    with tenant_context(tenant):
+        yield tenant
+
+
+def _log_tenant_failure(tenant: Tenant, error: BaseException) -> None:
+    """Log and count an exception that aborted a tenant's run."""
+    increment("TenantRunsFailed")
+    logger.error(
+        f"Unexpected error processing tenant {tenant.tenant_id}: "
+        f"{str(error)}"
+    )
+
+
+def run_for_tenants(
+    func: Callable[[], T], tenants: Optional[List[Tenant]] = None
+) -> Optional[Dict[str, Optional[T]]]:
+    """
+    Run ``func`` once per tenant, one tenant after another.
+
+    Args:
+        func (Callable): The stage function; it runs with the tenant
+            current, so every S3 key it uses is within the tenant's prefix.
+        tenants (list, optional): The tenants; defaults to the registry.
+
+    Returns:
+        dict: The result of every tenant (None if ``func`` raised), keyed by
+              tenant ID, or None if the registry could not be read.
+    """
+    if tenants is None:
+        tenants = load_tenants()
+        if tenants is None:
+            return None
+    results: Dict[str, Optional[T]] = {}
+    for tenant in tenants:
+        started = time.perf_counter()
+        with tenant_context(tenant):
+            if len(tenants) > 1:
+                logger.info(f"Processing tenant {tenant.tenant_id}")
+            try:
+                results[tenant.tenant_id] = func()
+            except Exception as e:
+                _log_tenant_failure(tenant, e)
+                results[tenant.tenant_id] = None
+        record_timing("TenantRun", (time.perf_counter() - started) * 1000)
+    return results
+
+
+async def run_for_tenants_async(
+    func: Callable[[], Awaitable[T]], tenants: Optional[List[Tenant]] = None
+) -> Optional[Dict[str, Optional[T]]]:
+    """
+    Asyncio variant of ``run_for_tenants``.
+
+    All tenants run concurrently, each in its own task with the tenant
+    current; the limiters from ``loop_limiter`` share the S3 and OpenAI
+    request slots between them by weight.
+    """
+    if tenants is None:
+        tenants = await run_in_thread(load_tenants)
+        if tenants is None:
+            return None
+
+    async def run(tenant: Tenant) -> Optional[T]:
+        """Run ``func`` for one tenant."""
+        with tenant_context(tenant):
+            try:
+                return await func()
+            except Exception as e:
+                _log_tenant_failure(tenant, e)
+                return None
+
+    results = await asyncio.gather(*(run(tenant) for tenant in tenants))
+    return {
+        tenant.tenant_id: result for tenant, result in zip(tenants, results)
+    }
+
+
+class FairLimiter:
+    """
+    Asyncio semaphore that shares its slots between tenants by weight.
+
+    Waiting acquisitions are granted in order of a per-tenant virtual finish
+    tag that advances by ``1 / weight`` per request, so while several
+    tenants are waiting each gets slots in proportion to its weight, and a
+    tenant that arrives late is not queued behind another tenant's backlog.
+    With a single tenant this is a plain FIFO semaphore.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(capacity, 1)
+        self.in_use = 0
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[str, float] = {}
+        self._waiters: List[Tuple[float, int, "asyncio.Future[None]"]] = []
+        self._sequence = itertools.count()
+
+    def _tag(self, tenant: Tenant) -> float:
+        """Charge one request to ``tenant`` and return its finish tag."""
+        tag = max(
+            self._virtual_time, self._finish_tags.get(tenant.tenant_id, 0.0)
+        ) + 1.0 / tenant.weight
+        self._finish_tags[tenant.tenant_id] = tag
+        return tag
+
+    async def acquire(self) -> None:
+        """Wait for a slot for the current tenant."""
+        tag = self._tag(current_tenant())
+        if self.in_use < self.capacity and not self._waiters:
+            self.in_use += 1
+            self._virtual_time = tag
+            return
+        future: "asyncio.Future[None]" = (
+            asyncio.get_running_loop().create_future()
+        )
+        heapq.heappush(self._waiters, (tag, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation
+                self.release()
+            else:
+                self._waiters = [
+                    waiter for waiter in self._waiters
+                    if waiter[2] is not future
+                ]
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self) -> None:
+        """Hand the slot to the waiter with the lowest tag, or free it."""
+        while self._waiters:
+            tag, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._virtual_time = tag
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.release()
+
+
+_loop_limiters: "weakref.WeakKeyDictionary[Any, Dict[str, FairLimiter]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def loop_limiter(name: str, capacity: int) -> FairLimiter:
+    """
+    Return the limiter called ``name`` of the running event loop.
+
+    Every tenant running on the loop shares it, so ``capacity`` bounds the
+    requests of all tenants together.
+    """
+    limiters = _loop_limiters.setdefault(asyncio.get_running_loop(), {})
+    limiter = limiters.get(name)
+    if limiter is None:
+        limiter = FairLimiter(capacity)
+        limiters[name] = limiter
+    return limiter
+
+
+async def run_in_thread(
+    func: Callable[..., T], *args: Any, **kwargs: Any
+) -> T:
+    """
+    Run a blocking call in the event loop's default thread pool.
+
+    Like ``asyncio.to_thread``, which needs Python 3.9, the call runs in a
+    copy of the caller's context, so it sees the current tenant.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(context.run, func, *args, **kwargs)
+    )
@@ -0,0 +1,292 @@
+"""
+Utility module for selecting the object storage backend.
+
+All object storage goes through the client in ``s3_utils``. That client is
+created here, according to ``STORAGE_BACKEND``:
+- ``s3``: a boto3 S3 client for ``S3_BUCKET_NAME``
+- ``local``: a ``LocalStorageClient`` that keeps each object as a file under
+  ``LOCAL_STORAGE_DIR/<bucket>/<key>``, for offline runs, profiling on
+  fast disk and tests
+
+``LocalStorageClient`` implements the part of the boto3 S3 client API the
+pipeline uses: ranged and conditional reads with streaming bodies,
+conditional writes, managed file uploads and downloads, listing, head and
+delete. ETags are MD5 hashes, like those of S3 single-part uploads.
+Conditional writes are atomic across threads and, where ``fcntl`` is
+available, across processes sharing the directory.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from ..config import LOCAL_STORAGE_DIR, S3_MAX_CONCURRENCY, STORAGE_BACKEND
+from .logging_utils import configure_logger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+# Configure logger
+logger = configure_logger('storage_utils')
+
+LOCK_FILE = ".storage.lock"
+TEMP_SUFFIX = ".tmp"
+
+
+def _client_error(code: str, status: int, operation: str) -> ClientError:
+    """Build the error boto3 raises for an S3 error response."""
+    return ClientError(
+        {"Error": {"Code": code, "Message": code},
+         "ResponseMetadata": {"HTTPStatusCode": status}},
+        operation
+    )
+
+
+def _etag(data: bytes) -> str:
+    """Return the quoted MD5 ETag of an object body."""
+    return f'"{hashlib.md5(data, usedforsecurity=False).hexdigest()}"'
+
+
+class _Body(io.BytesIO):
+    """An object body with the ``StreamingBody.iter_chunks`` method."""
+
+    def iter_chunks(self, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Yield the body in chunks of ``chunk_size`` bytes."""
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class LocalStorageClient:
+    """An S3 client replacement backed by a local directory."""
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR) -> None:
+        """
+        Use ``root`` as the storage directory; it is created if missing.
+
+        Args:
+            root (str): The directory holding one subdirectory per bucket.
+        """
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, bucket: str, key: str) -> str:
+        """Return the file of an object, refusing keys outside the bucket."""
+        bucket_dir = os.path.join(self.root, bucket)
+        path = os.path.normpath(os.path.join(bucket_dir, *key.split("/")))
+        if not key or not path.startswith(bucket_dir + os.sep):
+            raise _client_error("InvalidObjectName", 400, "Storage")
+        return path
+
+    def _read(self, bucket: str, key: str, operation: str) -> bytes:
+        """Return an object body, raising NoSuchKey if it is missing."""
+        try:
+            with open(self._path(bucket, key), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise _client_error("NoSuchKey", 404, operation) from None
+
+    @staticmethod
+    def _temp_path(path: str) -> str:
+        """Return a hidden temporary file next to ``path``."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return os.path.join(
+            os.path.dirname(path),
+            f".{os.path.basename(path)}.{uuid.uuid4().hex}{TEMP_SUFFIX}"
+        )
+
+    def _write(self, path: str, data: bytes) -> None:
+        """Write a file atomically, so readers never see a partial body."""
+        tmp_path = self._temp_path(path)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """Hold the thread lock and, if possible, a lock on the directory."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, LOCK_FILE), "ab") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def get_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Range: Optional[str] = None,
+        IfNoneMatch: Optional[str] = None,
+        **_: Any
+    ) -> Dict[str, Any]:
+        """Return an object body (or a byte range of it) as a stream."""
+        data = self._read(Bucket, Key, "GetObject")
+        etag = _etag(data)
+        if IfNoneMatch is not None and IfNoneMatch == etag:
+            raise _client_error("304", 304, "GetObject")
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            data = data[int(start):int(end) + 1]
+        return {
+            "Body": _Body(data),
+            "ETag": etag,
+            "ContentLength": len(data),
+        }
+
+    def put_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Body: Any,
+        IfMatch: Optional[str] = None,
+        IfNoneMatch: Optional[str] = None,
+        **_: Any
+    ) -> Dict[str, Any]:
+        """Store an object, honouring If-Match and If-None-Match."""
+        data = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        path = self._path(Bucket, Key)
+        with self._write_lock():
+            exists = os.path.isfile(path)
+            if IfNoneMatch == "*" and exists:
+                raise _client_error("PreconditionFailed", 412, "PutObject")
+            if IfMatch is not None and (
+                not exists or _etag(self._read(Bucket, Key, "PutObject"))
+                != IfMatch
+            ):
+                raise _client_error("PreconditionFailed", 412, "PutObject")
+            self._write(path, data)
+        return {"ETag": _etag(data)}
+
+    def upload_file(
+        self, Filename: str, Bucket: str, Key: str, **_: Any
+    ) -> None:
+        """Copy a local file into storage."""
+        path = self._path(Bucket, Key)
+        tmp_path = self._temp_path(path)
+        shutil.copyfile(Filename, tmp_path)
+        os.replace(tmp_path, path)
+
+    def download_file(
+        self, Bucket: str, Key: str, Filename: str, **_: Any
+    ) -> None:
+        """Copy an object to a local file."""
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _client_error("404", 404, "HeadObject")
+        shutil.copyfile(path, Filename)
+
+    def list_objects_v2(
+        self,
+        Bucket: str,
+        Prefix: str = "",
+        MaxKeys: int = 1000,
+        ContinuationToken: Optional[str] = None,
+        **_: Any
+    ) -> Dict[str, Any]:
+        """List keys with the given prefix in pages of ``MaxKeys``."""
+        bucket_dir = os.path.join(self.root, Bucket)
+        keys: List[str] = []
+        for directory, _dirs, files in os.walk(bucket_dir):
+            for name in files:
+                if name.startswith(".") and name.endswith(TEMP_SUFFIX):
+                    continue
+                key = os.path.relpath(
+                    os.path.join(directory, name), bucket_dir
+                ).replace(os.sep, "/")
+                if key.startswith(Prefix) and (
+                    ContinuationToken is None or key > ContinuationToken
+                ):
+                    keys.append(key)
+        keys.sort()
+
+        page = keys[:MaxKeys]
+        response: Dict[str, Any] = {
+            "KeyCount": len(page),
+            "IsTruncated": len(keys) > MaxKeys,
+        }
+        if page:
+            response["Contents"] = [
+                {
+                    "Key": key,
+                    "Size": os.path.getsize(self._path(Bucket, key)),
+                }
+                for key in page
+            ]
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def head_object(self, Bucket: str, Key: str, **_: Any) -> Dict[str, Any]:
+        """Return object metadata, raising if it does not exist."""
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _client_error("404", 404, "HeadObject")
+        return {
+            "ContentLength": os.path.getsize(path),
+            "ETag": _etag(self._read(Bucket, Key, "HeadObject")),
+        }
+
+    def delete_object(self, Bucket: str, Key: str, **_: Any) -> Dict[str, Any]:
+        """Delete an object; deleting a missing key is not an error."""
+        try:
+            os.remove(self._path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+    def delete_objects(
+        self, Bucket: str, Delete: Dict[str, Any], **_: Any
+    ) -> Dict[str, Any]:
+        """Delete several objects; missing keys are not an error."""
+        for obj in Delete["Objects"]:
+            self.delete_object(Bucket, obj["Key"])
+        return {}
+
+
+def create_storage_client(backend: str = STORAGE_BACKEND) -> Any:
+    """
+    Create the object storage client for a backend.
+
+    Args:
+        backend (str): ``s3`` or ``local``.
+
+    Returns:
+        object: A boto3 S3 client or a ``LocalStorageClient``.
+
+    Raises:
+        ValueError: If ``backend`` is not a known storage backend.
+    """
+    if backend == "local":
+        logger.info(f"Using local object storage in {LOCAL_STORAGE_DIR}")
+        return LocalStorageClient(LOCAL_STORAGE_DIR)
+    if backend == "s3":
+        # The connection pool is sized for the async layer in
+        # async_s3_utils, which shares the client across worker threads.
+        # Retries are made by resilience_utils, not by botocore.
+        return boto3.client(
+            "s3",
+            config=Config(
+                max_pool_connections=S3_MAX_CONCURRENCY,
+                retries={"total_max_attempts": 1, "mode": "standard"}
+            )
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,130 @@
+"""
+Utility module for tenants.
+
+A tenant is a club served by the same deployment: it has its own roster,
+its own S3 prefix (control file, batches, horoscopes, checkpoints and
+leases all live under it), its own model and a weight for its share of the
+S3 and OpenAI concurrency. This module provides functions to:
+- Parse tenant definitions from the tenant registry
+- Make a tenant current for a block of code, per thread or asyncio task
+- Map S3 keys into the current tenant's prefix
+
+Without a registry there is a single default tenant with an empty prefix,
+so every key is exactly as configured.
+"""
+
+import contextlib
+import contextvars
+import re
+from typing import Any, Dict, Iterator, List, NamedTuple
+
+from ..config import OPENAI_MODEL, RIDERS_FILE, TENANTS_PREFIX
+from .logging_utils import configure_logger
+
+# Configure logger
+logger = configure_logger('tenant_utils')
+
+# Tenant IDs end up in S3 keys and log lines
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+class Tenant(NamedTuple):
+    """One club: its S3 prefix, roster, model and scheduling weight."""
+
+    tenant_id: str
+    prefix: str
+    riders_file: str
+    model: str
+    weight: float
+    # The tenant's fraction of the total weight of all tenants
+    share: float = 1.0
+
+
+DEFAULT_TENANT = Tenant("default", "", RIDERS_FILE, OPENAI_MODEL, 1.0)
+
+_current_tenant: "contextvars.ContextVar[Tenant]" = contextvars.ContextVar(
+    "current_tenant", default=DEFAULT_TENANT
+)
+
+
+def current_tenant() -> Tenant:
+    """Return the tenant of the running thread or asyncio task."""
+    return _current_tenant.get()
+
+
+@contextlib.contextmanager
+def tenant_context(tenant: Tenant) -> Iterator[Tenant]:
+    """
+    Make ``tenant`` current for the enclosed block.
+
+    The tenant is stored in a context variable, so asyncio tasks and
+    ``run_in_thread`` calls started inside the block inherit it while
+    other tasks keep their own.
+    """
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+
+def tenant_key(key: str) -> str:
+    """Return the S3 key of ``key`` within the current tenant's prefix."""
+    prefix = current_tenant().prefix
+    return f"{prefix}/{key}" if prefix else key
+
+
+def strip_tenant_key(key: str) -> str:
+    """Return ``key`` relative to the current tenant's prefix."""
+    prefix = current_tenant().prefix
+    if prefix and key.startswith(prefix + "/"):
+        return key[len(prefix) + 1:]
+    return key
+
+
+def parse_tenants(entries: List[Dict[str, Any]]) -> List[Tenant]:
+    """
+    Build tenants from registry entries.
+
+    Each entry needs an ``id``; ``prefix`` defaults to
+    ``TENANTS_PREFIX/<id>``, ``riders_file`` to ``RIDERS_FILE`` (within the
+    prefix), ``model`` to ``OPENAI_MODEL`` and ``weight`` to 1. Invalid and
+    duplicate entries are skipped.
+
+    Args:
+        entries (list): The ``tenants`` list of the registry.
+
+    Returns:
+        list: The valid tenants, in registry order, with their ``share``.
+    """
+    tenants: List[Tenant] = []
+    seen = set()
+    for entry in entries:
+        tenant_id = str(entry.get("id") or "") if isinstance(
+            entry, dict
+        ) else ""
+        if not TENANT_ID_PATTERN.match(tenant_id) or tenant_id in seen:
+            logger.warning(f"Skipping invalid tenant entry: {entry!r}")
+            continue
+        try:
+            weight = float(entry.get("weight", 1.0))
+        except (TypeError, ValueError):
+            weight = 0.0
+        if weight <= 0:
+            logger.warning(f"Skipping tenant {tenant_id}: invalid weight")
+            continue
+        seen.add(tenant_id)
+        tenants.append(Tenant(
+            tenant_id=tenant_id,
+            prefix=str(
+                entry.get("prefix") or f"{TENANTS_PREFIX}/{tenant_id}"
+            ).strip("/"),
+            riders_file=str(entry.get("riders_file") or RIDERS_FILE),
+            model=str(entry.get("model") or OPENAI_MODEL),
+            weight=weight,
+        ))
+    total_weight = sum(tenant.weight for tenant in tenants)
+    return [
+        tenant._replace(share=tenant.weight / total_weight)
+        for tenant in tenants
+    ]
@@ -121,6 +121,43 @@ resource "aws_cloudwatch_dashboard" "batch_dashboard" {
           region = var.aws_region
           title  = "Task Counts"
         }
+      },
+      {
+        type   = "metric"
+        x      = 0
+        y      = 12
+        width  = 12
+        height = 6
+        properties = {
+          metrics = [
+            ["Veloscope", "StageRunTime", "Stage", "prepare", "Environment", var.environment],
+            ["Veloscope", "StageRunTime", "Stage", "upload", "Environment", var.environment],
+            ["Veloscope", "StageRunTime", "Stage", "download", "Environment", var.environment]
+          ]
+          period = 86400
+          stat   = "Maximum"
+          region = var.aws_region
+          title  = "Stage Duration (ms)"
+        }
+      },
+      {
+        type   = "metric"
+        x      = 12
+        y      = 12
+        width  = 12
+        height = 6
+        properties = {
+          metrics = [
+            ["Veloscope", "S3GetObjectP95Time", "Stage", "download", "Environment", var.environment],
+            ["Veloscope", "S3PutObjectP95Time", "Stage", "download", "Environment", var.environment],
+            ["Veloscope", "OpenAIBatchRetrieveP95Time", "Stage", "download", "Environment", var.environment],
+            ["Veloscope", "ControlFileWriteP95Time", "Stage", "download", "Environment", var.environment]
+          ]
+          period = 86400
+          stat   = "Maximum"
+          region = var.aws_region
+          title  = "Download Call Latency p95 (ms)"
+        }
       }
     ]
   })
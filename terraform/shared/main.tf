@@ -70,3 +70,16 @@ resource "aws_ecr_repository" "download_batch" {
     ManagedBy = "terraform"
   }
 }
+
+resource "aws_ecr_repository" "stage_dispatcher" {
+  name                 = "${var.ecr_repo_prefix}/stage-dispatcher"
+  image_tag_mutability = "MUTABLE"
+
+  image_scanning_configuration {
+    scan_on_push = true
+  }
+
+  tags = {
+    ManagedBy = "terraform"
+  }
+}
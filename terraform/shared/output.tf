@@ -17,3 +17,8 @@ output "ecr_download_batch_repository_url" {
   description = "URL of the download-batch ECR repository"
   value       = aws_ecr_repository.download_batch.repository_url
 }
+
+output "ecr_stage_dispatcher_repository_url" {
+  description = "URL of the stage-dispatcher ECR repository"
+  value       = aws_ecr_repository.stage_dispatcher.repository_url
+}
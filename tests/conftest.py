@@ -1,17 +1,52 @@
-"""Pytest configuration: make the batch-prepare source importable.
+"""Pytest configuration: make the package sources importable.
 
-The package directory name contains a hyphen, so it is not importable as a
-normal package. We add its ``src`` directory (and the repo root, for the
-``shared`` package) to ``sys.path``.
+The package directory names contain a hyphen, so they are not importable as
+normal packages. We add their ``src`` directories (and the repo root, for the
+``shared`` package) to ``sys.path``. The stage modules create an OpenAI
+client at import time, so a dummy API key is provided for tests.
+
+The ``fake_s3`` fixture replaces the S3 client with the in-memory bucket
+from ``fakes.py``.
 """
 import os
 import sys
+from typing import Any, Iterator
+
+import pytest
 
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 BATCH_PREPARE_SRC = os.path.join(
     REPO_ROOT, "packages", "batch-prepare", "src"
 )
+BATCH_UPLOAD_SRC = os.path.join(
+    REPO_ROOT, "packages", "batch-upload", "src"
+)
+BATCH_DOWNLOAD_SRC = os.path.join(
+    REPO_ROOT, "packages", "batch-download", "src"
+)
+STAGE_DISPATCHER_SRC = os.path.join(
+    REPO_ROOT, "packages", "stage-dispatcher", "src"
+)
 
-for path in (REPO_ROOT, BATCH_PREPARE_SRC):
+for path in (REPO_ROOT, BATCH_PREPARE_SRC, BATCH_UPLOAD_SRC,
+             BATCH_DOWNLOAD_SRC, STAGE_DISPATCHER_SRC):
     if path not in sys.path:
         sys.path.insert(0, path)
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+@pytest.fixture(name="fake_s3")
+def fixture_fake_s3(monkeypatch: Any) -> Iterator[Any]:
+    """Replace the S3 client with an in-memory bucket."""
+    # Imported here, once sys.path has the repo root
+    # pylint: disable=import-outside-toplevel
+    from fakes import FakeS3Client
+
+    from shared.utils import control_file_utils, s3_utils
+
+    client = FakeS3Client()
+    monkeypatch.setattr(s3_utils, "s3", client)
+    control_file_utils.invalidate_control_cache()
+    yield client
+    control_file_utils.invalidate_control_cache()
@@ -0,0 +1,364 @@
+"""
+In-process stand-ins for S3 and the OpenAI Batch API.
+
+The fakes implement just the client surface the pipeline uses, keep all
+objects in memory, and count every call so the benchmark can report
+request counts per stage. The benchmark and the tests use:
+- ``FakeS3Client`` replaces the boto3 S3 client in ``s3_utils``
+- ``FakeOpenAI`` replaces the OpenAI client in the upload and download
+  stages and synthesizes an output file as soon as a batch is created
+- ``FakeAsyncOpenAI`` exposes a ``FakeOpenAI`` through the ``AsyncOpenAI``
+  surface used by the ``ASYNC_IO`` stage variants
+"""
+
+import hashlib
+import io
+import itertools
+import json
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Set
+
+from botocore.exceptions import ClientError
+
+
+class FakeS3Error(Exception):
+    """Raised for missing objects, like botocore's NoSuchKey."""
+
+
+def _etag(body: bytes) -> str:
+    """Return a quoted content hash, like an S3 ETag."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def _not_modified(operation: str) -> ClientError:
+    """Build the error boto3 raises for a 304 Not Modified answer."""
+    return ClientError(
+        {"Error": {"Code": "304", "Message": "Not Modified"},
+         "ResponseMetadata": {"HTTPStatusCode": 304}},
+        operation
+    )
+
+
+def _precondition_failed(operation: str) -> ClientError:
+    """Build the error S3 raises when a conditional request fails."""
+    return ClientError(
+        {"Error": {"Code": "PreconditionFailed"},
+         "ResponseMetadata": {"HTTPStatusCode": 412}},
+        operation
+    )
+
+
+class FakeS3Client:
+    """A dictionary-backed replacement for the boto3 S3 client."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """
+        Create an empty bucket.
+
+        Args:
+            latency (float): Seconds every request takes, to simulate the
+                round trip to S3.
+        """
+        self.objects: Dict[str, bytes] = {}
+        self.calls: Counter = Counter()
+        self.latency = latency
+
+    def _count(self, operation: str) -> None:
+        self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, key: str) -> bytes:
+        if key not in self.objects:
+            raise FakeS3Error(f"NoSuchKey: {key}")
+        return self.objects[key]
+
+    def get_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Range: Optional[str] = None,
+        IfNoneMatch: Optional[str] = None,
+        **_: Any
+    ) -> Dict[str, Any]:
+        """Return an object body (or a byte range of it) as a stream."""
+        self._count("GetObject")
+        body = self._get(Key)
+        etag = _etag(body)
+        if IfNoneMatch is not None and IfNoneMatch == etag:
+            self.calls["GetObjectNotModified"] += 1
+            raise _not_modified("GetObject")
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            body = body[int(start):int(end) + 1]
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def put_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Body: Any,
+        IfMatch: Optional[str] = None,
+        IfNoneMatch: Optional[str] = None,
+        **_: Any
+    ) -> Dict[str, Any]:
+        """Store an object, honouring If-Match and If-None-Match."""
+        self._count("PutObject")
+        if IfNoneMatch == "*" and Key in self.objects:
+            raise _precondition_failed("PutObject")
+        if IfMatch is not None and (
+            Key not in self.objects or _etag(self.objects[Key]) != IfMatch
+        ):
+            raise _precondition_failed("PutObject")
+        self.objects[Key] = Body.encode("utf-8") if isinstance(
+            Body, str
+        ) else bytes(Body)
+        return {"ETag": _etag(self.objects[Key])}
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str) -> None:
+        """Store the contents of a local file."""
+        self._count("PutObject")
+        with open(Filename, "rb") as f:
+            self.objects[Key] = f.read()
+
+    def download_file(self, Bucket: str, Key: str, Filename: str) -> None:
+        """Write an object to a local file."""
+        self._count("GetObject")
+        with open(Filename, "wb") as f:
+            f.write(self._get(Key))
+
+    def list_objects_v2(
+        self, Bucket: str, Prefix: str = "", **_: Any
+    ) -> Dict[str, Any]:
+        """List up to 1000 keys with the given prefix."""
+        self._count("ListObjectsV2")
+        keys = sorted(k for k in self.objects if k.startswith(Prefix))[:1000]
+        if not keys:
+            return {}
+        return {"Contents": [{"Key": k} for k in keys]}
+
+    def head_object(self, Bucket: str, Key: str, **_: Any) -> Dict[str, Any]:
+        """Return object metadata, raising if it does not exist."""
+        self._count("HeadObject")
+        return {"ContentLength": len(self._get(Key))}
+
+    def delete_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        """Delete an object; deleting a missing key is not an error."""
+        self._count("DeleteObject")
+        self.objects.pop(Key, None)
+        return {}
+
+    def delete_objects(
+        self, Bucket: str, Delete: Dict[str, Any], **_: Any
+    ) -> Dict[str, Any]:
+        """Delete up to 1000 objects; missing keys are not an error."""
+        self._count("DeleteObjects")
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"], None)
+        return {}
+
+
+class _FakeFiles:
+    """The ``client.files`` namespace of ``FakeOpenAI``."""
+
+    def __init__(self, owner: "FakeOpenAI") -> None:
+        self._owner = owner
+
+    def create(self, file: Any, purpose: str) -> Any:
+        """Store an uploaded file."""
+        self._owner.calls["files.create"] += 1
+        # Files are passed as an open file or a (filename, bytes) tuple
+        data = file[1] if isinstance(file, tuple) else file.read()
+        return SimpleNamespace(id=self._owner.store(data))
+
+    def content(self, file_id: str) -> Any:
+        """Return a stored file with a ``text`` attribute."""
+        self._owner.calls["files.content"] += 1
+        data = self._owner.file_data[file_id]
+        return SimpleNamespace(text=data.decode("utf-8"), content=data)
+
+    def delete(self, file_id: str) -> Any:
+        """Delete a stored file."""
+        self._owner.calls["files.delete"] += 1
+        self._owner.file_data.pop(file_id, None)
+        return SimpleNamespace(id=file_id, deleted=True)
+
+
+class _FakeBatches:
+    """The ``client.batches`` namespace of ``FakeOpenAI``."""
+
+    def __init__(self, owner: "FakeOpenAI") -> None:
+        self._owner = owner
+
+    def create(self, input_file_id: str, **_: Any) -> Any:
+        """Create a batch and complete it immediately."""
+        self._owner.calls["batches.create"] += 1
+        return self._owner.complete_batch(input_file_id)
+
+    def retrieve(self, batch_id: str) -> Any:
+        """Return a previously created batch."""
+        self._owner.calls["batches.retrieve"] += 1
+        return self._owner.batch_data[batch_id]
+
+    def cancel(self, batch_id: str) -> Any:
+        """Cancel a previously created batch."""
+        self._owner.calls["batches.cancel"] += 1
+        batch = self._owner.batch_data[batch_id]
+        batch.status = "cancelled"
+        return batch
+
+
+class FakeOpenAI:
+    """
+    A replacement for the OpenAI client backed by in-memory files.
+
+    Batches complete as soon as they are created. Their output file holds a
+    short synthetic horoscope for every request, except for a configurable
+    fraction of requests that are written to the error file instead.
+
+    The reported usage models OpenAI's prompt caching: a request's prompt
+    prefix that an earlier request already sent is reported as cached, in
+    blocks of ``cache_block_tokens`` once it is ``cache_min_tokens`` long.
+    Prompt tokens are estimated at four characters per token.
+    """
+
+    # Prompt tokens reported for requests without messages
+    DEFAULT_PROMPT_TOKENS = 60
+
+    def __init__(
+        self,
+        failure_rate: float = 0.0,
+        cache_min_tokens: int = 1024,
+        cache_block_tokens: int = 128
+    ) -> None:
+        """
+        Create an empty fake account.
+
+        Args:
+            failure_rate (float): Fraction of requests reported as failed.
+            cache_min_tokens (int): Shortest prompt prefix that is cached.
+            cache_block_tokens (int): Granularity of cached prefixes.
+        """
+        self.failure_rate = failure_rate
+        self.cache_min_tokens = max(cache_min_tokens, 1)
+        self.cache_block_tokens = max(cache_block_tokens, 1)
+        self._cached_prefixes: Set[int] = set()
+        self.file_data: Dict[str, bytes] = {}
+        self.batch_data: Dict[str, Any] = {}
+        self.calls: Counter = Counter()
+        self.files = _FakeFiles(self)
+        self.batches = _FakeBatches(self)
+        self._ids = itertools.count(1)
+
+    def store(self, data: bytes) -> str:
+        """Store file content and return its file ID."""
+        file_id = f"file-{next(self._ids)}"
+        self.file_data[file_id] = data
+        return file_id
+
+    def usage(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the usage of a request, caching its prompt prefixes."""
+        prompt = "".join(
+            f"<{message.get('role')}>{message.get('content')}"
+            for message in body.get("messages", [])
+        )
+        if not prompt:
+            prompt_tokens = self.DEFAULT_PROMPT_TOKENS
+            cached_tokens = 0
+        else:
+            prompt_tokens = len(prompt) // 4
+            cached_tokens = 0
+            for tokens in range(
+                self.cache_min_tokens, prompt_tokens + 1,
+                self.cache_block_tokens
+            ):
+                prefix = hash(prompt[:tokens * 4])
+                if prefix in self._cached_prefixes:
+                    cached_tokens = tokens
+                self._cached_prefixes.add(prefix)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": 8,
+            "total_tokens": prompt_tokens + 8,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+    def complete_batch(self, input_file_id: str) -> Any:
+        """Synthesize the output and error files for a batch."""
+        outputs: List[str] = []
+        errors: List[str] = []
+        lines = self.file_data[input_file_id].decode("utf-8").splitlines()
+        fail_every = int(1 / self.failure_rate) if self.failure_rate else 0
+        for index, line in enumerate(lines, start=1):
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            if fail_every and index % fail_every == 0:
+                errors.append(json.dumps({
+                    "custom_id": custom_id,
+                    "response": None,
+                    "error": {"code": "server_error", "message": "fake"},
+                }))
+                continue
+            outputs.append(json.dumps({
+                "id": f"req-{index}",
+                "custom_id": custom_id,
+                "response": {
+                    "status_code": 200,
+                    "body": {
+                        "choices": [{"message": {
+                            "role": "assistant",
+                            "content": "Pedal with purpose; rest with joy.",
+                        }}],
+                        "usage": self.usage(request.get("body", {})),
+                    },
+                },
+                "error": None,
+            }))
+
+        batch_id = f"batch-{next(self._ids)}"
+        batch = SimpleNamespace(
+            id=batch_id,
+            status="completed",
+            output_file_id=self.store(
+                "\n".join(outputs).encode("utf-8")
+            ) if outputs else None,
+            error_file_id=self.store(
+                "\n".join(errors).encode("utf-8")
+            ) if errors else None,
+            request_counts=SimpleNamespace(
+                total=len(lines),
+                completed=len(outputs),
+                failed=len(errors),
+            ),
+        )
+        self.batch_data[batch_id] = batch
+        return batch
+
+
+class _AsyncNamespace:
+    """Awaitable wrappers around the methods of a fake namespace."""
+
+    def __init__(self, namespace: Any) -> None:
+        self._namespace = namespace
+
+    def __getattr__(self, name: str) -> Any:
+        method = getattr(self._namespace, name)
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            return method(*args, **kwargs)
+        return call
+
+
+class FakeAsyncOpenAI:
+    """An ``AsyncOpenAI`` replacement sharing a ``FakeOpenAI``'s state."""
+
+    def __init__(self, fake: FakeOpenAI) -> None:
+        """Wrap ``fake``; its files, batches and call counts are shared."""
+        self.fake = fake
+        self.files = _AsyncNamespace(fake.files)
+        self.batches = _AsyncNamespace(fake.batches)
+
+    async def close(self) -> None:
+        """Close the client (nothing to release)."""
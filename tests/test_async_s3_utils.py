@@ -0,0 +1,35 @@
+"""Tests for the asyncio S3 layer."""
+import asyncio
+import threading
+import time
+from typing import Any, List
+
+from shared.utils import async_s3_utils, s3_utils
+
+
+def test_concurrent_puts_are_bounded(monkeypatch: Any) -> None:
+    """No more than S3_MAX_CONCURRENCY requests run at the same time."""
+    monkeypatch.setattr(async_s3_utils, "S3_MAX_CONCURRENCY", 3)
+    lock = threading.Lock()
+    active: List[int] = [0]
+    peak: List[int] = [0]
+
+    def slow_put(key: str, data: Any, content_type: str) -> bool:
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        return True
+
+    monkeypatch.setattr(s3_utils, "put_s3_object", slow_put)
+
+    async def put_all() -> List[bool]:
+        return await asyncio.gather(*(
+            async_s3_utils.put_s3_object_async(f"k{i}", "x")
+            for i in range(12)
+        ))
+
+    assert asyncio.run(put_all()) == [True] * 12
+    assert 1 < peak[0] <= 3
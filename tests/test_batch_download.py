@@ -0,0 +1,372 @@
+"""Tests for result processing and retries in the batch-download stage."""
+import asyncio
+import json
+import shutil
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import batch_download_result as download
+import pytest
+from fakes import FakeAsyncOpenAI, FakeOpenAI, FakeS3Client
+
+from shared.config import CONTROL_KEY
+from shared.utils import download_utils, lease_utils, result_utils
+from shared.utils.result_utils import ResultTally
+
+
+def _line(custom_id: str, **fields: Any) -> str:
+    return json.dumps({"custom_id": custom_id, **fields})
+
+
+def test_parse_error_file_reads_both_error_shapes() -> None:
+    """Errors may be top-level or nested in a non-200 response body."""
+    error_text = "\n".join([
+        _line("a", error={"code": "batch_expired"}, response=None),
+        _line(
+            "b",
+            error=None,
+            response={
+                "status_code": 429,
+                "body": {"error": {"code": "rate_limit_exceeded"}},
+            },
+        ),
+        "",
+    ])
+
+    errors = download_utils._parse_error_file(error_text)
+
+    assert errors == {"a": "batch_expired", "b": "rate_limit_exceeded"}
+    assert download_utils._count_error_codes(errors) == {
+        "batch_expired": 1, "rate_limit_exceeded": 1
+    }
+
+
+def _patch_retry_io(monkeypatch: Any, tmp_path: Any) -> Dict[str, Any]:
+    """Serve a three-request input file and capture the retry batch."""
+    source = tmp_path / "input.jsonl"
+    source.write_text(
+        "".join(_line(cid, body={}) + "\n" for cid in ("a", "b", "c")),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(
+        download_utils, "RESULT_DIR", str(tmp_path / "results")
+    )
+    monkeypatch.setattr(
+        download_utils,
+        "download_file_from_s3",
+        lambda key, path: bool(shutil.copy(source, path)),
+    )
+    uploaded: Dict[str, List[str]] = {}
+
+    def fake_upload(path: str, key: str) -> bool:
+        with open(path, encoding="utf-8") as f:
+            uploaded[key] = [json.loads(line)["custom_id"] for line in f]
+        return True
+
+    created: Dict[str, Any] = {}
+
+    def fake_create_batch(**kwargs: Any) -> Any:
+        created.update(kwargs)
+        return True, "retry-id"
+
+    monkeypatch.setattr(
+        download_utils, "get_batch_by_input_file", lambda key: None
+    )
+    monkeypatch.setattr(download_utils, "upload_file_to_s3", fake_upload)
+    monkeypatch.setattr(download_utils, "create_batch", fake_create_batch)
+    (tmp_path / "results").mkdir()
+    return {"uploaded": uploaded, "created": created}
+
+
+BATCH_INFO = {
+    "batch_id": "parent",
+    "input_file": "openai/input/2030-01-01-abcd.jsonl",
+    "target_date": "2030-01-01",
+}
+RETRY_KEY = "openai/input/2030-01-01-abcd-retry1.jsonl"
+
+
+def test_retry_batch_contains_only_failed_requests(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """The retry JSONL is the failed subset of the original input."""
+    captured = _patch_retry_io(monkeypatch, tmp_path)
+
+    retry_id = download_utils._create_retry_batch(
+        BATCH_INFO, ResultTally({"a", "c"}, None, {})
+    )
+
+    assert retry_id == "retry-id"
+    assert captured["uploaded"] == {RETRY_KEY: ["a", "c"]}
+    additional_data = captured["created"]["additional_data"]
+    assert additional_data["parent_batch_id"] == "parent"
+    assert additional_data["rider_count"] == 2
+
+
+def test_retry_of_expired_batch_includes_unpublished_requests(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """Requests missing from both output and error file are resubmitted."""
+    captured = _patch_retry_io(monkeypatch, tmp_path)
+
+    download_utils._create_retry_batch(
+        BATCH_INFO, ResultTally({"b"}, {"a"}, {})
+    )
+
+    assert captured["uploaded"] == {RETRY_KEY: ["b", "c"]}
+
+
+def test_existing_retry_batch_is_reused(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """A retry batch left by an interrupted run is not created twice."""
+    captured = _patch_retry_io(monkeypatch, tmp_path)
+    monkeypatch.setattr(
+        download_utils, "get_batch_by_input_file",
+        lambda key: {"batch_id": "earlier-retry"} if key == RETRY_KEY else None
+    )
+
+    assert download_utils._create_retry_batch(
+        BATCH_INFO, ResultTally({"a"}, None, {})
+    ) == "earlier-retry"
+    assert captured["created"] == {}
+
+
+def test_retry_stops_at_attempt_limit() -> None:
+    """No retry batch is created once the attempt limit is reached."""
+    batch_info = {
+        "batch_id": "child",
+        "input_file": "openai/input/x.jsonl",
+        "target_date": "2030-01-01",
+        "retry_attempt": download_utils.RETRY_MAX_ATTEMPTS,
+    }
+    assert download_utils._create_retry_batch(
+        batch_info, ResultTally({"a"}, None, {})
+    ) is None
+
+
+def test_leased_ranges_are_shared_between_workers(
+    monkeypatch: Any, fake_s3: FakeS3Client
+) -> None:
+    """A batch is finalized once, after every worker's ranges are done."""
+    monkeypatch.setattr(download_utils, "RESULT_RANGE_BYTES", 150)
+    ok = {"status_code": 200, "body": {"choices": [
+        {"message": {"content": "Ride on."}}
+    ]}}
+    result_text = "".join(
+        _line(f"rider-{i}", response=ok) + "\n" for i in range(6)
+    )
+    monkeypatch.setattr(
+        download_utils, "_download_result_file",
+        lambda client, file_id: result_text
+    )
+    handled: List[str] = []
+    monkeypatch.setattr(
+        download_utils, "handle_failed_requests",
+        lambda *args: handled.append("worker") or {}
+    )
+    batch = SimpleNamespace(
+        status="completed", output_file_id="file-1", error_file_id=None
+    )
+    batch_info = {"batch_id": "b1", "target_date": "2030-01-01"}
+
+    # Another live worker holds the last range
+    size = len(result_text.encode("utf-8"))
+    last_start, last_end = lease_utils.split_byte_ranges(size, 150)[-1]
+    other = lease_utils.acquire_lease(
+        lease_utils.lease_key("b1", "ranges", f"{last_start}-{last_end}"),
+        owner="worker-b", ttl=600
+    )
+    assert other is not None
+
+    assert download_utils.download_with_leases(
+        None, batch, batch_info
+    ) == (None, {})
+    assert handled == []
+
+    lease_utils.release_lease(other)
+    assert download_utils.download_with_leases(
+        None, batch, batch_info
+    ) == (True, {})
+    assert download_utils.download_with_leases(
+        None, batch, batch_info
+    ) == (True, {})
+    assert handled == ["worker"]
+    horoscopes = [k for k in fake_s3.objects if k.startswith("horoscope/")]
+    assert len(horoscopes) == 6
+
+
+@pytest.mark.usefixtures("fake_s3")
+def test_range_lease_is_renewed_while_processing_runs_long(
+    monkeypatch: Any
+) -> None:
+    """A range that outlives the lease TTL is not taken over mid-way."""
+    monkeypatch.setattr(download_utils, "LEASE_TTL_SECONDS", 150)
+    monkeypatch.setattr(result_utils, "CHECKPOINT_EVERY", 1)
+    clock = [1000.0]
+    monkeypatch.setattr(
+        lease_utils, "time", SimpleNamespace(time=lambda: clock[0])
+    )
+    ok = {"status_code": 200, "body": {"choices": [
+        {"message": {"content": "Ride on."}}
+    ]}}
+    result_text = "".join(
+        _line(f"rider-{i}", response=ok) + "\n" for i in range(5)
+    )
+    monkeypatch.setattr(
+        download_utils, "_download_result_file",
+        lambda client, file_id: result_text
+    )
+    monkeypatch.setattr(
+        download_utils, "handle_failed_requests", lambda *args: {}
+    )
+    size = len(result_text.encode("utf-8"))
+    range_key = lease_utils.lease_key("b1", "ranges", f"0-{size}")
+    taken_over: List[bool] = []
+    upload = result_utils.upload_json_to_s3
+
+    def slow_upload(key: str, data: Dict[str, Any]) -> bool:
+        # Each horoscope takes 100s, so the range runs past the 150s TTL
+        clock[0] += 100
+        other = lease_utils.acquire_lease(range_key, owner="worker-b")
+        taken_over.append(other is not None)
+        return upload(key, data)
+
+    monkeypatch.setattr(result_utils, "upload_json_to_s3", slow_upload)
+    batch = SimpleNamespace(
+        status="completed", output_file_id="file-1", error_file_id=None
+    )
+    batch_info = {"batch_id": "b1", "target_date": "2030-01-01"}
+
+    assert download_utils.download_with_leases(
+        None, batch, batch_info
+    ) == (True, {})
+    assert taken_over == [False] * 5
+
+
+@pytest.mark.usefixtures("fake_s3")
+def test_interrupted_processing_resumes_from_checkpoint(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """A restarted run skips checkpointed lines and the download."""
+    monkeypatch.setattr(download_utils, "RESULT_DIR", str(tmp_path))
+    monkeypatch.setattr(result_utils, "CHECKPOINT_EVERY", 2)
+    ok = {"status_code": 200, "body": {
+        "choices": [{"message": {"content": "Ride on."}}],
+        "usage": {
+            "prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12,
+            "prompt_tokens_details": {"cached_tokens": 4},
+        },
+    }}
+    result_text = "\n".join(
+        _line(f"rider-{i}", response=ok) for i in range(5)
+    )
+    downloads: List[str] = []
+    monkeypatch.setattr(
+        download_utils, "_download_result_file",
+        lambda client, file_id: downloads.append(file_id) or result_text
+    )
+    uploaded: List[str] = []
+
+    def crash_on_fourth(key: str, data: Dict[str, Any]) -> bool:
+        if len(uploaded) == 3:
+            raise RuntimeError("container stopped")
+        uploaded.append(data["name"])
+        return True
+
+    monkeypatch.setattr(result_utils, "upload_json_to_s3", crash_on_fourth)
+    batch_info = {"batch_id": "b1", "target_date": "2030-01-01"}
+    failed: set = set()
+    try:
+        download_utils._process_with_checkpoints(
+            None, batch_info, "file-1", ResultTally(failed, None, {})
+        )
+    except RuntimeError:
+        pass
+
+    monkeypatch.setattr(
+        result_utils, "upload_json_to_s3",
+        lambda key, data: uploaded.append(data["name"]) or True
+    )
+    usage: Dict[str, int] = {}
+    published: set = set()
+    assert download_utils._process_with_checkpoints(
+        None, batch_info, "file-1", ResultTally(failed, published, usage)
+    )
+
+    # Lines 0-1 were checkpointed; line 2 ran again after the crash
+    assert uploaded == [
+        "rider-0", "rider-1", "rider-2", "rider-2", "rider-3", "rider-4"
+    ]
+    assert downloads == ["file-1"]
+    # Published IDs of checkpointed lines are rebuilt from the output file
+    assert published == {f"rider-{i}" for i in range(5)}
+    # Usage of checkpointed lines is restored, not counted twice
+    assert usage == {
+        "prompt_tokens": 50, "completion_tokens": 10, "total_tokens": 60,
+        "cached_tokens": 20,
+    }
+
+
+def test_async_stage_publishes_every_pending_batch(
+    monkeypatch: Any, tmp_path: Any, fake_s3: FakeS3Client
+) -> None:
+    """The asyncio download stage processes all batches concurrently."""
+    monkeypatch.setattr(download_utils, "RESULT_DIR", str(tmp_path))
+    monkeypatch.setattr(result_utils, "CHECKPOINT_EVERY", 2)
+    openai = FakeOpenAI()
+    monkeypatch.setattr(
+        download, "initialize_async_openai_client",
+        lambda: FakeAsyncOpenAI(openai)
+    )
+
+    batches = []
+    for index in range(3):
+        file_id = openai.store("".join(
+            _line(f"rider-{index}-{n}", body={}) + "\n" for n in range(5)
+        ).encode("utf-8"))
+        batches.append({
+            "batch_id": f"b{index}",
+            "input_file": f"openai/input/b{index}.jsonl",
+            "target_date": "2030-01-01",
+            "status": "submitted",
+            "openai_batch_id": openai.complete_batch(file_id).id,
+        })
+    fake_s3.objects[CONTROL_KEY] = json.dumps(
+        {"batches": batches}
+    ).encode("utf-8")
+
+    assert asyncio.run(download.process_pending_batches_async())
+
+    horoscopes = [k for k in fake_s3.objects if k.startswith("horoscope/")]
+    assert len(horoscopes) == 15
+    control = json.loads(fake_s3.objects[CONTROL_KEY])
+    assert {b["status"] for b in control["batches"]} == {"completed"}
+    assert {b["usage"]["prompt_tokens"] for b in control["batches"]} == {300}
+    assert openai.calls["files.content"] == 3
+
+
+def test_batch_stays_submitted_when_its_output_cannot_be_fetched(
+    monkeypatch: Any, tmp_path: Any, fake_s3: FakeS3Client
+) -> None:
+    """A failed output download is retried, not recorded as failed."""
+    monkeypatch.setattr(download_utils, "RESULT_DIR", str(tmp_path))
+    openai = FakeOpenAI()
+    monkeypatch.setattr(download, "client", openai)
+    file_id = openai.store((_line("rider-1", body={}) + "\n").encode("utf-8"))
+    fake_s3.objects[CONTROL_KEY] = json.dumps({"batches": [{
+        "batch_id": "b1",
+        "input_file": "openai/input/b1.jsonl",
+        "target_date": "2030-01-01",
+        "status": "submitted",
+        "openai_batch_id": openai.complete_batch(file_id).id,
+    }]}).encode("utf-8")
+    monkeypatch.setattr(
+        download_utils, "_download_result_file", lambda c, f: None
+    )
+
+    assert not download.process_pending_batches()
+
+    control = json.loads(fake_s3.objects[CONTROL_KEY])
+    assert control["batches"][0]["status"] == "submitted"
+    assert len(control["batches"]) == 1
@@ -0,0 +1,77 @@
+"""Tests for completing batches in the express stage."""
+from typing import Any, Dict, List
+
+import batch_express_result as express
+from fakes import FakeAsyncOpenAI, FakeOpenAI
+
+RESULTS = [{"custom_id": "a", "response": {}, "error": None}]
+
+
+def _patch_run(monkeypatch: Any, batch: Dict[str, Any]) -> List[str]:
+    """Serve ``batch`` and record the publishing instead of running it."""
+    published: List[str] = []
+
+    async def run(requests: Any) -> Any:
+        return RESULTS
+
+    def publish(results: Any, target_date: str, manifest_key: Any) -> Any:
+        published.append(target_date)
+        return True, {"total_tokens": 10}
+
+    monkeypatch.setattr(express, "get_batch_by_id", lambda batch_id: batch)
+    monkeypatch.setattr(
+        express, "load_requests", lambda key, custom_ids: [{"custom_id": "a"}]
+    )
+    monkeypatch.setattr(express, "run_express_requests", run)
+    monkeypatch.setattr(express, "_publish_results", publish)
+    return published
+
+
+def test_rejected_completion_publishes_nothing(monkeypatch: Any) -> None:
+    """Results are only published once the batch is marked completed."""
+    fake_openai = FakeOpenAI()
+    openai_batch = fake_openai.batches.create(
+        input_file_id=fake_openai.store(b""), endpoint="",
+        completion_window="24h"
+    )
+    openai_batch.status = "in_progress"
+    batch = {
+        "batch_id": "b1", "status": "submitted", "input_file": "in.jsonl",
+        "target_date": "2030-01-01", "openai_batch_id": openai_batch.id,
+    }
+    published = _patch_run(monkeypatch, batch)
+    monkeypatch.setattr(
+        express, "initialize_async_openai_client",
+        lambda: FakeAsyncOpenAI(fake_openai)
+    )
+    updates: List[Dict[str, Any]] = []
+    monkeypatch.setattr(
+        express, "update_batch_status",
+        lambda **kwargs: updates.append(kwargs) and False
+    )
+
+    assert not express.process_express(batch_id="b1")
+
+    assert openai_batch.status == "cancelled"
+    assert [u["new_status"] for u in updates] == ["completed"]
+    assert not published
+
+
+def test_completed_batch_records_usage(monkeypatch: Any) -> None:
+    """A whole, successful run completes the batch and records its usage."""
+    batch = {
+        "batch_id": "b1", "status": "failed", "input_file": "in.jsonl",
+        "target_date": "2030-01-01",
+    }
+    published = _patch_run(monkeypatch, batch)
+    updates: List[Dict[str, Any]] = []
+    monkeypatch.setattr(
+        express, "update_batch_status",
+        lambda **kwargs: updates.append(kwargs) or True
+    )
+
+    assert express.process_express(batch_id="b1")
+
+    assert published == ["2030-01-01"]
+    assert updates[0]["new_status"] == "completed"
+    assert updates[1]["additional_data"] == {"usage": {"total_tokens": 10}}
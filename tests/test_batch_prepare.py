@@ -0,0 +1,138 @@
+"""Tests for lookahead, sharding and deadline partitions in batch-prepare."""
+import json
+from typing import Any, List
+
+import batch_prepare_input as prepare
+import pytest
+from fakes import FakeS3Client
+
+from shared.config import CONTROL_KEY, RIDERS_FILE
+
+
+@pytest.mark.parametrize(
+    "count,max_requests,expected",
+    [
+        (5, 2, [(0, 2), (2, 4), (4, 5)]),
+        (7, 5, [(0, 4), (4, 7)]),
+        (3, 50000, [(0, 3)]),
+        (0, 10, [(0, 0)]),
+    ],
+)
+def test_shard_bounds_are_even(
+    count: int, max_requests: int, expected: Any
+) -> None:
+    """Shards cover every rider once and differ in size by at most one."""
+    assert prepare.shard_bounds(count, max_requests) == expected
+
+
+@pytest.mark.parametrize(
+    "tokens,max_requests,budget,expected",
+    [
+        ([100] * 10, 10, 1000, [(0, 10)]),
+        ([100] * 10, 10, 450, [(0, 4), (4, 8), (8, 10)]),
+        ([100] * 10, 3, 1000, [(0, 3), (3, 6), (6, 8), (8, 10)]),
+        ([900, 10, 10, 10], 4, 500, [(0, 1), (1, 4)]),
+        ([10, 900, 10, 10], 4, 500, [(0, 1), (1, 2), (2, 4)]),
+        ([100] * 10, 10, 0, [(0, 10)]),
+        ([], 10, 1000, []),
+        ([], 10, 0, []),
+    ],
+)
+def test_fit_token_budget_packs_shards_under_the_budget(
+    tokens: Any, max_requests: int, budget: int, expected: Any
+) -> None:
+    """Even shards are kept unless one would exceed the token budget."""
+    assert prepare.fit_token_budget(tokens, max_requests, budget) == expected
+
+
+def test_static_first_layout_shares_the_instruction_prefix() -> None:
+    """Only the last message differs between riders; inline keeps the text."""
+    first, second = (
+        prepare.build_request(cid, name, sign, "2030-01-01")["body"]
+        for cid, name, sign in (
+            ("a", "Demi", "Leo"), ("b", "Wout", "Aries")
+        )
+    )
+    assert first["messages"][:-1] == second["messages"][:-1]
+    assert "Demi" not in json.dumps(first["messages"][:-1])
+    assert first["messages"][-1]["content"].endswith("Rider: Demi")
+
+    inline = prepare.build_request(
+        "a", "Demi", "Leo", "2030-01-01", layout="inline"
+    )["body"]["messages"]
+    assert inline[-1]["content"].startswith(
+        "Generate a daily horoscope for Demi, whose zodiac sign is Leo"
+    )
+
+
+def test_lookahead_prepares_each_missing_day(
+    monkeypatch: Any, tmp_path: Any, fake_s3: FakeS3Client
+) -> None:
+    """Days with a live batch are skipped; the others are sharded."""
+    monkeypatch.setattr(
+        prepare, "OPENAI_INPUT_FILE", str(tmp_path / "input.jsonl")
+    )
+    monkeypatch.setattr(prepare, "MAX_REQUESTS_PER_BATCH", 2)
+    days = prepare.lookahead_dates(3)
+    fake_s3.objects[RIDERS_FILE] = json.dumps([
+        {"name": f"rider {n}", "birth_date": "2001-09-03"} for n in range(5)
+    ]).encode("utf-8")
+    fake_s3.objects[CONTROL_KEY] = json.dumps({"batches": [
+        {"batch_id": "done", "target_date": days[1], "status": "completed"},
+        {"batch_id": "lost", "target_date": days[2], "status": "expired"},
+    ]}).encode("utf-8")
+
+    created = prepare.generate_jsonl(3)
+
+    assert created is not None
+    assert [day for _, day in created] == [days[0]] * 3 + [days[2]] * 3
+    control = json.loads(fake_s3.objects[CONTROL_KEY])
+    new = [b for b in control["batches"] if b["status"] == "prepared"]
+    assert [b["rider_count"] for b in new] == [2, 2, 1] * 2
+    assert [b["shard"] for b in new] == [1, 2, 3] * 2
+
+    # The shards of a day hold every rider once, for that day only
+    custom_ids = []
+    for batch in new[:3]:
+        lines = fake_s3.objects[batch["input_file"]].decode().splitlines()
+        custom_ids += [json.loads(line)["custom_id"] for line in lines]
+        assert all(days[0] in line for line in lines)
+    assert len(set(custom_ids)) == 5
+
+    # A second run finds every day scheduled
+    assert prepare.generate_jsonl(3) == []
+
+
+def test_riders_are_partitioned_by_delivery_deadline(
+    monkeypatch: Any, tmp_path: Any, fake_s3: FakeS3Client
+) -> None:
+    """Riders who are due earlier get their own batch, created first."""
+    put_object = fake_s3.put_object
+    control_writes: List[str] = []
+
+    def count_control_writes(**kwargs: Any) -> Any:
+        if kwargs["Key"] == CONTROL_KEY:
+            control_writes.append(kwargs["Key"])
+        return put_object(**kwargs)
+
+    monkeypatch.setattr(fake_s3, "put_object", count_control_writes)
+    monkeypatch.setattr(
+        prepare, "OPENAI_INPUT_FILE", str(tmp_path / "input.jsonl")
+    )
+    fake_s3.objects[RIDERS_FILE] = json.dumps([
+        {"name": "geraint", "birth_date": "1986-05-25",
+         "timezone": "Europe/London"},
+        {"name": "yukiya", "birth_date": "1990-07-02",
+         "timezone": "Asia/Tokyo"},
+        {"name": "blanka", "birth_date": "2001-09-03"},
+    ]).encode("utf-8")
+
+    assert prepare.generate_jsonl(1)
+
+    batches = json.loads(fake_s3.objects[CONTROL_KEY])["batches"]
+    assert [b["rider_count"] for b in batches] == [1, 2]
+    # Both shards of the date are added with one write
+    assert len(control_writes) == 1
+    assert batches[0]["deadline"] < batches[1]["deadline"]
+    tokyo = fake_s3.objects[batches[0]["input_file"]].decode()
+    assert "Yukiya" in tokyo and "Blanka" not in tokyo
@@ -0,0 +1,92 @@
+"""Tests for typed batch records, their codec and status transitions."""
+import json
+
+from shared.utils.batch_record_utils import (
+    BatchIndex,
+    BatchRecord,
+    can_transition,
+    decode_batches,
+    encode_batches,
+)
+
+
+def test_records_round_trip_known_and_unknown_fields() -> None:
+    """A decoded record encodes back to the same JSON object."""
+    entry = {
+        "batch_id": "b1",
+        "target_date": "2030-01-01",
+        "status": "submitted",
+        "output_file_id": None,
+        "failed_request_count": 2,
+    }
+    records = decode_batches([entry, "not-a-batch"])
+
+    assert len(records) == 1
+    record = records[0]
+    assert not hasattr(record, "__dict__")
+    assert record.status == "submitted"
+    assert record["failed_request_count"] == 2
+    assert "output_file_id" in record and "file_id" not in record
+    assert record.get("file_id") is None
+    assert record == entry
+    assert json.dumps(encode_batches(records)) == json.dumps([entry])
+
+    record.update({"status": "completed", "published": 5})
+    del record["output_file_id"]
+    assert record.to_dict() == {
+        "batch_id": "b1",
+        "target_date": "2030-01-01",
+        "status": "completed",
+        "failed_request_count": 2,
+        "published": 5,
+    }
+
+
+def test_status_transitions() -> None:
+    """Batches move forward; express may complete a finished batch."""
+    assert can_transition("prepared", "submitted")
+    assert can_transition("submitted", "expired")
+    assert can_transition("failed", "completed")
+    assert can_transition("completed", "completed")
+    assert not can_transition("completed", "failed")
+    assert not can_transition("expired", "submitted")
+    assert not can_transition("submitted", "prepared")
+
+
+def test_index_groups_records_by_status() -> None:
+    """The index finds records by ID, input file and status."""
+    records = [
+        BatchRecord({"batch_id": "a", "status": "prepared",
+                     "input_file": "in/a.jsonl"}),
+        BatchRecord({"batch_id": "b", "status": "submitted"}),
+        BatchRecord({"batch_id": "c", "status": "prepared"}),
+    ]
+    index = BatchIndex(records)
+
+    assert index.find("b") is records[1]
+    assert index.find(input_file="in/a.jsonl") is records[0]
+    assert index.find("missing", "in/a.jsonl") is records[0]
+    assert index.find("missing") is None
+    assert index.with_status("prepared") == [records[0], records[2]]
+    assert index.with_status("failed") == []
+
+
+def test_copies_do_not_share_nested_values() -> None:
+    """Changing a copy's usage or error details leaves the original alone."""
+    record = BatchRecord({
+        "batch_id": "b1",
+        "usage": {"total_tokens": 10},
+        "error_codes": {"server_error": 1},
+    })
+    copied = record.copy()
+
+    copied["usage"]["total_tokens"] = 20
+    copied["error_codes"]["rate_limit_exceeded"] = 2
+
+    assert record["usage"] == {"total_tokens": 10}
+    assert record["error_codes"] == {"server_error": 1}
+    assert copied == {
+        "batch_id": "b1",
+        "usage": {"total_tokens": 20},
+        "error_codes": {"server_error": 1, "rate_limit_exceeded": 2},
+    }
@@ -0,0 +1,41 @@
+"""Tests for choosing the batches the batch-upload stage submits."""
+from typing import Any
+
+import batch_upload_input as upload
+from fakes import FakeOpenAI
+
+
+def _batch(batch_id: str, status: str, tokens: int) -> Any:
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "input_file": f"openai/input/{batch_id}.jsonl",
+        "target_date": "2030-01-01",
+        "estimated_tokens": tokens,
+    }
+
+
+def test_batches_held_back_by_token_limit_are_not_a_failure(
+    monkeypatch: Any
+) -> None:
+    """A run whose due batches all wait for enqueued tokens succeeds."""
+    fake_openai = FakeOpenAI()
+    monkeypatch.setattr(upload, "client", fake_openai)
+    monkeypatch.setattr(upload, "ENQUEUED_TOKEN_LIMIT", 1000)
+    monkeypatch.setattr(
+        upload, "get_pending_batches",
+        lambda: [_batch("enqueued", "submitted", 900)]
+    )
+    monkeypatch.setattr(
+        upload, "get_prepared_batches",
+        lambda: [
+            _batch("first", "prepared", 500),
+            _batch("second", "prepared", 300),
+        ]
+    )
+
+    due, held = upload._due_batches()
+    assert not due
+    assert [batch["batch_id"] for batch in held] == ["first", "second"]
+    assert upload.upload_jsonl_to_openai()
+    assert not fake_openai.calls
@@ -0,0 +1,151 @@
+"""Tests for deleting the OpenAI files and S3 objects of finished batches."""
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from fakes import FakeOpenAI, FakeS3Client
+
+from shared.config import CONTROL_KEY
+from shared.utils import cleanup_utils as cleanup
+from shared.utils import s3_utils
+
+NOW = datetime(2030, 1, 10, tzinfo=timezone.utc)
+
+
+def _batch(
+    batch_id: str, status: str, day: int, **fields: Any
+) -> Dict[str, Any]:
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "input_file": f"openai/input/{batch_id}.jsonl",
+        "manifest_file": f"openai/input/{batch_id}.manifest.json",
+        "completed_at": f"2030-01-{day:02d}T12:00:00+00:00",
+        "updated_at": f"2030-01-{day:02d}T12:00:00+00:00",
+        **fields,
+    }
+
+
+def _setup(fake_s3: FakeS3Client, batches: List[Dict[str, Any]]) -> None:
+    fake_s3.objects[CONTROL_KEY] = json.dumps(
+        {"batches": batches}
+    ).encode("utf-8")
+    for batch in batches:
+        for key in (batch["input_file"], batch["manifest_file"]):
+            fake_s3.objects[key] = b"{}"
+
+
+def test_cleanup_deletes_files_of_old_terminal_batches(
+    fake_s3: FakeS3Client
+) -> None:
+    """Old terminal batches are cleaned once; shared inputs are kept."""
+    fake_openai = FakeOpenAI()
+    files = [fake_openai.store(b"x") for _ in range(4)]
+    old = _batch(
+        "old", "completed", 1,
+        file_id=files[0], output_file_id=files[1], error_file_id=None,
+    )
+    retry = _batch(
+        "retry", "submitted", 9, file_id=files[2],
+        manifest_file=old["manifest_file"], completed_at=None,
+    )
+    recent = _batch("recent", "failed", 9, file_id=files[3])
+    _setup(fake_s3, [old, retry, recent])
+    fake_s3.objects["openai/output/old-output.jsonl"] = b"{}"
+    fake_s3.objects["leases/old/batch.json"] = b"{}"
+    fake_s3.objects["leases/old/ranges/0-9.json"] = b"{}"
+
+    counts = cleanup.cleanup_batches(fake_openai, 0, 3, now=NOW)
+
+    assert counts == {"openai_files": 3, "s3_objects": 5}
+    assert set(fake_openai.file_data) == {files[2]}
+    assert sorted(fake_s3.objects) == sorted([
+        CONTROL_KEY,
+        old["manifest_file"],
+        retry["input_file"],
+        recent["input_file"],
+        recent["manifest_file"],
+    ])
+    assert fake_s3.calls["DeleteObjects"] == 1
+    control = json.loads(fake_s3.objects[CONTROL_KEY])
+    cleaned = {b["batch_id"]: b for b in control["batches"]}
+    assert cleaned["old"]["s3_objects_deleted_at"] == NOW.isoformat()
+    assert cleaned["old"]["updated_at"] == old["updated_at"]
+    assert "s3_objects_deleted_at" not in cleaned["recent"]
+    assert cleaned["recent"]["openai_files_deleted_at"] == NOW.isoformat()
+
+    assert cleanup.cleanup_batches(fake_openai, 0, 3, now=NOW) == {
+        "openai_files": 0, "s3_objects": 0
+    }
+
+
+def test_openai_files_of_unfinished_work_are_kept(
+    fake_s3: FakeS3Client
+) -> None:
+    """Files of failed batches are kept until their retry has finished."""
+    fake_openai = FakeOpenAI()
+    files = [fake_openai.store(b"x") for _ in range(3)]
+    waiting = _batch(
+        "waiting", "expired", 1, file_id=files[0], output_file_id=None,
+        openai_batch_id="ob-1", retry_batch_id="waiting-retry",
+    )
+    waiting_retry = _batch(
+        "waiting-retry", "submitted", 2, file_id=files[1], completed_at=None,
+    )
+    handled = _batch(
+        "handled", "failed", 1, file_id=files[2], output_file_id=None,
+        openai_batch_id="ob-2", retry_batch_id="archived-retry",
+    )
+    _setup(fake_s3, [waiting, waiting_retry, handled])
+
+    counts = cleanup.cleanup_batches(fake_openai, 0, 30, now=NOW)
+
+    assert counts == {"openai_files": 1, "s3_objects": 0}
+    assert set(fake_openai.file_data) == {files[0], files[1]}
+
+
+def test_openai_files_of_batches_without_retry_are_deleted(
+    fake_s3: FakeS3Client
+) -> None:
+    """A failed batch that was not retried has nothing left to recover."""
+    fake_openai = FakeOpenAI()
+    files = [fake_openai.store(b"x") for _ in range(2)]
+    failed = _batch(
+        "failed", "failed", 5, file_id=files[0], output_file_id=None,
+        error_file_id=files[1], openai_batch_id="ob-1",
+    )
+    _setup(fake_s3, [failed])
+
+    counts = cleanup.cleanup_batches(fake_openai, 2, 30, now=NOW)
+
+    assert counts == {"openai_files": 2, "s3_objects": 0}
+    assert not fake_openai.file_data
+
+
+def test_dry_run_deletes_nothing(fake_s3: FakeS3Client) -> None:
+    """A dry run counts what is due without deleting or recording it."""
+    fake_openai = FakeOpenAI()
+    file_id = fake_openai.store(b"x")
+    _setup(fake_s3, [_batch("old", "expired", 1, file_id=file_id)])
+    before = dict(fake_s3.objects)
+
+    counts = cleanup.cleanup_batches(
+        fake_openai, 0, 0, dry_run=True, now=NOW
+    )
+
+    assert counts == {"openai_files": 1, "s3_objects": 4}
+    assert fake_s3.objects == before
+    assert file_id in fake_openai.file_data
+
+
+def test_delete_objects_sends_chunks_of_1000_keys(
+    fake_s3: FakeS3Client
+) -> None:
+    """Keys are deleted with as few DeleteObjects requests as possible."""
+    keys = [f"checkpoints/{i}.json" for i in range(2500)]
+    for key in keys:
+        fake_s3.objects[key] = b"{}"
+
+    assert s3_utils.delete_objects(keys) == []
+    assert fake_s3.objects == {}
+    assert fake_s3.calls["DeleteObjects"] == 3
@@ -0,0 +1,175 @@
+"""Tests for control-file compaction and the archive query API."""
+import gzip
+import json
+from datetime import datetime
+from typing import Any, Dict, List
+
+import pytest
+from fakes import FakeS3Client
+
+from shared.config import CONTROL_ARCHIVE_PREFIX, CONTROL_KEY
+from shared.utils import control_file_utils, s3_utils
+from shared.utils.batch_record_utils import BatchRecord
+
+NOW = datetime(2030, 1, 20, 12, 0, 0)
+
+
+def _batch(batch_id: str, status: str, updated: str) -> Dict[str, Any]:
+    return {
+        "batch_id": batch_id,
+        "target_date": updated[:10],
+        "status": status,
+        "updated_at": updated,
+    }
+
+
+@pytest.fixture(name="fake_s3")
+def fixture_fake_s3(fake_s3: FakeS3Client) -> FakeS3Client:
+    """Serve a control file with old, recent and in-flight batches."""
+    fake_s3.objects[CONTROL_KEY] = json.dumps({"batches": [
+        _batch("old-done", "completed", "2030-01-02T08:00:00"),
+        _batch("old-failed", "failed", "2030-01-03T08:00:00"),
+        _batch("old-submitted", "submitted", "2030-01-02T08:00:00"),
+        _batch("recent-done", "completed", "2030-01-19T08:00:00"),
+    ]}).encode("utf-8")
+    return fake_s3
+
+
+def test_compaction_archives_old_terminal_batches(
+    fake_s3: FakeS3Client
+) -> None:
+    """Only terminal batches past the retention window leave the file."""
+    assert control_file_utils.compact_control_data(7, now=NOW) == 2
+
+    live = control_file_utils.get_control_data()["batches"]
+    assert [b["batch_id"] for b in live] == ["old-submitted", "recent-done"]
+
+    archived = control_file_utils.query_archived_batches(
+        "2030-01-01", "2030-01-31"
+    )
+    assert [b["batch_id"] for b in archived] == ["old-done", "old-failed"]
+    assert control_file_utils.query_archived_batches(
+        "2030-01-01", "2030-01-31", status="failed"
+    )[0]["batch_id"] == "old-failed"
+    assert control_file_utils.query_archived_batches("2030-01-02") == [
+        archived[0]
+    ]
+
+
+def test_unreadable_archives_are_skipped(fake_s3: FakeS3Client) -> None:
+    """Truncated, corrupt or non-JSON archives do not break queries."""
+    assert control_file_utils.compact_control_data(7, now=NOW) == 2
+    prefix = f"{CONTROL_ARCHIVE_PREFIX}/2030/01/02/"
+    fake_s3.objects[prefix + "batches-a.jsonl.gz"] = b"\x1f\x8b\x08"
+    fake_s3.objects[prefix + "batches-b.jsonl.gz"] = b"not gzip"
+    fake_s3.objects[prefix + "batches-c.jsonl.gz"] = gzip.compress(b"{")
+
+    archived = control_file_utils.query_archived_batches(
+        "2030-01-01", "2030-01-31"
+    )
+
+    assert [b["batch_id"] for b in archived] == ["old-done", "old-failed"]
+
+
+def test_compaction_yields_to_concurrent_update(
+    fake_s3: FakeS3Client, monkeypatch: Any
+) -> None:
+    """A control-file change during compaction is kept, not overwritten."""
+    read = s3_utils.get_s3_object_with_etag
+
+    def read_then_update(key: str, **kwargs: Any) -> Any:
+        result = read(key, **kwargs)
+        fake_s3.objects[CONTROL_KEY] = json.dumps({"batches": []}).encode()
+        return result
+
+    monkeypatch.setattr(
+        control_file_utils, "get_s3_object_with_etag", read_then_update
+    )
+
+    assert control_file_utils.compact_control_data(7, now=NOW) == 0
+    assert json.loads(fake_s3.objects[CONTROL_KEY]) == {"batches": []}
+    assert not [k for k in fake_s3.objects if k.startswith("control-archive")]
+
+
+def test_repeated_reads_revalidate_instead_of_downloading(
+    fake_s3: FakeS3Client
+) -> None:
+    """Unchanged control data costs a 304; writes keep the cache current."""
+    first = control_file_utils.get_control_data()
+    first["batches"][0]["status"] = "cancelled"
+    first["batches"].clear()
+    second = control_file_utils.get_control_data()
+    assert second["batches"][0]["status"] == "completed"
+    assert fake_s3.calls["GetObjectNotModified"] == 1
+
+    assert control_file_utils.update_batch_status(
+        batch_id="old-submitted", new_status="completed"
+    )
+    batches = control_file_utils.get_completed_batches()
+    assert fake_s3.calls["GetObjectNotModified"] == 3
+    assert "old-submitted" in [b["batch_id"] for b in batches]
+
+    # A change by another process is picked up on the next read
+    fake_s3.objects[CONTROL_KEY] = json.dumps({"batches": []}).encode()
+    assert control_file_utils.get_control_data() == {"batches": []}
+
+
+def test_update_is_reapplied_after_a_concurrent_write(
+    fake_s3: FakeS3Client, monkeypatch: Any
+) -> None:
+    """A write by another process between read and write is kept."""
+    read = s3_utils.get_s3_object_with_etag
+    raced: List[bool] = []
+
+    def read_then_add_batch(key: str, **kwargs: Any) -> Any:
+        result = read(key, **kwargs)
+        if not raced:
+            raced.append(True)
+            control = json.loads(fake_s3.objects[CONTROL_KEY])
+            control["batches"].append(
+                _batch("other", "prepared", "2030-01-20T08:00:00")
+            )
+            fake_s3.objects[CONTROL_KEY] = json.dumps(control).encode()
+        return result
+
+    monkeypatch.setattr(
+        control_file_utils, "get_s3_object_with_etag", read_then_add_batch
+    )
+
+    assert control_file_utils.update_batch_status(
+        batch_id="old-submitted", new_status="completed"
+    )
+
+    batches = {
+        b["batch_id"]: b["status"]
+        for b in json.loads(fake_s3.objects[CONTROL_KEY])["batches"]
+    }
+    assert batches["other"] == "prepared"
+    assert batches["old-submitted"] == "completed"
+    assert fake_s3.calls["PutObject"] == 2
+
+
+def test_queries_use_the_index_and_reject_invalid_transitions(
+    fake_s3: FakeS3Client
+) -> None:
+    """Batches are typed records; a terminal batch cannot move back."""
+    batch = control_file_utils.get_batch_by_id("old-submitted")
+    assert isinstance(batch, BatchRecord)
+    assert control_file_utils.get_pending_batches() == [batch]
+    assert control_file_utils.get_batch_by_id("missing") is None
+
+    assert not control_file_utils.update_batch_status(
+        batch_id="old-done", new_status="failed"
+    )
+    assert control_file_utils.update_batch_status(
+        batch_id="old-failed", new_status="completed",
+        additional_data={"mode": "express", "published": 3}
+    )
+    control = json.loads(fake_s3.objects[CONTROL_KEY])
+    statuses = {b["batch_id"]: b["status"] for b in control["batches"]}
+    assert statuses["old-done"] == "completed"
+    assert statuses["old-failed"] == "completed"
+    assert control["batches"][1]["published"] == 3
+    assert [
+        b["batch_id"] for b in control_file_utils.get_completed_batches()
+    ] == ["old-done", "old-failed", "recent-done"]
@@ -0,0 +1,40 @@
+"""Tests for stage completion events on the local queue backend."""
+from typing import Any
+
+from shared.utils import event_utils
+
+
+def test_publish_list_and_ack(monkeypatch: Any, tmp_path: Any) -> None:
+    """Published events are listed oldest first until acknowledged."""
+    monkeypatch.setattr(event_utils, "EVENT_BACKEND", "local")
+    monkeypatch.setattr(event_utils, "EVENT_QUEUE_DIR", str(tmp_path))
+
+    first = event_utils.publish_stage_event(
+        "prepare", payload={"target_date": "2025-01-02"}
+    )
+    second = event_utils.publish_stage_event(
+        "upload", event_utils.EVENT_FAILED
+    )
+    assert first is not None and second is not None
+
+    pending = event_utils.list_pending_events()
+    assert [e["stage"] for e in pending] == ["prepare", "upload"]
+    assert pending[0]["payload"] == {"target_date": "2025-01-02"}
+    assert pending[1]["status"] == event_utils.EVENT_FAILED
+
+    assert event_utils.ack_event(pending[0])
+    assert [e["event_id"] for e in event_utils.list_pending_events()] == [
+        second["event_id"]
+    ]
+    assert (tmp_path / "processed").is_dir()
+
+
+def test_disabled_backend_publishes_nothing(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """With the default 'none' backend no event is stored."""
+    monkeypatch.setattr(event_utils, "EVENT_BACKEND", "none")
+    monkeypatch.setattr(event_utils, "EVENT_QUEUE_DIR", str(tmp_path))
+
+    assert event_utils.publish_stage_event("prepare") is None
+    assert event_utils.list_pending_events() == []
@@ -1,6 +1,6 @@
 """Tests for get_zodiac_sign, which expects ISO YYYY-MM-DD birth dates."""
 import pytest
-from batch_prepare_input import get_zodiac_sign
+from batch_prepare_input import assign_zodiac_signs, get_zodiac_sign
 
 
 @pytest.mark.parametrize(
@@ -34,3 +34,12 @@ def test_returns_correct_sign(birthdate: str, expected: str) -> None:
 def test_unparseable_returns_unknown(bad: str) -> None:
     """An unparseable birthdate string yields "Unknown"."""
     assert get_zodiac_sign(bad) == "Unknown"
+
+
+def test_bulk_assignment_matches_single_lookup() -> None:
+    """Bulk assignment keeps roster order and agrees with get_zodiac_sign."""
+    birth_dates = ["2001-09-03", "garbage", "2000-01-20", "2001-09-03"]
+
+    assert assign_zodiac_signs(birth_dates) == [
+        get_zodiac_sign(birthdate) for birthdate in birth_dates
+    ]
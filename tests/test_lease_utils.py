@@ -0,0 +1,55 @@
+"""Tests for S3 worker leases and byte-range splitting."""
+import pytest
+from fakes import FakeS3Client
+
+from shared.utils import lease_utils
+
+
+def test_lease_is_exclusive_until_it_expires(fake_s3: FakeS3Client) -> None:
+    """Another worker only gets a lease after its holder lets it expire."""
+    key = lease_utils.lease_key("batch-1", "batch")
+
+    held = lease_utils.acquire_lease(key, owner="worker-a", ttl=60)
+    assert held is not None
+    assert lease_utils.acquire_lease(key, owner="worker-b") is None
+
+    assert lease_utils.release_lease(held)
+    taken = lease_utils.acquire_lease(key, owner="worker-b", ttl=60)
+    assert taken is not None and taken["owner"] == "worker-b"
+
+    # The old holder's ETag is stale, so it can no longer complete the work
+    assert not lease_utils.complete_lease(held)
+    assert lease_utils.complete_lease(taken, {"published": 3})
+    assert lease_utils.acquire_lease(key, owner="worker-a") is None
+    assert lease_utils.read_lease(key)["data"] == {"published": 3}
+
+
+def test_expired_lease_is_taken_over(fake_s3: FakeS3Client) -> None:
+    """A crashed worker's lease is reassigned once its TTL has passed."""
+    key = lease_utils.lease_key("batch-1", "ranges", "0-10")
+    crashed = lease_utils.acquire_lease(key, owner="worker-a", ttl=-1)
+    assert crashed is not None
+
+    assert lease_utils.acquire_lease(key, owner="worker-b") is not None
+    assert not lease_utils.renew_lease(crashed)
+
+
+@pytest.mark.parametrize("range_bytes", [1, 7, 16, 1000])
+def test_line_ranges_cover_every_line_once(
+    fake_s3: FakeS3Client, range_bytes: int
+) -> None:
+    """Every line belongs to exactly one range, whatever the range size."""
+    lines = [f'{{"custom_id": "rider-{i}", "x": "{"y" * i}"}}'
+             for i in range(12)]
+    body = "".join(line + "\n" for line in lines).encode("utf-8")
+    fake_s3.objects["results.jsonl"] = body
+
+    read = []
+    for start, end in lease_utils.split_byte_ranges(len(body), range_bytes):
+        text = lease_utils.read_line_range(
+            "results.jsonl", start, end, len(body)
+        )
+        assert text is not None
+        read.extend(text.splitlines())
+
+    assert read == lines
@@ -0,0 +1,76 @@
+"""Tests for JSON log formatting, lazy queueing and message sampling."""
+import json
+import logging
+import queue
+from typing import Any, List
+
+from shared.utils.logging_utils import (
+    JsonFormatter,
+    LogSampler,
+    _LazyQueueHandler,
+)
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def _logger(name: str) -> Any:
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = _ListHandler()
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def test_json_formatter_includes_extras() -> None:
+    """Records become one JSON object including ``extra`` fields."""
+    record = logging.makeLogRecord({
+        "name": "batch_download", "levelname": "INFO", "levelno": 20,
+        "msg": "Uploaded %d horoscopes", "args": (3,), "batch_id": "b1",
+    })
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["message"] == "Uploaded 3 horoscopes"
+    assert entry["logger"] == "batch_download"
+    assert entry["batch_id"] == "b1"
+
+
+def test_queue_handler_does_not_format_in_caller() -> None:
+    """Message arguments are still unmerged when the record is queued."""
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue()
+    logger = logging.getLogger("lazy_test")
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.addHandler(_LazyQueueHandler(log_queue))
+
+    logger.warning("rider %s", "rider-1")
+
+    record = log_queue.get_nowait()
+    assert record.msg == "rider %s" and record.args == ("rider-1",)
+
+
+def test_sampler_logs_first_and_every_nth() -> None:
+    """Only sampled occurrences are written, plus one summary line."""
+    logger, handler = _logger("sampler_test")
+    sampler = LogSampler(logger, "Uploaded", first=2, every=5)
+
+    for i in range(1, 12):
+        sampler.log("Uploaded %d", i)
+    sampler.summary()
+
+    messages = [r.getMessage() for r in handler.records]
+    assert messages[:4] == [
+        "Uploaded 1", "Uploaded 2", "Uploaded 5", "Uploaded 10"
+    ]
+    assert messages[-1] == (
+        "Uploaded: 11 occurrences, 7 not logged individually"
+    )
@@ -0,0 +1,43 @@
+"""Tests for rider IDs, custom IDs and manifest keys."""
+from shared.utils.manifest_utils import (
+    custom_id_for,
+    derive_rider_id,
+    manifest_key_for,
+)
+
+
+def test_roster_id_is_used_when_present() -> None:
+    """An explicit roster ID becomes the rider ID."""
+    assert derive_rider_id({"id": 42, "name": "A"}, set()) == "42"
+
+
+def test_unsafe_roster_id_falls_back_to_derived_id() -> None:
+    """Roster IDs that would break the horoscope's S3 key are replaced."""
+    rider = {"name": "Blanka Vas", "birth_date": "2001-09-03"}
+    derived = derive_rider_id(rider, set())
+    for unsafe in ("../other", "a/b", "with space", "x" * 65):
+        assert derive_rider_id({**rider, "id": unsafe}, set()) == derived
+
+
+def test_derived_id_is_stable() -> None:
+    """Riders without an ID get the same hash-based ID every day."""
+    rider = {"name": "Blanka Vas", "birth_date": "2001-09-03"}
+    assert derive_rider_id(rider, set()) == derive_rider_id(rider, set())
+
+
+def test_duplicates_get_unique_ids() -> None:
+    """Identical riders in one batch do not collide."""
+    rider = {"name": "Blanka Vas", "birth_date": "2001-09-03"}
+    used: set = set()
+    first = derive_rider_id(rider, used)
+    second = derive_rider_id(rider, used)
+
+    assert second == f"{first}-2"
+    assert custom_id_for(first) != custom_id_for(second)
+
+
+def test_manifest_key_sits_next_to_input_file() -> None:
+    """The manifest key is derived from the batch input key."""
+    assert manifest_key_for("openai/input/2030-01-01-ab.jsonl") == (
+        "openai/input/2030-01-01-ab.manifest.json"
+    )
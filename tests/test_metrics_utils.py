@@ -0,0 +1,72 @@
+"""Tests for metric aggregation and the CloudWatch EMF document."""
+from typing import Any, Dict, Iterator
+
+import pytest
+
+from shared.utils import metrics_utils
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics() -> Iterator[None]:
+    """Start and end every test with an empty registry."""
+    metrics_utils.reset_metrics()
+    yield
+    metrics_utils.reset_metrics()
+
+
+def test_spans_are_aggregated_in_emf_document() -> None:
+    """Each span becomes count, total, max and p95 metrics."""
+    for ms in (10.0, 20.0, 30.0):
+        metrics_utils.record_timing("S3GetObject", ms)
+    metrics_utils.increment("S3BytesRead", 512, "Bytes")
+
+    doc: Dict[str, Any] = metrics_utils.build_emf_document(
+        "download", timestamp_ms=1
+    )
+
+    assert doc["S3GetObjectCount"] == 3
+    assert doc["S3GetObjectTime"] == 60.0
+    assert doc["S3GetObjectMaxTime"] == 30.0
+    assert doc["S3BytesRead"] == 512
+    assert doc["Stage"] == "download"
+    directive = doc["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Dimensions"] == [["Stage", "Environment"]]
+    units = {m["Name"]: m["Unit"] for m in directive["Metrics"]}
+    assert units["S3GetObjectTime"] == "Milliseconds"
+    assert units["S3BytesRead"] == "Bytes"
+
+
+def test_timing_memory_is_bounded() -> None:
+    """Totals stay exact while only a fixed sample of durations is kept."""
+    for ms in range(1, 10001):
+        metrics_utils.record_timing("ResultLine", float(ms))
+
+    doc: Dict[str, Any] = metrics_utils.build_emf_document("download")
+
+    timing = metrics_utils._timings["ResultLine"]
+    assert len(timing.samples) == metrics_utils.TIMING_SAMPLE_SIZE
+    assert doc["ResultLineCount"] == 10000
+    assert doc["ResultLineTime"] == 50005000.0
+    assert doc["ResultLineMaxTime"] == 10000.0
+    assert 9000 <= doc["ResultLineP95Time"] <= 10000
+
+
+def test_span_context_manager_records_on_error() -> None:
+    """A failing block is still timed."""
+    with pytest.raises(RuntimeError):
+        with metrics_utils.span("Boom"):
+            raise RuntimeError("boom")
+
+    doc = metrics_utils.build_emf_document("prepare")
+    assert doc["BoomCount"] == 1
+
+
+def test_flush_writes_one_emf_line_and_resets(capsys: Any) -> None:
+    """Flushing prints a single JSON line and clears the registry."""
+    metrics_utils.increment("RequestsPrepared", 3)
+
+    metrics_utils.flush_metrics("prepare")
+
+    out = capsys.readouterr().out.strip().splitlines()
+    assert len(out) == 1 and '"RequestsPrepared":3' in out[0]
+    assert "RequestsPrepared" not in metrics_utils.build_emf_document("x")
@@ -0,0 +1,89 @@
+"""Tests for the batch latency model and the plans made from it."""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from batch_planner import planner_report
+
+from shared.utils import planner_utils, schedule_utils
+
+START = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+def _history() -> List[Dict[str, Any]]:
+    """Batches of 30 min + 1 min per 1000 requests, twice as slow at 12h."""
+    batches = []
+    for day in range(10):
+        for hour, size in ((0, 1000), (12, 5000), (6, 20000)):
+            submitted = START + timedelta(days=day, hours=hour)
+            seconds = (1800 + 0.06 * size) * (2 if hour == 12 else 1)
+            batches.append({
+                "batch_id": f"{day}-{hour}",
+                "status": "completed",
+                "rider_count": size,
+                "submitted_at": submitted.isoformat(),
+                "completed_at": (
+                    submitted + timedelta(seconds=seconds)
+                ).isoformat(),
+            })
+    batches.append({"batch_id": "open", "status": "submitted"})
+    return batches
+
+
+def test_model_learns_size_and_hour_effects() -> None:
+    """Slow submission hours get a factor above the others."""
+    samples = planner_utils.history_samples(_history())
+    model = planner_utils.fit_latency_model(samples, min_samples=10)
+
+    assert model is not None and model.samples == 30
+    assert model.slope > 0
+    assert model.hourly[12] > 1.2 > 1 > model.hourly[0]
+    assert model.hourly[18] == 1.0
+    assert planner_utils.fit_latency_model(samples[:5], 10) is None
+
+
+def test_plans_trade_batch_size_against_overhead() -> None:
+    """More shards pay off until the per-batch overhead dominates."""
+    model = planner_utils.LatencyModel(20, 600.0, 0.1, (1.0,) * 24)
+
+    assert planner_utils.plan_shards(
+        model, 100000, START, planner_utils.ShardLimits(50000, 1000, 60)
+    ) == 13
+    assert planner_utils.plan_shards(
+        model, 100000, START, planner_utils.ShardLimits(50000, 1000, 100000)
+    ) == 2
+
+
+def test_submission_is_deferred_only_when_it_publishes_earlier() -> None:
+    """A faster hour is chosen if it still beats submitting now."""
+    hourly = [4.0] * 24
+    hourly[3] = 1.0
+    model = planner_utils.LatencyModel(20, 3600.0, 0.0, tuple(hourly))
+    now = START + timedelta(hours=1, minutes=30)
+
+    planned = planner_utils.plan_submission(model, 1000, now)
+    assert planned == START + timedelta(hours=3)
+    assert schedule_utils.submission_due(
+        {"submit_after": planned.isoformat()}, now
+    ) is False
+
+    # Too late for the deadline, so the batch goes now
+    deadline = START + timedelta(hours=3, minutes=30)
+    assert planner_utils.plan_submission(model, 1000, now, deadline) == now
+    assert schedule_utils.submission_due({}, now)
+
+
+def test_report_describes_model_and_plan() -> None:
+    """The CLI report shows the fit, predictions and a roster plan."""
+    batches = _history()
+    model = planner_utils.fit_latency_model(
+        planner_utils.history_samples(batches), min_samples=10
+    )
+
+    report = "\n".join(planner_report(
+        batches, model, [1000, 50000], 120000, START
+    ))
+
+    assert "History: 31 batches, 30 samples" in report
+    assert "min per 1000 requests" in report
+    assert "Plan for 120,000 riders" in report
+    assert "no completed batch has a recorded prediction" in report
@@ -0,0 +1,42 @@
+"""Tests for the opt-in stage profiling hooks."""
+import os
+from typing import Any
+
+from shared.utils import profiling_utils
+
+
+def test_disabled_by_default(monkeypatch: Any, tmp_path: Any) -> None:
+    """Without PROFILE_MODE nothing is written."""
+    monkeypatch.setattr(profiling_utils, "PROFILE_MODE", "")
+    monkeypatch.setattr(profiling_utils, "LOG_DIR", str(tmp_path))
+
+    with profiling_utils.profile_stage("prepare"):
+        pass
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_writes_and_uploads_artifacts(monkeypatch: Any, tmp_path: Any) -> None:
+    """Enabled profilers write their reports and upload them to S3."""
+    uploads = []
+    monkeypatch.setattr(
+        profiling_utils, "PROFILE_MODE", "cprofile, tracemalloc, unknown"
+    )
+    monkeypatch.setattr(profiling_utils, "PROFILE_UPLOAD", True)
+    monkeypatch.setattr(profiling_utils, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        profiling_utils,
+        "upload_file_to_s3",
+        lambda path, key: uploads.append(key) or True,
+    )
+
+    with profiling_utils.profile_stage("download"):
+        sorted(str(i) for i in range(1000))
+
+    names = os.listdir(tmp_path)
+    assert len(names) == 3
+    assert any(name.endswith(".prof") for name in names)
+    assert any(name.endswith("-tracemalloc.txt") for name in names)
+    assert any(name.endswith("-cprofile.txt") for name in names)
+    assert len(uploads) == 3
+    assert all(key.startswith("diagnostics/download/") for key in uploads)
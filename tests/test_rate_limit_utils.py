@@ -0,0 +1,79 @@
+"""Tests for the token bucket and the token estimates of requests."""
+import asyncio
+from typing import Any, List
+
+from shared.utils import rate_limit_utils
+from shared.utils.rate_limit_utils import (
+    DEFAULT_COMPLETION_TOKENS,
+    TokenBucket,
+    estimate_prompt_tokens,
+    estimate_request_tokens,
+)
+
+
+def test_bucket_allows_burst_up_to_capacity() -> None:
+    """A fresh bucket serves its full capacity without waiting."""
+    async def spend() -> float:
+        bucket = TokenBucket(per_minute=60)
+        waited = 0.0
+        for _ in range(60):
+            waited += await bucket.acquire(1)
+        return waited
+
+    assert asyncio.run(spend()) == 0.0
+
+
+def test_bucket_waits_once_empty() -> None:
+    """Spending past the capacity waits for the refill."""
+    async def spend() -> float:
+        bucket = TokenBucket(per_minute=6000)  # 100 units per second
+        await bucket.acquire(6000)
+        return await bucket.acquire(5)
+
+    assert asyncio.run(spend()) > 0.0
+
+
+def test_oversized_request_is_clamped_to_capacity() -> None:
+    """A request larger than the bucket still proceeds from a full bucket."""
+    async def spend() -> float:
+        bucket = TokenBucket(per_minute=10)
+        return await bucket.acquire(1000)
+
+    assert asyncio.run(spend()) == 0.0
+
+
+def test_estimate_uses_max_tokens_when_set(monkeypatch: Any) -> None:
+    """The completion cap is added to the prompt estimate."""
+    monkeypatch.setattr(rate_limit_utils, "_encoding", lambda model: None)
+    body = {
+        "messages": [{"role": "user", "content": "x" * 400}],
+        "max_tokens": 50,
+    }
+    # 100 content tokens, plus the message and reply overhead
+    assert estimate_request_tokens(body) == 100 + 3 + 3 + 50
+
+
+def test_estimate_defaults_completion_allowance(monkeypatch: Any) -> None:
+    """Requests without a cap use the default completion allowance."""
+    monkeypatch.setattr(rate_limit_utils, "_encoding", lambda model: None)
+    body = {"messages": [{"role": "user", "content": "x" * 40}]}
+    assert estimate_request_tokens(body) == (
+        10 + 3 + 3 + DEFAULT_COMPLETION_TOKENS
+    )
+
+
+def test_prompt_tokens_use_the_tokenizer(monkeypatch: Any) -> None:
+    """With tiktoken installed, messages are tokenized for the model."""
+    class Encoding:
+        def encode(self, text: str, **_: Any) -> List[str]:
+            return text.split()
+
+    monkeypatch.setattr(
+        rate_limit_utils, "_encoding", lambda model: Encoding()
+    )
+    body = {"model": "gpt-4.1-nano", "messages": [
+        {"role": "system", "content": "You write horoscopes."},
+        {"role": "user", "content": "Ride well, Blanka."},
+    ]}
+
+    assert estimate_prompt_tokens(body) == 3 + 3 + 3 * 2 + 3
@@ -0,0 +1,144 @@
+"""Tests for retries, circuit breaking and hedged reads."""
+import time
+from typing import Any, Callable, Iterator, List
+
+import pytest
+from botocore.exceptions import ClientError
+from fakes import FakeS3Client
+
+from shared.utils import metrics_utils, resilience_utils, s3_utils
+from shared.utils.resilience_utils import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    ServiceGuard,
+)
+
+
+def _error(code: str, status: int) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": code},
+         "ResponseMetadata": {"HTTPStatusCode": status}},
+        "GetObject"
+    )
+
+
+def _failing(errors: List[Exception], result: Any = "ok") -> Callable[[], Any]:
+    """Return a call that raises ``errors`` in turn, then succeeds."""
+    calls: List[int] = []
+
+    def call() -> Any:
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    call.calls = calls  # type: ignore[attr-defined]
+    return call
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch: Any) -> Iterator[None]:
+    """Retry immediately and start every test with empty metrics."""
+    monkeypatch.setattr(resilience_utils, "backoff_delay", lambda a: 0.0)
+    metrics_utils.reset_metrics()
+    yield
+    metrics_utils.reset_metrics()
+
+
+def _metric(name: str) -> Any:
+    return metrics_utils.build_emf_document("test", timestamp_ms=1).get(name)
+
+
+def test_throttled_calls_are_retried_and_paced() -> None:
+    """SlowDown is retried and slows down later requests."""
+    guard = ServiceGuard("S3", RetryPolicy(max_attempts=3))
+    call = _failing([_error("SlowDown", 503), _error("SlowDown", 503)])
+
+    assert guard.call(call) == "ok"
+    assert len(call.calls) == 3  # type: ignore[attr-defined]
+    assert guard.pacer.interval > 0
+    assert _metric("S3Retries") == 2
+    assert _metric("S3Throttled") == 2
+
+
+def test_non_idempotent_calls_only_retry_throttling() -> None:
+    """A 500 may have been applied, so a create is not repeated."""
+    guard = ServiceGuard("OpenAI", RetryPolicy(max_attempts=3))
+    with pytest.raises(ClientError):
+        guard.call(_failing([_error("InternalError", 500)]), idempotent=False)
+    assert guard.call(
+        _failing([_error("SlowDown", 503)]), idempotent=False
+    ) == "ok"
+
+
+def test_client_errors_are_not_retried() -> None:
+    """Missing keys and failed preconditions surface immediately."""
+    guard = ServiceGuard("S3", breaker=CircuitBreaker("S3", 1))
+    call = _failing([_error("PreconditionFailed", 412)])
+    with pytest.raises(ClientError):
+        guard.call(call)
+    assert len(call.calls) == 1  # type: ignore[attr-defined]
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_opens_and_recovers_through_probe() -> None:
+    """Repeated failures fail fast until a probe succeeds."""
+    breaker = CircuitBreaker("S3", failure_threshold=2, reset_seconds=0.05)
+    guard = ServiceGuard("S3", RetryPolicy(max_attempts=1), breaker)
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            guard.call(_failing([_error("ServiceUnavailable", 503)]))
+
+    rejected = _failing([])
+    with pytest.raises(CircuitOpenError):
+        guard.call(rejected)
+    assert rejected.calls == []  # type: ignore[attr-defined]
+
+    time.sleep(0.06)
+    assert guard.call(_failing([])) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_slow_reads_are_hedged() -> None:
+    """A read slower than the recent p95 is duplicated."""
+    guard = ServiceGuard(
+        "S3", RetryPolicy(hedged_reads=True, hedge_min_seconds=0.01)
+    )
+    for _ in range(resilience_utils.HEDGE_MIN_SAMPLES):
+        guard.read(lambda: "warm")
+
+    calls: List[int] = []
+
+    def slow_first() -> str:
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    started = time.monotonic()
+    assert guard.read(slow_first) == "fast"
+    assert time.monotonic() - started < 0.4
+    assert _metric("S3HedgeWins") == 1
+
+
+def test_s3_utils_retries_through_guard(
+    monkeypatch: Any, fake_s3: FakeS3Client
+) -> None:
+    """A throttled S3 read succeeds on retry instead of returning None."""
+    fake_s3.objects["a.json"] = b"{}"
+    get_object = fake_s3.get_object
+    throttled: List[int] = []
+
+    def throttle_once(**kwargs: Any) -> Any:
+        if not throttled:
+            throttled.append(1)
+            raise _error("SlowDown", 503)
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(fake_s3, "get_object", throttle_once)
+    # Keep the shared guard's pacing from slowing down later tests
+    monkeypatch.setattr(resilience_utils.S3_GUARD.pacer, "interval", 0.0)
+
+    assert s3_utils.get_s3_object("a.json") == b"{}"
+    assert throttled == [1]
@@ -0,0 +1,84 @@
+"""Tests for publishing batch results as horoscopes."""
+import json
+from typing import Any, Dict
+
+from shared.utils import result_utils
+
+
+def _line(custom_id: str, **fields: Any) -> str:
+    return json.dumps({"custom_id": custom_id, **fields})
+
+
+def test_process_results_collects_failed_ids(monkeypatch: Any) -> None:
+    """Lines without usable output are reported as failed."""
+    monkeypatch.setattr(result_utils, "upload_json_to_s3", lambda k, d: True)
+    ok = {"status_code": 200, "body": {"choices": [
+        {"message": {"content": "Ride on."}}
+    ]}}
+    result_text = "\n".join([
+        _line("a", response=ok),
+        _line("b", response={"status_code": 500, "body": {}}),
+        _line("c", response=None, error={"code": "server_error"}),
+    ])
+    tally = result_utils.ResultTally.empty(track_published=True)
+
+    assert result_utils.process_results(result_text, "2030-01-01", tally=tally)
+    assert tally.failed_ids == {"b", "c"}
+    assert tally.published_ids == {"a"}
+
+
+def test_unparseable_lines_are_retried_by_custom_id(monkeypatch: Any) -> None:
+    """A truncated line still names its rider, so it is retried."""
+    monkeypatch.setattr(result_utils, "upload_json_to_s3", lambda k, d: True)
+    result_text = "\n".join([
+        '{"id": "req-1", "custom_id": "rider-7", "response": {"status_',
+        '{"id": "req-2", "respo',
+    ])
+    tally = result_utils.ResultTally.empty()
+
+    assert not result_utils.process_results(
+        result_text, "2030-01-01", tally=tally
+    )
+    assert tally.failed_ids == {"rider-7"}
+
+
+def test_process_results_routes_through_manifest(monkeypatch: Any) -> None:
+    """Riders sharing a name get separate keys and full metadata."""
+    uploads: Dict[str, Any] = {}
+    monkeypatch.setattr(
+        result_utils,
+        "upload_json_to_s3",
+        lambda key, data: uploads.setdefault(key, data) is data,
+    )
+    ok = {"status_code": 200, "body": {"choices": [
+        {"message": {"content": "Ride on."}}
+    ]}}
+    manifest = {
+        "rider-1": ("1", "Blanka Vas", "Virgo"),
+        "rider-2": ("2", "Blanka Vas", "Leo"),
+    }
+    result_text = "\n".join(
+        [_line("rider-1", response=ok), _line("rider-2", response=ok)]
+    )
+
+    assert result_utils.process_results(
+        result_text, "2030-01-01", manifest=manifest
+    )
+    assert uploads["horoscope/2030-01-01/1.json"]["sign"] == "Virgo"
+    assert uploads["horoscope/2030-01-01/2.json"] == {
+        "name": "Blanka Vas",
+        "sign": "Leo",
+        "horoscope": "Ride on.",
+        "rider_id": "2",
+    }
+
+
+def test_published_ids_are_rebuilt_up_to_the_checkpoint() -> None:
+    """Lines before the checkpoint that did not fail were published."""
+    result_text = "\n".join([
+        _line("a"), "{not json", _line("b"), _line("c"), _line("d"),
+    ])
+
+    assert result_utils.published_custom_ids(
+        result_text, 4, failed_ids={"b"}
+    ) == {"a", "c"}
@@ -0,0 +1,50 @@
+"""Tests for loading the rider roster in JSON and columnar formats."""
+import json
+from typing import Any
+
+import pytest
+from fakes import FakeS3Client
+
+from shared.utils import roster_utils
+
+RIDERS = [
+    {"name": "blanka vas", "birth_date": "2001-09-03", "team": "SD Worx"},
+    {"id": 7, "name": "tadej pogacar", "birth_date": "1998-09-21"},
+]
+
+
+@pytest.fixture(name="fake_s3")
+def fixture_fake_s3(
+    fake_s3: FakeS3Client, monkeypatch: Any, tmp_path: Any
+) -> FakeS3Client:
+    """Serve a JSON roster from the in-memory bucket."""
+    fake_s3.objects["riders.json"] = json.dumps(RIDERS).encode("utf-8")
+    monkeypatch.setattr(roster_utils, "TEMP_DIR", str(tmp_path))
+    return fake_s3
+
+
+def test_json_roster_is_loaded_as_columns(fake_s3: FakeS3Client) -> None:
+    """Only the columns prepare uses are kept."""
+    roster = roster_utils.load_roster("riders.json")
+
+    assert roster is not None
+    assert roster.names == ["blanka vas", "tadej pogacar"]
+    assert roster.birth_dates == ["2001-09-03", "1998-09-21"]
+    assert roster.rider(1) == {
+        "id": 7, "name": "tadej pogacar", "birth_date": "1998-09-21"
+    }
+
+
+@pytest.mark.parametrize("key", ["riders.arrow", "riders.parquet"])
+def test_converted_roster_round_trips(
+    fake_s3: FakeS3Client, key: str
+) -> None:
+    """A converted columnar roster loads the same riders."""
+    pytest.importorskip("pyarrow")
+
+    assert roster_utils.convert_roster("riders.json", key)
+    roster = roster_utils.load_roster(key)
+
+    assert roster is not None
+    assert roster.names == ["blanka vas", "tadej pogacar"]
+    assert roster.ids == [None, "7"]
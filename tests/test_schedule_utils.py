@@ -0,0 +1,73 @@
+"""Tests for delivery deadlines and deadline-ordered batches."""
+from datetime import datetime, timezone
+from typing import Any
+
+from shared.utils import schedule_utils
+
+
+def test_deadline_is_delivery_hour_local_time(monkeypatch: Any) -> None:
+    """Deadlines follow the timezone, including daylight saving time."""
+    monkeypatch.setattr(schedule_utils, "DELIVERY_HOUR", 6)
+
+    tokyo = schedule_utils.delivery_deadline("2030-07-01", "Asia/Tokyo")
+    paris = schedule_utils.delivery_deadline("2030-07-01", "Europe/Paris")
+    unknown = schedule_utils.delivery_deadline("2030-07-01", "Mars/Olympus")
+
+    assert tokyo.isoformat() == "2030-06-30T21:00:00+00:00"
+    assert paris.isoformat() == "2030-07-01T04:00:00+00:00"
+    assert unknown.isoformat() == "2030-07-01T06:00:00+00:00"
+
+
+def test_partitions_group_close_deadlines_earliest_first() -> None:
+    """Riders are grouped into windows starting at the earliest deadline."""
+    timezones = [
+        "America/New_York", "Asia/Tokyo", None, "Australia/Sydney",
+        "Europe/Paris", "Asia/Tokyo",
+    ]
+
+    partitions = schedule_utils.partition_by_deadline(
+        timezones, "2030-01-15", window_hours=6
+    )
+
+    assert [indices for _, indices in partitions] == [
+        [3, 1, 5], [4, 2], [0]
+    ]
+    deadlines = [deadline for deadline, _ in partitions]
+    assert deadlines == sorted(deadlines)
+    assert len(schedule_utils.partition_by_deadline(
+        timezones, "2030-01-15", window_hours=0
+    )) == 5
+
+
+def test_batches_sort_by_deadline_with_fallbacks() -> None:
+    """Batches without a deadline use their target date; others go last."""
+    batches = [
+        {"batch_id": "none"},
+        {"batch_id": "late", "target_date": "2030-01-02"},
+        {"batch_id": "tokyo", "deadline": "2030-01-01T21:00:00+00:00",
+         "target_date": "2030-01-02"},
+        {"batch_id": "early", "target_date": "2030-01-01"},
+    ]
+
+    ordered = schedule_utils.sort_by_deadline(batches)
+
+    assert [b["batch_id"] for b in ordered] == [
+        "early", "tokyo", "late", "none"
+    ]
+
+
+def test_next_submission_time_is_the_earliest_deferred_batch() -> None:
+    """Due batches and invalid times do not delay the next submission."""
+    now = datetime(2030, 7, 1, 12, tzinfo=timezone.utc)
+    batches = [
+        {"batch_id": "now"},
+        {"batch_id": "past", "submit_after": "2030-07-01T11:00:00+00:00"},
+        {"batch_id": "late", "submit_after": "2030-07-01T18:00:00+00:00"},
+        {"batch_id": "next", "submit_after": "2030-07-01T14:00:00"},
+        {"batch_id": "bad", "submit_after": "soon"},
+    ]
+
+    assert schedule_utils.next_submission_time(batches, now) == datetime(
+        2030, 7, 1, 14, tzinfo=timezone.utc
+    )
+    assert schedule_utils.next_submission_time(batches[:2], now) is None
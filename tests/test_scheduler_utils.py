@@ -0,0 +1,86 @@
+"""Tests for the tenant registry and weighted fair request sharing."""
+import asyncio
+import json
+from typing import Any, List
+
+from fakes import FakeS3Client
+
+from shared.utils import async_s3_utils, scheduler_utils
+from shared.utils.tenant_utils import (
+    DEFAULT_TENANT,
+    current_tenant,
+    parse_tenants,
+    tenant_context,
+)
+
+
+def test_load_tenants_reads_the_registry(
+    monkeypatch: Any, fake_s3: FakeS3Client
+) -> None:
+    """Without a registry there is one tenant; with one, its entries."""
+    assert scheduler_utils.load_tenants() == [DEFAULT_TENANT]
+
+    monkeypatch.setattr(scheduler_utils, "TENANTS_KEY", "tenants.json")
+    assert scheduler_utils.load_tenants() is None
+    fake_s3.objects["tenants.json"] = json.dumps(
+        {"tenants": [{"id": "club"}, {"id": "gravel", "weight": 2}]}
+    ).encode("utf-8")
+    tenants = scheduler_utils.load_tenants()
+    assert tenants is not None
+    assert [t.tenant_id for t in tenants] == ["club", "gravel"]
+    assert scheduler_utils.find_tenant("gravel") == tenants[1]
+    assert scheduler_utils.find_tenant(None) is None
+
+
+def test_fair_limiter_shares_slots_by_weight() -> None:
+    """A tenant with three times the weight gets three times the slots."""
+    heavy, light = parse_tenants([
+        {"id": "heavy", "weight": 3}, {"id": "light", "weight": 1}
+    ])
+
+    async def scenario() -> List[str]:
+        limiter = scheduler_utils.FairLimiter(1)
+        order: List[str] = []
+
+        async def request(tenant: Any) -> None:
+            with tenant_context(tenant):
+                async with limiter:
+                    order.append(tenant.tenant_id)
+                    await asyncio.sleep(0)
+
+        await limiter.acquire()
+        # The heavy tenant queues its whole backlog first
+        tasks = [
+            asyncio.create_task(request(tenant))
+            for tenant in [heavy] * 8 + [light] * 8
+        ]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert limiter.in_use == 0
+        return order
+
+    order = asyncio.run(scenario())
+    assert order[:8].count("heavy") == 6
+    assert order[:8].count("light") == 2
+    assert order[1] == "heavy" and order[3] == "light"
+
+
+def test_async_tenants_run_concurrently_in_their_own_prefix(
+    monkeypatch: Any, fake_s3: FakeS3Client
+) -> None:
+    """Async S3 calls of a tenant task run in that tenant's prefix."""
+    tenants = parse_tenants([{"id": "club"}, {"id": "gravel"}])
+
+    async def stage() -> bool:
+        return await async_s3_utils.put_s3_object_async(
+            "marker.txt", current_tenant().tenant_id, "text/plain"
+        )
+
+    results = asyncio.run(
+        scheduler_utils.run_for_tenants_async(stage, tenants)
+    )
+
+    assert results == {"club": True, "gravel": True}
+    assert fake_s3.objects["tenants/club/marker.txt"] == b"club"
+    assert fake_s3.objects["tenants/gravel/marker.txt"] == b"gravel"
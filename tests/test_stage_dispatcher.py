@@ -0,0 +1,152 @@
+"""Tests for launching the next stage on stage completion events."""
+from datetime import datetime, timedelta, timezone
+from typing import Any, List
+
+import stage_dispatcher
+
+from shared.utils import event_utils, scheduler_utils
+from shared.utils.tenant_utils import current_tenant, parse_tenants
+
+
+def _use_local_queue(monkeypatch: Any, tmp_path: Any) -> List[str]:
+    """Route events to a temp dir and record launches instead of running."""
+    launched: List[str] = []
+    monkeypatch.setattr(event_utils, "EVENT_BACKEND", "local")
+    monkeypatch.setattr(event_utils, "EVENT_QUEUE_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        stage_dispatcher, "launch_stage",
+        lambda stage: launched.append(stage) or True
+    )
+    monkeypatch.setattr(stage_dispatcher, "get_prepared_batches", lambda: [])
+    monkeypatch.setattr(stage_dispatcher, "get_pending_batches", lambda: [])
+    return launched
+
+
+def test_prepare_event_launches_upload(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """A successful prepare launches upload; a failed one is dead-lettered."""
+    launched = _use_local_queue(monkeypatch, tmp_path)
+    event_utils.publish_stage_event("prepare")
+    failed = event_utils.publish_stage_event(
+        "prepare", event_utils.EVENT_FAILED
+    )
+    assert failed is not None
+
+    assert stage_dispatcher.dispatch_pending_events() == 1
+    assert launched == ["upload"]
+    assert event_utils.list_pending_events() == []
+    dead_letters = list((tmp_path / event_utils.DEAD_LETTER).iterdir())
+    assert [p.name for p in dead_letters] == [
+        event_utils._event_name(failed)
+    ]
+
+
+def test_upload_event_waits_for_finished_batch(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """Download is launched only once a submitted batch is finished."""
+    launched = _use_local_queue(monkeypatch, tmp_path)
+    finished = [False]
+    monkeypatch.setattr(
+        stage_dispatcher, "submitted_batches_finished", lambda: finished[0]
+    )
+    event_utils.publish_stage_event("upload")
+
+    assert stage_dispatcher.dispatch_pending_events() == 0
+    assert len(event_utils.list_pending_events()) == 1
+
+    finished[0] = True
+    assert stage_dispatcher.dispatch_pending_events() == 1
+    assert launched == ["download"]
+    assert event_utils.list_pending_events() == []
+
+
+def test_download_event_resubmits_retry_batches(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """Download launches upload again when it left prepared retry batches."""
+    launched = _use_local_queue(monkeypatch, tmp_path)
+    monkeypatch.setattr(
+        stage_dispatcher, "get_prepared_batches",
+        lambda: [{"batch_id": "retry"}]
+    )
+    event_utils.publish_stage_event("download")
+
+    assert stage_dispatcher.dispatch_pending_events() == 1
+    assert launched == ["upload"]
+
+
+def test_download_runs_again_while_batches_are_submitted(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """Every download run, even a failed one, is followed by the next."""
+    launched = _use_local_queue(monkeypatch, tmp_path)
+    monkeypatch.setattr(
+        stage_dispatcher, "get_pending_batches",
+        lambda: [{"batch_id": "still-running"}]
+    )
+    finished = [False]
+    monkeypatch.setattr(
+        stage_dispatcher, "submitted_batches_finished", lambda: finished[0]
+    )
+    event_utils.publish_stage_event("download")
+    event_utils.publish_stage_event("download", event_utils.EVENT_FAILED)
+
+    assert stage_dispatcher.dispatch_pending_events() == 0
+    assert len(event_utils.list_pending_events()) == 2
+
+    finished[0] = True
+    assert stage_dispatcher.dispatch_pending_events() == 1
+    assert launched == ["download"]
+    assert event_utils.list_pending_events() == []
+    assert len(list((tmp_path / event_utils.DEAD_LETTER).iterdir())) == 1
+
+
+def test_download_follow_up_checks_every_tenant(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """Batches of any tenant, not just the default one, keep download going."""
+    launched = _use_local_queue(monkeypatch, tmp_path)
+    monkeypatch.setattr(
+        scheduler_utils, "load_tenants",
+        lambda: parse_tenants([{"id": "club"}, {"id": "gravel"}])
+    )
+    monkeypatch.setattr(
+        stage_dispatcher, "get_pending_batches",
+        lambda: [{"batch_id": "running"}]
+        if current_tenant().tenant_id == "gravel" else []
+    )
+    monkeypatch.setattr(
+        stage_dispatcher, "submitted_batches_finished", lambda: True
+    )
+    event_utils.publish_stage_event("download")
+
+    assert stage_dispatcher.dispatch_pending_events() == 1
+    assert launched == ["download"]
+
+
+def test_scheduled_upload_waits_until_it_is_due(
+    monkeypatch: Any, tmp_path: Any
+) -> None:
+    """Upload runs again once the first deferred batch becomes due."""
+    launched = _use_local_queue(monkeypatch, tmp_path)
+    later = datetime.now(timezone.utc) + timedelta(hours=2)
+    monkeypatch.setattr(
+        stage_dispatcher, "get_prepared_batches",
+        lambda: [{"batch_id": "later", "submit_after": later.isoformat()}]
+    )
+    event_utils.publish_stage_event(
+        "upload", event_utils.EVENT_SCHEDULED,
+        {"not_before": later.isoformat()}
+    )
+    # A deferred batch does not make download launch upload again
+    event_utils.publish_stage_event("download")
+
+    assert stage_dispatcher.dispatch_pending_events() == 0
+    assert len(event_utils.list_pending_events()) == 1
+
+    due = later + timedelta(seconds=1)
+    assert stage_dispatcher.dispatch_pending_events(now=due) == 1
+    assert launched == ["upload"]
+    assert event_utils.list_pending_events() == []
@@ -0,0 +1,112 @@
+"""Tests for the local filesystem storage backend."""
+import json
+from typing import Any, Iterator
+
+import pytest
+
+from shared.config import CONTROL_KEY
+from shared.utils import control_file_utils, s3_utils
+from shared.utils.storage_utils import (
+    LocalStorageClient,
+    create_storage_client,
+)
+
+
+@pytest.fixture
+def storage(monkeypatch: Any, tmp_path: Any) -> Iterator[LocalStorageClient]:
+    """Route s3_utils to a storage directory under tmp_path."""
+    client = LocalStorageClient(str(tmp_path))
+    monkeypatch.setattr(s3_utils, "s3", client)
+    control_file_utils.invalidate_control_cache()
+    yield client
+    control_file_utils.invalidate_control_cache()
+
+
+def test_objects_round_trip_through_s3_utils(
+    storage: LocalStorageClient, tmp_path: Any
+) -> None:
+    """Reads, writes, ranges, listing and deletes behave like S3."""
+    assert s3_utils.upload_json_to_s3("a/b.json", {"x": 1})
+    assert s3_utils.put_s3_object("a/c.txt", "hello world", "text/plain")
+    source = tmp_path / "source.jsonl"
+    source.write_text("line\n", encoding="utf-8")
+    assert s3_utils.upload_file_to_s3(str(source), "files/source.jsonl")
+
+    assert s3_utils.download_json_from_s3("a/b.json") == {"x": 1}
+    assert s3_utils.get_s3_object_range("a/c.txt", 6, 10) == b"world"
+    assert s3_utils.get_object_size("a/c.txt") == 11
+    assert s3_utils.list_objects("a/") == ["a/b.json", "a/c.txt"]
+    assert s3_utils.get_s3_object("missing.json") is None
+    assert not s3_utils.object_exists("missing.json")
+
+    target = tmp_path / "copy" / "source.jsonl"
+    assert s3_utils.download_file_from_s3("files/source.jsonl", str(target))
+    assert target.read_text(encoding="utf-8") == "line\n"
+
+    assert s3_utils.delete_object("a/b.json")
+    assert s3_utils.list_objects("a/") == ["a/c.txt"]
+
+
+def test_conditional_requests(storage: LocalStorageClient) -> None:
+    """If-None-Match and If-Match follow S3 semantics."""
+    etag = s3_utils.put_s3_object_conditional(
+        "lease.json", "1", create_only=True
+    )
+    assert etag is not None
+    assert s3_utils.put_s3_object_conditional(
+        "lease.json", "2", create_only=True
+    ) is None
+    assert s3_utils.get_s3_object_with_etag(
+        "lease.json", if_none_match=etag
+    ) == (None, etag)
+    new_etag = s3_utils.put_s3_object_conditional(
+        "lease.json", "3", if_match=etag
+    )
+    assert new_etag is not None and new_etag != etag
+    assert s3_utils.put_s3_object_conditional(
+        "lease.json", "4", if_match=etag
+    ) is None
+    assert s3_utils.get_s3_object("lease.json") == b"3"
+
+
+def test_listing_is_paginated(storage: LocalStorageClient) -> None:
+    """list_objects follows continuation tokens past a page."""
+    for index in range(5):
+        s3_utils.put_s3_object(f"events/{index}.json", "{}")
+    page = storage.list_objects_v2(Bucket="b", Prefix="", MaxKeys=2)
+    assert page["KeyCount"] == 0 and not page["IsTruncated"]
+
+    page = storage.list_objects_v2(
+        Bucket=s3_utils.S3_BUCKET_NAME, Prefix="events/", MaxKeys=2
+    )
+    assert page["IsTruncated"]
+    assert [obj["Key"] for obj in page["Contents"]] == [
+        "events/0.json", "events/1.json"
+    ]
+    assert len(s3_utils.list_objects("events/")) == 5
+
+
+def test_keys_cannot_escape_the_bucket(storage: LocalStorageClient) -> None:
+    """Keys resolving outside the bucket directory are rejected."""
+    assert not s3_utils.put_s3_object("../outside.json", "{}")
+
+
+def test_control_file_on_local_storage(storage: LocalStorageClient) -> None:
+    """The control file works unchanged on the local backend."""
+    success, batch_id = control_file_utils.create_batch(
+        "openai/input/x.jsonl", "2030-01-01"
+    )
+    assert success
+    assert control_file_utils.update_batch_status(
+        batch_id=batch_id, new_status="submitted"
+    )
+    control_file_utils.invalidate_control_cache()
+    control = json.loads(s3_utils.get_s3_object(CONTROL_KEY) or b"{}")
+    assert control["batches"][0]["status"] == "submitted"
+    assert control_file_utils.get_pending_batches()[0]["batch_id"] == batch_id
+
+
+def test_unknown_backend_is_rejected() -> None:
+    """A misspelt STORAGE_BACKEND fails loudly."""
+    with pytest.raises(ValueError):
+        create_storage_client("gcs")
@@ -0,0 +1,80 @@
+"""Tests for tenant definitions and tenant-prefixed S3 keys."""
+import json
+
+from fakes import FakeS3Client
+
+from shared.config import CONTROL_KEY, OPENAI_MODEL, RIDERS_FILE
+from shared.utils import control_file_utils, s3_utils, scheduler_utils
+from shared.utils.tenant_utils import (
+    current_tenant,
+    parse_tenants,
+    tenant_context,
+)
+
+
+def test_parse_tenants_fills_defaults_and_skips_invalid_entries() -> None:
+    """Entries without a usable ID or weight are dropped."""
+    tenants = parse_tenants([
+        {"id": "velo-club", "weight": 3},
+        {"id": "gravel", "prefix": "/clubs/gravel/", "model": "gpt-4.1"},
+        {"id": "velo-club"},
+        {"id": "../escape"},
+        {"id": "idle", "weight": 0},
+        "not-a-dict",
+    ])
+
+    assert [t.tenant_id for t in tenants] == ["velo-club", "gravel"]
+    velo, gravel = tenants
+    assert velo.prefix == "tenants/velo-club"
+    assert velo.riders_file == RIDERS_FILE
+    assert velo.model == OPENAI_MODEL
+    assert gravel.prefix == "clubs/gravel"
+    assert gravel.model == "gpt-4.1"
+    assert (velo.share, gravel.share) == (0.75, 0.25)
+
+
+def test_s3_keys_are_scoped_to_the_current_tenant(
+    fake_s3: FakeS3Client
+) -> None:
+    """Each tenant reads and lists only the objects under its prefix."""
+    club, gravel = parse_tenants([{"id": "club"}, {"id": "gravel"}])
+
+    with tenant_context(club):
+        assert current_tenant() is club
+        assert s3_utils.put_s3_object("horoscope/a.json", "{}")
+    with tenant_context(gravel):
+        assert s3_utils.get_s3_object("horoscope/a.json") is None
+        assert s3_utils.list_objects("horoscope/") == []
+    with tenant_context(club):
+        assert s3_utils.list_objects("horoscope/") == ["horoscope/a.json"]
+
+    assert list(fake_s3.objects) == ["tenants/club/horoscope/a.json"]
+    assert current_tenant().prefix == ""
+
+
+def test_run_for_tenants_keeps_control_files_apart(
+    fake_s3: FakeS3Client
+) -> None:
+    """Every tenant gets its own control file; a failure is contained."""
+    tenants = parse_tenants([{"id": "a"}, {"id": "broken"}, {"id": "b"}])
+
+    def stage() -> bool:
+        if current_tenant().tenant_id == "broken":
+            raise RuntimeError("bad roster")
+        control_file_utils.invalidate_control_cache()
+        created, _ = control_file_utils.create_batch(
+            "openai/input/x.jsonl", "2030-01-01"
+        )
+        return created
+
+    results = scheduler_utils.run_for_tenants(stage, tenants)
+
+    assert results == {"a": True, "broken": None, "b": True}
+    for tenant_id in ("a", "b"):
+        key = f"tenants/{tenant_id}/{CONTROL_KEY}"
+        control = json.loads(fake_s3.objects[key])
+        assert len(control["batches"]) == 1
+    assert CONTROL_KEY not in fake_s3.objects
+    for tenant in tenants:
+        with tenant_context(tenant):
+            control_file_utils.invalidate_control_cache()